@@ -0,0 +1,132 @@
+"""
+Aging de contas a pagar e a receber.
+
+Agrupa os títulos abertos por parceiro em faixas de dias vencidos e a vencer
+(0-30, 31-60, 61-90 e 90+) com uma única consulta agrupada, coberta pelo
+índice (status, data_vencimento, parceiro, valor): o MySQL percorre só o
+trecho do índice dos status abertos, sem ler as linhas da tabela.
+
+O resultado fica em cache no processo por tabela e dia, junto com a marca
+da tabela (total de alterações registradas em contadores_log, ver
+log_alteracoes.marca). Cada leitura confere a marca, uma soma de poucas
+linhas que não cresce com o histórico, e só recalcula se alguma conta foi
+criada, alterada ou excluída, por qualquer processo, inclusive por
+transações que confirmam fora da ordem dos offsets do log.
+"""
+
+import threading
+from datetime import date, timedelta
+import log_alteracoes
+
+# Tabela -> coluna do parceiro
+TABELAS = {
+    "contas_pagar": "fornecedor_id",
+    "contas_receber": "cliente_id",
+}
+
+STATUS_ABERTO = ("pendente", "aberto")
+
+# Da mais antiga para a mais distante; limites em dias em relação à data base
+FAIXAS = (
+    "vencido_90_mais", "vencido_61_90", "vencido_31_60", "vencido_0_30",
+    "a_vencer_0_30", "a_vencer_31_60", "a_vencer_61_90", "a_vencer_90_mais",
+)
+FAIXAS_VENCIDAS = FAIXAS[:4]
+
+_cache = {}  # tabela -> (data base, marca do log, resultado)
+_lock = threading.Lock()
+
+def _calcular(cursor, tabela, hoje):
+    coluna = TABELAS[tabela]
+    limites = [
+        hoje - timedelta(days=90), hoje - timedelta(days=60), hoje - timedelta(days=30), hoje,
+        hoje + timedelta(days=30), hoje + timedelta(days=60), hoje + timedelta(days=90),
+    ]
+    cursor.execute(
+        f"""
+        SELECT {coluna} AS parceiro_id,
+               CASE
+                   WHEN data_vencimento < %s THEN 'vencido_90_mais'
+                   WHEN data_vencimento < %s THEN 'vencido_61_90'
+                   WHEN data_vencimento < %s THEN 'vencido_31_60'
+                   WHEN data_vencimento < %s THEN 'vencido_0_30'
+                   WHEN data_vencimento <= %s THEN 'a_vencer_0_30'
+                   WHEN data_vencimento <= %s THEN 'a_vencer_31_60'
+                   WHEN data_vencimento <= %s THEN 'a_vencer_61_90'
+                   ELSE 'a_vencer_90_mais'
+               END AS faixa,
+               COUNT(*) AS quantidade,
+               SUM(valor) AS valor
+        FROM {tabela}
+        WHERE status IN ({', '.join(['%s'] * len(STATUS_ABERTO))})
+        GROUP BY parceiro_id, faixa
+        """,
+        [*limites, *STATUS_ABERTO]
+    )
+
+    totais = {faixa: {"quantidade": 0, "valor": 0.0} for faixa in FAIXAS}
+    parceiros = {}
+    for linha in cursor.fetchall():
+        valor = float(linha["valor"] or 0)
+        totais[linha["faixa"]]["quantidade"] += linha["quantidade"]
+        totais[linha["faixa"]]["valor"] += valor
+
+        parceiro = parceiros.setdefault(
+            linha["parceiro_id"], {**dict.fromkeys(FAIXAS, 0.0), "total": 0.0, "total_vencido": 0.0}
+        )
+        parceiro[linha["faixa"]] += valor
+        parceiro["total"] += valor
+        if linha["faixa"] in FAIXAS_VENCIDAS:
+            parceiro["total_vencido"] += valor
+
+    return {"data_base": hoje, "totais": totais, "parceiros": parceiros}
+
+def calcular(cursor, tabela):
+    """
+    Aging da tabela na data de hoje: {"data_base", "totais": {faixa: {quantidade, valor}},
+    "parceiros": {parceiro_id: {faixa: valor, total, total_vencido}}}.
+    O resultado é compartilhado pelo cache; não o altere.
+    """
+    hoje = date.today()
+    # Total de alterações da tabela (contadores mantidos por log_alteracoes.registrar)
+    marca = log_alteracoes.marca(cursor, (tabela,))
+
+    item = _cache.get(tabela)
+    if item and item[0] == hoje and item[1] == marca:
+        return item[2]
+
+    resultado = _calcular(cursor, tabela, hoje)
+    with _lock:
+        _cache[tabela] = (hoje, marca, resultado)
+    return resultado
+
+def por_parceiro(cursor, tabela, limite=50, ordenar_por="total_vencido"):
+    """Totais e os 'limite' parceiros com maior valor em 'ordenar_por', com nome."""
+    aging = calcular(cursor, tabela)
+    ordenados = sorted(aging["parceiros"].items(), key=lambda item: item[1][ordenar_por], reverse=True)[:limite]
+
+    nomes = {}
+    ids = [parceiro_id for parceiro_id, _ in ordenados if parceiro_id is not None]
+    if ids:
+        cursor.execute(
+            f"SELECT id, nome FROM parceiros WHERE id IN ({', '.join(['%s'] * len(ids))})",
+            ids
+        )
+        nomes = {linha["id"]: linha["nome"] for linha in cursor.fetchall()}
+
+    return {
+        "data_base": aging["data_base"],
+        "totais": aging["totais"],
+        "parceiros": [
+            {"parceiro_id": parceiro_id, "nome": nomes.get(parceiro_id), **faixas}
+            for parceiro_id, faixas in ordenados
+        ],
+    }
+
+def total_vencido(cursor, tabela):
+    """Quantidade e valor dos títulos vencidos (todas as faixas vencidas)."""
+    totais = calcular(cursor, tabela)["totais"]
+    return {
+        "quantidade": sum(totais[faixa]["quantidade"] for faixa in FAIXAS_VENCIDAS),
+        "valor_total": sum(totais[faixa]["valor"] for faixa in FAIXAS_VENCIDAS),
+    }
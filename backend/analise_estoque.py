@@ -0,0 +1,235 @@
+"""
+Análise de estoque vetorizada: curva ABC, giro, cobertura e estoque parado.
+
+O histórico de vendas e de movimentações da janela é carregado de uma vez,
+agregado por (produto, dia), e todos os indicadores do catálogo são
+calculados com NumPy em uma única passada, sem uma consulta por produto.
+
+Cada execução fica em cache por janela (VALIDADE_CACHE segundos), de modo
+que o endpoint e a exportação reaproveitam o mesmo resultado.
+"""
+
+import csv
+import io
+import threading
+import time
+from datetime import date, datetime, timedelta
+import numpy as np
+import xlsxwriter
+from database import get_db_cursor
+from cubo_produtos import STATUS_VENDA_CANCELADA
+
+# Limites da curva ABC (participação acumulada)
+LIMITE_A = 0.80
+LIMITE_B = 0.95
+
+DIAS_JANELA = 365
+# Sem venda há este número de dias (com estoque) = estoque parado
+DIAS_PARADO = 180
+# Cobertura acima deste número de dias (com estoque) = item de giro lento
+DIAS_COBERTURA_LENTO = 180
+
+VALIDADE_CACHE = 600
+
+_execucoes = {}
+_execucoes_lock = threading.Lock()
+
+COLUNAS = [
+    "id", "codigo", "nome", "estoque_atual", "custo", "valor_estoque",
+    "quantidade_vendida", "receita", "classe_receita", "classe_volume",
+    "estoque_medio", "giro", "dias_cobertura", "dias_sem_venda", "lento", "parado"
+]
+
+def _classificar_abc(valores):
+    """Classe ABC de cada posição pela participação acumulada (maiores primeiro)."""
+    classes = np.full(len(valores), "C", dtype="<U1")
+    total = valores.sum()
+    if total <= 0:
+        return classes
+
+    ordem = np.argsort(-valores, kind="stable")
+    ordenados = valores[ordem]
+    # Participação acumulada antes do item: o item que cruza o limite ainda entra na classe
+    anterior = (np.cumsum(ordenados) - ordenados) / total
+    classe_ordenada = np.where(anterior < LIMITE_A, "A", np.where(anterior < LIMITE_B, "B", "C"))
+    classe_ordenada[ordenados <= 0] = "C"
+    classes[ordem] = classe_ordenada
+    return classes
+
+def _indices(ids_ordenados, ids):
+    """Posição de cada id no catálogo e máscara dos ids encontrados."""
+    if len(ids_ordenados) == 0:
+        return np.zeros(len(ids), dtype=np.int64), np.zeros(len(ids), dtype=bool)
+    posicoes = np.searchsorted(ids_ordenados, ids)
+    posicoes = np.clip(posicoes, 0, len(ids_ordenados) - 1)
+    return posicoes, ids_ordenados[posicoes] == ids
+
+def _sem_infinito(valores):
+    return [None if not np.isfinite(v) else round(float(v), 2) for v in valores]
+
+def calcular(dias_janela=DIAS_JANELA, hoje=None):
+    """Executa a análise de todo o catálogo ativo para a janela de 'dias_janela' dias."""
+    hoje = hoje or date.today()
+    inicio = hoje - timedelta(days=dias_janela - 1)
+
+    with get_db_cursor(read_only=True) as cursor:
+        cursor.execute(
+            """
+            SELECT id, codigo, nome, estoque_atual,
+                   COALESCE(custo_medio, preco_custo) AS custo
+            FROM produtos
+            WHERE ativo = TRUE
+            ORDER BY id
+            """
+        )
+        produtos = cursor.fetchall()
+
+        cursor.execute(
+            f"""
+            SELECT i.produto_id, DATEDIFF(%s, DATE(pv.data_pedido)) AS dias_atras,
+                   SUM(i.quantidade) AS quantidade, SUM(i.subtotal) AS receita
+            FROM itens_pedido_venda i
+            JOIN pedidos_venda pv ON pv.id = i.pedido_id
+            WHERE pv.data_pedido >= %s
+            AND pv.status NOT IN ({", ".join(["%s"] * len(STATUS_VENDA_CANCELADA))})
+            GROUP BY i.produto_id, dias_atras
+            """,
+            [hoje, inicio, *STATUS_VENDA_CANCELADA]
+        )
+        vendas = cursor.fetchall()
+
+        # Ajustes definem saldo absoluto e não entram no saldo líquido diário
+        cursor.execute(
+            """
+            SELECT produto_id, DATEDIFF(%s, DATE(data_movimentacao)) AS dias_atras,
+                   SUM(CASE tipo WHEN 'entrada' THEN quantidade
+                                 WHEN 'saida' THEN -quantidade
+                                 ELSE 0 END) AS liquido
+            FROM movimentacao_estoque
+            WHERE data_movimentacao >= %s
+            GROUP BY produto_id, dias_atras
+            """,
+            (hoje, inicio)
+        )
+        movimentos = cursor.fetchall()
+
+    n = len(produtos)
+    ids = np.fromiter((p["id"] for p in produtos), dtype=np.int64, count=n)
+    estoque = np.fromiter((p["estoque_atual"] or 0 for p in produtos), dtype=np.float64, count=n)
+    custo = np.fromiter((float(p["custo"] or 0) for p in produtos), dtype=np.float64, count=n)
+
+    # Vendas por produto na janela
+    v_ids = np.fromiter((v["produto_id"] for v in vendas), dtype=np.int64, count=len(vendas))
+    v_dias = np.fromiter((v["dias_atras"] for v in vendas), dtype=np.float64, count=len(vendas))
+    v_qtd = np.fromiter((float(v["quantidade"]) for v in vendas), dtype=np.float64, count=len(vendas))
+    v_rec = np.fromiter((float(v["receita"]) for v in vendas), dtype=np.float64, count=len(vendas))
+    pos, ok = _indices(ids, v_ids)
+    pos, v_dias, v_qtd, v_rec = pos[ok], v_dias[ok], v_qtd[ok], v_rec[ok]
+
+    quantidade = np.bincount(pos, weights=v_qtd, minlength=n)
+    receita = np.bincount(pos, weights=v_rec, minlength=n)
+    dias_sem_venda = np.full(n, np.inf)
+    np.minimum.at(dias_sem_venda, pos, v_dias)
+
+    # Estoque médio diário na janela, reconstruído a partir do saldo atual:
+    # o saldo de k dias atrás é o atual menos o líquido dos dias mais recentes, então
+    # média = atual - (1/D) * soma(liquido_j * (D - 1 - j)), com j = dias atrás do movimento
+    m_ids = np.fromiter((m["produto_id"] for m in movimentos), dtype=np.int64, count=len(movimentos))
+    m_dias = np.fromiter((m["dias_atras"] for m in movimentos), dtype=np.float64, count=len(movimentos))
+    m_liq = np.fromiter((float(m["liquido"]) for m in movimentos), dtype=np.float64, count=len(movimentos))
+    pos_m, ok_m = _indices(ids, m_ids)
+    peso = m_liq[ok_m] * (dias_janela - 1 - m_dias[ok_m])
+    estoque_medio = np.maximum(estoque - np.bincount(pos_m[ok_m], weights=peso, minlength=n) / dias_janela, 0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        giro = np.where(estoque_medio > 0, quantidade / estoque_medio, np.where(quantidade > 0, np.inf, 0))
+        demanda_diaria = quantidade / dias_janela
+        dias_cobertura = np.where(demanda_diaria > 0, estoque / demanda_diaria, np.where(estoque > 0, np.inf, 0))
+
+    com_estoque = estoque > 0
+    lento = com_estoque & (dias_cobertura > DIAS_COBERTURA_LENTO)
+    parado = com_estoque & (dias_sem_venda >= DIAS_PARADO)
+
+    classe_receita = _classificar_abc(receita)
+    classe_volume = _classificar_abc(quantidade)
+    valor_estoque = estoque * custo
+
+    resultados = [
+        dict(zip(COLUNAS, linha))
+        for linha in zip(
+            ids.tolist(),
+            [p["codigo"] for p in produtos],
+            [p["nome"] for p in produtos],
+            estoque.astype(np.int64).tolist(),
+            np.round(custo, 4).tolist(),
+            np.round(valor_estoque, 2).tolist(),
+            quantidade.astype(np.int64).tolist(),
+            np.round(receita, 2).tolist(),
+            classe_receita.tolist(),
+            classe_volume.tolist(),
+            np.round(estoque_medio, 2).tolist(),
+            _sem_infinito(giro),
+            _sem_infinito(dias_cobertura),
+            [None if not np.isfinite(d) else int(d) for d in dias_sem_venda],
+            lento.tolist(),
+            parado.tolist(),
+        )
+    ]
+
+    resumo = {
+        "total_produtos": n,
+        "classe_receita": {c: int((classe_receita == c).sum()) for c in "ABC"},
+        "classe_volume": {c: int((classe_volume == c).sum()) for c in "ABC"},
+        "lentos": int(lento.sum()),
+        "parados": int(parado.sum()),
+        "valor_parado": round(float(valor_estoque[parado].sum()), 2),
+    }
+
+    return {
+        "gerado_em": datetime.now(),
+        "dias_janela": dias_janela,
+        "resumo": resumo,
+        "produtos": resultados,
+    }
+
+def obter_analise(dias_janela=DIAS_JANELA, atualizar=False):
+    """Retorna a última execução da janela, recalculando se expirou ou se atualizar=True."""
+    with _execucoes_lock:
+        execucao = _execucoes.get(dias_janela)
+        if execucao and not atualizar and time.monotonic() - execucao[0] < VALIDADE_CACHE:
+            return execucao[1]
+
+    resultado = calcular(dias_janela)
+    with _execucoes_lock:
+        _execucoes[dias_janela] = (time.monotonic(), resultado)
+    return resultado
+
+def exportar(resultado, formato="xlsx"):
+    """
+    Exporta os produtos de uma execução em 'csv' ou 'xlsx'.
+    Retorna (conteúdo em bytes, media type, nome do arquivo).
+    """
+    nome = f"analise_estoque_{resultado['gerado_em']:%Y%m%d_%H%M}"
+    produtos = resultado["produtos"]
+
+    if formato == "csv":
+        saida = io.StringIO()
+        escritor = csv.DictWriter(saida, fieldnames=COLUNAS, delimiter=";")
+        escritor.writeheader()
+        escritor.writerows(produtos)
+        return saida.getvalue().encode("utf-8-sig"), "text/csv", f"{nome}.csv"
+
+    saida = io.BytesIO()
+    planilha = xlsxwriter.Workbook(saida, {"in_memory": True})
+    aba = planilha.add_worksheet("Análise de estoque")
+    aba.write_row(0, 0, COLUNAS, planilha.add_format({"bold": True}))
+    for linha, produto in enumerate(produtos, 1):
+        aba.write_row(linha, 0, ["" if produto[c] is None else produto[c] for c in COLUNAS])
+    aba.autofilter(0, 0, len(produtos), len(COLUNAS) - 1)
+    aba.freeze_panes(1, 0)
+    planilha.close()
+    return (
+        saida.getvalue(),
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        f"{nome}.xlsx"
+    )
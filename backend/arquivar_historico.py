@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script para mover para as tabelas de arquivo os lançamentos fechados antigos
+(movimentações de estoque e de caixa, contas pagas/recebidas e pedidos
+finalizados/cancelados com seus itens).
+
+A data de corte padrão é a mais recente permitida (primeiro dia do mês, 24
+meses atrás). Pode ser executado periodicamente (ex.: mensalmente via cron).
+"""
+
+import os
+import sys
+import argparse
+from datetime import datetime
+
+# Adiciona o diretório atual ao path para permitir importações relativas
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import sem_timeout_leitura
+import arquivo_historico
+
+def main():
+    parser = argparse.ArgumentParser(description='Arquiva lançamentos fechados anteriores a uma data de corte')
+    parser.add_argument('--ate', help='Data de corte AAAA-MM-DD (padrão: a mais recente permitida)')
+    parser.add_argument('--tabelas', nargs='+', choices=sorted(arquivo_historico.TABELAS),
+                        help='Tabelas a arquivar (padrão: todas)')
+    parser.add_argument('--lote', type=int, default=arquivo_historico.TAMANHO_LOTE,
+                        help=f'Linhas por transação (padrão: {arquivo_historico.TAMANHO_LOTE})')
+    parser.add_argument('--simular', action='store_true', help='Apenas conta as linhas que seriam arquivadas')
+
+    args = parser.parse_args()
+
+    # As consultas em lote passam do timeout de leitura das rotas
+    sem_timeout_leitura()
+
+    ate = datetime.strptime(args.ate, '%Y-%m-%d').date() if args.ate else arquivo_historico.limite_arquivamento()
+    print(f"Data de corte: {ate:%d/%m/%Y}")
+
+    if args.simular:
+        for tabela, total in arquivo_historico.contar(ate, args.tabelas).items():
+            print(f"{tabela}: {total} linhas seriam arquivadas")
+        return
+
+    try:
+        resultado = arquivo_historico.arquivar(ate, args.tabelas, args.lote)
+    except arquivo_historico.ArquivamentoInvalido as e:
+        print(f"Erro: {e}")
+        sys.exit(1)
+
+    for tabela, total in resultado.items():
+        print(f"{tabela}: {total} linhas arquivadas")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Arquivamento de períodos fechados das tabelas de lançamentos.
+
+Cada tabela arquivável tem uma cópia arquivo_<tabela> (criada pelo init_db.py)
+com as mesmas colunas, sem chaves estrangeiras, comprimida e particionada por
+ano. arquivar() move para ela, em lotes transacionais, as linhas fechadas
+anteriores a uma data (no mínimo MESES_MINIMOS atrás) e grava essa data em
+arquivamentos.arquivado_ate.
+
+Consultas por período usam fonte(): enquanto o período pedido começa depois
+de arquivado_ate, ela devolve a própria tabela; caso contrário, a união da
+tabela com o arquivo, com o filtro de data aplicado em cada lado.
+
+As tabelas vivas não são particionadas porque o MySQL não permite chaves
+estrangeiras em tabelas particionadas; com o histórico arquivado elas ficam
+pequenas, e o arquivo (sem chaves estrangeiras) é quem cresce.
+"""
+
+from datetime import date, timedelta
+from database import get_db_cursor
+from cubo_produtos import STATUS_VENDA_CANCELADA
+from comissoes import STATUS_VENDA_FINALIZADA
+
+# Históricos mais recentes que isto são lidos por previsões, segmentação e comissões
+MESES_MINIMOS = 24
+
+TAMANHO_LOTE = 5000
+
+STATUS_PEDIDO_FECHADO = STATUS_VENDA_FINALIZADA + STATUS_VENDA_CANCELADA
+
+def _placeholders(valores):
+    return ", ".join(["%s"] * len(valores))
+
+# Tabela -> coluna de data e condição extra (ate -> (sql, parâmetros)) para a
+# linha ser considerada fechada. Filhas são arquivadas junto com a linha pai,
+# na mesma transação.
+TABELAS = {
+    "movimentacao_estoque": {"data": "data_movimentacao"},
+    "movimentos_caixa": {"data": "data_movimento"},
+    "contas_pagar": {
+        "data": "data_vencimento",
+        "condicao": lambda ate: ("t.status IN ('pago', 'cancelado') AND t.data_emissao < %s", [ate]),
+    },
+    "contas_receber": {
+        "data": "data_vencimento",
+        "condicao": lambda ate: ("t.status IN ('recebido', 'cancelado') AND t.data_emissao < %s", [ate]),
+    },
+    "pedidos_venda": {
+        "data": "data_pedido",
+        "condicao": lambda ate: (
+            f"t.status IN ({_placeholders(STATUS_PEDIDO_FECHADO)})", list(STATUS_PEDIDO_FECHADO)
+        ),
+        "filhas": {"itens_pedido_venda": "pedido_id"},
+    },
+}
+
+# Tabelas filhas: pai e coluna de ligação (o filtro de data vem do pai)
+FILHAS = {
+    filha: (tabela, coluna)
+    for tabela, definicao in TABELAS.items()
+    for filha, coluna in definicao.get("filhas", {}).items()
+}
+
+_colunas_cache = {}
+
+class ArquivamentoInvalido(Exception):
+    """Data de corte recente demais ou tabela desconhecida."""
+
+def limite_arquivamento(hoje=None):
+    """Data de corte mais recente permitida: primeiro dia do mês, MESES_MINIMOS atrás."""
+    hoje = hoje or date.today()
+    meses = hoje.year * 12 + hoje.month - 1 - MESES_MINIMOS
+    return date(meses // 12, meses % 12 + 1, 1)
+
+def _colunas(cursor, tabela):
+    """Colunas comuns à tabela e ao seu arquivo, na ordem da tabela."""
+    if tabela not in _colunas_cache:
+        cursor.execute(
+            """
+            SELECT t.COLUMN_NAME AS coluna
+            FROM information_schema.COLUMNS t
+            JOIN information_schema.COLUMNS a
+              ON a.TABLE_SCHEMA = t.TABLE_SCHEMA AND a.TABLE_NAME = %s AND a.COLUMN_NAME = t.COLUMN_NAME
+            WHERE t.TABLE_SCHEMA = DATABASE() AND t.TABLE_NAME = %s
+            ORDER BY t.ORDINAL_POSITION
+            """,
+            (f"arquivo_{tabela}", tabela)
+        )
+        _colunas_cache[tabela] = [f"`{linha['coluna']}`" for linha in cursor.fetchall()]
+    return _colunas_cache[tabela]
+
+def arquivado_ate(cursor, tabela):
+    """Data de corte do último arquivamento da tabela (None se nunca arquivada)."""
+    cursor.execute("SELECT arquivado_ate FROM arquivamentos WHERE tabela = %s", (tabela,))
+    linha = cursor.fetchone()
+    return linha["arquivado_ate"] if linha else None
+
+def fonte(cursor, tabela, inicio=None, fim=None):
+    """
+    Origem dos dados de 'tabela' para o período [inicio, fim] (datas; None = sem limite).
+    Retorna (sql, parâmetros) para usar em FROM: a própria tabela, se o período não
+    alcança o arquivo, ou uma tabela derivada com a união das duas.
+    """
+    base = FILHAS[tabela][0] if tabela in FILHAS else tabela
+    corte = arquivado_ate(cursor, base)
+    if corte is None or (inicio is not None and inicio >= corte):
+        return tabela, []
+
+    colunas = _colunas(cursor, tabela)
+    partes = []
+    parametros = []
+    for origem in (tabela, f"arquivo_{tabela}"):
+        if tabela in FILHAS:
+            pai, ligacao = FILHAS[tabela]
+            origem_pai = pai if origem == tabela else f"arquivo_{pai}"
+            coluna_data = f"p.{TABELAS[pai]['data']}"
+            sql = (
+                f"SELECT {', '.join(f't.{c}' for c in colunas)} FROM {origem} t "
+                f"JOIN {origem_pai} p ON p.id = t.{ligacao} WHERE 1=1"
+            )
+        else:
+            coluna_data = TABELAS[tabela]["data"]
+            sql = f"SELECT {', '.join(colunas)} FROM {origem} WHERE 1=1"
+
+        # Filtro um pouco mais largo que o período; a consulta externa aplica o exato
+        if inicio is not None:
+            sql += f" AND {coluna_data} >= %s"
+            parametros.append(inicio)
+        if fim is not None:
+            sql += f" AND {coluna_data} < %s"
+            parametros.append(fim + timedelta(days=1))
+        partes.append(sql)
+
+    return f"({' UNION ALL '.join(partes)})", parametros
+
+def _referencias(cursor, tabela, ignorar):
+    """Chaves estrangeiras de outras tabelas que apontam para 'tabela'."""
+    cursor.execute(
+        """
+        SELECT TABLE_NAME AS tabela, COLUMN_NAME AS coluna
+        FROM information_schema.KEY_COLUMN_USAGE
+        WHERE REFERENCED_TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME = %s
+        """,
+        (tabela,)
+    )
+    return [(r["tabela"], r["coluna"]) for r in cursor.fetchall() if r["tabela"] not in ignorar]
+
+def _garantir_particoes(cursor, tabela, ano):
+    """Separa da partição p_futuro os anos até 'ano', se ainda não tiverem partição própria."""
+    cursor.execute(
+        """
+        SELECT PARTITION_NAME AS nome FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        """,
+        (f"arquivo_{tabela}",)
+    )
+    particoes = {linha["nome"] for linha in cursor.fetchall()}
+    anos = sorted(int(nome[1:]) for nome in particoes if nome[1:].isdigit())
+    if "p_futuro" not in particoes or not anos or anos[-1] >= ano:
+        return
+
+    novas = ", ".join(
+        f"PARTITION p{a} VALUES LESS THAN ({a + 1})" for a in range(anos[-1] + 1, ano + 1)
+    )
+    cursor.execute(
+        f"""
+        ALTER TABLE arquivo_{tabela} REORGANIZE PARTITION p_futuro INTO (
+            {novas}, PARTITION p_futuro VALUES LESS THAN MAXVALUE
+        )
+        """
+    )
+
+def _filtro_fechadas(cursor, tabela, ate):
+    """Condição (sql, parâmetros) das linhas de 'tabela' que podem ser arquivadas."""
+    definicao = TABELAS[tabela]
+    sql = f"t.{definicao['data']} < %s"
+    parametros = [ate]
+
+    if "condicao" in definicao:
+        condicao, parametros_condicao = definicao["condicao"](ate)
+        sql += f" AND {condicao}"
+        parametros.extend(parametros_condicao)
+
+    # Linhas ainda referenciadas por outras tabelas ficam (ex.: pedidos comissionados)
+    for referencia, coluna in _referencias(cursor, tabela, set(definicao.get("filhas", {}))):
+        sql += f" AND NOT EXISTS (SELECT 1 FROM {referencia} r WHERE r.{coluna} = t.id)"
+
+    return sql, parametros
+
+def _mover(cursor, tabela, coluna, ids):
+    colunas = ", ".join(_colunas(cursor, tabela))
+    marcadores = _placeholders(ids)
+    cursor.execute(
+        f"INSERT INTO arquivo_{tabela} ({colunas}) SELECT {colunas} FROM {tabela} WHERE {coluna} IN ({marcadores})",
+        ids
+    )
+    movidas = cursor.rowcount
+    cursor.execute(f"DELETE FROM {tabela} WHERE {coluna} IN ({marcadores})", ids)
+    return movidas
+
+def contar(ate, tabelas=None):
+    """Quantidade de linhas que arquivar() moveria, por tabela."""
+    resultado = {}
+    with get_db_cursor() as cursor:
+        for tabela in tabelas or TABELAS:
+            filtro, parametros = _filtro_fechadas(cursor, tabela, ate)
+            cursor.execute(f"SELECT COUNT(*) AS total FROM {tabela} t WHERE {filtro}", parametros)
+            resultado[tabela] = cursor.fetchone()["total"]
+    return resultado
+
+def arquivar(ate, tabelas=None, tamanho_lote=TAMANHO_LOTE):
+    """
+    Move para o arquivo as linhas fechadas anteriores a 'ate' (date), em lotes
+    de uma transação cada. Retorna as linhas movidas por tabela (incluindo filhas).
+    """
+    if ate > limite_arquivamento():
+        raise ArquivamentoInvalido(
+            f"A data de corte deve ser no máximo {limite_arquivamento():%d/%m/%Y} ({MESES_MINIMOS} meses)"
+        )
+    desconhecidas = set(tabelas or []) - set(TABELAS)
+    if desconhecidas:
+        raise ArquivamentoInvalido(f"Tabelas não arquiváveis: {', '.join(sorted(desconhecidas))}")
+
+    resultado = {}
+    for tabela in tabelas or TABELAS:
+        filhas = TABELAS[tabela].get("filhas", {})
+        movidas = dict.fromkeys([tabela, *filhas], 0)
+
+        with get_db_cursor(commit=True) as cursor:
+            _garantir_particoes(cursor, tabela, ate.year)
+            filtro, parametros = _filtro_fechadas(cursor, tabela, ate)
+
+        while True:
+            with get_db_cursor(commit=True) as cursor:
+                cursor.execute(
+                    f"SELECT t.id FROM {tabela} t WHERE {filtro} ORDER BY t.id LIMIT %s FOR UPDATE",
+                    [*parametros, tamanho_lote]
+                )
+                ids = [linha["id"] for linha in cursor.fetchall()]
+                if not ids:
+                    break
+
+                for filha, coluna in filhas.items():
+                    movidas[filha] += _mover(cursor, filha, coluna, ids)
+                movidas[tabela] += _mover(cursor, tabela, "id", ids)
+
+        with get_db_cursor(commit=True) as cursor:
+            cursor.execute(
+                """
+                INSERT INTO arquivamentos (tabela, arquivado_ate, linhas) VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE arquivado_ate = GREATEST(arquivado_ate, VALUES(arquivado_ate)),
+                                        linhas = linhas + VALUES(linhas)
+                """,
+                (tabela, ate, movidas[tabela])
+            )
+
+        resultado.update(movidas)
+
+    return resultado
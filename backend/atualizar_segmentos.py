@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Atualiza a segmentação RFM e o LTV dos clientes (segmento_clientes).
+
+Sem opções, reagrega apenas os clientes com pedidos novos ou alterados desde
+a última execução e reclassifica todos (a recência muda a cada dia).
+Use --completo na primeira execução ou para corrigir divergências.
+
+Exemplos:
+    python atualizar_segmentos.py
+    python atualizar_segmentos.py --completo
+"""
+
+import os
+import sys
+import argparse
+import time
+
+# Adiciona o diretório atual ao path para permitir importações relativas
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import segmentacao_clientes
+
+def main():
+    parser = argparse.ArgumentParser(description='Atualiza a segmentação RFM e o LTV dos clientes')
+    parser.add_argument('--completo', action='store_true', help='Reagrega todos os clientes')
+
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    resultado = segmentacao_clientes.atualizar(completo=args.completo)
+    print(f"Clientes reagregados: {resultado['reagregados']}  "
+          f"reclassificados: {resultado['reclassificados']}  ({time.perf_counter() - inicio:.1f}s)")
+
+if __name__ == "__main__":
+    main()
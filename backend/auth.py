@@ -4,14 +4,20 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from typing import Optional
-from database import get_db_cursor
-from config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+from database import get_db_cursor, definir_usuario_atual
+from config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, BCRYPT_ROUNDS, HASH_WORKERS
 from models import Token, TokenData, UserInDB
 
 # Utilitários de segurança
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# O bcrypt libera o GIL: um pool pequeno de threads tira o hash do event loop
+# e limita quantos hashes rodam ao mesmo tempo (os demais aguardam na fila)
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="hash-senha")
+
 # Funções de autenticação
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -19,6 +25,38 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+# Hash usado quando o email não existe, para o tempo de resposta não revelar contas
+# válidas. Calculado no início da API (preparar_hash_ficticio) e não na carga do
+# módulo: um erro do bcrypt não deve impedir a importação
+_hash_ficticio = None
+
+async def _no_pool_de_hash(funcao, *args):
+    return await asyncio.get_running_loop().run_in_executor(_hash_executor, funcao, *args)
+
+async def verify_password_async(plain_password, hashed_password):
+    return await _no_pool_de_hash(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await _no_pool_de_hash(get_password_hash, password)
+
+async def preparar_hash_ficticio():
+    """Calcula o hash fictício no pool de hash, se ainda não foi calculado."""
+    global _hash_ficticio
+    if _hash_ficticio is None:
+        _hash_ficticio = await get_password_hash_async("senha-ficticia")
+    return _hash_ficticio
+
+async def verify_and_update_password(plain_password, hashed_password):
+    """
+    Verifica a senha fora do event loop. Retorna (válida, novo_hash); novo_hash
+    vem preenchido quando o hash gravado usa parâmetros antigos (ex.: outro custo).
+    Sem hash gravado (usuário inexistente), compara com um hash fictício e retorna inválido.
+    """
+    if not hashed_password:
+        await verify_password_async(plain_password, await preparar_hash_ficticio())
+        return False, None
+    return await _no_pool_de_hash(pwd_context.verify_and_update, plain_password, hashed_password)
+
 # Funções de token
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -47,9 +85,10 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
     
-    with get_db_cursor() as cursor:
+    # Sempre no primário: o estado de conexão muda no login e não pode vir atrasado de uma réplica
+    with get_db_cursor(read_only=False, prepared=True) as cursor:
         cursor.execute(
-            "SELECT id, nome, email, nivel_acesso, last_access, connected FROM usuarios WHERE email = %s",
+            "SELECT id, nome, email, nivel_acesso, last_access, connected, grupo_id FROM usuarios WHERE email = %s",
             (token_data.username,)
         )
         user = cursor.fetchone()
@@ -64,7 +103,10 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         "email": user["email"],
         "nivel_acesso": user["nivel_acesso"],
         "last_access": user["last_access"].isoformat() if user["last_access"] else None,
-        "connected": bool(user["connected"]) if user["connected"] is not None else False
+        "connected": bool(user["connected"]) if user["connected"] is not None else False,
+        "grupo_id": user["grupo_id"],
+        # Máscara de permissões embutida no token (PERMISSOES_NO_TOKEN), se houver
+        "permissoes": payload.get("perm")
     }
     
     # Verifica se o usuário está conectado
@@ -82,4 +124,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             (user_data["id"],)
         )
     
+    # A partir daqui, escritas da requisição mantêm o usuário lendo do primário
+    definir_usuario_atual(user_data["id"])
+    
     return UserInDB(**user_data)
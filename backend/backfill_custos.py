@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Recalcula o custo médio ponderado e o custo das vendas históricas.
+
+Para cada produto, repete as movimentações de estoque em ordem cronológica
+(recebimentos de compra alteram o custo médio), grava em cada item de venda
+o custo médio vigente na data do pedido e atualiza produtos.custo_medio.
+Depois soma o custo dos itens em pedidos_venda.custo_produto e reconstrói
+o cubo de produtos, cujas margens dependem desse custo.
+
+Cada produto é processado em sua própria transação.
+
+Exemplos:
+    python backfill_custos.py
+    python backfill_custos.py --produto 42
+"""
+
+import os
+import sys
+import argparse
+
+# Adiciona o diretório atual ao path para permitir importações relativas
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import get_db_cursor, sem_timeout_leitura
+import custos
+import cubo_produtos
+import log_alteracoes
+
+def main():
+    parser = argparse.ArgumentParser(description='Recalcula o custo médio e o custo das vendas históricas')
+    parser.add_argument('--produto', type=int, help='Processa apenas este produto')
+    parser.add_argument('--sem-cubo', action='store_true', help='Não reconstrói o cubo de produtos ao final')
+
+    args = parser.parse_args()
+
+    # As consultas em lote passam do timeout de leitura das rotas
+    sem_timeout_leitura()
+
+    if args.produto:
+        produto_ids = [args.produto]
+    else:
+        with get_db_cursor() as cursor:
+            cursor.execute("SELECT id FROM produtos ORDER BY id")
+            produto_ids = [row["id"] for row in cursor.fetchall()]
+
+    total_itens = 0
+    for i, produto_id in enumerate(produto_ids, 1):
+        with get_db_cursor(commit=True) as cursor:
+            total_itens += custos.recalcular_historico_produto(cursor, produto_id)
+        if i % 100 == 0:
+            print(f"{i}/{len(produto_ids)} produtos processados...")
+
+    print(f"{len(produto_ids)} produtos processados, {total_itens} itens de venda atualizados.")
+
+    with get_db_cursor(commit=True) as cursor:
+        custos.atualizar_custo_pedidos(cursor)
+        cursor.execute("SELECT id FROM pedidos_venda")
+        log_alteracoes.registrar(cursor, "pedidos_venda", [row["id"] for row in cursor.fetchall()], "update")
+    print("Custo dos pedidos de venda atualizado.")
+
+    if not args.sem_cubo:
+        with get_db_cursor(commit=True) as cursor:
+            cubo_produtos.reconstruir(cursor)
+        print("Cubo de produtos reconstruído.")
+
+if __name__ == "__main__":
+    main()
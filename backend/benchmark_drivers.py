@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmark de overhead por consulta entre os drivers de banco suportados.
+
+Executa as consultas mais quentes do sistema (login/autenticação, produto por
+id e por código e a inserção de itens de pedido) em cada driver, em modo texto
+e com prepared statements, e imprime a latência mediana e o p95 por consulta.
+
+As inserções são feitas em uma tabela temporária com a mesma estrutura de
+itens_pedido_venda, portanto nenhum dado real é alterado.
+
+Exemplo:
+    python benchmark_drivers.py --iteracoes 5000 --drivers mysql-connector,mysql-connector-c,pymysql
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+# Adiciona o diretório atual ao path para permitir importações relativas
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import DB_HOST, DB_USER, DB_PASSWORD, DB_NAME
+from db_drivers import DRIVERS, obter_driver
+
+db_config = {
+    'host': DB_HOST,
+    'user': DB_USER,
+    'password': DB_PASSWORD,
+    'database': DB_NAME
+}
+
+# Formatos reais das consultas mais executadas
+CONSULTA_USUARIO = "SELECT id, nome, email, nivel_acesso, last_access, connected FROM usuarios WHERE email = %s"
+CONSULTA_PRODUTO_ID = "SELECT * FROM produtos WHERE id = %s"
+CONSULTA_PRODUTO_CODIGO = "SELECT * FROM produtos WHERE codigo = %s"
+INSERE_ITEM = """
+    INSERT INTO bench_itens_pedido_venda (
+        pedido_id, produto_id, quantidade, preco_unitario,
+        desconto, subtotal
+    )
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+def obter_amostras(cursor):
+    """Obtém um email de usuário e um produto existentes para usar como parâmetros."""
+    cursor.execute("SELECT email FROM usuarios LIMIT 1")
+    usuario = cursor.fetchone()
+    cursor.execute("SELECT id, codigo FROM produtos LIMIT 1")
+    produto = cursor.fetchone()
+    if not usuario or not produto:
+        print("Erro: é necessário ao menos um usuário e um produto cadastrados.")
+        sys.exit(1)
+    return usuario["email"], produto["id"], produto["codigo"]
+
+def medir(executar, iteracoes):
+    """Executa a função 'iteracoes' vezes e retorna as latências em microssegundos."""
+    # Aquecimento
+    for _ in range(min(100, iteracoes)):
+        executar()
+
+    latencias = []
+    for _ in range(iteracoes):
+        inicio = time.perf_counter()
+        executar()
+        latencias.append((time.perf_counter() - inicio) * 1_000_000)
+    return latencias
+
+def benchmark_driver(nome, iteracoes):
+    driver = obter_driver(nome)
+    conn = driver.connect(db_config)
+    resultados = []
+
+    try:
+        cursor = driver.cursor(conn)
+        email, produto_id, codigo = obter_amostras(cursor)
+        cursor.execute("CREATE TEMPORARY TABLE bench_itens_pedido_venda LIKE itens_pedido_venda")
+
+        casos = [
+            ("auth: usuário por email", CONSULTA_USUARIO, (email,)),
+            ("produto por id", CONSULTA_PRODUTO_ID, (produto_id,)),
+            ("produto por código", CONSULTA_PRODUTO_CODIGO, (codigo,)),
+            ("insert item de pedido", INSERE_ITEM, (1, produto_id, 1, 10.0, 0.0, 10.0)),
+        ]
+
+        modos = [("texto", cursor)]
+        if driver.suporta_preparado:
+            modos.append(("preparado", None))
+
+        for descricao, query, params in casos:
+            for modo, cursor_texto in modos:
+                if cursor_texto is not None:
+                    def executar():
+                        cursor_texto.execute(query, params)
+                        if cursor_texto.description:
+                            cursor_texto.fetchall()
+                else:
+                    # Um cursor preparado por comando, como no cache por conexão
+                    cursor_preparado = driver.cursor_preparado(conn)
+
+                    def executar():
+                        cursor_preparado.execute(query, params)
+                        if cursor_preparado.description:
+                            cursor_preparado.fetchall()
+
+                latencias = medir(executar, iteracoes)
+                latencias.sort()
+                resultados.append({
+                    "driver": nome,
+                    "consulta": descricao,
+                    "modo": modo,
+                    "mediana": statistics.median(latencias),
+                    "p95": latencias[int(len(latencias) * 0.95) - 1],
+                })
+
+                if cursor_texto is None:
+                    cursor_preparado.close()
+
+        conn.rollback()
+        cursor.close()
+    finally:
+        conn.close()
+
+    return resultados
+
+def main():
+    parser = argparse.ArgumentParser(description='Compara o overhead por consulta entre drivers de banco')
+    parser.add_argument('--drivers', default=','.join(DRIVERS),
+                        help=f'Drivers separados por vírgula (padrão: {",".join(DRIVERS)})')
+    parser.add_argument('--iteracoes', type=int, default=2000,
+                        help='Execuções medidas por consulta (padrão: 2000)')
+
+    args = parser.parse_args()
+
+    resultados = []
+    for nome in [d.strip() for d in args.drivers.split(',') if d.strip()]:
+        try:
+            resultados.extend(benchmark_driver(nome, args.iteracoes))
+        except (RuntimeError, ValueError) as e:
+            print(f"Ignorando {nome}: {e}")
+
+    print(f"\n{'driver':<20} {'consulta':<26} {'modo':<10} {'mediana (µs)':>13} {'p95 (µs)':>10}")
+    print("-" * 83)
+    for r in resultados:
+        print(f"{r['driver']:<20} {r['consulta']:<26} {r['modo']:<10} {r['mediana']:>13.1f} {r['p95']:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark de vazão de login e da latência das demais requisições durante
+uma rajada de logins.
+
+Dois modos:
+- local (padrão): sem servidor nem banco. Em um event loop, dispara logins
+  concorrentes com o bcrypt executado no próprio loop (como era antes) e no
+  pool de hash (como é agora), enquanto uma tarefa de sondagem mede o atraso
+  que uma requisição comum sofreria.
+- --url: contra um servidor em execução. Dispara logins reais em POST /token
+  e, ao mesmo tempo, requisições a GET /api/configuracoes/status, medindo a
+  latência (mediana, p95, p99) dessas requisições.
+
+As falhas de login contam para o limite por conta/IP: use credenciais válidas.
+
+Exemplos:
+    python benchmark_login.py --logins 200 --concorrencia 20
+    python benchmark_login.py --url http://localhost:8000 --email admin@erpmaneiro.com --senha admin123
+"""
+
+import os
+import sys
+import time
+import json
+import asyncio
+import argparse
+import threading
+import urllib.request
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+# Adiciona o diretório atual ao path para permitir importações relativas
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from auth import pwd_context, verify_and_update_password
+
+INTERVALO_SONDAGEM = 0.01
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+def resumo(latencias_ms):
+    return (
+        f"mediana {percentil(latencias_ms, 0.5):8.1f} ms | "
+        f"p95 {percentil(latencias_ms, 0.95):8.1f} ms | "
+        f"p99 {percentil(latencias_ms, 0.99):8.1f} ms | "
+        f"máx {max(latencias_ms, default=0):8.1f} ms"
+    )
+
+# Modo local
+
+async def _sondar(atrasos, parar):
+    """Mede quanto o event loop demora além do previsto para acordar uma tarefa."""
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        await asyncio.sleep(INTERVALO_SONDAGEM)
+        atrasos.append((time.perf_counter() - inicio - INTERVALO_SONDAGEM) * 1000)
+
+async def _rodada_local(hash_senha, logins, concorrencia, no_pool):
+    semaforo = asyncio.Semaphore(concorrencia)
+
+    async def login():
+        async with semaforo:
+            if no_pool:
+                await verify_and_update_password("senha-benchmark", hash_senha)
+            else:
+                pwd_context.verify("senha-benchmark", hash_senha)
+                # Devolve o controle ao loop, como ao final de uma requisição
+                await asyncio.sleep(0)
+
+    atrasos = []
+    parar = asyncio.Event()
+    sonda = asyncio.create_task(_sondar(atrasos, parar))
+    inicio = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    duracao = time.perf_counter() - inicio
+    parar.set()
+    await sonda
+    return logins / duracao, atrasos
+
+def benchmark_local(args):
+    hash_senha = pwd_context.hash("senha-benchmark")
+    print(f"bcrypt: {pwd_context.identify(hash_senha)}, {args.logins} logins, concorrência {args.concorrencia}\n")
+
+    for descricao, no_pool in (("bcrypt no event loop", False), ("bcrypt no pool de hash", True)):
+        vazao, atrasos = asyncio.run(_rodada_local(hash_senha, args.logins, args.concorrencia, no_pool))
+        print(f"{descricao:<24} {vazao:7.1f} logins/s")
+        print(f"  atraso de outras requisições: {resumo(atrasos)}\n")
+
+# Modo servidor
+
+def _login(url, email, senha):
+    dados = urllib.parse.urlencode({"username": email, "password": senha}).encode()
+    with urllib.request.urlopen(urllib.request.Request(f"{url}/token", data=dados), timeout=60) as resposta:
+        return json.loads(resposta.read())["access_token"]
+
+def _status(url):
+    inicio = time.perf_counter()
+    with urllib.request.urlopen(f"{url}/api/configuracoes/status", timeout=60) as resposta:
+        resposta.read()
+    return (time.perf_counter() - inicio) * 1000
+
+def benchmark_servidor(args):
+    url = args.url.rstrip("/")
+    _login(url, args.email, args.senha)
+
+    latencias = []
+    parar = threading.Event()
+
+    def sondar():
+        while not parar.is_set():
+            latencias.append(_status(url))
+            time.sleep(INTERVALO_SONDAGEM)
+
+    # Linha de base: latência sem logins
+    sondas = [threading.Thread(target=sondar) for _ in range(args.sondas)]
+    for sonda in sondas:
+        sonda.start()
+    time.sleep(2)
+    base = list(latencias)
+    latencias.clear()
+
+    erros = 0
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+        futuros = [executor.submit(_login, url, args.email, args.senha) for _ in range(args.logins)]
+        for futuro in futuros:
+            try:
+                futuro.result()
+            except Exception:
+                erros += 1
+    duracao = time.perf_counter() - inicio
+
+    parar.set()
+    for sonda in sondas:
+        sonda.join()
+
+    print(f"{args.logins} logins em {duracao:.1f}s ({(args.logins - erros) / duracao:.1f} logins/s, {erros} erros)")
+    print(f"GET /status sem logins: {resumo(base)}")
+    print(f"GET /status com logins: {resumo(latencias)}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Mede a vazão de login e a latência das demais requisições')
+    parser.add_argument('--logins', type=int, default=100, help='Logins disparados (padrão: 100)')
+    parser.add_argument('--concorrencia', type=int, default=20, help='Logins simultâneos (padrão: 20)')
+    parser.add_argument('--url', help='URL de um servidor em execução (sem ela, roda o modo local)')
+    parser.add_argument('--email', help='Email de um usuário válido (modo servidor)')
+    parser.add_argument('--senha', help='Senha do usuário (modo servidor)')
+    parser.add_argument('--sondas', type=int, default=4, help='Clientes simultâneos em GET /status (padrão: 4)')
+
+    args = parser.parse_args()
+
+    if args.url:
+        if not args.email or not args.senha:
+            parser.error("--email e --senha são obrigatórios com --url")
+        benchmark_servidor(args)
+    else:
+        benchmark_local(args)
+
+if __name__ == "__main__":
+    main()
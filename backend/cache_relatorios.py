@@ -0,0 +1,149 @@
+"""
+Cache dos resultados dos relatórios por período.
+
+Cada resultado fica em memória no processo, com a chave (relatório,
+parâmetros) e uma marca d'água conferida a cada leitura: o total de
+alterações de cada entidade lida pelo relatório, mantido por
+log_alteracoes.registrar (log_alteracoes.marca). É uma soma de poucas linhas
+por entidade, feita na mesma transação do cálculo e independente do tamanho
+do histórico; se qualquer total mudar, o relatório é recalculado. Toda
+escrita nessas tabelas é registrada, e uma transação que confirma fora de
+ordem também muda o total.
+
+Os relatórios de vendas e compras de um período fechado (todos os dias até
+o fim do período com o caixa fechado) não dependem mais dos pedidos: os
+pedidos de dias fechados não aceitam alterações nos campos que eles leem
+(fechamento_caixa.garantir_aberto). A marca desses períodos é o fechamento
+que cobre o fim do período, que muda se ele for reaberto, mais os cadastros
+cujos nomes aparecem no relatório; novas vendas não os invalidam. O estoque
+atual não entra em nenhuma marca além da do relatório de estoque: a
+valorização do relatório geral é calculada fora do cache, e os relatórios
+de vendas e compras só leem o cadastro dos produtos (produtos_cadastro).
+
+As entradas são descartadas da menos usada para a mais usada quando o total
+passa de relatorios_cache_mb (0 desliga o cache). O tamanho de cada entrada é
+estimado pelo JSON do resultado. estatisticas() devolve, por relatório,
+consultas, acertos e taxa de acerto.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+import configuracoes_sistema
+import fechamento_caixa
+import log_alteracoes
+
+# Relatório -> entidades do log das tabelas que ele lê (os itens de pedido
+# são registrados na entidade do pedido; produtos_cadastro conta só as
+# alterações do cadastro dos produtos, não as de estoque)
+ENTIDADES = {
+    "geral": ("propostas_comerciais", "pedidos_venda"),
+    "vendas": ("pedidos_venda", "parceiros", "vendedores", "produtos_cadastro"),
+    "compras": ("pedidos_compra", "parceiros", "produtos_cadastro"),
+    "financeiro": ("contas_pagar", "contas_receber", "movimentos_caixa"),
+    "estoque": ("produtos", "movimentacao_estoque"),
+}
+
+# Relatório -> entidades que ainda podem mudar o resultado de um período fechado
+ENTIDADES_PERIODO_FECHADO = {
+    "vendas": ("parceiros", "vendedores", "produtos_cadastro"),
+    "compras": ("parceiros", "produtos_cadastro"),
+}
+
+_cache = OrderedDict()  # (relatório, parâmetros) -> (marca, resultado, tamanho)
+_bytes = 0
+_estatisticas = {relatorio: {"consultas": 0, "acertos": 0} for relatorio in ENTIDADES}
+_lock = threading.Lock()
+
+def _limite_bytes():
+    return (configuracoes_sistema.obter("relatorios_cache_mb") or 0) * 1024 * 1024
+
+def _descartar_excesso(limite):
+    """Descarta as entradas menos usadas até caber no limite. Chame com _lock."""
+    global _bytes
+    while _cache and _bytes > limite:
+        _, (_, _, tamanho) = _cache.popitem(last=False)
+        _bytes -= tamanho
+
+def _guardar(chave, marca, resultado):
+    global _bytes
+    limite = _limite_bytes()
+    tamanho = len(json.dumps(resultado, default=str))
+    with _lock:
+        anterior = _cache.pop(chave, None)
+        if anterior:
+            _bytes -= anterior[2]
+        if tamanho > limite:
+            return
+        _cache[chave] = (marca, resultado, tamanho)
+        _bytes += tamanho
+        _descartar_excesso(limite)
+
+def _marca(cursor, relatorio, fim):
+    if fim is not None and relatorio in ENTIDADES_PERIODO_FECHADO:
+        fechamento = fechamento_caixa.fechamento_cobrindo(cursor, fim)
+        if fechamento:
+            return (
+                "fechado", fechamento["data"], fechamento["data_fechamento"],
+                *log_alteracoes.marca(cursor, ENTIDADES_PERIODO_FECHADO[relatorio])
+            )
+    return log_alteracoes.marca(cursor, ENTIDADES[relatorio])
+
+def obter(cursor, relatorio, parametros, calcular, fim=None):
+    """
+    Resultado do relatório para os parâmetros (tupla com tudo que o altera,
+    inclusive o período), do cache se a marca ainda confere ou de calcular().
+    'fim' é o último dia do período, para reconhecer períodos fechados.
+    Chame antes de qualquer outra leitura no cursor, para que a marca e o
+    cálculo vejam o mesmo snapshot. O resultado é compartilhado pelo cache;
+    não o altere.
+    """
+    if not _limite_bytes():
+        return calcular()
+
+    chave = (relatorio, parametros)
+    marca = _marca(cursor, relatorio, fim)
+
+    with _lock:
+        estatisticas = _estatisticas[relatorio]
+        estatisticas["consultas"] += 1
+        item = _cache.get(chave)
+        if item and item[0] == marca:
+            estatisticas["acertos"] += 1
+            _cache.move_to_end(chave)
+            return item[1]
+
+    resultado = calcular()
+    _guardar(chave, marca, resultado)
+    return resultado
+
+def limpar(relatorio=None):
+    """Descarta as entradas do relatório (ou todas). Retorna quantas foram descartadas."""
+    global _bytes
+    with _lock:
+        chaves = [chave for chave in _cache if relatorio is None or chave[0] == relatorio]
+        for chave in chaves:
+            _bytes -= _cache.pop(chave)[2]
+    return len(chaves)
+
+def estatisticas():
+    """Consultas, acertos, taxa de acerto, entradas e bytes por relatório, e o uso total."""
+    limite = _limite_bytes()
+    with _lock:
+        relatorios = {}
+        for relatorio, contagem in _estatisticas.items():
+            entradas = [item[2] for chave, item in _cache.items() if chave[0] == relatorio]
+            relatorios[relatorio] = {
+                **contagem,
+                "taxa_acerto": contagem["acertos"] / contagem["consultas"] if contagem["consultas"] else 0.0,
+                "entradas": len(entradas),
+                "bytes": sum(entradas),
+            }
+        return {"bytes": _bytes, "limite_bytes": limite, "relatorios": relatorios}
+
+@configuracoes_sistema.ao_alterar
+def _ajustar_limite(alteradas):
+    if "relatorios_cache_mb" in alteradas:
+        limite = _limite_bytes()
+        with _lock:
+            _descartar_excesso(limite)
@@ -0,0 +1,385 @@
+"""
+Baixa de estoque de pedidos de venda segura sob concorrência.
+
+Cada pedido é gravado em uma única transação. O estoque é baixado pelo próprio
+banco com decremento condicional (`estoque_atual >= quantidade`) ou, na
+importação em lote, com `SELECT ... FOR UPDATE` dos produtos em ordem de id,
+de modo que dois checkouts simultâneos nunca vendem a mesma unidade.
+Deadlocks e timeouts de lock fazem a transação inteira ser repetida.
+"""
+
+import logging
+import random
+import time
+from database import get_db_cursor, driver
+import cubo_produtos
+import custos
+import log_alteracoes
+import sequencias
+
+logger = logging.getLogger("checkout")
+
+# Códigos do MySQL que indicam que a transação foi desfeita e pode ser repetida
+ERRO_DEADLOCK = 1213
+ERRO_LOCK_WAIT_TIMEOUT = 1205
+ERROS_RETENTAVEIS = {ERRO_DEADLOCK, ERRO_LOCK_WAIT_TIMEOUT}
+
+TENTATIVAS_TRANSACAO = 5
+
+# Pedidos gravados por transação na importação em lote
+TAMANHO_BLOCO_LOTE = 250
+
+FORMAS_PAGAMENTO = ["dinheiro", "cartao_credito", "cartao_debito", "boleto", "pix", "transferencia"]
+
+class EstoqueInsuficiente(Exception):
+    """Levantada quando a baixa condicional não encontra saldo suficiente."""
+
+    def __init__(self, produto_id, nome=None, disponivel=None):
+        self.produto_id = produto_id
+        self.nome = nome
+        self.disponivel = disponivel
+        super().__init__(
+            f"Estoque insuficiente para o produto {nome or produto_id}. Disponível: {disponivel}"
+        )
+
+def executar_transacao(operacao, tentativas=TENTATIVAS_TRANSACAO, prepared=False):
+    """
+    Executa operacao(cursor) em uma única transação e retorna seu resultado.
+    Em deadlock ou timeout de lock o MySQL desfaz a transação; ela é então
+    repetida do início, com espera aleatória crescente entre as tentativas.
+    """
+    for tentativa in range(1, tentativas + 1):
+        try:
+            with get_db_cursor(commit=True, prepared=prepared) as cursor:
+                return operacao(cursor)
+        except driver.Error as err:
+            if driver.codigo_erro(err) not in ERROS_RETENTAVEIS or tentativa == tentativas:
+                raise
+            logger.warning(f"Transação repetida após erro {driver.codigo_erro(err)} (tentativa {tentativa})")
+            time.sleep(random.uniform(0, 0.01 * 2 ** tentativa))
+
+def agrupar_quantidades(itens):
+    """Soma as quantidades por produto (um produto pode aparecer em mais de um item)."""
+    quantidades = {}
+    for item in itens:
+        quantidades[item.produto_id] = quantidades.get(item.produto_id, 0) + item.quantidade
+    return quantidades
+
+def baixar_estoque(cursor, quantidades):
+    """
+    Baixa o estoque com decremento condicional, em ordem de id para que
+    transações concorrentes travem as linhas sempre na mesma ordem.
+    Levanta EstoqueInsuficiente se algum produto não tiver saldo.
+    """
+    for produto_id in sorted(quantidades):
+        quantidade = quantidades[produto_id]
+        cursor.execute(
+            "UPDATE produtos SET estoque_atual = estoque_atual - %s WHERE id = %s AND estoque_atual >= %s",
+            (quantidade, produto_id, quantidade)
+        )
+        if cursor.rowcount == 0:
+            cursor.execute(
+                "SELECT nome, estoque_atual FROM produtos WHERE id = %s",
+                (produto_id,)
+            )
+            produto = cursor.fetchone() or {}
+            raise EstoqueInsuficiente(produto_id, produto.get("nome"), produto.get("estoque_atual"))
+
+def travar_produtos(cursor, produto_ids):
+    """Trava os produtos (SELECT ... FOR UPDATE em ordem de id) e retorna o saldo de cada um."""
+    produto_ids = sorted(set(produto_ids))
+    if not produto_ids:
+        return {}
+    placeholders = ", ".join(["%s"] * len(produto_ids))
+    cursor.execute(
+        f"SELECT id, nome, estoque_atual FROM produtos WHERE id IN ({placeholders}) ORDER BY id FOR UPDATE",
+        produto_ids
+    )
+    return {produto["id"]: produto for produto in cursor.fetchall()}
+
+def gerar_codigos_pedido_venda(cursor, quantidade):
+    """
+    Reserva 'quantidade' códigos sequenciais de pedido (formato: PV + ano + sequencial)
+    no contador travado de sequencias: checkouts simultâneos nunca repetem um código.
+    """
+    return sequencias.reservar(cursor, "pedidos_venda", "PV", quantidade)
+
+def calcular_valores(pedido):
+    """Retorna (valor_produtos, valor_total) do pedido."""
+    valor_produtos = sum((item.preco_unitario - item.desconto) * item.quantidade for item in pedido.itens)
+    valor_total = valor_produtos + pedido.valor_frete - pedido.valor_desconto
+    return valor_produtos, valor_total
+
+def _linhas_itens(pedido_id, pedido):
+    return [
+        (
+            pedido_id, item.produto_id, item.quantidade, item.preco_unitario,
+            item.desconto, (item.preco_unitario - item.desconto) * item.quantidade
+        )
+        for item in pedido.itens
+    ]
+
+def _linhas_movimentacoes(pedido, codigo, usuario_id):
+    return [
+        (item.produto_id, item.quantidade, codigo, usuario_id)
+        for item in pedido.itens
+    ]
+
+INSERE_PEDIDO = """
+    INSERT INTO pedidos_venda (
+        codigo, cliente_id, vendedor_id, data_entrega, status,
+        valor_produtos, valor_frete, valor_desconto, valor_total,
+        forma_pagamento, observacoes, usuario_id, chave_idempotencia
+    )
+    VALUES (%s, %s, %s, %s, 'pendente', %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+INSERE_ITEM = """
+    INSERT INTO itens_pedido_venda (
+        pedido_id, produto_id, quantidade, preco_unitario,
+        desconto, subtotal
+    )
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+INSERE_MOVIMENTACAO_SAIDA = """
+    INSERT INTO movimentacao_estoque (
+        produto_id, tipo, quantidade, motivo,
+        documento_referencia, usuario_id
+    )
+    VALUES (%s, 'saida', %s, 'Pedido de venda', %s, %s)
+"""
+
+def _registrar_alteracoes(cursor, pedido_ids, codigos, produto_ids, usuario_id):
+    """Registra no log de alterações os pedidos, os produtos baixados e as movimentações."""
+    log_alteracoes.registrar(cursor, "pedidos_venda", pedido_ids, "insert", usuario_id)
+    log_alteracoes.registrar(cursor, "produtos", sorted(produto_ids), "update", usuario_id)
+    cursor.execute(
+        f"""
+        SELECT id FROM movimentacao_estoque
+        WHERE documento_referencia IN ({", ".join(["%s"] * len(codigos))}) AND tipo = 'saida'
+        """,
+        list(codigos)
+    )
+    log_alteracoes.registrar(
+        cursor, "movimentacao_estoque", [row["id"] for row in cursor.fetchall()], "insert", usuario_id
+    )
+
+def _linha_pedido(pedido, codigo, cliente_id, usuario_id, chave_idempotencia=None):
+    valor_produtos, valor_total = calcular_valores(pedido)
+    # Trata vendedor_id=0 como None para evitar erro de foreign key
+    vendedor_id = pedido.vendedor_id or None
+    return (
+        codigo, cliente_id, vendedor_id, pedido.data_entrega,
+        valor_produtos, pedido.valor_frete, pedido.valor_desconto, valor_total,
+        pedido.forma_pagamento, pedido.observacoes, usuario_id, chave_idempotencia
+    )
+
+def registrar_pedido_venda(cursor, pedido, cliente_id, usuario_id):
+    """
+    Grava um pedido de venda, seus itens, a baixa de estoque e as movimentações
+    na transação do cursor. Retorna o id do pedido.
+    Use dentro de executar_transacao para ter a repetição em deadlock.
+    """
+    # A baixa vem primeiro: trava os produtos cedo e falha antes de qualquer inserção
+    baixar_estoque(cursor, agrupar_quantidades(pedido.itens))
+
+    codigo = gerar_codigos_pedido_venda(cursor, 1)[0]
+    cursor.execute(INSERE_PEDIDO, _linha_pedido(pedido, codigo, cliente_id, usuario_id))
+
+    # Obtém o ID do pedido criado
+    cursor.execute("SELECT LAST_INSERT_ID()")
+    pedido_id = cursor.fetchone()["LAST_INSERT_ID()"]
+
+    cursor.executemany(INSERE_ITEM, _linhas_itens(pedido_id, pedido))
+    cursor.executemany(INSERE_MOVIMENTACAO_SAIDA, _linhas_movimentacoes(pedido, codigo, usuario_id))
+
+    custos.fixar_custos(cursor, [pedido_id])
+    cubo_produtos.registrar_vendas(cursor, [pedido_id])
+    _registrar_alteracoes(
+        cursor, [pedido_id], [codigo], {item.produto_id for item in pedido.itens}, usuario_id
+    )
+
+    return pedido_id
+
+def _resultado(indice, pedido, situacao, pedido_id=None, codigo=None, erro=None):
+    return {
+        "indice": indice,
+        "chave_idempotencia": pedido.chave_idempotencia,
+        "status": situacao,
+        "pedido_id": pedido_id,
+        "codigo": codigo,
+        "erro": erro,
+    }
+
+def _pedidos_existentes(cursor, chaves, travar=False):
+    """Retorna {chave_idempotencia: pedido} para as chaves já gravadas."""
+    if not chaves:
+        return {}
+    placeholders = ", ".join(["%s"] * len(chaves))
+    cursor.execute(
+        f"SELECT id, codigo, chave_idempotencia FROM pedidos_venda "
+        f"WHERE chave_idempotencia IN ({placeholders})" + (" FOR UPDATE" if travar else ""),
+        list(chaves)
+    )
+    return {pedido["chave_idempotencia"]: pedido for pedido in cursor.fetchall()}
+
+def _validar_pedido(pedido, clientes, vendedores, produtos):
+    """Valida um pedido do lote contra os mapas pré-carregados. Retorna a mensagem de erro ou None."""
+    cliente = clientes.get(pedido.cliente_id)
+    if not cliente:
+        return "Cliente não encontrado"
+    if cliente["tipo"] not in ["cliente", "ambos"]:
+        return "O parceiro selecionado não é um cliente"
+    if pedido.vendedor_id and pedido.vendedor_id not in vendedores:
+        return "Vendedor não encontrado"
+    if not pedido.itens:
+        return "O pedido deve conter pelo menos um item"
+    for item in pedido.itens:
+        if item.produto_id not in produtos:
+            return f"Produto com ID {item.produto_id} não encontrado"
+        if item.quantidade <= 0:
+            return f"A quantidade do produto {produtos[item.produto_id]['nome']} deve ser maior que zero"
+    if pedido.forma_pagamento not in FORMAS_PAGAMENTO:
+        return f"Forma de pagamento inválida. Deve ser uma das seguintes: {', '.join(FORMAS_PAGAMENTO)}"
+    return None
+
+def _carregar_mapa(cursor, query, ids):
+    ids = sorted(set(ids))
+    if not ids:
+        return {}
+    placeholders = ", ".join(["%s"] * len(ids))
+    cursor.execute(query.format(placeholders=placeholders), ids)
+    return {linha["id"]: linha for linha in cursor.fetchall()}
+
+def _gravar_bloco(cursor, bloco, usuario_id):
+    """
+    Grava um bloco de pedidos já validados em uma transação.
+    Retorna a lista de resultados (criado, duplicado ou erro de estoque) do bloco.
+    """
+    resultados = []
+
+    # Trava as chaves (inclusive as ausentes, pelo lock de intervalo do índice único)
+    # para que um reenvio simultâneo do mesmo pedido espere e o veja como duplicado
+    existentes = _pedidos_existentes(cursor, [p.chave_idempotencia for _, p in bloco], travar=True)
+    pendentes = []
+    for indice, pedido in bloco:
+        existente = existentes.get(pedido.chave_idempotencia)
+        if existente:
+            resultados.append(_resultado(indice, pedido, "duplicado", existente["id"], existente["codigo"]))
+        else:
+            pendentes.append((indice, pedido))
+
+    # Aloca o estoque travado pedido a pedido, na ordem do lote
+    travados = travar_produtos(cursor, [item.produto_id for _, p in pendentes for item in p.itens])
+    saldos = {produto_id: produto["estoque_atual"] for produto_id, produto in travados.items()}
+    aceitos = []
+    baixas = {}
+    for indice, pedido in pendentes:
+        quantidades = agrupar_quantidades(pedido.itens)
+        sem_saldo = next(
+            (produto_id for produto_id, qtd in quantidades.items() if saldos.get(produto_id, 0) < qtd),
+            None
+        )
+        if sem_saldo is not None:
+            resultados.append(_resultado(
+                indice, pedido, "erro",
+                erro=str(EstoqueInsuficiente(
+                    sem_saldo, travados.get(sem_saldo, {}).get("nome"), saldos.get(sem_saldo, 0)
+                ))
+            ))
+            continue
+        for produto_id, qtd in quantidades.items():
+            saldos[produto_id] -= qtd
+            baixas[produto_id] = baixas.get(produto_id, 0) + qtd
+        aceitos.append((indice, pedido))
+
+    if not aceitos:
+        return resultados
+
+    codigos = gerar_codigos_pedido_venda(cursor, len(aceitos))
+    cursor.executemany(INSERE_PEDIDO, [
+        _linha_pedido(pedido, codigo, pedido.cliente_id, usuario_id, pedido.chave_idempotencia)
+        for (_, pedido), codigo in zip(aceitos, codigos)
+    ])
+
+    # Os ids de um INSERT multi-linha não são garantidamente consecutivos: busca pela chave
+    ids = {
+        chave: pedido["id"]
+        for chave, pedido in _pedidos_existentes(cursor, [p.chave_idempotencia for _, p in aceitos]).items()
+    }
+
+    itens = []
+    movimentacoes = []
+    for (indice, pedido), codigo in zip(aceitos, codigos):
+        pedido_id = ids[pedido.chave_idempotencia]
+        itens.extend(_linhas_itens(pedido_id, pedido))
+        movimentacoes.extend(_linhas_movimentacoes(pedido, codigo, usuario_id))
+        resultados.append(_resultado(indice, pedido, "criado", pedido_id, codigo))
+
+    cursor.executemany(INSERE_ITEM, itens)
+    # Os produtos já estão travados por esta transação: o decremento simples é seguro
+    cursor.executemany(
+        "UPDATE produtos SET estoque_atual = estoque_atual - %s WHERE id = %s",
+        [(baixas[produto_id], produto_id) for produto_id in sorted(baixas)]
+    )
+    cursor.executemany(INSERE_MOVIMENTACAO_SAIDA, movimentacoes)
+
+    pedido_ids = [ids[p.chave_idempotencia] for _, p in aceitos]
+    custos.fixar_custos(cursor, pedido_ids)
+    cubo_produtos.registrar_vendas(cursor, pedido_ids)
+    _registrar_alteracoes(cursor, pedido_ids, codigos, baixas.keys(), usuario_id)
+
+    return resultados
+
+def processar_lote_pedidos(pedidos, usuario_id, tamanho_bloco=TAMANHO_BLOCO_LOTE):
+    """
+    Importa uma lista de pedidos (cada um com chave_idempotencia).
+
+    Clientes, vendedores e produtos são carregados uma única vez e todos os
+    pedidos são validados contra esses mapas; os válidos são gravados em blocos
+    de 'tamanho_bloco' pedidos por transação, com inserções multi-linha.
+    Pedidos cuja chave já foi gravada retornam como 'duplicado', de modo que
+    reenviar o mesmo lote é seguro. Retorna um resultado por pedido, na ordem recebida.
+    """
+    resultados = [None] * len(pedidos)
+
+    with get_db_cursor() as cursor:
+        clientes = _carregar_mapa(
+            cursor, "SELECT id, tipo FROM parceiros WHERE id IN ({placeholders})",
+            [p.cliente_id for p in pedidos]
+        )
+        vendedores = _carregar_mapa(
+            cursor, "SELECT id FROM vendedores WHERE id IN ({placeholders})",
+            [p.vendedor_id for p in pedidos if p.vendedor_id]
+        )
+        produtos = _carregar_mapa(
+            cursor, "SELECT id, nome FROM produtos WHERE id IN ({placeholders})",
+            [item.produto_id for p in pedidos for item in p.itens]
+        )
+        existentes = _pedidos_existentes(cursor, {p.chave_idempotencia for p in pedidos})
+
+    validos = []
+    chaves_vistas = set()
+    for indice, pedido in enumerate(pedidos):
+        existente = existentes.get(pedido.chave_idempotencia)
+        if existente:
+            resultados[indice] = _resultado(indice, pedido, "duplicado", existente["id"], existente["codigo"])
+            continue
+        if pedido.chave_idempotencia in chaves_vistas:
+            resultados[indice] = _resultado(indice, pedido, "erro", erro="Chave de idempotência repetida no lote")
+            continue
+        chaves_vistas.add(pedido.chave_idempotencia)
+
+        erro = _validar_pedido(pedido, clientes, vendedores, produtos)
+        if erro:
+            resultados[indice] = _resultado(indice, pedido, "erro", erro=erro)
+        else:
+            validos.append((indice, pedido))
+
+    for inicio in range(0, len(validos), tamanho_bloco):
+        bloco = validos[inicio:inicio + tamanho_bloco]
+        for resultado in executar_transacao(lambda cursor: _gravar_bloco(cursor, bloco, usuario_id)):
+            resultados[resultado["indice"]] = resultado
+
+    return resultados
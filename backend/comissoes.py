@@ -0,0 +1,133 @@
+"""
+Fechamento de comissões de vendedores.
+
+Um fechamento cobre um período e grava, de uma vez (INSERT ... SELECT):
+- um lançamento 'comissao' por pedido finalizado do período ainda não comissionado,
+  com o percentual do vendedor no momento do fechamento;
+- um lançamento 'estorno' (valor negativo) por pedido já comissionado em um
+  fechamento anterior e que foi cancelado depois;
+- o extrato de cada vendedor, somando os lançamentos.
+
+Fechamentos são imutáveis e nunca recalculados: o índice único (pedido_id, tipo)
+garante que cada pedido é comissionado e estornado no máximo uma vez, e cada
+fechamento só lê os pedidos da sua janela (mais DIAS_RETROATIVOS para pedidos
+finalizados ou cancelados com atraso).
+"""
+
+from datetime import timedelta
+from cubo_produtos import STATUS_VENDA_CANCELADA
+
+STATUS_VENDA_FINALIZADA = ("finalizada", "concluída")
+
+# Pedidos anteriores ao período ainda considerados (finalizados/cancelados com atraso)
+DIAS_RETROATIVOS = 90
+
+class PeriodoInvalido(Exception):
+    """Período sobreposto a um fechamento existente ou com datas invertidas."""
+
+def _placeholders(valores):
+    return ", ".join(["%s"] * len(valores))
+
+def fechar_periodo(cursor, data_inicio, data_fim, usuario_id):
+    """
+    Fecha as comissões de data_inicio a data_fim (inclusive) e retorna o id do fechamento.
+    Chame em uma transação (get_db_cursor(commit=True)).
+    """
+    if data_fim < data_inicio:
+        raise PeriodoInvalido("A data final deve ser igual ou posterior à data inicial")
+
+    # Serializa fechamentos concorrentes e impede sobreposição com os já fechados
+    cursor.execute(
+        """
+        SELECT id FROM fechamentos_comissao
+        WHERE data_inicio <= %s AND data_fim >= %s
+        FOR UPDATE
+        """,
+        (data_fim, data_inicio)
+    )
+    if cursor.fetchone():
+        raise PeriodoInvalido("O período se sobrepõe a um fechamento de comissões existente")
+
+    cursor.execute(
+        "INSERT INTO fechamentos_comissao (data_inicio, data_fim, usuario_id) VALUES (%s, %s, %s)",
+        (data_inicio, data_fim, usuario_id)
+    )
+    cursor.execute("SELECT LAST_INSERT_ID()")
+    fechamento_id = cursor.fetchone()["LAST_INSERT_ID()"]
+
+    desde = data_inicio - timedelta(days=DIAS_RETROATIVOS)
+    ate = data_fim + timedelta(days=1)
+
+    # Comissão dos pedidos finalizados ainda não comissionados (base: produtos menos desconto)
+    cursor.execute(
+        f"""
+        INSERT INTO lancamentos_comissao (
+            fechamento_id, vendedor_id, pedido_id, tipo, data_pedido,
+            valor_base, percentual, valor_comissao
+        )
+        SELECT %s, pv.vendedor_id, pv.id, 'comissao', pv.data_pedido,
+               pv.valor_produtos - pv.valor_desconto, v.comissao_percentual,
+               ROUND((pv.valor_produtos - pv.valor_desconto) * v.comissao_percentual / 100, 2)
+        FROM pedidos_venda pv
+        JOIN vendedores v ON v.id = pv.vendedor_id
+        LEFT JOIN lancamentos_comissao l ON l.pedido_id = pv.id AND l.tipo = 'comissao'
+        WHERE pv.data_pedido >= %s AND pv.data_pedido < %s
+        AND pv.status IN ({_placeholders(STATUS_VENDA_FINALIZADA)})
+        AND l.id IS NULL
+        """,
+        [fechamento_id, desde, ate, *STATUS_VENDA_FINALIZADA]
+    )
+
+    # Estorno de pedidos comissionados antes e cancelados depois
+    cursor.execute(
+        f"""
+        INSERT INTO lancamentos_comissao (
+            fechamento_id, vendedor_id, pedido_id, tipo, data_pedido,
+            valor_base, percentual, valor_comissao
+        )
+        SELECT %s, c.vendedor_id, c.pedido_id, 'estorno', c.data_pedido,
+               -c.valor_base, c.percentual, -c.valor_comissao
+        FROM pedidos_venda pv
+        JOIN lancamentos_comissao c ON c.pedido_id = pv.id AND c.tipo = 'comissao'
+        LEFT JOIN lancamentos_comissao e ON e.pedido_id = pv.id AND e.tipo = 'estorno'
+        WHERE pv.data_pedido >= %s AND pv.data_pedido < %s
+        AND pv.status IN ({_placeholders(STATUS_VENDA_CANCELADA)})
+        AND e.id IS NULL
+        """,
+        [fechamento_id, desde, ate, *STATUS_VENDA_CANCELADA]
+    )
+
+    cursor.execute(
+        """
+        INSERT INTO extratos_comissao (
+            fechamento_id, vendedor_id, quantidade_pedidos, quantidade_estornos,
+            total_vendas, total_estornos, total_comissao
+        )
+        SELECT fechamento_id, vendedor_id,
+               SUM(tipo = 'comissao'), SUM(tipo = 'estorno'),
+               SUM(CASE WHEN tipo = 'comissao' THEN valor_base ELSE 0 END),
+               SUM(CASE WHEN tipo = 'estorno' THEN valor_comissao ELSE 0 END),
+               SUM(valor_comissao)
+        FROM lancamentos_comissao
+        WHERE fechamento_id = %s
+        GROUP BY fechamento_id, vendedor_id
+        """,
+        (fechamento_id,)
+    )
+
+    cursor.execute(
+        """
+        UPDATE fechamentos_comissao f
+        JOIN (
+            SELECT fechamento_id, SUM(quantidade_pedidos) AS pedidos,
+                   SUM(total_vendas) AS vendas, SUM(total_comissao) AS comissao
+            FROM extratos_comissao
+            WHERE fechamento_id = %s
+            GROUP BY fechamento_id
+        ) e ON e.fechamento_id = f.id
+        SET f.quantidade_pedidos = e.pedidos, f.total_vendas = e.vendas, f.total_comissao = e.comissao
+        """,
+        (fechamento_id,)
+    )
+
+    return fechamento_id
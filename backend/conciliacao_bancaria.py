@@ -0,0 +1,539 @@
+"""
+Importação de extratos bancários (OFX e retorno CNAB 240/400) e conciliação.
+
+Os arquivos são lidos em fluxo: o OFX em blocos de TAMANHO_BLOCO bytes (há
+bancos que mandam o arquivo inteiro numa linha só) e o CNAB linha a linha.
+Os lançamentos são processados em lotes de TAMANHO_LOTE, cada um na sua
+transação, então a memória usada não depende do tamanho do arquivo.
+
+Para cada lote, poucas consultas trazem os candidatos da janela de datas do
+lote — contas a receber/pagar abertas com o mesmo valor ou código e movimentos
+de caixa ainda não conciliados com o mesmo valor — e os guardam em
+dicionários por código e por valor em centavos. Cada lançamento procura,
+nesta ordem:
+  1. conta aberta cujo código é o documento / nosso número do lançamento;
+  2. movimento de caixa do mesmo tipo e valor a até JANELA_DIAS dias (o mais
+     próximo), para baixas já lançadas à mão;
+  3. a única conta aberta de mesmo valor vencendo a até JANELA_DIAS dias.
+As contas encontradas são baixadas em lote (um UPDATE por data e um INSERT de
+vários movimentos de caixa, com o valor efetivamente creditado/debitado), e
+cada lançamento fica em extrato_bancario com a referência do que o conciliou.
+Lançamentos de dias com o caixa fechado só conciliam com movimentos já
+existentes; os demais ficam como 'periodo_fechado'.
+
+A chave (conta_bancaria_id, id_externo) torna a importação idempotente:
+reenviar o arquivo pula o que já foi conciliado e tenta de novo o restante.
+"""
+
+import re
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from database import get_db_cursor
+from aging_contas import STATUS_ABERTO
+import fechamento_caixa
+import log_alteracoes
+
+FORMATOS = ("ofx", "cnab240", "cnab400")
+
+TAMANHO_LOTE = 1000
+
+TAMANHO_BLOCO = 64 * 1024
+
+# Diferença máxima em dias entre o lançamento e o vencimento / movimento
+JANELA_DIAS = 5
+
+# Lançamentos não conciliados devolvidos no relatório (os demais só contam)
+MAX_NAO_CONCILIADOS = 200
+
+# Códigos de ocorrência de retorno que indicam liquidação do título
+OCORRENCIAS_LIQUIDACAO = ("06", "15", "17")
+
+# Sentido do lançamento (crédito?) -> (tabela de contas, tipo do movimento, status e coluna da baixa, descrição)
+SENTIDOS = {
+    True: ("contas_receber", "entrada", "recebido", "data_recebimento", "Recebimento de conta"),
+    False: ("contas_pagar", "saida", "pago", "data_pagamento", "Pagamento de conta"),
+}
+
+class ExtratoInvalido(ValueError):
+    """Arquivo em formato desconhecido, registro malformado ou conta bancária inválida."""
+
+def _placeholders(valores):
+    return ", ".join(["%s"] * len(valores))
+
+def _centavos(valor):
+    return int((abs(valor) * 100).to_integral_value())
+
+def _valor(texto, contexto):
+    try:
+        return Decimal(texto.strip().replace(",", "."))
+    except InvalidOperation:
+        raise ExtratoInvalido(f"{contexto}: valor inválido '{texto.strip()}'")
+
+def _valor_cnab(campo, contexto):
+    if not campo.strip().isdigit():
+        raise ExtratoInvalido(f"{contexto}: valor inválido '{campo.strip()}'")
+    return Decimal(int(campo)).scaleb(-2)
+
+def _data(texto, formato, contexto):
+    """Data do campo ou None se vazio/zerado."""
+    texto = texto.strip()
+    if not texto or not texto.strip("0"):
+        return None
+    try:
+        return datetime.strptime(texto, formato).date()
+    except ValueError:
+        raise ExtratoInvalido(f"{contexto}: data inválida '{texto}'")
+
+# OFX
+
+_TAG_OFX = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+def _tags_ofx(arquivo):
+    """(fechamento, nome, valor) de cada tag, lendo o arquivo em blocos."""
+    resto = ""
+    while True:
+        bloco = arquivo.read(TAMANHO_BLOCO)
+        if not bloco:
+            break
+        texto = resto + bloco.decode("latin-1")
+        # O valor da última tag pode continuar no próximo bloco
+        corte = texto.rfind("<")
+        if corte <= 0:
+            resto = texto
+            continue
+        yield from _TAG_OFX.findall(texto[:corte])
+        resto = texto[corte:]
+    yield from _TAG_OFX.findall(resto)
+
+def _lancamento_ofx(transacao):
+    contexto = f"Transação OFX {transacao.get('FITID', '')}".strip()
+    if "TRNAMT" not in transacao or "DTPOSTED" not in transacao:
+        raise ExtratoInvalido(f"{contexto}: sem valor (TRNAMT) ou data (DTPOSTED)")
+
+    valor = _valor(transacao["TRNAMT"], contexto)
+    data = _data(transacao["DTPOSTED"][:8], "%Y%m%d", contexto)
+    if data is None:
+        raise ExtratoInvalido(f"{contexto}: data (DTPOSTED) zerada")
+    codigos = tuple(dict.fromkeys(
+        transacao[campo] for campo in ("CHECKNUM", "REFNUM") if transacao.get(campo)
+    ))
+    return {
+        "id_externo": transacao.get("FITID") or f"{data:%Y%m%d}/{valor}/{'/'.join(codigos)}",
+        "data": data,
+        "valor": valor,
+        "codigos": codigos,
+        "descricao": transacao.get("MEMO") or transacao.get("NAME"),
+    }
+
+def ler_ofx(arquivo):
+    """Lançamentos (STMTTRN) de um extrato OFX 1.x (SGML) ou 2.x (XML)."""
+    transacao = None
+    for fechamento, nome, valor in _tags_ofx(arquivo):
+        nome = nome.upper()
+        if nome == "STMTTRN":
+            if transacao:
+                yield _lancamento_ofx(transacao)
+            transacao = None if fechamento else {}
+        elif transacao is not None and not fechamento and valor.strip():
+            transacao[nome] = valor.strip()
+    if transacao:
+        yield _lancamento_ofx(transacao)
+
+# CNAB
+
+def _linhas(arquivo, tamanho, formato):
+    """(número, linha) dos registros não vazios, conferindo o tamanho."""
+    for numero, linha in enumerate(arquivo, start=1):
+        linha = linha.decode("latin-1").rstrip("\r\n")
+        if not linha.strip():
+            continue
+        if len(linha) < tamanho:
+            raise ExtratoInvalido(f"Linha {numero}: o registro {formato} deve ter {tamanho} posições")
+        yield numero, linha
+
+def ler_cnab240(arquivo):
+    """
+    Liquidações de um retorno de cobrança CNAB 240 (FEBRABAN): cada título
+    vem nos segmentos T (nosso número, seu número, ocorrência) e U (valor pago,
+    datas de ocorrência e de crédito).
+    """
+    titulo = None
+    for numero, linha in _linhas(arquivo, 240, "CNAB 240"):
+        if linha[7] != "3":
+            continue
+        segmento = linha[13]
+        if segmento == "T":
+            titulo = linha
+        elif segmento == "U" and titulo:
+            ocorrencia = titulo[15:17]
+            if ocorrencia in OCORRENCIAS_LIQUIDACAO:
+                contexto = f"Linha {numero}"
+                nosso_numero = titulo[37:57].strip()
+                data = (_data(linha[145:153], "%d%m%Y", contexto)
+                        or _data(linha[137:145], "%d%m%Y", contexto))
+                if data is None:
+                    raise ExtratoInvalido(f"{contexto}: liquidação sem data de ocorrência ou crédito")
+                yield {
+                    "id_externo": f"{nosso_numero}/{ocorrencia}/{data:%Y%m%d}",
+                    "data": data,
+                    "valor": _valor_cnab(linha[77:92], contexto),
+                    "codigos": tuple(dict.fromkeys(c for c in (titulo[58:73].strip(), nosso_numero) if c)),
+                    "descricao": f"Liquidação do título {nosso_numero}",
+                }
+            titulo = None
+
+def ler_cnab400(arquivo):
+    """
+    Liquidações de um retorno de cobrança CNAB 400 no leiaute Bradesco
+    (ocorrência, datas, seu número e valor pago nas mesmas posições do Itaú;
+    só o nosso número muda de banco para banco).
+    """
+    for numero, linha in _linhas(arquivo, 400, "CNAB 400"):
+        if linha[0] != "1":
+            continue
+        ocorrencia = linha[108:110]
+        if ocorrencia not in OCORRENCIAS_LIQUIDACAO:
+            continue
+        contexto = f"Linha {numero}"
+        nosso_numero = linha[70:82].strip()
+        data = (_data(linha[295:301], "%d%m%y", contexto)
+                or _data(linha[110:116], "%d%m%y", contexto))
+        if data is None:
+            raise ExtratoInvalido(f"{contexto}: liquidação sem data de ocorrência ou crédito")
+        yield {
+            "id_externo": f"{nosso_numero}/{ocorrencia}/{data:%Y%m%d}",
+            "data": data,
+            "valor": _valor_cnab(linha[253:266], contexto),
+            "codigos": tuple(dict.fromkeys(c for c in (linha[116:126].strip(), nosso_numero) if c)),
+            "descricao": f"Liquidação do título {nosso_numero}",
+        }
+
+LEITORES = {"ofx": ler_ofx, "cnab240": ler_cnab240, "cnab400": ler_cnab400}
+
+def detectar_formato(arquivo):
+    """Formato pelo início do arquivo (binário e posicionável; volta ao início)."""
+    inicio = arquivo.read(1024)
+    arquivo.seek(0)
+    texto = inicio.decode("latin-1")
+    if "OFXHEADER" in texto.upper() or "<OFX>" in texto.upper():
+        return "ofx"
+    primeira = texto.splitlines()[0] if texto.strip() else ""
+    if len(primeira) == 240:
+        return "cnab240"
+    if len(primeira) == 400:
+        return "cnab400"
+    raise ExtratoInvalido("Formato de arquivo não reconhecido. Envie um extrato OFX ou um retorno CNAB 240/400")
+
+# Conciliação
+
+def _lotes(lancamentos, tamanho):
+    lote = []
+    for lancamento in lancamentos:
+        lote.append(lancamento)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def _indexar(cursor, lancamentos):
+    """
+    Candidatos do lote: {"codigos": {(tabela, código): conta},
+    "valores": {(origem, centavos): [contas ou movimentos]}}.
+    Trava as contas abertas encontradas até o fim da transação.
+    """
+    inicio = min(lancamento["data"] for lancamento in lancamentos) - timedelta(days=JANELA_DIAS)
+    fim = max(lancamento["data"] for lancamento in lancamentos) + timedelta(days=JANELA_DIAS)
+    indice = {"codigos": {}, "valores": {}}
+
+    for credito, (tabela, tipo, *_) in SENTIDOS.items():
+        do_sentido = [lancamento for lancamento in lancamentos if (lancamento["valor"] > 0) == credito]
+        if not do_sentido:
+            continue
+        valores = sorted({abs(lancamento["valor"]) for lancamento in do_sentido})
+        codigos = sorted({codigo for lancamento in do_sentido for codigo in lancamento["codigos"]})
+
+        contas = {}
+        cursor.execute(
+            f"""
+            SELECT id, codigo, descricao, valor, data_vencimento FROM {tabela}
+            WHERE status IN ({_placeholders(STATUS_ABERTO)})
+              AND data_vencimento BETWEEN %s AND %s AND valor IN ({_placeholders(valores)})
+            FOR UPDATE
+            """,
+            [*STATUS_ABERTO, inicio, fim, *valores]
+        )
+        for conta in cursor.fetchall():
+            contas[conta["id"]] = conta
+        if codigos:
+            cursor.execute(
+                f"""
+                SELECT id, codigo, descricao, valor, data_vencimento FROM {tabela}
+                WHERE status IN ({_placeholders(STATUS_ABERTO)}) AND codigo IN ({_placeholders(codigos)})
+                FOR UPDATE
+                """,
+                [*STATUS_ABERTO, *codigos]
+            )
+            for conta in cursor.fetchall():
+                contas[conta["id"]] = conta
+
+        for conta in contas.values():
+            indice["codigos"][(tabela, conta["codigo"])] = conta
+            indice["valores"].setdefault((tabela, _centavos(conta["valor"])), []).append(conta)
+
+        cursor.execute(
+            f"""
+            SELECT mc.id, mc.valor, mc.data_movimento FROM movimentos_caixa mc
+            WHERE mc.tipo = %s AND mc.data_movimento BETWEEN %s AND %s AND mc.valor IN ({_placeholders(valores)})
+              AND NOT EXISTS (SELECT 1 FROM extrato_bancario e WHERE e.movimento_caixa_id = mc.id)
+            """,
+            [tipo, inicio, fim, *valores]
+        )
+        for movimento in cursor.fetchall():
+            indice["valores"].setdefault((tipo, _centavos(movimento["valor"])), []).append(movimento)
+
+    return indice
+
+def _procurar(lancamento, indice, usados):
+    """(origem, registro) que concilia o lançamento, ou (None, None)."""
+    tabela, tipo, *_ = SENTIDOS[lancamento["valor"] > 0]
+    centavos = _centavos(lancamento["valor"])
+
+    for codigo in lancamento["codigos"]:
+        conta = indice["codigos"].get((tabela, codigo))
+        if conta and (tabela, conta["id"]) not in usados:
+            return tabela, conta
+
+    movimentos = [
+        movimento for movimento in indice["valores"].get((tipo, centavos), ())
+        if ("movimentos_caixa", movimento["id"]) not in usados
+        and abs((movimento["data_movimento"] - lancamento["data"]).days) <= JANELA_DIAS
+    ]
+    if movimentos:
+        return "movimentos_caixa", min(
+            movimentos, key=lambda movimento: abs((movimento["data_movimento"] - lancamento["data"]).days)
+        )
+
+    contas = [
+        conta for conta in indice["valores"].get((tabela, centavos), ())
+        if (tabela, conta["id"]) not in usados
+        and abs((conta["data_vencimento"] - lancamento["data"]).days) <= JANELA_DIAS
+    ]
+    if len(contas) == 1:
+        return tabela, contas[0]
+    return None, None
+
+def _baixar(cursor, tabela, baixas, importacao_id, usuario_id):
+    """
+    Baixa as contas de 'baixas' [(conta, lançamento)] e registra um movimento de
+    caixa por conta. Retorna {conta_id: movimento_caixa_id}.
+    """
+    _, tipo, status_baixa, coluna_data, descricao = SENTIDOS[tabela == "contas_receber"]
+
+    por_data = {}
+    for conta, lancamento in baixas:
+        por_data.setdefault(lancamento["data"], []).append(conta["id"])
+    for data, ids in por_data.items():
+        cursor.execute(
+            f"UPDATE {tabela} SET status = %s, {coluna_data} = %s WHERE id IN ({_placeholders(ids)})",
+            [status_baixa, data, *ids]
+        )
+
+    cursor.execute(
+        f"""
+        INSERT INTO movimentos_caixa (
+            tipo, valor, data_movimento, descricao, documento_referencia, observacoes, usuario_id
+        )
+        VALUES {', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(baixas))}
+        """,
+        [
+            valor
+            for conta, lancamento in baixas
+            for valor in (
+                tipo, abs(lancamento["valor"]), lancamento["data"], f"{descricao}: {conta['descricao']}",
+                conta["codigo"], f"Conciliação bancária (importação {importacao_id})", usuario_id
+            )
+        ]
+    )
+    # Os ids de um INSERT de várias linhas não são necessariamente consecutivos
+    # (innodb_autoinc_lock_mode=2), mas nenhum é menor que LAST_INSERT_ID(): os
+    # movimentos são relidos pela importação e pelo código da conta, em ordem
+    cursor.execute("SELECT LAST_INSERT_ID()")
+    primeiro = cursor.fetchone()["LAST_INSERT_ID()"]
+    codigos = list(dict.fromkeys(conta["codigo"] for conta, _ in baixas))
+    cursor.execute(
+        f"""
+        SELECT id, documento_referencia FROM movimentos_caixa
+        WHERE id >= %s AND observacoes = %s AND documento_referencia IN ({_placeholders(codigos)})
+        ORDER BY id
+        """,
+        [primeiro, f"Conciliação bancária (importação {importacao_id})", *codigos]
+    )
+    por_codigo = {}
+    for linha in cursor.fetchall():
+        por_codigo.setdefault(linha["documento_referencia"], []).append(linha["id"])
+    movimentos = {conta["id"]: por_codigo[conta["codigo"]].pop(0) for conta, _ in baixas}
+
+    log_alteracoes.registrar(cursor, tabela, list(movimentos), "update", usuario_id)
+    log_alteracoes.registrar(cursor, "movimentos_caixa", list(movimentos.values()), "insert", usuario_id)
+    return movimentos
+
+def _conciliar_lote(cursor, lote, conta_bancaria_id, importacao_id, usuario_id, relatorio):
+    ids_externos = list(dict.fromkeys(lancamento["id_externo"] for lancamento in lote))
+    cursor.execute(
+        f"""
+        SELECT id_externo FROM extrato_bancario
+        WHERE conta_bancaria_id = %s AND situacao = 'conciliado' AND id_externo IN ({_placeholders(ids_externos)})
+        """,
+        [conta_bancaria_id, *ids_externos]
+    )
+    ignorados = {linha["id_externo"] for linha in cursor.fetchall()}
+
+    lancamentos = []
+    for lancamento in lote:
+        if lancamento["id_externo"] in ignorados:
+            relatorio["ja_conciliados"] += 1
+            continue
+        ignorados.add(lancamento["id_externo"])
+        lancamentos.append(lancamento)
+    if not lancamentos:
+        return
+
+    ultimo = fechamento_caixa.ultimo_fechamento(cursor, travar="share")
+    fechado_ate = ultimo["data"] if ultimo else None
+    indice = _indexar(cursor, lancamentos)
+
+    usados = set()
+    resultados = []  # (lançamento, situação, tabela da conta, conta, movimento)
+    baixas = {"contas_receber": [], "contas_pagar": []}
+    for lancamento in lancamentos:
+        origem, registro = _procurar(lancamento, indice, usados)
+        if origem == "movimentos_caixa":
+            usados.add((origem, registro["id"]))
+            resultados.append((lancamento, "conciliado", None, None, registro["id"]))
+        elif origem and fechado_ate and lancamento["data"] <= fechado_ate:
+            resultados.append((lancamento, "periodo_fechado", origem, registro, None))
+        elif origem:
+            usados.add((origem, registro["id"]))
+            baixas[origem].append((registro, lancamento))
+            resultados.append((lancamento, "conciliado", origem, registro, None))
+        else:
+            resultados.append((lancamento, "pendente", None, None, None))
+
+    movimentos = {
+        tabela: _baixar(cursor, tabela, itens, importacao_id, usuario_id)
+        for tabela, itens in baixas.items() if itens
+    }
+
+    linhas = []
+    for lancamento, situacao, tabela, conta, movimento_id in resultados:
+        if situacao == "conciliado":
+            if tabela:
+                movimento_id = movimentos[tabela][conta["id"]]
+            relatorio["conciliados"] += 1
+            relatorio["por_origem"][tabela or "movimentos_caixa"] += 1
+            relatorio["valor_conciliado"] += abs(lancamento["valor"])
+        else:
+            relatorio[situacao] += 1
+            if len(relatorio["nao_conciliados"]) < MAX_NAO_CONCILIADOS:
+                relatorio["nao_conciliados"].append({
+                    "id_externo": lancamento["id_externo"],
+                    "data": lancamento["data"],
+                    "valor": lancamento["valor"],
+                    "documento": lancamento["codigos"][0] if lancamento["codigos"] else None,
+                    "descricao": lancamento["descricao"],
+                    "situacao": situacao,
+                })
+        conta_id = conta["id"] if conta and situacao == "conciliado" else None
+        linhas.append((
+            importacao_id, conta_bancaria_id, lancamento["id_externo"][:100], lancamento["data"],
+            lancamento["valor"], (lancamento["codigos"][0][:50] if lancamento["codigos"] else None),
+            (lancamento["descricao"] or "")[:255] or None, situacao,
+            tabela if conta_id else None, conta_id, movimento_id
+        ))
+
+    cursor.execute(
+        f"""
+        INSERT INTO extrato_bancario (
+            importacao_id, conta_bancaria_id, id_externo, data, valor, documento, descricao,
+            situacao, conta_tabela, conta_id, movimento_caixa_id
+        )
+        VALUES {', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'] * len(linhas))}
+        ON DUPLICATE KEY UPDATE importacao_id = VALUES(importacao_id), situacao = VALUES(situacao),
+                                conta_tabela = VALUES(conta_tabela), conta_id = VALUES(conta_id),
+                                movimento_caixa_id = VALUES(movimento_caixa_id)
+        """,
+        [valor for linha in linhas for valor in linha]
+    )
+
+def importar(arquivo, conta_bancaria_id, usuario_id, nome_arquivo=None, formato=None, tamanho_lote=TAMANHO_LOTE):
+    """
+    Importa e concilia o extrato 'arquivo' (binário e posicionável) da conta
+    bancária, em lotes de uma transação cada. Retorna o relatório da importação.
+    """
+    formato = formato or detectar_formato(arquivo)
+    if formato not in LEITORES:
+        raise ExtratoInvalido(f"Formato inválido. Use: {', '.join(FORMATOS)}")
+
+    with get_db_cursor(commit=True) as cursor:
+        cursor.execute("SELECT id, ativo FROM contas_bancarias WHERE id = %s", (conta_bancaria_id,))
+        conta_bancaria = cursor.fetchone()
+        if not conta_bancaria or not conta_bancaria["ativo"]:
+            raise ExtratoInvalido("Conta bancária não encontrada ou inativa")
+
+        cursor.execute(
+            """
+            INSERT INTO importacoes_extrato (conta_bancaria_id, arquivo, formato, usuario_id)
+            VALUES (%s, %s, %s, %s)
+            """,
+            (conta_bancaria_id, (nome_arquivo or "")[:255] or None, formato, usuario_id)
+        )
+        cursor.execute("SELECT LAST_INSERT_ID()")
+        importacao_id = cursor.fetchone()["LAST_INSERT_ID()"]
+
+    relatorio = {
+        "importacao_id": importacao_id,
+        "formato": formato,
+        "lancamentos": 0,
+        "conciliados": 0,
+        "ja_conciliados": 0,
+        "pendente": 0,
+        "periodo_fechado": 0,
+        "por_origem": dict.fromkeys(("contas_receber", "contas_pagar", "movimentos_caixa"), 0),
+        "valor_conciliado": Decimal("0"),
+        "nao_conciliados": [],
+    }
+
+    try:
+        lancamentos = (lancamento for lancamento in LEITORES[formato](arquivo) if lancamento["valor"])
+        for lote in _lotes(lancamentos, tamanho_lote):
+            relatorio["lancamentos"] += len(lote)
+            with get_db_cursor(commit=True) as cursor:
+                _conciliar_lote(cursor, lote, conta_bancaria_id, importacao_id, usuario_id, relatorio)
+    finally:
+        # Lotes já gravados continuam valendo; reenviar o arquivo retoma do ponto do erro
+        with get_db_cursor(commit=True) as cursor:
+            cursor.execute(
+                """
+                UPDATE importacoes_extrato
+                SET lancamentos = %s, conciliados = %s, ja_conciliados = %s, pendentes = %s
+                WHERE id = %s
+                """,
+                (
+                    relatorio["lancamentos"], relatorio["conciliados"], relatorio["ja_conciliados"],
+                    relatorio["pendente"] + relatorio["periodo_fechado"], importacao_id
+                )
+            )
+
+    return relatorio
+
+def pendentes(cursor, conta_bancaria_id=None, limite=100, offset=0):
+    """Lançamentos importados ainda não conciliados, do mais recente para o mais antigo."""
+    sql = "SELECT * FROM extrato_bancario WHERE situacao <> 'conciliado'"
+    parametros = []
+    if conta_bancaria_id is not None:
+        sql += " AND conta_bancaria_id = %s"
+        parametros.append(conta_bancaria_id)
+    sql += " ORDER BY data DESC, id DESC LIMIT %s OFFSET %s"
+    cursor.execute(sql, [*parametros, limite, offset])
+    return cursor.fetchall()
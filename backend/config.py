@@ -10,10 +10,45 @@ DB_USER = os.getenv("DB_USER", "root")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 DB_NAME = os.getenv("DB_NAME", "erp_maneiro")
 
+# Driver do banco: mysql-connector, mysql-connector-c, mysqlclient ou pymysql
+DB_DRIVER = os.getenv("DB_DRIVER", "mysql-connector")
+# Conexões ociosas mantidas por servidor para reaproveitamento (0 = sem pool)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+# Prepared statements mantidos em cache por conexão
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "32"))
+# Tempo máximo para abrir uma conexão e para esperar a resposta de um comando (segundos)
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "3"))
+DB_READ_TIMEOUT = int(os.getenv("DB_READ_TIMEOUT", "30"))
+# Disjuntor: falhas de conexão seguidas até abrir e espera antes de testar de novo
+# (segundos; dobra a cada teste que falha, até a espera máxima)
+DB_DISJUNTOR_FALHAS = int(os.getenv("DB_DISJUNTOR_FALHAS", "3"))
+DB_DISJUNTOR_ESPERA = float(os.getenv("DB_DISJUNTOR_ESPERA", "2"))
+DB_DISJUNTOR_ESPERA_MAXIMA = float(os.getenv("DB_DISJUNTOR_ESPERA_MAXIMA", "30"))
+
+# Réplicas de leitura (formato: host1:3306,host2:3307). Vazio = somente o primário
+DB_REPLICA_HOSTS = [h.strip() for h in os.getenv("DB_REPLICA_HOSTS", "").split(",") if h.strip()]
+# Atraso máximo aceito em uma réplica (segundos) antes de voltar ao primário
+DB_REPLICA_MAX_LAG = int(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+# Intervalo entre verificações de atraso de cada réplica (segundos)
+DB_REPLICA_CHECK_INTERVAL = int(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))
+# Janela em que um usuário lê do primário depois de escrever (read-your-writes)
+DB_READ_YOUR_WRITES_SECONDS = int(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+
 # Configurações de segurança
 SECRET_KEY = os.getenv("SECRET_KEY", "chave_secreta_temporaria")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Embute a máscara de permissões do grupo no JWT (alterações no grupo valem a partir do próximo login)
+PERMISSOES_NO_TOKEN = os.getenv("PERMISSOES_NO_TOKEN", "false").lower() in ("1", "true", "sim")
+
+# Custo do bcrypt; hashes com custo diferente são refeitos no próximo login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Threads dedicadas ao hash de senhas (limita o uso de CPU em rajadas de login)
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+# Falhas de login permitidas por conta e por IP dentro da janela (segundos)
+LOGIN_MAX_FALHAS_CONTA = int(os.getenv("LOGIN_MAX_FALHAS_CONTA", "5"))
+LOGIN_MAX_FALHAS_IP = int(os.getenv("LOGIN_MAX_FALHAS_IP", "20"))
+LOGIN_JANELA_SEGUNDOS = int(os.getenv("LOGIN_JANELA_SEGUNDOS", "300"))
 
 # Configurações da aplicação
 APP_NAME = "ERP Maneiro"
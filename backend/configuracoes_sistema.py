@@ -0,0 +1,268 @@
+"""
+Serviço de configurações do sistema (tabela configuracoes).
+
+As configurações são lidas do banco uma vez por processo e mantidas em um
+snapshot em memória, já convertidas e validadas conforme CHAVES: obter() e
+listar() nunca consultam o banco. As gravações passam por salvar() e
+excluir(), que usam um único upsert, registram a alteração em
+log_alteracoes e recarregam o snapshot.
+
+Os demais processos (workers) percebem a alteração por uma verificação leve
+em segundo plano (COUNT/MAX do log da entidade 'configuracoes') e recarregam
+também. Módulos que guardam valores derivados das configurações registram
+um callback com ao_alterar() para descartar seus caches.
+"""
+
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+from database import get_db_cursor
+import log_alteracoes
+
+logger = logging.getLogger("configuracoes")
+
+ENTIDADE = "configuracoes"
+
+# Intervalo da verificação de alterações feitas por outros processos (segundos)
+INTERVALO_VERIFICACAO = 10
+
+class ConfiguracaoInvalida(ValueError):
+    """Valor que não pode ser convertido para o tipo da chave."""
+
+class Chave:
+    """Definição de uma configuração conhecida: tipo, valor padrão e limites."""
+
+    def __init__(self, tipo, padrao, descricao, minimo=None, maximo=None, opcoes=None):
+        self.tipo = tipo
+        self.padrao = padrao
+        self.descricao = descricao
+        self.minimo = minimo
+        self.maximo = maximo
+        self.opcoes = opcoes
+
+    def converter(self, valor):
+        """Converte o texto gravado no banco para o tipo da chave."""
+        texto = str(valor).strip() if valor is not None else ""
+        if not texto:
+            return self.padrao
+
+        if self.tipo == "int":
+            try:
+                numero = int(texto)
+            except ValueError:
+                raise ConfiguracaoInvalida(f"'{texto}' não é um número inteiro")
+            if (self.minimo is not None and numero < self.minimo) or (self.maximo is not None and numero > self.maximo):
+                raise ConfiguracaoInvalida(f"O valor deve estar entre {self.minimo} e {self.maximo}")
+            return numero
+
+        if self.tipo == "lista":
+            return [item.strip() for item in texto.split(",") if item.strip()]
+
+        if self.tipo == "dias":
+            try:
+                dias = [int(item) for item in texto.split(",") if item.strip()]
+            except ValueError:
+                raise ConfiguracaoInvalida(f"'{texto}' não é uma lista de dias (ex.: 30,60,90)")
+            if not dias or any(dia < 0 for dia in dias):
+                raise ConfiguracaoInvalida("Informe ao menos um prazo, sem valores negativos")
+            return dias
+
+        if self.tipo == "url":
+            partes = urlparse(texto)
+            if partes.scheme not in ("http", "https") or not partes.netloc:
+                raise ConfiguracaoInvalida(f"'{texto}' não é uma URL http(s) válida")
+            return texto.rstrip("/")
+
+        if self.opcoes and texto not in self.opcoes:
+            raise ConfiguracaoInvalida(f"Valor inválido. Use: {', '.join(self.opcoes)}")
+        return texto
+
+CHAVES = {
+    "link_api": Chave("url", "http://localhost:8000", "URL da API"),
+    "api_port": Chave("int", 8000, "Porta da API", minimo=1, maximo=65535),
+    "environment": Chave("str", "development", "Ambiente de execução da aplicação",
+                         opcoes=("development", "production")),
+    "allowed_origins": Chave("lista", [], "Origens permitidas para CORS"),
+    "timeout_time": Chave("int", 15, "Tempo limite de inatividade do usuário em minutos",
+                          minimo=1, maximo=1440),
+    "prazos_parcelamento": Chave("dias", [30], "Prazos em dias das parcelas geradas ao finalizar uma venda a prazo"),
+    "rastreamento_transportadoras": Chave("lista", [], "Transportadoras com rastreamento automático, como nome=URL base"),
+    "relatorios_cache_mb": Chave("int", 64, "Memória máxima em MB do cache de relatórios (0 desliga)",
+                                 minimo=0, maximo=4096),
+}
+
+_lock = threading.RLock()
+_valores = None     # chave -> valor convertido
+_registros = {}     # chave -> {"chave", "valor", "descricao"} como gravado no banco
+_marcador = None    # (quantidade, último id) do log da entidade no último carregamento
+_callbacks = []
+_vigia = None
+
+def _ler_marcador(cursor):
+    cursor.execute(
+        "SELECT COUNT(*) AS quantidade, COALESCE(MAX(id), 0) AS ultimo FROM log_alteracoes WHERE entidade = %s",
+        (ENTIDADE,)
+    )
+    linha = cursor.fetchone()
+    return (linha["quantidade"], linha["ultimo"])
+
+def _converter_todos(registros):
+    valores = {}
+    for chave, definicao in CHAVES.items():
+        registro = registros.get(chave)
+        try:
+            valores[chave] = definicao.converter(registro["valor"] if registro else None)
+        except ConfiguracaoInvalida as e:
+            logger.warning(f"Configuração '{chave}' inválida no banco ({e}). Usando o padrão.")
+            valores[chave] = definicao.padrao
+    return valores
+
+def recarregar():
+    """Relê as configurações do banco, troca o snapshot e notifica os callbacks."""
+    global _valores, _registros, _marcador
+
+    try:
+        with get_db_cursor() as cursor:
+            marcador = _ler_marcador(cursor)
+            cursor.execute("SELECT chave, valor, descricao FROM configuracoes")
+            registros = {linha["chave"]: linha for linha in cursor.fetchall()}
+    except Exception as e:
+        logger.error(f"Erro ao carregar configurações: {e}")
+        with _lock:
+            if _valores is None:
+                _valores = _converter_todos({})
+        return
+
+    valores = _converter_todos(registros)
+
+    with _lock:
+        anteriores = _registros if _valores is not None else None
+        _valores, _registros, _marcador = valores, registros, marcador
+
+    if anteriores is None:
+        return
+
+    alteradas = {
+        chave for chave in set(anteriores) | set(registros)
+        if (anteriores.get(chave) or {}).get("valor") != (registros.get(chave) or {}).get("valor")
+    }
+    if alteradas:
+        logger.info(f"Configurações alteradas: {', '.join(sorted(alteradas))}")
+        for callback in list(_callbacks):
+            try:
+                callback(alteradas)
+            except Exception:
+                logger.exception("Erro ao notificar alteração de configurações")
+
+def _vigiar():
+    """Recarrega o snapshot quando outro processo altera as configurações."""
+    while True:
+        time.sleep(INTERVALO_VERIFICACAO)
+        try:
+            with get_db_cursor() as cursor:
+                marcador = _ler_marcador(cursor)
+            if marcador != _marcador:
+                recarregar()
+        except Exception as e:
+            logger.error(f"Erro ao verificar alterações de configurações: {e}")
+
+def _snapshot():
+    global _vigia
+    if _valores is None:
+        with _lock:
+            if _valores is None:
+                recarregar()
+            if _vigia is None:
+                _vigia = threading.Thread(target=_vigiar, name="vigia-configuracoes", daemon=True)
+                _vigia.start()
+    return _valores
+
+def obter(chave):
+    """
+    Retorna o valor de uma configuração a partir do snapshot em memória.
+    Chaves conhecidas (CHAVES) vêm convertidas; as demais, como texto (ou None).
+    """
+    valores = _snapshot()
+    if chave in valores:
+        return valores[chave]
+    registro = _registros.get(chave)
+    return registro["valor"] if registro else None
+
+def carregado():
+    """Se o snapshot veio do banco (False enquanto só há os padrões por falha na leitura)."""
+    _snapshot()
+    return _marcador is not None
+
+def listar():
+    """Lista as configurações gravadas (chave, valor, descrição), sem ir ao banco."""
+    _snapshot()
+    return [dict(registro) for registro in _registros.values()]
+
+def existe(chave):
+    _snapshot()
+    return chave in _registros
+
+def validar(chave, valor):
+    """Valida o valor de uma chave conhecida. Levanta ConfiguracaoInvalida."""
+    if chave in CHAVES:
+        CHAVES[chave].converter(valor)
+
+def ao_alterar(callback):
+    """Registra uma função chamada com o conjunto de chaves alteradas a cada recarga."""
+    _callbacks.append(callback)
+    return callback
+
+def salvar(configuracoes, descricoes=None, usuario_id=None):
+    """
+    Grava várias configurações em um único upsert e recarrega o snapshot.
+    As chaves conhecidas são validadas antes (ConfiguracaoInvalida).
+    Retorna (criadas, atualizadas) com os nomes das chaves.
+    """
+    descricoes = descricoes or {}
+    for chave, valor in configuracoes.items():
+        try:
+            validar(chave, valor)
+        except ConfiguracaoInvalida as e:
+            raise ConfiguracaoInvalida(f"Configuração '{chave}': {e}")
+
+    chaves = list(configuracoes)
+    if not chaves:
+        return [], []
+
+    with get_db_cursor(commit=True) as cursor:
+        placeholders = ", ".join(["%s"] * len(chaves))
+        cursor.execute(f"SELECT chave FROM configuracoes WHERE chave IN ({placeholders})", chaves)
+        existentes = {linha["chave"] for linha in cursor.fetchall()}
+
+        cursor.execute(
+            f"""
+            INSERT INTO configuracoes (chave, valor, descricao)
+            VALUES {", ".join(["(%s, %s, %s)"] * len(chaves))}
+            ON DUPLICATE KEY UPDATE valor = VALUES(valor), descricao = COALESCE(VALUES(descricao), descricao)
+            """,
+            [item for chave in chaves for item in (chave, configuracoes[chave], descricoes.get(chave))]
+        )
+
+        cursor.execute(f"SELECT id, chave FROM configuracoes WHERE chave IN ({placeholders})", chaves)
+        ids = {linha["chave"]: linha["id"] for linha in cursor.fetchall()}
+        criadas = [chave for chave in chaves if chave not in existentes]
+        atualizadas = [chave for chave in chaves if chave in existentes]
+        log_alteracoes.registrar(cursor, ENTIDADE, [ids[c] for c in criadas], "insert", usuario_id)
+        log_alteracoes.registrar(cursor, ENTIDADE, [ids[c] for c in atualizadas], "update", usuario_id)
+
+    recarregar()
+    return criadas, atualizadas
+
+def excluir(chave, usuario_id=None):
+    """Exclui uma configuração e recarrega o snapshot. Retorna o registro excluído ou None."""
+    with get_db_cursor(commit=True) as cursor:
+        cursor.execute("SELECT id, chave, valor, descricao FROM configuracoes WHERE chave = %s", (chave,))
+        registro = cursor.fetchone()
+        if not registro:
+            return None
+        cursor.execute("DELETE FROM configuracoes WHERE id = %s", (registro["id"],))
+        log_alteracoes.registrar(cursor, ENTIDADE, registro["id"], "delete", usuario_id)
+
+    recarregar()
+    return registro
@@ -0,0 +1,238 @@
+"""
+Cubo de vendas e compras por produto e mês.
+
+A tabela cubo_produto_mensal guarda, para cada (produto, mês), a quantidade
+vendida, a receita, o custo das vendas, a margem e o que foi comprado. Ela é
+mantida de forma incremental pelos handlers de venda e compra (criação,
+cancelamento e exclusão) dentro da mesma transação do pedido, de modo que
+rankings de produtos por período viram leituras por faixa de meses em vez
+de junções sobre todo o histórico de itens.
+
+Para reconstruir a partir do histórico use reconstruir_cubo.py.
+"""
+
+from datetime import date, timedelta
+
+# Status que tiram um pedido de venda das estatísticas (o banco compara sem caixa)
+STATUS_VENDA_CANCELADA = ("cancelado", "cancelada")
+
+# Medidas disponíveis para ordenar rankings
+MEDIDAS = ("quantidade_vendida", "receita", "custo", "margem", "quantidade_comprada", "valor_comprado")
+
+def venda_cancelada(status):
+    return (status or "").lower() in STATUS_VENDA_CANCELADA
+
+def _mes(coluna):
+    """Expressão SQL do primeiro dia do mês da coluna (sem '%', que os drivers tratam como parâmetro)."""
+    return f"DATE_SUB(DATE({coluna}), INTERVAL DAYOFMONTH({coluna}) - 1 DAY)"
+
+def _placeholders(ids):
+    return ", ".join(["%s"] * len(ids))
+
+def registrar_vendas(cursor, pedido_ids, sinal=1):
+    """
+    Soma (sinal=1) ou estorna (sinal=-1) no cubo os itens dos pedidos de venda,
+    no mês de data_pedido. Chame na mesma transação que grava o pedido.
+    """
+    if not pedido_ids:
+        return
+    cursor.execute(
+        f"""
+        INSERT INTO cubo_produto_mensal (produto_id, mes, quantidade_vendida, receita, custo)
+        SELECT i.produto_id, {_mes("pv.data_pedido")},
+               %s * SUM(i.quantidade), %s * SUM(i.subtotal),
+               %s * SUM(i.quantidade * COALESCE(i.custo_unitario, 0))
+        FROM itens_pedido_venda i
+        JOIN pedidos_venda pv ON pv.id = i.pedido_id
+        WHERE i.pedido_id IN ({_placeholders(pedido_ids)})
+        GROUP BY i.produto_id, {_mes("pv.data_pedido")}
+        ON DUPLICATE KEY UPDATE
+            quantidade_vendida = quantidade_vendida + VALUES(quantidade_vendida),
+            receita = receita + VALUES(receita),
+            custo = custo + VALUES(custo)
+        """,
+        [sinal, sinal, sinal] + list(pedido_ids)
+    )
+
+def registrar_compras(cursor, pedido_ids, sinal=1):
+    """
+    Soma (sinal=1) ou estorna (sinal=-1) no cubo os itens dos pedidos de compra,
+    no mês de data_pedido. Chame na mesma transação que grava o pedido.
+    """
+    if not pedido_ids:
+        return
+    cursor.execute(
+        f"""
+        INSERT INTO cubo_produto_mensal (produto_id, mes, quantidade_comprada, valor_comprado)
+        SELECT i.produto_id, {_mes("pc.data_pedido")},
+               %s * SUM(i.quantidade), %s * SUM(i.subtotal)
+        FROM itens_pedido_compra i
+        JOIN pedidos_compra pc ON pc.id = i.pedido_id
+        WHERE i.pedido_id IN ({_placeholders(pedido_ids)})
+        GROUP BY i.produto_id, {_mes("pc.data_pedido")}
+        ON DUPLICATE KEY UPDATE
+            quantidade_comprada = quantidade_comprada + VALUES(quantidade_comprada),
+            valor_comprado = valor_comprado + VALUES(valor_comprado)
+        """,
+        [sinal, sinal] + list(pedido_ids)
+    )
+
+def _primeiro_mes_sem_arquivo(cursor):
+    """Primeiro mês sem vendas arquivadas (ver arquivo_historico); 1970-01-01 se nada foi arquivado."""
+    cursor.execute("SELECT arquivado_ate FROM arquivamentos WHERE tabela = 'pedidos_venda'")
+    linha = cursor.fetchone()
+    if not linha:
+        return date(1970, 1, 1)
+    corte = linha["arquivado_ate"]
+    return corte if corte.day == 1 else _inicio_mes_seguinte(corte)
+
+def reconstruir(cursor, desde=None):
+    """
+    Recalcula o cubo a partir do histórico de pedidos.
+    Com 'desde' (date), só os meses a partir dele são recalculados.
+
+    As vendas dos meses com pedidos arquivados (antes de arquivado_ate) são
+    mantidas: o arquivo só guarda pedidos fechados, cujo lançamento no cubo
+    não muda mais. As compras, que não são arquivadas, são refeitas em todos
+    os meses a partir de 'desde'.
+    """
+    mes_inicial = date(desde.year, desde.month, 1) if desde else date(1970, 1, 1)
+    mes_vendas = max(mes_inicial, _primeiro_mes_sem_arquivo(cursor))
+
+    cursor.execute(
+        "UPDATE cubo_produto_mensal SET quantidade_comprada = 0, valor_comprado = 0 WHERE mes >= %s AND mes < %s",
+        (mes_inicial, mes_vendas)
+    )
+    cursor.execute("DELETE FROM cubo_produto_mensal WHERE mes >= %s", (mes_vendas,))
+
+    cursor.execute(
+        f"""
+        INSERT INTO cubo_produto_mensal (produto_id, mes, quantidade_vendida, receita, custo)
+        SELECT i.produto_id, {_mes("pv.data_pedido")},
+               SUM(i.quantidade), SUM(i.subtotal),
+               SUM(i.quantidade * COALESCE(i.custo_unitario, 0))
+        FROM itens_pedido_venda i
+        JOIN pedidos_venda pv ON pv.id = i.pedido_id
+        WHERE pv.data_pedido >= %s
+        AND pv.status NOT IN ({_placeholders(STATUS_VENDA_CANCELADA)})
+        GROUP BY i.produto_id, {_mes("pv.data_pedido")}
+        """,
+        [mes_vendas, *STATUS_VENDA_CANCELADA]
+    )
+    vendas = cursor.rowcount
+
+    cursor.execute(
+        f"""
+        INSERT INTO cubo_produto_mensal (produto_id, mes, quantidade_comprada, valor_comprado)
+        SELECT i.produto_id, {_mes("pc.data_pedido")},
+               SUM(i.quantidade), SUM(i.subtotal)
+        FROM itens_pedido_compra i
+        JOIN pedidos_compra pc ON pc.id = i.pedido_id
+        WHERE pc.data_pedido >= %s
+        AND pc.status != 'cancelado'
+        GROUP BY i.produto_id, {_mes("pc.data_pedido")}
+        ON DUPLICATE KEY UPDATE
+            quantidade_comprada = VALUES(quantidade_comprada),
+            valor_comprado = VALUES(valor_comprado)
+        """,
+        (mes_inicial,)
+    )
+    compras = cursor.rowcount
+
+    return vendas, compras
+
+def _inicio_mes_seguinte(dia):
+    return date(dia.year + dia.month // 12, dia.month % 12 + 1, 1)
+
+def _dividir_periodo(data_inicio, data_fim):
+    """
+    Divide o período [data_inicio, data_fim] (dias inteiros) em meses completos,
+    lidos do cubo, e pontas parciais, lidas dos itens.
+    Retorna ((mes_ini, mes_fim_exclusivo) ou None, [(ini, fim_exclusivo), ...]).
+    """
+    fim_exclusivo = data_fim + timedelta(days=1)
+    primeiro_mes = data_inicio if data_inicio.day == 1 else _inicio_mes_seguinte(data_inicio)
+    ultimo_mes = date(fim_exclusivo.year, fim_exclusivo.month, 1)
+
+    if primeiro_mes >= ultimo_mes:
+        return None, [(data_inicio, fim_exclusivo)]
+
+    pontas = []
+    if data_inicio < primeiro_mes:
+        pontas.append((data_inicio, primeiro_mes))
+    if ultimo_mes < fim_exclusivo:
+        pontas.append((ultimo_mes, fim_exclusivo))
+    return (primeiro_mes, ultimo_mes), pontas
+
+def ranking_produtos(cursor, data_inicio, data_fim, medida="receita", limite=10):
+    """
+    Ranking de produtos no período, ordenado pela medida (ver MEDIDAS).
+    Meses completos vêm do cubo; apenas os dias das pontas parciais do período
+    são somados a partir dos itens de pedido.
+    """
+    if medida not in MEDIDAS:
+        raise ValueError(f"Medida inválida: {medida}")
+
+    meses, pontas = _dividir_periodo(data_inicio, data_fim)
+    partes = []
+    params = []
+
+    if meses:
+        partes.append(
+            """
+            SELECT produto_id, quantidade_vendida, receita, custo,
+                   quantidade_comprada, valor_comprado
+            FROM cubo_produto_mensal
+            WHERE mes >= %s AND mes < %s
+            """
+        )
+        params.extend(meses)
+
+    if pontas:
+        filtro_venda = " OR ".join(["(pv.data_pedido >= %s AND pv.data_pedido < %s)"] * len(pontas))
+        filtro_compra = filtro_venda.replace("pv.", "pc.")
+        datas = [d for ponta in pontas for d in ponta]
+
+        partes.append(
+            f"""
+            SELECT i.produto_id, i.quantidade AS quantidade_vendida, i.subtotal AS receita,
+                   i.quantidade * COALESCE(i.custo_unitario, 0) AS custo,
+                   0 AS quantidade_comprada, 0 AS valor_comprado
+            FROM itens_pedido_venda i
+            JOIN pedidos_venda pv ON pv.id = i.pedido_id
+            WHERE ({filtro_venda})
+            AND pv.status NOT IN ({_placeholders(STATUS_VENDA_CANCELADA)})
+            """
+        )
+        params.extend(datas + list(STATUS_VENDA_CANCELADA))
+
+        partes.append(
+            f"""
+            SELECT i.produto_id, 0, 0, 0, i.quantidade, i.subtotal
+            FROM itens_pedido_compra i
+            JOIN pedidos_compra pc ON pc.id = i.pedido_id
+            WHERE ({filtro_compra})
+            AND pc.status != 'cancelado'
+            """
+        )
+        params.extend(datas)
+
+    cursor.execute(
+        f"""
+        SELECT t.produto_id, p.nome AS produto,
+               SUM(t.quantidade_vendida) AS quantidade_vendida,
+               SUM(t.receita) AS receita,
+               SUM(t.custo) AS custo,
+               SUM(t.receita) - SUM(t.custo) AS margem,
+               SUM(t.quantidade_comprada) AS quantidade_comprada,
+               SUM(t.valor_comprado) AS valor_comprado
+        FROM ({" UNION ALL ".join(partes)}) t
+        JOIN produtos p ON p.id = t.produto_id
+        GROUP BY t.produto_id, p.nome
+        HAVING {medida} > 0
+        ORDER BY {medida} DESC
+        LIMIT %s
+        """,
+        params + [limite]
+    )
+    return cursor.fetchall()
@@ -0,0 +1,209 @@
+"""
+Custo médio ponderado por produto.
+
+produtos.custo_medio é atualizado a cada recebimento de pedido de compra:
+    novo = (estoque * custo_medio + quantidade * custo_compra) / (estoque + quantidade)
+Na venda, o custo médio do momento é gravado em cada item
+(itens_pedido_venda.custo_unitario) e o total no pedido (pedidos_venda.custo_produto),
+de modo que o lucro é só valor_total - custo_produto, sem junções na leitura.
+
+Produtos sem custo médio calculado usam preco_custo.
+Para recalcular o histórico use backfill_custos.py.
+"""
+
+import bisect
+import arquivo_historico
+import log_alteracoes
+
+# Custo em vigor de um produto, em SQL (alias 'p' para produtos)
+CUSTO_ATUAL_SQL = "COALESCE(p.custo_medio, p.preco_custo)"
+
+MOTIVO_RECEBIMENTO_COMPRA = "Recebimento de pedido de compra"
+
+def _placeholders(ids):
+    return ", ".join(["%s"] * len(ids))
+
+def registrar_entrada_compra(cursor, produto_id, quantidade, custo_unitario):
+    """
+    Dá entrada no estoque de um item comprado e recalcula o custo médio.
+    Com estoque zerado ou negativo o custo médio passa a ser o custo da compra.
+    """
+    # O MySQL avalia as atribuições da esquerda para a direita: custo_medio usa o estoque anterior
+    cursor.execute(
+        """
+        UPDATE produtos p
+        SET p.custo_medio = CASE
+                WHEN p.estoque_atual <= 0 THEN %s
+                ELSE (p.estoque_atual * COALESCE(p.custo_medio, p.preco_custo) + %s * %s)
+                     / (p.estoque_atual + %s)
+            END,
+            p.estoque_atual = p.estoque_atual + %s
+        WHERE p.id = %s
+        """,
+        (custo_unitario, quantidade, custo_unitario, quantidade, quantidade, produto_id)
+    )
+
+def registrar_entradas_compra(cursor, itens):
+    """
+    Versão em lote de registrar_entrada_compra para itens (produto_id, quantidade,
+    custo_unitario): um único UPDATE, com os itens do mesmo produto somados e o
+    custo ponderado pela quantidade.
+    """
+    por_produto = {}
+    for produto_id, quantidade, custo_unitario in itens:
+        total = por_produto.setdefault(produto_id, [0, 0])
+        total[0] += quantidade
+        total[1] += quantidade * float(custo_unitario)
+    if not por_produto:
+        return
+
+    entradas = " UNION ALL ".join(["SELECT %s AS produto_id, %s AS quantidade, %s AS custo"] * len(por_produto))
+    parametros = []
+    for produto_id, (quantidade, valor) in por_produto.items():
+        parametros.extend([produto_id, quantidade, valor / quantidade])
+
+    cursor.execute(
+        f"""
+        UPDATE produtos p
+        JOIN ({entradas}) e ON e.produto_id = p.id
+        SET p.custo_medio = CASE
+                WHEN p.estoque_atual <= 0 THEN e.custo
+                ELSE (p.estoque_atual * COALESCE(p.custo_medio, p.preco_custo) + e.quantidade * e.custo)
+                     / (p.estoque_atual + e.quantidade)
+            END,
+            p.estoque_atual = p.estoque_atual + e.quantidade
+        """,
+        parametros
+    )
+
+def fixar_custos(cursor, pedido_ids):
+    """
+    Grava nos itens o custo médio vigente de cada produto e no pedido o custo total.
+    Chame na mesma transação que grava o pedido de venda.
+    """
+    if not pedido_ids:
+        return
+    placeholders = _placeholders(pedido_ids)
+    cursor.execute(
+        f"""
+        UPDATE itens_pedido_venda i
+        JOIN produtos p ON p.id = i.produto_id
+        SET i.custo_unitario = {CUSTO_ATUAL_SQL}
+        WHERE i.pedido_id IN ({placeholders})
+        """,
+        list(pedido_ids)
+    )
+    atualizar_custo_pedidos(cursor, pedido_ids)
+
+def atualizar_custo_pedidos(cursor, pedido_ids=None):
+    """Soma o custo dos itens em pedidos_venda.custo_produto (todos os pedidos se pedido_ids for None)."""
+    filtro = f"WHERE pedido_id IN ({_placeholders(pedido_ids)})" if pedido_ids else ""
+    cursor.execute(
+        f"""
+        UPDATE pedidos_venda pv
+        JOIN (
+            SELECT pedido_id, SUM(quantidade * COALESCE(custo_unitario, 0)) AS custo
+            FROM itens_pedido_venda
+            {filtro}
+            GROUP BY pedido_id
+        ) c ON c.pedido_id = pv.id
+        SET pv.custo_produto = c.custo
+        """,
+        list(pedido_ids) if pedido_ids else None
+    )
+
+def recalcular_historico_produto(cursor, produto_id):
+    """
+    Refaz o custo médio de um produto repetindo suas movimentações em ordem
+    cronológica e grava, em cada item vendido, o custo médio vigente na data
+    do pedido. Atualiza também produtos.custo_medio.
+
+    O estoque anterior à primeira movimentação é deduzido do saldo atual
+    (ou zero, se houve ajustes absolutos) e avaliado a preco_custo.
+    As movimentações arquivadas entram na repetição; os itens de pedidos
+    arquivados mantêm o custo gravado.
+    Retorna a quantidade de itens de venda atualizados.
+    """
+    cursor.execute(
+        "SELECT preco_custo, estoque_atual FROM produtos WHERE id = %s",
+        (produto_id,)
+    )
+    produto = cursor.fetchone()
+    if not produto:
+        return 0
+
+    # Inclui as movimentações arquivadas: sem elas o custo e o estoque inicial mudariam
+    movimentacoes, parametros = arquivo_historico.fonte(cursor, "movimentacao_estoque")
+    cursor.execute(
+        f"""
+        SELECT m.data_movimentacao AS momento, m.tipo, m.quantidade, m.motivo,
+               (SELECT SUM(ic.subtotal) / SUM(ic.quantidade)
+                FROM itens_pedido_compra ic
+                JOIN pedidos_compra pc ON pc.id = ic.pedido_id
+                WHERE pc.codigo = m.documento_referencia
+                AND ic.produto_id = m.produto_id) AS custo_compra
+        FROM {movimentacoes} m
+        WHERE m.produto_id = %s
+        ORDER BY m.data_movimentacao, m.id
+        """,
+        [*parametros, produto_id]
+    )
+    movimentacoes = cursor.fetchall()
+
+    if any(m["tipo"] == "ajuste" for m in movimentacoes):
+        estoque = 0
+    else:
+        liquido = sum(m["quantidade"] if m["tipo"] == "entrada" else -m["quantidade"] for m in movimentacoes)
+        estoque = max(produto["estoque_atual"] - liquido, 0)
+
+    custo = float(produto["preco_custo"])
+    momentos = []
+    custos = []
+    for m in movimentacoes:
+        if m["tipo"] == "entrada":
+            if m["motivo"] == MOTIVO_RECEBIMENTO_COMPRA and m["custo_compra"] is not None:
+                custo_compra = float(m["custo_compra"])
+                if estoque <= 0:
+                    custo = custo_compra
+                else:
+                    custo = (estoque * custo + m["quantidade"] * custo_compra) / (estoque + m["quantidade"])
+                momentos.append(m["momento"])
+                custos.append(custo)
+            estoque += m["quantidade"]
+        elif m["tipo"] == "saida":
+            estoque -= m["quantidade"]
+        else:
+            estoque = m["quantidade"]
+
+    cursor.execute(
+        """
+        SELECT i.id, i.pedido_id, pv.data_pedido
+        FROM itens_pedido_venda i
+        JOIN pedidos_venda pv ON pv.id = i.pedido_id
+        WHERE i.produto_id = %s
+        """,
+        (produto_id,)
+    )
+    itens = cursor.fetchall()
+
+    custo_inicial = float(produto["preco_custo"])
+    atualizacoes = []
+    for item in itens:
+        # Custo vigente: o da última compra recebida até a data do pedido
+        posicao = bisect.bisect_right(momentos, item["data_pedido"])
+        atualizacoes.append((custos[posicao - 1] if posicao else custo_inicial, item["id"]))
+
+    if atualizacoes:
+        cursor.executemany(
+            "UPDATE itens_pedido_venda SET custo_unitario = %s WHERE id = %s",
+            atualizacoes
+        )
+
+    cursor.execute(
+        "UPDATE produtos SET custo_medio = %s WHERE id = %s",
+        (custo, produto_id)
+    )
+    log_alteracoes.registrar(cursor, "produtos", produto_id, "update")
+    log_alteracoes.registrar(cursor, "pedidos_venda", [item["pedido_id"] for item in itens], "update")
+
+    return len(atualizacoes)
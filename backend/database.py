@@ -1,42 +1,471 @@
-import mysql.connector
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
 from contextlib import contextmanager
-from config import DB_HOST, DB_USER, DB_PASSWORD, DB_NAME
+from contextvars import ContextVar
+from db_drivers import obter_driver
+from disjuntor import Disjuntor, erro_de_conexao
+from config import (
+    DB_HOST, DB_USER, DB_PASSWORD, DB_NAME,
+    DB_DRIVER, DB_POOL_SIZE, DB_STATEMENT_CACHE_SIZE,
+    DB_CONNECT_TIMEOUT, DB_READ_TIMEOUT,
+    DB_REPLICA_HOSTS, DB_REPLICA_MAX_LAG, DB_REPLICA_CHECK_INTERVAL,
+    DB_READ_YOUR_WRITES_SECONDS
+)
+
+logger = logging.getLogger("database")
+
+# Driver selecionado por configuração (ver db_drivers.py)
+driver = obter_driver(DB_DRIVER)
 
 # Configurações do banco de dados
 db_config = {
     'host': DB_HOST,
     'user': DB_USER,
     'password': DB_PASSWORD,
-    'database': DB_NAME
+    'database': DB_NAME,
+    # Sem limite, um banco fora do ar prende cada worker no connect até o timeout do sistema
+    'connection_timeout': DB_CONNECT_TIMEOUT,
+    'read_timeout': DB_READ_TIMEOUT,
 }
 
-@contextmanager
-def get_db_connection():
+def sem_timeout_leitura():
     """
-    Gerenciador de contexto para conexões com o banco de dados.
-    Garante que a conexão seja fechada após o uso.
+    Tira o limite de espera pela resposta de um comando (DB_READ_TIMEOUT) das
+    conexões abertas daqui em diante. Para os scripts em lote, cujas
+    consultas passam do limite pensado para as rotas; chame antes de abrir
+    a primeira conexão.
+    """
+    for config in (db_config, *replica_configs):
+        config.pop('read_timeout', None)
+
+def _replica_config(endpoint):
+    """Monta a configuração de conexão de uma réplica a partir de 'host[:porta]'."""
+    config = dict(db_config)
+    if ":" in endpoint:
+        host, port = endpoint.rsplit(":", 1)
+        config['host'] = host
+        config['port'] = int(port)
+    else:
+        config['host'] = endpoint
+    return config
+
+# Configurações das réplicas de leitura
+replica_configs = [_replica_config(endpoint) for endpoint in DB_REPLICA_HOSTS]
+
+# Estado das réplicas: índice -> (momento da verificação, saudável)
+_replica_status = {}
+_replica_status_lock = threading.Lock()
+_replica_rr = itertools.count()
+
+# Último momento de escrita por usuário, para garantir read-your-writes
+_ultima_escrita = {}
+_ultima_escrita_lock = threading.Lock()
+
+# Estado por requisição: usuário autenticado e preferência de leitura em réplica
+_usuario_atual = ContextVar("usuario_atual", default=None)
+_preferir_replica = ContextVar("preferir_replica", default=False)
+
+def definir_usuario_atual(usuario_id):
+    """
+    Associa o usuário autenticado à requisição atual.
+    Escritas posteriores na mesma requisição tornam o usuário "aderente" ao primário.
     """
-    conn = None
+    _usuario_atual.set(usuario_id)
+
+async def usar_replica_leitura():
+    """
+    Dependência para opt-in de roteadores analíticos:
+    leituras sem commit da requisição passam a ser servidas por uma réplica.
+    Uso: APIRouter(dependencies=[Depends(usar_replica_leitura)])
+    """
+    _preferir_replica.set(True)
+
+def registrar_escrita(usuario_id=None):
+    """Registra que o usuário escreveu no primário agora."""
+    usuario_id = usuario_id if usuario_id is not None else _usuario_atual.get()
+    if usuario_id is None:
+        return
+    with _ultima_escrita_lock:
+        _ultima_escrita[usuario_id] = time.monotonic()
+
+def _usuario_aderente_ao_primario():
+    """Verifica se o usuário da requisição escreveu há menos de DB_READ_YOUR_WRITES_SECONDS."""
+    usuario_id = _usuario_atual.get()
+    if usuario_id is None:
+        return False
+    with _ultima_escrita_lock:
+        ultima = _ultima_escrita.get(usuario_id)
+    return ultima is not None and time.monotonic() - ultima < DB_READ_YOUR_WRITES_SECONDS
+
+def _verificar_atraso_replica(config):
+    """
+    Consulta o atraso de replicação da réplica.
+    Retorna True se a réplica estiver replicando com atraso aceitável.
+    """
+    conn = driver.connect(dict(config, connection_timeout=2))
     try:
-        conn = mysql.connector.connect(**db_config)
-        yield conn
+        cursor = driver.cursor(conn)
+        try:
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except driver.Error:
+                # MySQL anterior à 8.0.22
+                cursor.execute("SHOW SLAVE STATUS")
+            status = cursor.fetchone()
+        finally:
+            cursor.close()
     finally:
-        if conn is not None and conn.is_connected():
-            conn.close()
+        conn.close()
+
+    if not status:
+        return False
+    atraso = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+    return atraso is not None and atraso <= DB_REPLICA_MAX_LAG
+
+def _replica_saudavel(indice):
+    """Retorna o estado da réplica, reaproveitando a última verificação dentro do intervalo."""
+    agora = time.monotonic()
+    with _replica_status_lock:
+        verificado_em, saudavel = _replica_status.get(indice, (None, False))
+    if verificado_em is not None and agora - verificado_em < DB_REPLICA_CHECK_INTERVAL:
+        return saudavel
+
+    try:
+        saudavel = _verificar_atraso_replica(replica_configs[indice])
+    except Exception as e:
+        logger.warning(f"Réplica {replica_configs[indice]['host']} indisponível: {e}")
+        saudavel = False
+
+    if not saudavel:
+        logger.info(f"Réplica {replica_configs[indice]['host']} fora do limite de atraso, usando o primário")
+
+    with _replica_status_lock:
+        _replica_status[indice] = (agora, saudavel)
+    return saudavel
+
+def estado_replicas():
+    """
+    Saúde e momento da última verificação de cada réplica. Refaz as verificações
+    vencidas (bloqueante; no máximo uma por DB_REPLICA_CHECK_INTERVAL).
+    """
+    estados = []
+    for indice, config in enumerate(replica_configs):
+        saudavel = _replica_saudavel(indice)
+        with _replica_status_lock:
+            verificado_em, _ = _replica_status.get(indice, (None, False))
+        estados.append({
+            "host": config['host'],
+            "saudavel": saudavel,
+            "verificada_ha_segundos": round(time.monotonic() - verificado_em, 1) if verificado_em else None,
+        })
+    return estados
+
+def _escolher_replica():
+    """
+    Escolhe uma réplica saudável em rodízio. Retorna None se nenhuma estiver disponível.
+    Réplicas com o disjuntor aberto são puladas sem verificação.
+    """
+    if not replica_configs:
+        return None
+    inicio = next(_replica_rr)
+    for deslocamento in range(len(replica_configs)):
+        indice = (inicio + deslocamento) % len(replica_configs)
+        if not _pool_para(replica_configs[indice]).disjuntor.disponivel():
+            continue
+        if _replica_saudavel(indice):
+            return replica_configs[indice]
+    return None
+
+class CacheComandos:
+    """
+    Cache LRU de prepared statements de uma conexão.
+    Cada texto SQL fica associado a um cursor preparado que mantém o
+    statement alocado no servidor enquanto a conexão estiver viva.
+    """
+
+    def __init__(self, conn, tamanho=DB_STATEMENT_CACHE_SIZE):
+        self.conn = conn
+        self.tamanho = tamanho
+        self._cursores = OrderedDict()
+
+    def cursor_para(self, query):
+        cursor = self._cursores.get(query)
+        if cursor is not None:
+            self._cursores.move_to_end(query)
+            return cursor
+
+        cursor = driver.cursor_preparado(self.conn)
+        self._cursores[query] = cursor
+        if len(self._cursores) > self.tamanho:
+            _, antigo = self._cursores.popitem(last=False)
+            self._fechar_cursor(antigo)
+        return cursor
+
+    def descartar(self, query):
+        cursor = self._cursores.pop(query, None)
+        if cursor is not None:
+            self._fechar_cursor(cursor)
+
+    def fechar(self):
+        while self._cursores:
+            _, cursor = self._cursores.popitem()
+            self._fechar_cursor(cursor)
+
+    @staticmethod
+    def _fechar_cursor(cursor):
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+class ConexaoBanco:
+    """Conexão do driver acompanhada do seu cache de prepared statements."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.comandos = CacheComandos(conn) if driver.suporta_preparado else None
+
+    def fechar(self):
+        if self.comandos is not None:
+            self.comandos.fechar()
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+class PoolConexoes:
+    """
+    Pool simples de conexões ociosas para um servidor.
+    Reaproveitar conexões mantém os prepared statements vivos entre requisições.
+    O disjuntor do servidor (ver disjuntor.py) rejeita obter() enquanto ele está fora.
+    """
+
+    def __init__(self, config, tamanho=DB_POOL_SIZE):
+        self.config = config
+        self._ociosas = queue.LifoQueue(maxsize=max(tamanho, 0) or 1)
+        self.tamanho = tamanho
+        self.em_uso = 0
+        self._em_uso_lock = threading.Lock()
+        servidor = config['host'] + (f":{config['port']}" if config.get('port') else "")
+        self.disjuntor = Disjuntor(servidor)
+
+    def registrar_erro(self, erro):
+        """Conta a exceção no disjuntor se for falha de conexão."""
+        if erro_de_conexao(erro, driver.codigo_erro(erro)):
+            self.disjuntor.falha()
+        else:
+            # O servidor respondeu (ex.: senha errada): não está fora do ar
+            self.disjuntor.sucesso()
+
+    def _contar(self, delta):
+        with self._em_uso_lock:
+            self.em_uso += delta
+
+    def obter(self):
+        self.disjuntor.permitir()
+        while True:
+            try:
+                conexao = self._ociosas.get_nowait()
+            except queue.Empty:
+                try:
+                    conexao = ConexaoBanco(driver.connect(self.config))
+                except Exception as e:
+                    self.registrar_erro(e)
+                    raise
+                self.disjuntor.sucesso()
+                self._contar(1)
+                return conexao
+            # Ping com o timeout de conexão: um servidor travado não prende a requisição
+            # pelo timeout de leitura
+            if driver.conectado(conexao.conn, DB_CONNECT_TIMEOUT):
+                self.disjuntor.sucesso()
+                self._contar(1)
+                return conexao
+            # Ping sem resposta conta como falha. As demais ociosas são da mesma época e
+            # provavelmente estão no mesmo estado: são descartadas, e a decisão fica com
+            # a abertura de uma conexão nova (se o disjuntor ainda permitir)
+            conexao.fechar()
+            self.disjuntor.falha()
+            self._descartar_ociosas()
+            self.disjuntor.permitir()
+
+    def _descartar_ociosas(self):
+        while True:
+            try:
+                self._ociosas.get_nowait().fechar()
+            except queue.Empty:
+                return
+
+    def descartar(self, conexao):
+        """Fecha uma conexão em uso em vez de devolvê-la ao pool."""
+        self._contar(-1)
+        conexao.fechar()
+
+    def estado(self):
+        """Conexões em uso e ociosas; em_uso acima do tamanho indica pool saturado."""
+        return {
+            "host": self.config['host'],
+            "tamanho": self.tamanho,
+            "em_uso": self.em_uso,
+            "ociosas": self._ociosas.qsize(),
+            "disjuntor": self.disjuntor.estado_atual(),
+        }
+
+    def devolver(self, conexao):
+        self._contar(-1)
+        if self.tamanho <= 0:
+            conexao.fechar()
+            return
+        try:
+            # Encerra qualquer transação aberta para não reaproveitar um snapshot antigo
+            conexao.conn.rollback()
+            self._ociosas.put_nowait(conexao)
+        except Exception:
+            conexao.fechar()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _pool_para(config):
+    chave = (config['host'], config.get('port'))
+    with _pools_lock:
+        pool = _pools.get(chave)
+        if pool is None:
+            pool = _pools[chave] = PoolConexoes(config)
+        return pool
+
+def estado_pools():
+    """Estado de cada pool de conexões (primário e réplicas já usadas), sem ir ao banco."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.estado() for pool in pools]
+
+@contextmanager
+def _obter_conexao(config=None):
+    pool = _pool_para(config or db_config)
+    conexao = pool.obter()
+    try:
+        yield conexao
+    except driver.Error:
+        # Erro do banco deixa a conexão em estado incerto: não volta ao pool. Erros
+        # no meio do uso (inclusive timeout de uma consulta lenta) não contam no
+        # disjuntor: se o servidor caiu, a próxima conexão ou ping percebe
+        pool.descartar(conexao)
+        raise
+    except BaseException:
+        # Erros da aplicação (ex.: HTTPException) não afetam a conexão
+        pool.devolver(conexao)
+        raise
+    else:
+        pool.devolver(conexao)
+
+@contextmanager
+def get_db_connection(config=None):
+    """
+    Gerenciador de contexto para conexões com o banco de dados.
+    Garante que a conexão seja devolvida ao pool (ou fechada) após o uso.
+    Por padrão conecta ao primário; 'config' permite conectar a uma réplica.
+    """
+    with _obter_conexao(config) as conexao:
+        yield conexao.conn
+
+class CursorPreparado:
+    """
+    Cursor com a mesma interface usada pelos roteadores (execute, executemany,
+    fetchone, fetchall, lastrowid, rowcount) que executa comandos parametrizados
+    como prepared statements em cache na conexão.
+    Comandos sem parâmetros, ou drivers sem suporte, usam o cursor comum.
+    """
+
+    def __init__(self, conexao, cursor_texto):
+        self._comandos = conexao.comandos
+        self._texto = cursor_texto
+        self._linhas = None
+        self.lastrowid = None
+        self.rowcount = -1
+
+    def execute(self, query, params=None):
+        if self._comandos is None or not params:
+            self._linhas = None
+            self._texto.execute(query, params)
+            self.lastrowid = self._texto.lastrowid
+            self.rowcount = self._texto.rowcount
+            return
+
+        cursor = self._comandos.cursor_para(query)
+        try:
+            cursor.execute(query, tuple(params))
+            linhas = cursor.fetchall() if cursor.description else []
+        except Exception:
+            self._comandos.descartar(query)
+            raise
+
+        colunas = [coluna[0] for coluna in cursor.description or ()]
+        self._linhas = [dict(zip(colunas, linha)) for linha in linhas]
+        self.lastrowid = cursor.lastrowid
+        self.rowcount = cursor.rowcount
+
+    def executemany(self, query, seq_params):
+        # O driver reescreve INSERT ... VALUES em um único comando multi-linha,
+        # o que é mais rápido que repetir o prepared statement linha a linha
+        self._linhas = None
+        self._texto.executemany(query, seq_params)
+        self.lastrowid = self._texto.lastrowid
+        self.rowcount = self._texto.rowcount
+
+    def fetchone(self):
+        if self._linhas is None:
+            return self._texto.fetchone()
+        return self._linhas.pop(0) if self._linhas else None
+
+    def fetchall(self):
+        if self._linhas is None:
+            return self._texto.fetchall()
+        linhas, self._linhas = self._linhas, []
+        return linhas
+
+    def nextset(self):
+        return None if self._linhas is not None else self._texto.nextset()
+
+    def close(self):
+        self._texto.close()
 
 @contextmanager
-def get_db_cursor(commit=False):
+def get_db_cursor(commit=False, read_only=None, prepared=False):
     """
     Gerenciador de contexto para cursores de banco de dados.
     Opcionalmente realiza commit após as operações.
+
+    read_only=True envia a leitura para uma réplica saudável; read_only=None segue
+    a preferência do roteador (usar_replica_leitura); read_only=False força o primário.
+    Leituras voltam ao primário quando o usuário escreveu recentemente ou quando
+    nenhuma réplica está dentro do limite de atraso.
+
+    prepared=True executa os comandos parametrizados como prepared statements
+    reaproveitados pela conexão; use nas consultas mais quentes.
     """
-    with get_db_connection() as conn:
+    if read_only is None:
+        read_only = _preferir_replica.get()
+
+    config = None
+    if read_only and not commit and not _usuario_aderente_ao_primario():
+        config = _escolher_replica()
+
+    with _obter_conexao(config) as conexao:
+        conn = conexao.conn
         # Add buffered=True to prevent "Unread result found" errors
-        cursor = conn.cursor(dictionary=True, buffered=True)
+        cursor = driver.cursor(conn, buffered=True)
+        if prepared:
+            cursor = CursorPreparado(conexao, cursor)
         try:
             yield cursor
             if commit:
                 conn.commit()
+                registrar_escrita()
         except Exception:
             if commit:
                 conn.rollback()
@@ -52,11 +481,12 @@ def get_db_cursor_unbuffered(commit=False):
     Use quando você souber que vai consumir todos os resultados.
     """
     with get_db_connection() as conn:
-        cursor = conn.cursor(dictionary=True, buffered=False)
+        cursor = driver.cursor(conn, buffered=False)
         try:
             yield cursor
             if commit:
                 conn.commit()
+                registrar_escrita()
         except Exception:
             if commit:
                 conn.rollback()
@@ -81,11 +511,11 @@ def safe_execute(cursor, query, params=None):
             pass
     except:
         pass
-    
+
     # Execute the query
     if params:
         cursor.execute(query, params)
     else:
         cursor.execute(query)
-    
-    return cursor
\ No newline at end of file
+
+    return cursor
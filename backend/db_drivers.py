@@ -0,0 +1,182 @@
+"""
+Drivers de banco de dados suportados pelo ERP.
+
+Cada driver expõe a mesma interface mínima usada por database.py:
+conexão, cursor de dicionário (bufferizado ou não), cursor preparado
+(quando o driver suporta prepared statements no servidor) e a
+classe base de erros. O driver é escolhido pela variável DB_DRIVER:
+
+- mysql-connector    conector oficial em Python puro (padrão)
+- mysql-connector-c  conector oficial usando a extensão em C
+- mysqlclient        MySQLdb (libmysqlclient)
+- pymysql            PyMySQL
+
+mysqlclient e PyMySQL só falam o protocolo de texto; para eles os
+comandos "preparados" são executados como consultas comuns.
+
+A configuração segue o formato do mysql.connector, mais 'read_timeout'
+(segundos de espera pela resposta de um comando), que cada driver aplica
+do seu jeito. conectado() aceita um timeout próprio para o ping, aplicado
+pelo mysql-connector em Python puro e pelo PyMySQL; os drivers em C não
+trocam o timeout de uma conexão aberta e usam o de leitura.
+"""
+
+class DriverBase:
+    nome = ""
+    suporta_preparado = False
+
+    # Chaves de configuração no formato do mysql.connector -> formato do driver
+    _chaves_config = {}
+
+    @property
+    def Error(self):
+        raise NotImplementedError
+
+    def _traduzir_config(self, config):
+        return {self._chaves_config.get(chave, chave): valor for chave, valor in config.items()}
+
+    def connect(self, config):
+        raise NotImplementedError
+
+    def cursor(self, conn, buffered=True):
+        """Cursor que devolve as linhas como dicionários."""
+        raise NotImplementedError
+
+    def cursor_preparado(self, conn):
+        """Cursor de prepared statement no servidor (linhas como tuplas)."""
+        raise NotImplementedError
+
+    def conectado(self, conn, timeout=None):
+        """Testa a conexão (ping), esperando a resposta no máximo 'timeout' segundos quando suportado."""
+        raise NotImplementedError
+
+    def codigo_erro(self, erro):
+        """Código de erro do MySQL (ex.: 1213 para deadlock) de uma exceção do driver."""
+        codigo = getattr(erro, "errno", None)
+        if codigo is None and getattr(erro, "args", None):
+            codigo = erro.args[0]
+        return codigo if isinstance(codigo, int) else None
+
+
+class MySQLConnectorDriver(DriverBase):
+    suporta_preparado = True
+
+    def __init__(self, use_pure):
+        import mysql.connector
+        self._mysql = mysql.connector
+        self.use_pure = use_pure
+        self.nome = "mysql-connector" if use_pure else "mysql-connector-c"
+        if not use_pure and not mysql.connector.HAVE_CEXT:
+            raise RuntimeError("A extensão em C do mysql-connector não está disponível nesta instalação")
+
+    @property
+    def Error(self):
+        return self._mysql.Error
+
+    def connect(self, config):
+        config = dict(config)
+        read_timeout = config.pop("read_timeout", None)
+        conn = self._mysql.connect(use_pure=self.use_pure, **config)
+        # O conector não tem read_timeout: a versão em Python puro zera o timeout
+        # do socket depois de conectar, então ele é definido aqui. A extensão em C
+        # só aceita o timeout de conexão.
+        if read_timeout and self.use_pure:
+            conn._socket.set_connection_timeout(read_timeout)
+        return conn
+
+    def cursor(self, conn, buffered=True):
+        return conn.cursor(dictionary=True, buffered=buffered)
+
+    def cursor_preparado(self, conn):
+        return conn.cursor(prepared=True)
+
+    def conectado(self, conn, timeout=None):
+        if not (timeout and self.use_pure):
+            return conn.is_connected()
+        anterior = conn._socket._connection_timeout
+        conn._socket.set_connection_timeout(timeout)
+        try:
+            return conn.is_connected()
+        except Exception:
+            return False
+        finally:
+            conn._socket.set_connection_timeout(anterior)
+
+
+class MySQLClientDriver(DriverBase):
+    nome = "mysqlclient"
+    _chaves_config = {"connection_timeout": "connect_timeout"}
+
+    def __init__(self):
+        import MySQLdb
+        import MySQLdb.cursors
+        self._mysqldb = MySQLdb
+
+    @property
+    def Error(self):
+        return self._mysqldb.Error
+
+    def connect(self, config):
+        return self._mysqldb.connect(charset="utf8mb4", **self._traduzir_config(config))
+
+    def cursor(self, conn, buffered=True):
+        cursores = self._mysqldb.cursors
+        return conn.cursor(cursores.DictCursor if buffered else cursores.SSDictCursor)
+
+    def conectado(self, conn, timeout=None):
+        try:
+            conn.ping()
+            return True
+        except self._mysqldb.Error:
+            return False
+
+
+class PyMySQLDriver(DriverBase):
+    nome = "pymysql"
+    _chaves_config = {"connection_timeout": "connect_timeout"}
+
+    def __init__(self):
+        import pymysql
+        import pymysql.cursors
+        self._pymysql = pymysql
+
+    @property
+    def Error(self):
+        return self._pymysql.MySQLError
+
+    def connect(self, config):
+        return self._pymysql.connect(charset="utf8mb4", **self._traduzir_config(config))
+
+    def cursor(self, conn, buffered=True):
+        cursores = self._pymysql.cursors
+        return conn.cursor(cursores.DictCursor if buffered else cursores.SSDictCursor)
+
+    def conectado(self, conn, timeout=None):
+        if timeout and conn._sock:
+            conn._sock.settimeout(timeout)
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except (self._pymysql.MySQLError, OSError):
+            return False
+        finally:
+            # Uma falha fecha o socket; senão volta ao timeout de leitura
+            if timeout and conn._sock:
+                conn._sock.settimeout(conn._read_timeout)
+
+
+DRIVERS = {
+    "mysql-connector": lambda: MySQLConnectorDriver(use_pure=True),
+    "mysql-connector-c": lambda: MySQLConnectorDriver(use_pure=False),
+    "mysqlclient": MySQLClientDriver,
+    "pymysql": PyMySQLDriver,
+}
+
+def obter_driver(nome):
+    """Instancia o driver pelo nome configurado em DB_DRIVER."""
+    if nome not in DRIVERS:
+        raise ValueError(f"Driver de banco desconhecido: '{nome}'. Opções: {', '.join(DRIVERS)}")
+    try:
+        return DRIVERS[nome]()
+    except ImportError as e:
+        raise RuntimeError(f"O driver '{nome}' não está instalado: {e}")
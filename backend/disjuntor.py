@@ -0,0 +1,151 @@
+"""
+Disjuntor (circuit breaker) das conexões com o banco.
+
+Cada servidor (primário e réplicas) tem um disjuntor. Depois de
+DB_DISJUNTOR_FALHAS falhas de conexão seguidas ele abre: as requisições
+falham na hora com BancoIndisponivel (503 com Retry-After) em vez de
+esperarem o timeout de conexão e se acumularem nos workers. Passada a
+espera, o disjuntor fica meio aberto e deixa passar uma única requisição
+de teste; se ela conectar, fecha; se falhar, abre de novo com a espera
+dobrada (até DB_DISJUNTOR_ESPERA_MAXIMA). A espera tem variação aleatória
+de ±50% para que vários processos não testem o banco ao mesmo tempo
+depois de um failover.
+
+Só contam como falha os erros ao abrir uma conexão (servidor fora, timeout
+de conexão, excesso de conexões) e o ping sem resposta de uma conexão
+ociosa. Erros durante um comando, inclusive o timeout de leitura de uma
+consulta lenta, e erros de SQL não abrem o disjuntor.
+"""
+
+import logging
+import random
+import threading
+import time
+from config import DB_DISJUNTOR_FALHAS, DB_DISJUNTOR_ESPERA, DB_DISJUNTOR_ESPERA_MAXIMA
+
+logger = logging.getLogger("database")
+
+FECHADO = "fechado"
+ABERTO = "aberto"
+MEIO_ABERTO = "meio_aberto"
+
+# Códigos de erro do MySQL que, ao conectar, indicam problema de conexão e não de
+# credenciais ou configuração
+ERROS_CONEXAO = {
+    1040,  # Too many connections
+    1053,  # Server shutdown in progress
+    2002,  # Can't connect through socket
+    2003,  # Can't connect to MySQL server
+    2005,  # Unknown MySQL server host
+    2006,  # MySQL server has gone away
+    2013,  # Lost connection to MySQL server during query
+    2055,  # Lost connection to MySQL server at '%s', system error
+}
+
+class BancoIndisponivel(Exception):
+    """O disjuntor do servidor está aberto; tente de novo em 'espera' segundos."""
+
+    def __init__(self, servidor, espera):
+        super().__init__(f"Banco de dados {servidor} indisponível; nova tentativa em {espera:.0f}s")
+        self.servidor = servidor
+        self.espera = espera
+
+class Disjuntor:
+    def __init__(self, servidor, falhas=DB_DISJUNTOR_FALHAS, espera=DB_DISJUNTOR_ESPERA,
+                 espera_maxima=DB_DISJUNTOR_ESPERA_MAXIMA):
+        self.servidor = servidor
+        self.limite_falhas = falhas
+        self.espera_base = espera
+        self.espera_maxima = espera_maxima
+
+        self.estado = FECHADO
+        self.falhas_consecutivas = 0
+        self._espera = espera
+        self._proxima_tentativa = 0.0
+        self._teste_em_andamento = False
+        self._lock = threading.Lock()
+
+        # Métricas
+        self.aberturas = 0
+        self.meio_aberturas = 0
+        self.fechamentos = 0
+        self.rejeitadas = 0
+        self.ultima_transicao = None
+
+    def _transicao(self, estado):
+        self.estado = estado
+        self.ultima_transicao = time.time()
+
+    def _abrir(self):
+        self._espera = min(self._espera * 2, self.espera_maxima) if self.estado == MEIO_ABERTO else self.espera_base
+        self._proxima_tentativa = time.monotonic() + self._espera * random.uniform(0.5, 1.5)
+        self._teste_em_andamento = False
+        self.aberturas += 1
+        self._transicao(ABERTO)
+        logger.warning(
+            f"Disjuntor do banco {self.servidor} aberto após {self.falhas_consecutivas} falha(s); "
+            f"nova tentativa em {self._proxima_tentativa - time.monotonic():.1f}s"
+        )
+
+    def disponivel(self):
+        """Se uma requisição agora seria aceita (sem reservar o teste do meio aberto)."""
+        return self.estado == FECHADO or (
+            not self._teste_em_andamento and time.monotonic() >= self._proxima_tentativa
+        )
+
+    def permitir(self):
+        """Libera a requisição ou lança BancoIndisponivel. Chame antes de conectar."""
+        if self.estado == FECHADO:
+            return
+        with self._lock:
+            if self.estado == FECHADO:
+                return
+            agora = time.monotonic()
+            if self.estado == ABERTO and agora >= self._proxima_tentativa:
+                # Uma única requisição testa o servidor; as demais continuam rejeitadas
+                self.meio_aberturas += 1
+                self._teste_em_andamento = True
+                self._transicao(MEIO_ABERTO)
+                logger.info(f"Disjuntor do banco {self.servidor} meio aberto: testando a conexão")
+                return
+            self.rejeitadas += 1
+            raise BancoIndisponivel(self.servidor, max(self._proxima_tentativa - agora, 1))
+
+    def sucesso(self):
+        if self.estado == FECHADO and not self.falhas_consecutivas:
+            return
+        with self._lock:
+            self.falhas_consecutivas = 0
+            if self.estado != FECHADO:
+                self._espera = self.espera_base
+                self._teste_em_andamento = False
+                self.fechamentos += 1
+                self._transicao(FECHADO)
+                logger.info(f"Disjuntor do banco {self.servidor} fechado: conexão restabelecida")
+
+    def falha(self):
+        with self._lock:
+            self.falhas_consecutivas += 1
+            if self.estado == MEIO_ABERTO or (
+                self.estado == FECHADO and self.falhas_consecutivas >= self.limite_falhas
+            ):
+                self._abrir()
+
+    def estado_atual(self):
+        return {
+            "servidor": self.servidor,
+            "estado": self.estado,
+            "falhas_consecutivas": self.falhas_consecutivas,
+            "aberturas": self.aberturas,
+            "meio_aberturas": self.meio_aberturas,
+            "fechamentos": self.fechamentos,
+            "rejeitadas": self.rejeitadas,
+            "ultima_transicao": self.ultima_transicao,
+        }
+
+def erro_de_conexao(erro, codigo):
+    """
+    Se a exceção ao conectar (com o código MySQL já extraído pelo driver) indica
+    falha de conexão. Não use para erros durante um comando.
+    """
+    return codigo in ERROS_CONEXAO or isinstance(erro, (OSError, TimeoutError))
@@ -0,0 +1,150 @@
+"""
+Canal de eventos em tempo real (Server-Sent Events).
+
+Um único publicador por processo acompanha o log de alterações
+(log_alteracoes) e distribui deltas compactos aos clientes conectados,
+por tópico:
+- vendas: pedido de venda criado, alterado ou excluído
+- estoque: saldo de produto alterado
+- caixa: movimento de caixa lançado ou excluído
+- financeiro: conta a pagar/receber criada, alterada ou excluída
+
+O publicador só consulta o banco enquanto há clientes conectados, e uma
+leitura serve a todos. Cada cliente tem uma fila limitada: se não consumir
+rápido o bastante, os eventos pendentes são descartados e ele recebe um
+evento 'ressincronizar' para recarregar a tela.
+"""
+
+import asyncio
+import json
+import logging
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from database import get_db_cursor
+import log_alteracoes
+
+logger = logging.getLogger("eventos")
+
+TOPICOS = {
+    "vendas": ("pedidos_venda",),
+    "estoque": ("produtos",),
+    "caixa": ("movimentos_caixa",),
+    "financeiro": ("contas_pagar", "contas_receber"),
+}
+TOPICO_ENTIDADE = {entidade: topico for topico, entidades in TOPICOS.items() for entidade in entidades}
+
+# Estado atual enviado em cada delta (só o necessário para atualizar a tela)
+CONSULTAS = {
+    "pedidos_venda": """
+        SELECT pv.id, pv.codigo, pv.status, pv.valor_total, pv.custo_produto,
+               pv.data_pedido, p.nome AS cliente_nome
+        FROM pedidos_venda pv
+        LEFT JOIN parceiros p ON p.id = pv.cliente_id
+        WHERE pv.id IN ({})
+    """,
+    "produtos": "SELECT id, nome, estoque_atual, estoque_minimo FROM produtos WHERE id IN ({})",
+    "movimentos_caixa": "SELECT id, tipo, valor, descricao, data_movimento FROM movimentos_caixa WHERE id IN ({})",
+    "contas_pagar": "SELECT id, codigo, status, valor, data_vencimento FROM contas_pagar WHERE id IN ({})",
+    "contas_receber": "SELECT id, codigo, status, valor, data_vencimento FROM contas_receber WHERE id IN ({})",
+}
+
+INTERVALO_LEITURA = 1.0
+INTERVALO_PING = 15
+TAMANHO_FILA = 200
+LIMITE_LEITURA = 500
+
+def _ultimo_offset():
+    """Horizonte confirmado do log: começar do MAX(id) pularia transações ainda não confirmadas."""
+    with get_db_cursor() as cursor:
+        return log_alteracoes.confirmado_ate(cursor)
+
+def _ler_eventos(offset):
+    """Lê o log a partir de 'offset' e monta os eventos. Retorna (eventos, novo offset)."""
+    with get_db_cursor() as cursor:
+        alteracoes, proximo = log_alteracoes.ler(cursor, offset, LIMITE_LEITURA)
+
+        # Só a última alteração de cada registro importa: o estado enviado é o atual
+        ultimas = {}
+        for alteracao in alteracoes:
+            if alteracao["entidade"] in TOPICO_ENTIDADE:
+                ultimas[(alteracao["entidade"], alteracao["entidade_id"])] = alteracao
+
+        estados = {}
+        por_entidade = {}
+        for (entidade, entidade_id), alteracao in ultimas.items():
+            if alteracao["operacao"] != "delete":
+                por_entidade.setdefault(entidade, []).append(entidade_id)
+        for entidade, ids in por_entidade.items():
+            cursor.execute(CONSULTAS[entidade].format(", ".join(["%s"] * len(ids))), ids)
+            for row in cursor.fetchall():
+                estados[(entidade, row["id"])] = row
+
+    eventos = [
+        {
+            "topico": TOPICO_ENTIDADE[alteracao["entidade"]],
+            "tipo": f"{alteracao['entidade']}.{alteracao['operacao']}",
+            "id": alteracao["entidade_id"],
+            "offset": alteracao["id"],
+            "dados": estados.get(chave),
+        }
+        for chave, alteracao in sorted(ultimas.items(), key=lambda item: item[1]["id"])
+    ]
+    return jsonable_encoder(eventos), proximo
+
+def formatar(evento):
+    """Serializa um evento no formato text/event-stream."""
+    linhas = [f"event: {evento['topico']}"]
+    if evento.get("offset"):
+        linhas.append(f"id: {evento['offset']}")
+    linhas.append(f"data: {json.dumps(evento, ensure_ascii=False)}")
+    return "\n".join(linhas) + "\n\n"
+
+class Assinante:
+    def __init__(self, topicos):
+        self.topicos = set(topicos)
+        self.fila = asyncio.Queue(maxsize=TAMANHO_FILA)
+
+    def entregar(self, evento):
+        try:
+            self.fila.put_nowait(evento)
+        except asyncio.QueueFull:
+            # Cliente lento: descarta o atraso e pede que recarregue o estado
+            while not self.fila.empty():
+                self.fila.get_nowait()
+            self.fila.put_nowait({"topico": "sistema", "tipo": "ressincronizar"})
+
+class Publicador:
+    def __init__(self):
+        self.assinantes = set()
+        self.tarefa = None
+
+    def assinar(self, topicos):
+        assinante = Assinante(topicos)
+        self.assinantes.add(assinante)
+        if self.tarefa is None or self.tarefa.done():
+            self.tarefa = asyncio.get_running_loop().create_task(self._acompanhar())
+        return assinante
+
+    def cancelar(self, assinante):
+        self.assinantes.discard(assinante)
+
+    def publicar(self, evento):
+        for assinante in list(self.assinantes):
+            if evento["topico"] in assinante.topicos or evento["topico"] == "sistema":
+                assinante.entregar(evento)
+
+    async def _acompanhar(self):
+        """Lê o log enquanto houver assinantes; recomeça do fim do log na próxima assinatura."""
+        offset = None
+        while self.assinantes:
+            try:
+                if offset is None:
+                    offset = await run_in_threadpool(_ultimo_offset)
+                eventos, offset = await run_in_threadpool(_ler_eventos, offset)
+                for evento in eventos:
+                    self.publicar(evento)
+            except Exception:
+                logger.exception("Erro ao ler o log de alterações para o canal de eventos")
+            await asyncio.sleep(INTERVALO_LEITURA)
+
+publicador = Publicador()
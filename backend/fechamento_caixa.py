@@ -0,0 +1,184 @@
+"""
+Fechamento diário do caixa.
+
+Cada dia fechado tem uma linha em fechamentos_caixa com saldo inicial,
+entradas, saídas e saldo final. O saldo atual é o saldo final do último
+fechamento mais os movimentos dos dias ainda abertos, e os totais de um
+período somam os fechamentos do período mais esses mesmos dias abertos: o
+custo depende do tamanho do período, não do histórico.
+
+Dias fechados não aceitam movimentos novos nem exclusões (garantir_aberto).
+Para corrigir um dia fechado, reabra-o (reabrir) e feche novamente.
+"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+from fastapi import HTTPException, status
+import arquivo_historico
+
+def ultimo_fechamento(cursor, travar=None):
+    """
+    Último dia fechado (linha de fechamentos_caixa) ou None.
+    travar='share' impede novos fechamentos até o fim da transação;
+    travar='update' também impede movimentos concorrentes em dias abertos.
+    """
+    sql = "SELECT * FROM fechamentos_caixa ORDER BY data DESC LIMIT 1"
+    if travar == "share":
+        sql += " LOCK IN SHARE MODE"
+    elif travar == "update":
+        sql += " FOR UPDATE"
+    cursor.execute(sql)
+    return cursor.fetchone()
+
+def fechamento_cobrindo(cursor, data):
+    """
+    Fechamento do primeiro dia fechado a partir de 'data', ou None se 'data'
+    ainda está aberta. Como os dias são fechados em sequência, é o fechamento
+    que cobre 'data'; reabrir 'data' o apaga.
+    """
+    cursor.execute(
+        "SELECT data, data_fechamento FROM fechamentos_caixa WHERE data >= %s ORDER BY data LIMIT 1",
+        (data,)
+    )
+    return cursor.fetchone()
+
+def garantir_aberto(cursor, data_movimento):
+    """Impede alterações em dias já fechados. Use na mesma transação da alteração."""
+    ultimo = ultimo_fechamento(cursor, travar="share")
+    if ultimo and data_movimento <= ultimo["data"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"O caixa está fechado até {ultimo['data']:%d/%m/%Y}; reabra o período para alterá-lo"
+        )
+
+def diario(cursor, inicio, fim):
+    """
+    Tabela derivada (data_movimento, entradas, saidas) do período [inicio, fim]:
+    um registro por dia fechado (de fechamentos_caixa) e um por movimento
+    dos dias ainda abertos. Retorna (sql, parâmetros) para usar em FROM.
+    """
+    ultimo = ultimo_fechamento(cursor)
+    partes = []
+    parametros = []
+
+    if ultimo and inicio <= ultimo["data"]:
+        partes.append(
+            "SELECT data AS data_movimento, entradas, saidas FROM fechamentos_caixa WHERE data BETWEEN %s AND %s"
+        )
+        parametros.extend([inicio, min(fim, ultimo["data"])])
+
+    inicio_aberto = max(inicio, ultimo["data"] + timedelta(days=1)) if ultimo else inicio
+    if inicio_aberto <= fim or not partes:
+        movimentos, params_movimentos = arquivo_historico.fonte(cursor, "movimentos_caixa", inicio_aberto, fim)
+        partes.append(
+            f"""
+            SELECT data_movimento,
+                   CASE WHEN tipo = 'entrada' THEN valor ELSE 0 END AS entradas,
+                   CASE WHEN tipo = 'saida' THEN valor ELSE 0 END AS saidas
+            FROM {movimentos} mc
+            WHERE data_movimento BETWEEN %s AND %s
+            """
+        )
+        parametros.extend([*params_movimentos, inicio_aberto, fim])
+
+    return f"({' UNION ALL '.join(partes)})", parametros
+
+def totais(cursor, inicio, fim):
+    """Entradas e saídas do período [inicio, fim]."""
+    origem, parametros = diario(cursor, inicio, fim)
+    cursor.execute(
+        f"""
+        SELECT COALESCE(SUM(entradas), 0) AS entradas, COALESCE(SUM(saidas), 0) AS saidas
+        FROM {origem} d
+        """,
+        parametros
+    )
+    return cursor.fetchone()
+
+def saldo_atual(cursor):
+    """Saldo final do último fechamento mais os movimentos dos dias abertos."""
+    ultimo = ultimo_fechamento(cursor)
+    saldo = ultimo["saldo_final"] if ultimo else Decimal("0")
+
+    inicio = ultimo["data"] + timedelta(days=1) if ultimo else None
+
+    movimentos, parametros = arquivo_historico.fonte(cursor, "movimentos_caixa", inicio)
+    sql = f"""
+        SELECT COALESCE(SUM(CASE WHEN tipo = 'entrada' THEN valor ELSE -valor END), 0) AS saldo
+        FROM {movimentos} mc
+    """
+    if inicio:
+        sql += " WHERE data_movimento >= %s"
+        parametros = [*parametros, inicio]
+    cursor.execute(sql, parametros)
+    return saldo + cursor.fetchone()["saldo"]
+
+def fechar(cursor, ate, usuario_id=None):
+    """
+    Fecha os dias abertos até 'ate' (inclusive; precisa ser anterior a hoje),
+    um registro por dia, encadeando os saldos. Retorna os dias fechados.
+    """
+    if ate >= date.today():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Só é possível fechar dias anteriores a hoje"
+        )
+
+    ultimo = ultimo_fechamento(cursor, travar="update")
+    if ultimo:
+        inicio = ultimo["data"] + timedelta(days=1)
+        saldo = ultimo["saldo_final"]
+    else:
+        # Primeiro fechamento: começa no primeiro movimento registrado
+        movimentos, parametros = arquivo_historico.fonte(cursor, "movimentos_caixa")
+        cursor.execute(f"SELECT MIN(data_movimento) AS primeiro FROM {movimentos} mc", parametros)
+        inicio = cursor.fetchone()["primeiro"]
+        if inicio is None:
+            return 0
+        saldo = Decimal("0")
+
+    if inicio > ate:
+        return 0
+
+    movimentos, parametros = arquivo_historico.fonte(cursor, "movimentos_caixa", inicio, ate)
+    cursor.execute(
+        f"""
+        SELECT data_movimento AS data,
+               COALESCE(SUM(CASE WHEN tipo = 'entrada' THEN valor ELSE 0 END), 0) AS entradas,
+               COALESCE(SUM(CASE WHEN tipo = 'saida' THEN valor ELSE 0 END), 0) AS saidas,
+               COUNT(*) AS quantidade
+        FROM {movimentos} mc
+        WHERE data_movimento BETWEEN %s AND %s
+        GROUP BY data_movimento
+        """,
+        [*parametros, inicio, ate]
+    )
+    por_dia = {linha["data"]: linha for linha in cursor.fetchall()}
+
+    linhas = []
+    dia = inicio
+    while dia <= ate:
+        movimento = por_dia.get(dia)
+        entradas = movimento["entradas"] if movimento else Decimal("0")
+        saidas = movimento["saidas"] if movimento else Decimal("0")
+        quantidade = movimento["quantidade"] if movimento else 0
+        saldo_final = saldo + entradas - saidas
+        linhas.append((dia, saldo, entradas, saidas, saldo_final, quantidade, usuario_id))
+        saldo = saldo_final
+        dia += timedelta(days=1)
+
+    cursor.executemany(
+        """
+        INSERT INTO fechamentos_caixa (
+            data, saldo_inicial, entradas, saidas, saldo_final, quantidade_movimentos, usuario_id
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """,
+        linhas
+    )
+    return len(linhas)
+
+def reabrir(cursor, desde):
+    """Desfaz os fechamentos a partir de 'desde' (inclusive). Retorna os dias reabertos."""
+    cursor.execute("DELETE FROM fechamentos_caixa WHERE data >= %s", (desde,))
+    return cursor.rowcount
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script para fechar o caixa dos dias abertos (padrão: até ontem).
+Pode ser agendado diariamente (ex.: cron logo após a meia-noite).
+"""
+
+import os
+import sys
+import argparse
+from datetime import date, datetime, timedelta
+
+# Adiciona o diretório atual ao path para permitir importações relativas
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import HTTPException
+from database import get_db_cursor
+import fechamento_caixa
+
+def main():
+    parser = argparse.ArgumentParser(description='Fecha o caixa dos dias abertos')
+    parser.add_argument('--ate', help='Último dia a fechar, AAAA-MM-DD (padrão: ontem)')
+    parser.add_argument('--usuario-id', type=int, help='Usuário registrado nos fechamentos')
+
+    args = parser.parse_args()
+
+    ate = datetime.strptime(args.ate, '%Y-%m-%d').date() if args.ate else date.today() - timedelta(days=1)
+
+    try:
+        with get_db_cursor(commit=True) as cursor:
+            dias = fechamento_caixa.fechar(cursor, ate, args.usuario_id)
+            ultimo = fechamento_caixa.ultimo_fechamento(cursor)
+    except HTTPException as e:
+        print(f"Erro: {e.detail}")
+        sys.exit(1)
+
+    print(f"{dias} dia(s) fechado(s)")
+    if ultimo:
+        print(f"Caixa fechado até {ultimo['data']:%d/%m/%Y}, saldo final {ultimo['saldo_final']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Previsão de demanda e sugestão automática de compras para todo o catálogo.
+
+Ajusta os modelos de previsão (média móvel, suavização exponencial e
+Holt-Winters sazonal) sobre as saídas semanais de estoque de cada produto,
+calcula o ponto de pedido a partir do prazo de entrega do fornecedor e lista
+os produtos que precisam de reposição. Opcionalmente grava o ponto de pedido
+em estoque_minimo e cria pedidos de compra pendentes, um por fornecedor,
+para revisão e aprovação no sistema.
+
+Pensado para rodar em lote (ex.: cron semanal).
+
+Exemplos:
+    python gerar_sugestoes_compra.py
+    python gerar_sugestoes_compra.py --atualizar-minimo
+    python gerar_sugestoes_compra.py --gerar-pedidos --usuario-id 1 --cobertura-semanas 6
+"""
+
+import os
+import sys
+import argparse
+import time
+
+# Adiciona o diretório atual ao path para permitir importações relativas
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import previsao_demanda
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera sugestões de compra a partir da previsão de demanda')
+    parser.add_argument('--semanas', type=int, default=previsao_demanda.SEMANAS_HISTORICO,
+                        help='Semanas de histórico usadas na previsão')
+    parser.add_argument('--cobertura-semanas', type=float, default=previsao_demanda.COBERTURA_SEMANAS,
+                        help='Semanas de demanda cobertas além do prazo de entrega')
+    parser.add_argument('--prazo-padrao', type=float, default=previsao_demanda.PRAZO_ENTREGA_PADRAO,
+                        help='Prazo de entrega (dias) para fornecedores sem histórico de recebimento')
+    parser.add_argument('--lote', type=int, default=previsao_demanda.TAMANHO_LOTE,
+                        help='Produtos processados por lote')
+    parser.add_argument('--atualizar-minimo', action='store_true',
+                        help='Grava o ponto de pedido calculado em produtos.estoque_minimo')
+    parser.add_argument('--gerar-pedidos', action='store_true',
+                        help='Cria pedidos de compra pendentes, um por fornecedor')
+    parser.add_argument('--usuario-id', type=int, help='Usuário responsável pelos pedidos gerados')
+
+    args = parser.parse_args()
+
+    if args.semanas < previsao_demanda.SEMANAS_MEDIA_MOVEL * 2:
+        print(f"Erro: --semanas deve ser pelo menos {previsao_demanda.SEMANAS_MEDIA_MOVEL * 2}")
+        sys.exit(1)
+    if args.gerar_pedidos and not args.usuario_id:
+        print("Erro: --gerar-pedidos requer --usuario-id")
+        sys.exit(1)
+
+    inicio = time.perf_counter()
+    sugestoes, estatisticas = previsao_demanda.calcular_sugestoes(
+        semanas=args.semanas,
+        cobertura_semanas=args.cobertura_semanas,
+        prazo_padrao=args.prazo_padrao,
+        tamanho_lote=args.lote,
+        atualizar_minimo=args.atualizar_minimo,
+    )
+    duracao = time.perf_counter() - inicio
+
+    print(f"{estatisticas['produtos']} produtos analisados em {duracao:.1f}s")
+    print("Modelos escolhidos: " + ", ".join(f"{m}={q}" for m, q in estatisticas["modelos"].items()))
+    if args.atualizar_minimo:
+        print("Ponto de pedido gravado em estoque_minimo.")
+
+    print(f"\n{len(sugestoes)} produtos para repor:")
+    print(f"{'ID':>6}  {'Produto':<40} {'Estoque':>8} {'Aberto':>7} {'PP':>6} {'Sugerido':>9}  Modelo")
+    for s in sugestoes:
+        print(
+            f"{s['produto_id']:>6}  {s['produto_nome'][:40]:<40} {s['estoque_atual']:>8} "
+            f"{s['em_aberto']:>7} {s['ponto_pedido']:>6} {s['quantidade']:>9}  {s['modelo']}"
+        )
+
+    if estatisticas["sem_fornecedor"]:
+        print(f"\nAtenção: {estatisticas['sem_fornecedor']} produtos sem fornecedor conhecido "
+              "(nenhuma compra anterior) não entram nos pedidos gerados.")
+
+    if args.gerar_pedidos:
+        pedidos = previsao_demanda.gerar_pedidos_compra(sugestoes, args.usuario_id)
+        print(f"\n{len(pedidos)} pedidos de compra pendentes criados:")
+        for p in pedidos:
+            print(f"  {p['codigo']}  fornecedor {p['fornecedor_id']}  {p['itens']} itens  R$ {p['valor_total']:.2f}")
+
+if __name__ == "__main__":
+    main()
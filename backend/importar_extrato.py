@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script para importar e conciliar um extrato bancário (OFX ou retorno CNAB 240/400).
+Pode ser agendado para processar os arquivos baixados do banco.
+"""
+
+import os
+import sys
+import argparse
+
+# Adiciona o diretório atual ao path para permitir importações relativas
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import conciliacao_bancaria
+
+def main():
+    parser = argparse.ArgumentParser(description='Importa e concilia um extrato bancário')
+    parser.add_argument('arquivo', help='Arquivo OFX ou retorno CNAB 240/400')
+    parser.add_argument('--conta', type=int, required=True, help='ID da conta bancária do extrato')
+    parser.add_argument('--usuario-id', type=int, required=True, help='Usuário registrado nas baixas')
+    parser.add_argument('--formato', choices=conciliacao_bancaria.FORMATOS,
+                        help='Formato do arquivo (padrão: detectado pelo conteúdo)')
+    parser.add_argument('--lote', type=int, default=conciliacao_bancaria.TAMANHO_LOTE,
+                        help='Lançamentos por transação')
+
+    args = parser.parse_args()
+
+    try:
+        with open(args.arquivo, 'rb') as arquivo:
+            relatorio = conciliacao_bancaria.importar(
+                arquivo, args.conta, args.usuario_id, os.path.basename(args.arquivo), args.formato, args.lote
+            )
+    except conciliacao_bancaria.ExtratoInvalido as e:
+        print(f"Erro: {e}")
+        sys.exit(1)
+
+    print(f"Importação {relatorio['importacao_id']} ({relatorio['formato']}): {relatorio['lancamentos']} lançamento(s)")
+    print(f"  Conciliados: {relatorio['conciliados']} (valor {relatorio['valor_conciliado']})")
+    for origem, quantidade in relatorio['por_origem'].items():
+        print(f"    {origem}: {quantidade}")
+    print(f"  Já conciliados anteriormente: {relatorio['ja_conciliados']}")
+    print(f"  Pendentes: {relatorio['pendente']}")
+    print(f"  Em dias com o caixa fechado: {relatorio['periodo_fechado']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script para importar NF-e de entrada (XML ou .zip) como pedidos de compra.
+Aceita vários arquivos; notas já importadas são ignoradas.
+
+Exemplo:
+    python importar_nfe.py notas_outubro.zip 35261012345678000190550010000012341000012345.xml --usuario-id 1
+"""
+
+import os
+import sys
+import argparse
+
+# Adiciona o diretório atual ao path para permitir importações relativas
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import nfe_importacao
+
+def main():
+    parser = argparse.ArgumentParser(description='Importa NF-e de entrada como pedidos de compra')
+    parser.add_argument('arquivos', nargs='+', help='Arquivos XML de NF-e ou .zip com vários')
+    parser.add_argument('--usuario-id', type=int, required=True, help='Usuário registrado nos pedidos')
+    parser.add_argument('--sem-receber', action='store_true',
+                        help='Apenas cria os pedidos, sem dar entrada no estoque')
+
+    args = parser.parse_args()
+
+    recusadas = 0
+    for caminho in args.arquivos:
+        try:
+            with open(caminho, 'rb') as arquivo:
+                relatorio = nfe_importacao.importar(
+                    arquivo, args.usuario_id, os.path.basename(caminho), not args.sem_receber
+                )
+        except nfe_importacao.NotaInvalida as e:
+            print(f"{caminho}: erro: {e}")
+            recusadas += 1
+            continue
+
+        print(f"{caminho}: {relatorio['notas']} nota(s), {relatorio['importadas']} importada(s), "
+              f"{relatorio['ja_importadas']} já importada(s), {relatorio['recusadas']} recusada(s)")
+        for pedido in relatorio['pedidos']:
+            print(f"  NF-e {pedido['numero']} -> pedido {pedido['codigo']} ({pedido['itens']} itens, {pedido['valor_total']})")
+        for erro in relatorio['erros']:
+            print(f"  Recusada {erro['arquivo']}: {erro['motivo']}")
+        recusadas += relatorio['recusadas']
+
+    if recusadas:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
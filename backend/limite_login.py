@@ -0,0 +1,110 @@
+"""
+Limite de tentativas de login por conta e por IP.
+
+Cada limite é uma janela deslizante em memória: guarda os instantes das
+falhas recentes de cada chave e bloqueia a chave enquanto houver 'maximo'
+falhas dentro dos últimos 'janela' segundos. Um login bem-sucedido limpa as
+falhas da conta (as do IP continuam valendo, para conter ataques que testam
+muitas contas a partir do mesmo endereço).
+
+A tentativa é contada como falha antes de a senha ser verificada
+(iniciar_tentativa) e descontada se ela estiver correta (registrar_sucesso):
+assim tentativas simultâneas não passam todas pela checagem enquanto o
+bcrypt ainda está rodando.
+
+O estado é por processo: com vários workers o limite efetivo é multiplicado
+pelo número de workers, o que ainda contém rajadas de força bruta.
+"""
+
+import threading
+import time
+from collections import deque
+from config import LOGIN_JANELA_SEGUNDOS, LOGIN_MAX_FALHAS_CONTA, LOGIN_MAX_FALHAS_IP
+
+# Acima deste número de chaves, as que não têm falhas recentes são descartadas
+LIMITE_CHAVES = 10000
+
+class JanelaDeslizante:
+    def __init__(self, maximo, janela):
+        self.maximo = maximo
+        self.janela = janela
+        self.falhas = {}
+        self.lock = threading.Lock()
+
+    def _expirar(self, chave, agora):
+        fila = self.falhas.get(chave)
+        if fila is None:
+            return None
+        while fila and fila[0] <= agora - self.janela:
+            fila.popleft()
+        if not fila:
+            del self.falhas[chave]
+            return None
+        return fila
+
+    def bloqueio(self, chave):
+        """Segundos até a chave ser liberada (0 = liberada)."""
+        agora = time.monotonic()
+        with self.lock:
+            fila = self._expirar(chave, agora)
+            if fila is None or len(fila) < self.maximo:
+                return 0
+            return max(1, int(fila[-self.maximo] + self.janela - agora) + 1)
+
+    def registrar(self, chave):
+        agora = time.monotonic()
+        with self.lock:
+            if len(self.falhas) >= LIMITE_CHAVES:
+                for antiga in list(self.falhas):
+                    self._expirar(antiga, agora)
+            fila = self.falhas.setdefault(chave, deque())
+            fila.append(agora)
+            # Só as últimas 'maximo' falhas importam para o bloqueio
+            while len(fila) > self.maximo:
+                fila.popleft()
+
+    def descontar(self, chave):
+        """Remove a falha mais recente da chave."""
+        with self.lock:
+            fila = self.falhas.get(chave)
+            if fila:
+                fila.pop()
+                if not fila:
+                    del self.falhas[chave]
+
+    def limpar(self, chave):
+        with self.lock:
+            self.falhas.pop(chave, None)
+
+por_conta = JanelaDeslizante(LOGIN_MAX_FALHAS_CONTA, LOGIN_JANELA_SEGUNDOS)
+por_ip = JanelaDeslizante(LOGIN_MAX_FALHAS_IP, LOGIN_JANELA_SEGUNDOS)
+
+def _conta(email):
+    return (email or "").strip().lower()
+
+# Serializa a checagem e a contagem das duas janelas
+_lock = threading.Lock()
+
+def iniciar_tentativa(email, ip):
+    """
+    Segundos de espera antes de uma nova tentativa (0 = pode tentar). Quando
+    liberada, a tentativa já sai contada como falha da conta e do IP; se a
+    senha estiver correta, chame registrar_sucesso.
+    """
+    conta = _conta(email)
+    with _lock:
+        espera = max(por_conta.bloqueio(conta), por_ip.bloqueio(ip))
+        if not espera:
+            por_conta.registrar(conta)
+            por_ip.registrar(ip)
+    return espera
+
+def desfazer_tentativa(email, ip):
+    """Desconta a tentativa que não chegou a verificar a senha (ex.: banco indisponível)."""
+    por_conta.descontar(_conta(email))
+    por_ip.descontar(ip)
+
+def registrar_sucesso(email, ip):
+    """Limpa as falhas da conta e desconta do IP a tentativa bem-sucedida."""
+    por_conta.limpar(_conta(email))
+    por_ip.descontar(ip)
@@ -0,0 +1,232 @@
+"""
+Log de alterações (outbox transacional).
+
+Cada rota de escrita registra (entidade, id, operação, versão, momento) em
+log_alteracoes dentro da mesma transação da alteração: se a transação for
+desfeita, o registro também some. O id auto-incremento é o offset lido pelos
+consumidores (GET /api/alteracoes?desde=...), que podem atualizar caches e
+agregados de forma incremental em vez de reler as tabelas.
+
+A versão é sequencial por (entidade, id) e fica em versoes_registros: a linha
+do registro é travada pela própria transação (como a linha alterada), sem
+travar faixas do log, de modo que escritas concorrentes não geram deadlock.
+
+Um offset é reservado no INSERT mas só fica visível no commit, e transações
+podem confirmar fora da ordem dos offsets. Por isso a leitura nunca passa do
+horizonte confirmado (confirmado_ate): o maior offset até o qual todas as
+lacunas são comprovadamente de transações desfeitas. A comprovação usa
+information_schema.innodb_trx (o usuário do banco precisa do privilégio
+PROCESS); sem ele, uma lacuna só é dada como desfeita quando o offset
+seguinte foi gravado há mais de LACUNA_MAXIMA segundos, o que supõe que
+nenhuma transação de escrita dure tanto.
+
+registrar também soma as alterações ao contador da entidade em
+contadores_log, na mesma transação; marca() lê esses contadores para validar
+caches sem percorrer o log. O contador é dividido em fatias pela conexão,
+para que escritas concorrentes na mesma entidade não disputem a mesma linha.
+"""
+
+import logging
+
+logger = logging.getLogger("log_alteracoes")
+
+OPERACOES = ("insert", "update", "delete")
+
+TAMANHO_BLOCO = 500
+
+# Margem (segundos) entre o início de uma transação e a gravação das suas
+# linhas no log: cobre a duração de uma instrução e a precisão em segundos
+# de innodb_trx.trx_started
+MARGEM_TRANSACAO = 2
+
+# Sem o privilégio PROCESS: idade (segundos) a partir da qual um offset conta
+# como encerrado e as lacunas antes dele como transações desfeitas
+LACUNA_MAXIMA = 300
+
+# Linhas lidas por consulta ao percorrer offsets contíguos
+TAMANHO_VARREDURA = 5000
+
+# Fatias de cada contador em contadores_log (uma por conexão, módulo este valor)
+FATIAS_CONTADOR = 64
+
+_sem_privilegio = False
+
+def registrar(cursor, entidade, ids, operacao, usuario_id=None):
+    """
+    Registra a alteração de um ou mais registros de 'entidade'.
+    Chame no mesmo cursor (transação) que fez a alteração, depois dela.
+    """
+    if isinstance(ids, int):
+        ids = [ids]
+    ids = sorted(set(i for i in ids if i is not None))
+
+    for inicio in range(0, len(ids), TAMANHO_BLOCO):
+        bloco = ids[inicio:inicio + TAMANHO_BLOCO]
+        marcadores = ", ".join(["%s"] * len(bloco))
+
+        cursor.execute(
+            f"""
+            INSERT INTO versoes_registros (entidade, entidade_id, versao)
+            VALUES {", ".join(["(%s, %s, 1)"] * len(bloco))}
+            ON DUPLICATE KEY UPDATE versao = versao + 1
+            """,
+            [valor for registro_id in bloco for valor in (entidade, registro_id)]
+        )
+        # A própria transação enxerga as versões que acabou de gravar
+        cursor.execute(
+            f"SELECT entidade_id, versao FROM versoes_registros WHERE entidade = %s AND entidade_id IN ({marcadores})",
+            [entidade, *bloco]
+        )
+        versoes = {linha["entidade_id"]: linha["versao"] for linha in cursor.fetchall()}
+
+        cursor.execute(
+            f"""
+            INSERT INTO log_alteracoes (entidade, entidade_id, operacao, versao, usuario_id)
+            VALUES {", ".join(["(%s, %s, %s, %s, %s)"] * len(bloco))}
+            """,
+            [
+                valor for registro_id in bloco
+                for valor in (entidade, registro_id, operacao, versoes[registro_id], usuario_id)
+            ]
+        )
+
+    if ids:
+        contar(cursor, entidade, len(ids))
+
+def contar(cursor, entidade, quantidade=1):
+    """
+    Soma 'quantidade' ao contador de 'entidade' (lido por marca). registrar já
+    o chama; use diretamente para marcas que não têm linhas no log.
+    """
+    cursor.execute(
+        """
+        INSERT INTO contadores_log (entidade, fatia, total)
+        VALUES (%s, MOD(CONNECTION_ID(), %s), %s)
+        ON DUPLICATE KEY UPDATE total = total + VALUES(total)
+        """,
+        (entidade, FATIAS_CONTADOR, quantidade)
+    )
+
+def marca(cursor, entidades):
+    """
+    Total de alterações de cada entidade (na ordem dada), somando as fatias de
+    contadores_log: o custo não depende do tamanho do log. Como o contador é
+    gravado na transação da alteração, uma transação que confirma fora de
+    ordem também muda o total; sirva-se disso para validar caches.
+    """
+    cursor.execute(
+        f"""
+        SELECT entidade, SUM(total) AS total FROM contadores_log
+        WHERE entidade IN ({", ".join(["%s"] * len(entidades))})
+        GROUP BY entidade
+        """,
+        list(entidades)
+    )
+    totais = {linha["entidade"]: linha["total"] for linha in cursor.fetchall()}
+    return tuple(totais.get(entidade, 0) for entidade in entidades)
+
+def _inicio_transacoes(cursor):
+    """
+    (agora, início da transação com escrita mais antiga em andamento, exceto a
+    própria), ou None sem o privilégio PROCESS.
+    """
+    global _sem_privilegio
+    try:
+        cursor.execute(
+            """
+            SELECT NOW(6) AS agora,
+                   (SELECT MIN(trx_started) FROM information_schema.innodb_trx
+                    WHERE trx_mysql_thread_id <> CONNECTION_ID() AND trx_rows_modified > 0) AS inicio
+            """
+        )
+    except Exception as e:
+        if not _sem_privilegio:
+            _sem_privilegio = True
+            logger.warning(
+                f"Sem acesso a information_schema.innodb_trx ({e}); lacunas do log só são "
+                f"puladas depois de {LACUNA_MAXIMA} segundos"
+            )
+        return None
+    linha = cursor.fetchone()
+    return linha["agora"], linha["inicio"]
+
+def confirmado_ate(cursor, desde=0):
+    """
+    Horizonte confirmado: o maior offset H (>= desde) tal que todo offset até H
+    já está visível ou foi desfeito. Leituras até H nunca perdem alterações.
+
+    Chame antes de qualquer outra leitura da transação e no primário: a prova
+    compara as transações em andamento agora com o snapshot lido em seguida.
+    Um offset reservado antes do início da transação com escrita mais antiga
+    ainda em andamento (menos a margem) pertence a uma transação já encerrada:
+    se ela confirmou, a linha está no snapshot; se não está, foi desfeita.
+    Sem o privilégio PROCESS, a referência é o momento atual e a margem é
+    LACUNA_MAXIMA: uma transação desfeita atrasa os consumidores por esse
+    tempo, em vez de pará-los. Depois desse ponto o horizonte só avança por
+    offsets contíguos.
+    """
+    base = desde
+    transacoes = _inicio_transacoes(cursor)
+    if transacoes:
+        agora, inicio = transacoes
+        referencia = min(agora, inicio) if inicio else agora
+        margem = MARGEM_TRANSACAO
+    else:
+        cursor.execute("SELECT NOW(6) AS agora")
+        referencia = cursor.fetchone()["agora"]
+        margem = LACUNA_MAXIMA
+
+    cursor.execute(
+        """
+        SELECT id FROM log_alteracoes
+        WHERE id > %s AND data_alteracao < %s - INTERVAL %s SECOND
+        ORDER BY id DESC
+        LIMIT 1
+        """,
+        (desde, referencia, margem)
+    )
+    linha = cursor.fetchone()
+    if linha:
+        base = linha["id"]
+
+    while True:
+        cursor.execute(
+            "SELECT id FROM log_alteracoes WHERE id > %s ORDER BY id LIMIT %s",
+            (base, TAMANHO_VARREDURA)
+        )
+        linhas = cursor.fetchall()
+        for linha in linhas:
+            if linha["id"] != base + 1:
+                return base
+            base = linha["id"]
+        if len(linhas) < TAMANHO_VARREDURA:
+            return base
+
+def ler(cursor, desde=0, limite=1000, entidades=None):
+    """
+    Lê as alterações com offset maior que 'desde', em ordem, até o horizonte
+    confirmado; o que estiver depois dele é lido na próxima chamada.
+    Chame no início da transação (ver confirmado_ate).
+    Retorna (alterações, próximo offset).
+    """
+    horizonte = confirmado_ate(cursor, desde)
+
+    query = """
+        SELECT id, entidade, entidade_id, operacao, versao, usuario_id, data_alteracao
+        FROM log_alteracoes
+        WHERE id > %s AND id <= %s
+    """
+    params = [desde, horizonte]
+
+    if entidades:
+        query += f" AND entidade IN ({', '.join(['%s'] * len(entidades))})"
+        params.extend(entidades)
+
+    query += " ORDER BY id LIMIT %s"
+    params.append(limite)
+
+    cursor.execute(query, params)
+    alteracoes = cursor.fetchall()
+
+    proximo = alteracoes[-1]["id"] if len(alteracoes) == limite else horizonte
+    return alteracoes, proximo
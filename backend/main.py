@@ -1,17 +1,25 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
 from datetime import timedelta
+import logging
 
 # Importa as configurações centralizadas
-from config import APP_NAME, APP_VERSION, APP_DESCRIPTION, ACCESS_TOKEN_EXPIRE_MINUTES
+from config import APP_NAME, APP_VERSION, APP_DESCRIPTION, ACCESS_TOKEN_EXPIRE_MINUTES, PERMISSOES_NO_TOKEN
 
 # Importa os modelos
 from models import Token
 
 # Importa o módulo de autenticação
-from auth import create_access_token, verify_password, get_current_user
+from auth import create_access_token, verify_and_update_password, get_current_user, preparar_hash_ficticio
+
+# Importa o limite de tentativas de login
+import limite_login
+
+# Importa as permissões de grupo
+import permissoes
 
 # Importa os módulos de rotas
 import routers.usuarios as usuarios
@@ -27,14 +35,30 @@ import routers.propostas as propostas
 import routers.contas_pagar as contas_pagar
 import routers.contas_receber as contas_receber
 import routers.caixa as caixa
+import routers.conciliacao as conciliacao
 import routers.relatorios as relatorios
 import routers.clientes as clientes
 import routers.dashboard as dashboard
 import routers.configuracoes as configuracoes
+import routers.comissoes as comissoes
+import routers.alteracoes as alteracoes
+import routers.eventos as eventos
+import routers.saude as saude_rotas
 
 # Importa o gerenciador de timeout
 from timeout_manager import start_timeout_manager
 
+# Importa o serviço de configurações do sistema
+import configuracoes_sistema
+
+# Importa o monitor de saúde (loop de eventos e dependências)
+import saude
+
+# Importa a exceção do disjuntor do banco
+from disjuntor import BancoIndisponivel
+
+logger = logging.getLogger("main")
+
 # Configurações da aplicação
 app = FastAPI(
     title=APP_NAME + " API",
@@ -45,8 +69,6 @@ app = FastAPI(
 # Configuração do CORS
 # Obter origens permitidas da configuração do banco de dados
 def get_allowed_origins():
-    from database import get_db_cursor
-    
     # Lista de origens permitidas para desenvolvimento local
     local_origins = [
         "http://localhost",
@@ -60,21 +82,29 @@ def get_allowed_origins():
         "null"  # Para requisições de arquivo local (file://)
     ]
     
-    try:
-        with get_db_cursor() as cursor:
-            cursor.execute("SELECT valor FROM configuracoes WHERE chave = 'allowed_origins'")
-            result = cursor.fetchone()
-            if result and result['valor']:
-                # Formato esperado: dominio1.com,dominio2.com
-                db_origins = [origin.strip() for origin in result['valor'].split(',')]
-                # Combinar origens do banco com origens locais
-                return db_origins + local_origins
-    except Exception as e:
-        print(f"Erro ao obter origens permitidas: {e}")
+    # Formato esperado no banco: dominio1.com,dominio2.com (já convertido em lista)
+    db_origins = configuracoes_sistema.obter("allowed_origins")
+    if db_origins:
+        # Combinar origens do banco com origens locais
+        return db_origins + local_origins
+
+    if not configuracoes_sistema.carregado():
+        # Banco fora do ar: a lista configurada é desconhecida, então não libera
+        # todas as origens; só as locais até as configurações serem lidas
+        _avisar_origens_indisponiveis()
+        return local_origins
     
     # Fallback para desenvolvimento
     return ["*"]
 
+_origens_avisadas = False
+
+def _avisar_origens_indisponiveis():
+    global _origens_avisadas
+    if not _origens_avisadas:
+        _origens_avisadas = True
+        logger.warning("Configurações não carregadas do banco: CORS restrito às origens locais")
+
 # Middleware personalizado para CORS dinâmico
 @app.middleware("http")
 async def dynamic_cors(request, call_next):
@@ -100,6 +130,36 @@ async def dynamic_cors(request, call_next):
     # Se a origem não estiver permitida, continuar sem adicionar headers CORS
     return await call_next(request)
 
+# Registra as requisições em andamento para o monitor do loop de eventos
+@app.middleware("http")
+async def monitorar_requisicoes(request, call_next):
+    identificador = saude.inicio_requisicao(f"{request.method} {request.url.path}")
+    try:
+        return await call_next(request)
+    finally:
+        saude.fim_requisicao(identificador)
+
+@app.on_event("startup")
+async def iniciar_monitor_loop():
+    saude.monitor_loop.iniciar()
+
+# Hash fictício do login pronto antes da primeira tentativa com email desconhecido
+@app.on_event("startup")
+async def preparar_login():
+    try:
+        await preparar_hash_ficticio()
+    except Exception as e:
+        logger.warning(f"Hash fictício do login não calculado no início ({e}); será tentado no primeiro login")
+
+# Banco fora do ar (disjuntor aberto): 503 imediato em vez de esperar o timeout
+@app.exception_handler(BancoIndisponivel)
+async def banco_indisponivel(request: Request, exc: BancoIndisponivel):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Banco de dados temporariamente indisponível. Tente novamente em instantes."},
+        headers={"Retry-After": str(max(int(exc.espera), 1))},
+    )
+
 # Configuração do CORS com origens permitidas do banco de dados
 # Manter para compatibilidade, mas o middleware acima terá prioridade
 app.add_middleware(
@@ -114,33 +174,65 @@ app.add_middleware(
 
 # Rotas de autenticação
 @app.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
     from database import get_db_cursor
     
-    with get_db_cursor() as cursor:
-        cursor.execute(
-            "SELECT id, nome, email, senha, nivel_acesso FROM usuarios WHERE email = %s",
-            (form_data.username,)
+    # Bloqueia a conta ou o IP com muitas falhas recentes antes de gastar CPU com o bcrypt.
+    # A tentativa já conta como falha até a senha ser confirmada
+    ip = request.client.host if request.client else "desconhecido"
+    espera = limite_login.iniciar_tentativa(form_data.username, ip)
+    if espera:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Muitas tentativas de login. Tente novamente em {espera} segundos.",
+            headers={"Retry-After": str(espera)},
+        )
+    
+    try:
+        with get_db_cursor(prepared=True) as cursor:
+            cursor.execute(
+                "SELECT id, nome, email, senha, nivel_acesso, grupo_id FROM usuarios WHERE email = %s",
+                (form_data.username,)
+            )
+            user = cursor.fetchone()
+        
+        # O bcrypt roda no pool de hash, sem travar o event loop
+        senha_valida, novo_hash = await verify_and_update_password(
+            form_data.password, user["senha"] if user else None
         )
-        user = cursor.fetchone()
+    except Exception:
+        limite_login.desfazer_tentativa(form_data.username, ip)
+        raise
     
-    if not user or not verify_password(form_data.password, user["senha"]):
+    if not senha_valida:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email ou senha incorretos",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Atualiza o último acesso, last_access e connected
+    limite_login.registrar_sucesso(form_data.username, ip)
+    
+    # Atualiza o último acesso, last_access e connected (e o hash, se o custo do bcrypt mudou)
     with get_db_cursor(commit=True) as cursor:
-        cursor.execute(
-            "UPDATE usuarios SET ultimo_acesso = NOW(), last_access = NOW(), connected = TRUE WHERE id = %s",
-            (user["id"],)
-        )
+        if novo_hash:
+            cursor.execute(
+                "UPDATE usuarios SET senha = %s, ultimo_acesso = NOW(), last_access = NOW(), connected = TRUE WHERE id = %s",
+                (novo_hash, user["id"])
+            )
+        else:
+            cursor.execute(
+                "UPDATE usuarios SET ultimo_acesso = NOW(), last_access = NOW(), connected = TRUE WHERE id = %s",
+                (user["id"],)
+            )
+    
+    token_data = {"sub": user["email"], "nivel": user["nivel_acesso"]}
+    if PERMISSOES_NO_TOKEN and user["nivel_acesso"] != "admin":
+        token_data["perm"] = permissoes.mascara_do_grupo(user["grupo_id"]) or 0
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user["email"], "nivel": user["nivel_acesso"]},
+        data=token_data,
         expires_delta=access_token_expires
     )
     
@@ -161,10 +253,15 @@ app.include_router(propostas.router, prefix="/api/propostas", tags=["Propostas"]
 app.include_router(contas_pagar.router, prefix="/api/contas-pagar", tags=["Contas a Pagar"])
 app.include_router(contas_receber.router, prefix="/api/contas-receber", tags=["Contas a Receber"])
 app.include_router(caixa.router, prefix="/api/caixa", tags=["Caixa"])
+app.include_router(conciliacao.router, prefix="/api/conciliacao", tags=["Conciliação Bancária"])
 app.include_router(relatorios.router, prefix="/api/relatorios", tags=["Relatórios"])
 app.include_router(clientes.router, prefix="/api/clientes", tags=["Clientes"])
 app.include_router(dashboard.router, prefix="/api/dashboard", tags=["Dashboard"])
 app.include_router(configuracoes.router, prefix="/api/configuracoes", tags=["Configurações"])
+app.include_router(comissoes.router, prefix="/api/comissoes", tags=["Comissões"])
+app.include_router(alteracoes.router, prefix="/api/alteracoes", tags=["Alterações"])
+app.include_router(eventos.router, prefix="/api/eventos", tags=["Eventos"])
+app.include_router(saude_rotas.router, prefix="/api/saude", tags=["Saúde"])
 
 # Configuração para servir arquivos estáticos (uploads)
 import os
@@ -178,29 +275,12 @@ async def root():
 
 if __name__ == "__main__":
     import uvicorn
-    from database import get_db_cursor
     
-    # Obter porta do banco de dados, se disponível
-    port = 8000
-    try:
-        with get_db_cursor() as cursor:
-            cursor.execute("SELECT valor FROM configuracoes WHERE chave = 'api_port'")
-            result = cursor.fetchone()
-            if result and result['valor']:
-                port = int(result['valor'])
-    except Exception as e:
-        print(f"Erro ao obter porta da API: {e}")
+    # Porta e ambiente vêm do snapshot de configurações
+    port = configuracoes_sistema.obter("api_port")
     
     # Em produção, desabilitar o reload automático
-    is_production = False
-    try:
-        with get_db_cursor() as cursor:
-            cursor.execute("SELECT valor FROM configuracoes WHERE chave = 'environment'")
-            result = cursor.fetchone()
-            if result and result['valor'] == 'production':
-                is_production = True
-    except Exception as e:
-        print(f"Erro ao verificar ambiente: {e}")
+    is_production = configuracoes_sistema.obter("environment") == "production"
 
     # Inicializar o gerenciador de timeout
     print("Iniciando gerenciador de timeout...")
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional, Dict, Any
+from datetime import date
 
 # Modelos de autenticação
 class Token(BaseModel):
@@ -46,3 +47,12 @@ class UserInDB(BaseModel):
     last_access: Optional[str] = None
     connected: Optional[bool] = False
     grupo_id: Optional[int] = None
+    permissoes: Optional[int] = None
+
+class PlanoParcelamento(BaseModel):
+    """Vencimentos por prazos em dias (ex.: [30, 60, 90]) ou N parcelas a partir do primeiro vencimento."""
+    prazos: Optional[List[int]] = None
+    quantidade: int = 1
+    primeiro_vencimento: Optional[date] = None
+    intervalo_dias: Optional[int] = None  # None = mensal
+    resto: str = "ultima"  # parcela que recebe os centavos da divisão: 'primeira' ou 'ultima'
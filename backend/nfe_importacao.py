@@ -0,0 +1,277 @@
+"""
+Importação de NF-e de entrada (XML) como pedidos de compra.
+
+ler_notas() aceita o XML de uma NF-e (NFe ou nfeProc) ou um .zip com vários e
+lê cada nota com iterparse, limpando cada elemento já lido: a memória usada
+não cresce com o tamanho das notas nem com a quantidade de notas do lote.
+
+O fornecedor é encontrado pelo CNPJ do emitente (parceiros.documento, só os
+dígitos) e cada produto pelo código de barras da nota (cEAN) ou pelo código
+do produto no fornecedor (cProd), ambos comparados com produtos.codigo, em
+mapas carregados uma vez por importação. Cada nota vira um pedido de compra
+com todos os itens e, opcionalmente, já é recebida em lote
+(recebimento_compras.receber), tudo na mesma transação. Notas com fornecedor
+ou produtos não cadastrados são recusadas inteiras; a chave de acesso gravada
+em notas_fiscais_entrada impede importar a mesma nota duas vezes.
+"""
+
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from database import get_db_cursor
+import cubo_produtos
+import log_alteracoes
+import recebimento_compras
+
+# Notas importadas / recusadas listadas no relatório (as demais só contam)
+MAX_DETALHES = 200
+
+GTIN_VAZIOS = ("", "SEM GTIN")
+
+CENTAVO = Decimal("0.01")
+
+class NotaInvalida(ValueError):
+    """XML que não é uma NF-e, item malformado ou fornecedor/produto não cadastrado."""
+
+def _digitos(texto):
+    return re.sub(r"\D", "", texto or "")
+
+def _nome(elemento):
+    return elemento.tag.rsplit("}", 1)[-1]
+
+def _filho(elemento, nome):
+    for filho in elemento:
+        if _nome(filho) == nome:
+            return filho
+    return None
+
+def _texto(elemento, nome):
+    filho = _filho(elemento, nome) if elemento is not None else None
+    return (filho.text or "").strip() if filho is not None else ""
+
+def _decimal(texto, contexto):
+    try:
+        return Decimal(texto)
+    except InvalidOperation:
+        raise NotaInvalida(f"{contexto}: valor inválido '{texto}'")
+
+def _item(det):
+    prod = _filho(det, "prod")
+    contexto = f"Item {det.get('nItem', '?')}"
+    if prod is None:
+        raise NotaInvalida(f"{contexto}: sem dados do produto")
+
+    quantidade = _decimal(_texto(prod, "qCom") or "0", contexto)
+    if quantidade <= 0 or quantidade != quantidade.to_integral_value():
+        raise NotaInvalida(f"{contexto} ({_texto(prod, 'cProd')}): quantidade {quantidade} não é um inteiro positivo")
+
+    # Valor líquido do item: valor dos produtos menos o desconto
+    valor = _decimal(_texto(prod, "vProd") or "0", contexto) - _decimal(_texto(prod, "vDesc") or "0", contexto)
+    ean = _texto(prod, "cEAN")
+    return {
+        "codigo": _texto(prod, "cProd"),
+        "ean": "" if ean.upper() in GTIN_VAZIOS else ean,
+        "descricao": _texto(prod, "xProd"),
+        "quantidade": int(quantidade),
+        "subtotal": valor.quantize(CENTAVO),
+        "preco_unitario": (valor / quantidade).quantize(CENTAVO),
+    }
+
+def _ler_xml(arquivo, origem):
+    """Uma NF-e do XML; erros viram {"arquivo", "erro"} para não interromper o lote."""
+    nota = {"arquivo": origem, "chave": None, "itens": []}
+    try:
+        for _, elemento in ET.iterparse(arquivo, events=("end",)):
+            nome = _nome(elemento)
+            if nome == "ide":
+                nota["numero"] = _texto(elemento, "nNF")
+                nota["serie"] = _texto(elemento, "serie")
+                emissao = _texto(elemento, "dhEmi") or _texto(elemento, "dEmi")
+                nota["data_emissao"] = datetime.strptime(emissao[:10], "%Y-%m-%d").date() if emissao else None
+            elif nome == "emit":
+                nota["cnpj"] = _digitos(_texto(elemento, "CNPJ") or _texto(elemento, "CPF"))
+                nota["emitente"] = _texto(elemento, "xNome")
+            elif nome == "det":
+                nota["itens"].append(_item(elemento))
+            elif nome == "ICMSTot":
+                nota["valor_nota"] = _decimal(_texto(elemento, "vNF") or "0", "Total")
+            elif nome == "infNFe":
+                nota["chave"] = _digitos(elemento.get("Id"))
+            elif nome == "infProt" and not nota["chave"]:
+                nota["chave"] = _digitos(_texto(elemento, "chNFe"))
+            elif nome not in ("dest", "transp", "cobr", "pag", "Signature"):
+                continue
+            elemento.clear()
+    except ET.ParseError as e:
+        return {"arquivo": origem, "erro": f"XML inválido: {e}"}
+    except ValueError as e:
+        return {"arquivo": origem, "chave": nota["chave"], "erro": str(e)}
+
+    if len(nota["chave"] or "") != 44:
+        return {"arquivo": origem, "erro": "O arquivo não é uma NF-e (sem chave de acesso)"}
+    if not nota.get("cnpj"):
+        return {"arquivo": origem, "chave": nota["chave"], "erro": "NF-e sem CNPJ do emitente"}
+    if not nota["itens"]:
+        return {"arquivo": origem, "chave": nota["chave"], "erro": "NF-e sem itens"}
+    return nota
+
+def ler_notas(arquivo, nome="nota.xml"):
+    """NF-e do arquivo (binário e posicionável): um XML ou um .zip com vários."""
+    assinatura = arquivo.read(4)
+    arquivo.seek(0)
+    if assinatura.startswith(b"PK"):
+        try:
+            pacote = zipfile.ZipFile(arquivo)
+        except zipfile.BadZipFile:
+            raise NotaInvalida("Arquivo .zip inválido")
+        with pacote:
+            for info in pacote.infolist():
+                if info.is_dir() or not info.filename.lower().endswith(".xml"):
+                    continue
+                with pacote.open(info) as membro:
+                    yield _ler_xml(membro, info.filename)
+    else:
+        yield _ler_xml(arquivo, nome)
+
+def carregar_mapas(cursor):
+    """Fornecedores por CNPJ (só dígitos) e produtos por código."""
+    cursor.execute(
+        "SELECT id, documento FROM parceiros WHERE tipo IN ('fornecedor', 'ambos') AND documento IS NOT NULL"
+    )
+    fornecedores = {_digitos(linha["documento"]): linha["id"] for linha in cursor.fetchall()}
+    cursor.execute("SELECT id, codigo FROM produtos")
+    produtos = {linha["codigo"]: linha["id"] for linha in cursor.fetchall()}
+    return {"fornecedores": fornecedores, "produtos": produtos}
+
+def resolver(nota, mapas):
+    """Fornecedor e itens com produto_id; NotaInvalida lista o que não está cadastrado."""
+    fornecedor_id = mapas["fornecedores"].get(nota["cnpj"])
+    if fornecedor_id is None:
+        raise NotaInvalida(f"Fornecedor com CNPJ {nota['cnpj']} ({nota.get('emitente')}) não cadastrado")
+
+    itens, faltando = [], []
+    for item in nota["itens"]:
+        produto_id = mapas["produtos"].get(item["ean"]) if item["ean"] else None
+        if produto_id is None:
+            produto_id = mapas["produtos"].get(item["codigo"])
+        if produto_id is None:
+            faltando.append(f"{item['codigo']} ({item['descricao']})")
+            continue
+        itens.append({**item, "produto_id": produto_id})
+
+    if faltando:
+        raise NotaInvalida(f"Produtos não cadastrados: {', '.join(faltando)}")
+    return fornecedor_id, itens
+
+def _gerar_codigo(cursor):
+    """Código do pedido de compra (formato: PC + ano + sequencial)."""
+    cursor.execute(
+        """
+        SELECT YEAR(NOW()) AS ano, COUNT(*) + 1 AS seq
+        FROM pedidos_compra
+        WHERE YEAR(data_pedido) = YEAR(NOW())
+        """
+    )
+    linha = cursor.fetchone()
+    return f"PC{linha['ano']}{linha['seq']:04d}"
+
+def gravar(cursor, nota, fornecedor_id, itens, usuario_id, receber=True):
+    """
+    Cria o pedido de compra da nota (e o recebe, se 'receber'). Retorna o
+    resumo do pedido ou None se a nota já foi importada.
+    """
+    cursor.execute("SELECT pedido_compra_id FROM notas_fiscais_entrada WHERE chave = %s", (nota["chave"],))
+    if cursor.fetchone():
+        return None
+
+    codigo = _gerar_codigo(cursor)
+    valor_total = sum(item["subtotal"] for item in itens)
+    cursor.execute(
+        """
+        INSERT INTO pedidos_compra (
+            codigo, fornecedor_id, status, valor_total, observacoes, usuario_id
+        )
+        VALUES (%s, %s, 'pendente', %s, %s, %s)
+        """,
+        (
+            codigo, fornecedor_id, valor_total,
+            f"NF-e {nota.get('numero')}/{nota.get('serie')} - chave {nota['chave']}", usuario_id
+        )
+    )
+    cursor.execute("SELECT LAST_INSERT_ID()")
+    pedido_id = cursor.fetchone()["LAST_INSERT_ID()"]
+
+    cursor.execute(
+        f"""
+        INSERT INTO itens_pedido_compra (
+            pedido_id, produto_id, quantidade, preco_unitario, subtotal
+        )
+        VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(itens))}
+        """,
+        [
+            valor
+            for item in itens
+            for valor in (pedido_id, item["produto_id"], item["quantidade"], item["preco_unitario"], item["subtotal"])
+        ]
+    )
+    cubo_produtos.registrar_compras(cursor, [pedido_id])
+
+    cursor.execute(
+        """
+        INSERT INTO notas_fiscais_entrada (
+            chave, numero, serie, fornecedor_id, pedido_compra_id, data_emissao, valor_nota, usuario_id
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """,
+        (
+            nota["chave"], nota.get("numero"), nota.get("serie"), fornecedor_id, pedido_id,
+            nota.get("data_emissao"), nota.get("valor_nota"), usuario_id
+        )
+    )
+    log_alteracoes.registrar(cursor, "pedidos_compra", pedido_id, "insert", usuario_id)
+
+    if receber:
+        recebimento_compras.receber(cursor, {"id": pedido_id, "codigo": codigo}, itens, usuario_id)
+
+    return {
+        "chave": nota["chave"],
+        "numero": nota.get("numero"),
+        "pedido_id": pedido_id,
+        "codigo": codigo,
+        "itens": len(itens),
+        "valor_total": valor_total,
+    }
+
+def importar(arquivo, usuario_id, nome_arquivo=None, receber=True):
+    """
+    Importa as NF-e do arquivo (XML ou .zip), uma transação por nota.
+    Retorna o relatório: contagens, pedidos criados e notas recusadas com o motivo.
+    """
+    with get_db_cursor() as cursor:
+        mapas = carregar_mapas(cursor)
+
+    relatorio = {"notas": 0, "importadas": 0, "ja_importadas": 0, "recusadas": 0, "pedidos": [], "erros": []}
+    for nota in ler_notas(arquivo, nome_arquivo or "nota.xml"):
+        relatorio["notas"] += 1
+        try:
+            if "erro" in nota:
+                raise NotaInvalida(nota["erro"])
+            fornecedor_id, itens = resolver(nota, mapas)
+            with get_db_cursor(commit=True) as cursor:
+                pedido = gravar(cursor, nota, fornecedor_id, itens, usuario_id, receber)
+        except NotaInvalida as e:
+            relatorio["recusadas"] += 1
+            if len(relatorio["erros"]) < MAX_DETALHES:
+                relatorio["erros"].append({"arquivo": nota["arquivo"], "chave": nota.get("chave"), "motivo": str(e)})
+            continue
+
+        if pedido is None:
+            relatorio["ja_importadas"] += 1
+            continue
+        relatorio["importadas"] += 1
+        if len(relatorio["pedidos"]) < MAX_DETALHES:
+            relatorio["pedidos"].append(pedido)
+
+    return relatorio
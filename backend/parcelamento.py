@@ -0,0 +1,206 @@
+"""
+Geração de parcelas (contas a receber ou a pagar) em lote.
+
+Os vencimentos vêm de prazos em dias a partir de uma data base (ex.: 30/60/90)
+ou de N parcelas mensais / a cada X dias a partir do primeiro vencimento. Os
+centavos que sobram da divisão do valor vão para a primeira ou para a última
+parcela. criar_parcelas() reserva os códigos de uma vez (gerar_codigos, a
+partir de um contador travado em sequencias) e grava todas as parcelas com
+um único INSERT de várias linhas.
+
+Todo pedido de venda é finalizado por finalizar_pedidos() (alteração manual,
+objetos de postagem e rastreamento), que chama parcelas_do_pedido(): sem
+contas a receber, o pedido ganha as parcelas do plano informado ou do padrão
+das configurações (prazos_parcelamento).
+"""
+
+import calendar
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_DOWN
+import configuracoes_sistema
+import log_alteracoes
+import sequencias
+from comissoes import STATUS_VENDA_FINALIZADA
+
+# Tabela -> (prefixo do código, coluna do parceiro, coluna do pedido)
+TABELAS = {
+    "contas_receber": ("CR", "cliente_id", "pedido_venda_id"),
+    "contas_pagar": ("CP", "fornecedor_id", "pedido_compra_id"),
+}
+
+RESTOS = ("primeira", "ultima")
+
+MAX_PARCELAS = 360
+
+FORMAS_PAGAMENTO = ("dinheiro", "cartao", "boleto", "pix", "transferencia", "cheque")
+
+# Formas de pagamento do pedido recebidas no ato (uma parcela vencendo no dia)
+FORMAS_A_VISTA = ("dinheiro", "pix", "cartao_debito")
+
+# Forma de pagamento do pedido -> forma da conta a receber
+FORMAS_CONTA = {"cartao_credito": "cartao", "cartao_debito": "cartao"}
+
+CENTAVO = Decimal("0.01")
+
+class PlanoInvalido(ValueError):
+    """Plano de parcelamento sem parcelas, com prazos inválidos ou valor não positivo."""
+
+def _somar_meses(data, meses):
+    mes = data.month - 1 + meses
+    ano = data.year + mes // 12
+    mes = mes % 12 + 1
+    return date(ano, mes, min(data.day, calendar.monthrange(ano, mes)[1]))
+
+def vencimentos(primeiro_vencimento=None, quantidade=1, intervalo="mensal", prazos=None, base=None):
+    """
+    Datas de vencimento das parcelas.
+    Com 'prazos' (dias a partir de 'base', padrão hoje) há uma parcela por prazo;
+    senão, 'quantidade' parcelas a partir de 'primeiro_vencimento', mensais
+    (mesmo dia do mês, limitado ao último dia) ou a cada 'intervalo' dias.
+    """
+    if prazos:
+        try:
+            prazos = [int(prazo) for prazo in prazos]
+        except (TypeError, ValueError):
+            raise PlanoInvalido("Os prazos devem ser números inteiros de dias")
+        if any(prazo < 0 for prazo in prazos):
+            raise PlanoInvalido("Os prazos não podem ser negativos")
+        base = base or date.today()
+        datas = [base + timedelta(days=prazo) for prazo in sorted(prazos)]
+    else:
+        if primeiro_vencimento is None:
+            raise PlanoInvalido("Informe os prazos ou o primeiro vencimento")
+        if intervalo == "mensal":
+            datas = [_somar_meses(primeiro_vencimento, i) for i in range(quantidade)]
+        elif isinstance(intervalo, int) and intervalo > 0:
+            datas = [primeiro_vencimento + timedelta(days=intervalo * i) for i in range(quantidade)]
+        else:
+            raise PlanoInvalido("O intervalo deve ser 'mensal' ou um número de dias maior que zero")
+
+    if not 1 <= len(datas) <= MAX_PARCELAS:
+        raise PlanoInvalido(f"O número de parcelas deve estar entre 1 e {MAX_PARCELAS}")
+    return datas
+
+def vencimentos_do_plano(plano):
+    """Vencimentos de um models.PlanoParcelamento."""
+    return vencimentos(plano.primeiro_vencimento, plano.quantidade, plano.intervalo_dias or "mensal", plano.prazos)
+
+def dividir(valor_total, quantidade, resto="ultima"):
+    """Divide o valor em parcelas de centavos inteiros; a diferença vai para a primeira ou a última."""
+    if resto not in RESTOS:
+        raise PlanoInvalido(f"Regra de resto inválida. Use: {', '.join(RESTOS)}")
+    total = Decimal(str(valor_total)).quantize(CENTAVO)
+    if total <= 0:
+        raise PlanoInvalido("O valor total deve ser maior que zero")
+
+    parcela = (total / quantidade).quantize(CENTAVO, rounding=ROUND_DOWN)
+    valores = [parcela] * quantidade
+    valores[0 if resto == "primeira" else -1] += total - parcela * quantidade
+    return valores
+
+def gerar_codigos(cursor, tabela, quantidade):
+    """
+    Reserva 'quantidade' códigos sequenciais de conta (formato: CR/CP + ano + sequencial)
+    no contador travado de sequencias.
+    """
+    return sequencias.reservar(cursor, tabela, TABELAS[tabela][0], quantidade)
+
+def criar_parcelas(cursor, tabela, parceiro_id, valor_total, datas, descricao, usuario_id,
+                   pedido_id=None, forma_pagamento="dinheiro", observacoes=None, resto="ultima"):
+    """
+    Grava uma conta por vencimento em 'datas', dividindo 'valor_total'.
+    Chame dentro da transação que valida o parceiro/pedido. Retorna as contas criadas.
+    """
+    _, coluna_parceiro, coluna_pedido = TABELAS[tabela]
+    valores = dividir(valor_total, len(datas), resto)
+    codigos = gerar_codigos(cursor, tabela, len(datas))
+
+    sufixo = len(datas) > 1
+    cursor.executemany(
+        f"""
+        INSERT INTO {tabela} (
+            codigo, {coluna_parceiro}, descricao, valor, data_vencimento,
+            {coluna_pedido}, status, forma_pagamento, observacoes, usuario_id
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, 'pendente', %s, %s, %s)
+        """,
+        [
+            (
+                codigo, parceiro_id,
+                f"{descricao} - Parcela {numero}/{len(datas)}" if sufixo else descricao,
+                valor, vencimento, pedido_id, forma_pagamento, observacoes, usuario_id
+            )
+            for numero, (codigo, valor, vencimento) in enumerate(zip(codigos, valores, datas), start=1)
+        ]
+    )
+
+    cursor.execute(
+        f"SELECT * FROM {tabela} WHERE codigo IN ({', '.join(['%s'] * len(codigos))}) ORDER BY data_vencimento, id",
+        codigos
+    )
+    contas = cursor.fetchall()
+    log_alteracoes.registrar(cursor, tabela, [conta["id"] for conta in contas], "insert", usuario_id)
+    return contas
+
+def prazos_padrao():
+    """Prazos (dias) das parcelas geradas ao finalizar uma venda, das configurações."""
+    return configuracoes_sistema.obter("prazos_parcelamento")
+
+def parcelas_do_pedido(cursor, pedido_id, usuario_id, plano=None):
+    """
+    Gera as contas a receber de um pedido de venda que ainda não tem nenhuma,
+    com o plano informado (models.PlanoParcelamento) ou, sem ele, uma parcela
+    no dia para vendas à vista e os prazos padrão para as demais.
+    Retorna as contas criadas (lista vazia se o pedido já tinha contas).
+    """
+    cursor.execute(
+        "SELECT id, codigo, cliente_id, valor_total, forma_pagamento FROM pedidos_venda WHERE id = %s FOR UPDATE",
+        (pedido_id,)
+    )
+    pedido = cursor.fetchone()
+    cursor.execute("SELECT COUNT(*) AS total FROM contas_receber WHERE pedido_venda_id = %s", (pedido_id,))
+    if cursor.fetchone()["total"] or not pedido["valor_total"] or pedido["valor_total"] <= 0:
+        return []
+
+    if plano is not None:
+        datas, resto = vencimentos_do_plano(plano), plano.resto
+    else:
+        prazos = [0] if pedido["forma_pagamento"] in FORMAS_A_VISTA else prazos_padrao()
+        datas, resto = vencimentos(prazos=prazos), "ultima"
+
+    forma = FORMAS_CONTA.get(pedido["forma_pagamento"], pedido["forma_pagamento"])
+    return criar_parcelas(
+        cursor, "contas_receber", pedido["cliente_id"], pedido["valor_total"], datas,
+        f"Pedido de venda {pedido['codigo']}", usuario_id, pedido_id=pedido_id, forma_pagamento=forma,
+        resto=resto
+    )
+
+def finalizar_pedidos(cursor, pedido_ids, usuario_id=None, plano=None, status="Finalizada"):
+    """
+    Finaliza os pedidos de venda ainda não finalizados: grava o status, registra
+    no log e gera as contas a receber de cada um (parcelas_do_pedido, com o plano
+    informado ou o padrão). Todo caminho que finaliza pedidos deve passar por aqui.
+    Retorna os ids finalizados.
+    """
+    pedido_ids = sorted(set(pedido_ids))
+    if not pedido_ids:
+        return []
+    cursor.execute(
+        f"SELECT id, status FROM pedidos_venda WHERE id IN ({', '.join(['%s'] * len(pedido_ids))}) FOR UPDATE",
+        pedido_ids
+    )
+    finalizar = [
+        pedido["id"] for pedido in cursor.fetchall()
+        if (pedido["status"] or "").lower() not in STATUS_VENDA_FINALIZADA
+    ]
+    if not finalizar:
+        return []
+
+    cursor.execute(
+        f"UPDATE pedidos_venda SET status = %s WHERE id IN ({', '.join(['%s'] * len(finalizar))})",
+        [status, *finalizar]
+    )
+    log_alteracoes.registrar(cursor, "pedidos_venda", finalizar, "update", usuario_id)
+    for pedido_id in finalizar:
+        parcelas_do_pedido(cursor, pedido_id, usuario_id, plano)
+    return finalizar
@@ -0,0 +1,113 @@
+"""
+Permissões de grupo verificadas no servidor.
+
+As 20 colunas booleanas de grupo_usuario são compiladas em uma máscara de
+bits (um bit por permissão, na ordem de PERMISSOES). A máscara de cada grupo
+fica em cache no processo e é descartada por invalidar() quando o grupo é
+alterado (ou expira em CACHE_SEGUNDOS, para alterações feitas em outro
+processo). Com PERMISSOES_NO_TOKEN a máscara vai no próprio JWT (claim
+'perm') e a verificação não consulta nem o cache.
+
+Uso nas rotas:
+    current_user: UserInDB = Depends(require("produtos_editar"))
+"""
+
+import threading
+import time
+from fastapi import Depends, HTTPException, status
+from database import get_db_cursor
+from auth import get_current_user
+from models import UserInDB
+
+PERMISSOES = (
+    "dashboard_visualizar", "dashboard_editar",
+    "produtos_visualizar", "produtos_editar",
+    "clientes_visualizar", "clientes_editar",
+    "vendas_visualizar", "vendas_editar",
+    "vendedores_visualizar", "vendedores_editar",
+    "compras_visualizar", "compras_editar",
+    "fornecedores_visualizar", "fornecedores_editar",
+    "estoque_visualizar", "estoque_editar",
+    "configuracoes_visualizar", "configuracoes_editar",
+    "financeiro_visualizar", "financeiro_editar",
+)
+
+BITS = {nome: 1 << indice for indice, nome in enumerate(PERMISSOES)}
+TODAS = (1 << len(PERMISSOES)) - 1
+
+# Validade da máscara em cache (alterações feitas por outros processos)
+CACHE_SEGUNDOS = 60
+
+_cache = {}  # grupo_id -> (máscara, expira_em)
+_lock = threading.Lock()
+
+def compilar(grupo):
+    """Compila as colunas booleanas de um grupo em uma máscara de bits."""
+    mascara = 0
+    for nome, bit in BITS.items():
+        if grupo.get(nome):
+            mascara |= bit
+    return mascara
+
+def expandir(mascara):
+    """Converte uma máscara de volta para o dicionário permissão -> bool."""
+    return {nome: bool(mascara & bit) for nome, bit in BITS.items()}
+
+def mascara_do_grupo(grupo_id):
+    """Máscara do grupo, do cache ou (na falta) do banco. Retorna None se o grupo não existir."""
+    if grupo_id is None:
+        return None
+
+    item = _cache.get(grupo_id)
+    if item and item[1] > time.monotonic():
+        return item[0]
+
+    with get_db_cursor() as cursor:
+        cursor.execute(
+            f"SELECT {', '.join(PERMISSOES)} FROM grupo_usuario WHERE id = %s",
+            (grupo_id,)
+        )
+        grupo = cursor.fetchone()
+
+    if not grupo:
+        return None
+
+    mascara = compilar(grupo)
+    with _lock:
+        _cache[grupo_id] = (mascara, time.monotonic() + CACHE_SEGUNDOS)
+    return mascara
+
+def invalidar(grupo_id=None):
+    """Descarta a máscara em cache de um grupo (ou de todos)."""
+    with _lock:
+        if grupo_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(grupo_id, None)
+
+def mascara_do_usuario(usuario):
+    """Máscara efetiva: administradores têm todas; o claim do token tem precedência sobre o grupo."""
+    if usuario.nivel_acesso == "admin":
+        return TODAS
+    if usuario.permissoes is not None:
+        return usuario.permissoes
+    return mascara_do_grupo(usuario.grupo_id) or 0
+
+def require(*permissoes):
+    """
+    Dependência que exige ao menos uma das permissões informadas.
+    Retorna o usuário atual, para substituir Depends(get_current_user).
+    """
+    bits = 0
+    for nome in permissoes:
+        bits |= BITS[nome]
+
+    async def verificar(current_user: UserInDB = Depends(get_current_user)):
+        if not mascara_do_usuario(current_user) & bits:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Permissão negada para esta operação"
+            )
+        return current_user
+
+    return verificar
@@ -0,0 +1,344 @@
+"""
+Previsão de demanda e sugestão automática de compras.
+
+As saídas semanais de cada produto (movimentacao_estoque, descontadas as
+devoluções de vendas canceladas/excluídas) viram uma matriz produtos × semanas
+e três modelos são ajustados de uma vez para todos os produtos do lote:
+média móvel, suavização exponencial simples e Holt-Winters aditivo com
+sazonalidade anual (quando há pelo menos dois anos de histórico).
+Cada produto usa o modelo de menor erro absoluto médio no histórico.
+
+Com a previsão, o prazo de entrega do fornecedor (médio entre pedido e
+recebimento; padrão quando não há histórico) e o erro do modelo, calcula-se
+o ponto de pedido e a quantidade sugerida até a cobertura desejada.
+
+O catálogo é processado em lotes de produtos (paginação por id), então a
+memória usada é limitada pelo tamanho do lote, não pelo catálogo.
+"""
+
+import math
+from datetime import date
+import numpy as np
+from database import get_db_cursor
+import cubo_produtos
+import log_alteracoes
+from custos import MOTIVO_RECEBIMENTO_COMPRA
+
+SEMANAS_HISTORICO = 104
+SEMANAS_SAZONALIDADE = 52
+SEMANAS_MEDIA_MOVEL = 8
+ALFA = 0.3
+GAMA = 0.1
+# Nível de serviço de ~95% para o estoque de segurança
+Z_SERVICO = 1.65
+COBERTURA_SEMANAS = 4
+PRAZO_ENTREGA_PADRAO = 14
+TAMANHO_LOTE = 2000
+
+MODELOS = ("media_movel", "suavizacao", "holt_winters")
+
+MOTIVOS_DEVOLUCAO_VENDA = ("Cancelamento de pedido de venda", "Exclusão de pedido de venda")
+
+def _placeholders(ids):
+    return ", ".join(["%s"] * len(ids))
+
+def _media_movel(Y, janela):
+    """Previsões um passo à frente (NaN antes de 'janela') e previsão futura."""
+    n, W = Y.shape
+    acumulado = np.concatenate([np.zeros((n, 1)), np.cumsum(Y, axis=1)], axis=1)
+    previsto = np.full((n, W), np.nan)
+    previsto[:, janela:] = (acumulado[:, janela:W] - acumulado[:, :W - janela]) / janela
+    futuro = (acumulado[:, W] - acumulado[:, W - janela]) / janela
+    return previsto, futuro
+
+def _suavizacao(Y, alfa):
+    n, W = Y.shape
+    nivel = Y[:, :4].mean(axis=1)
+    previsto = np.empty((n, W))
+    for t in range(W):
+        previsto[:, t] = nivel
+        nivel = nivel + alfa * (Y[:, t] - nivel)
+    return previsto, nivel
+
+def _holt_winters(Y, periodo, alfa, gama, horizonte):
+    """Holt-Winters aditivo sem tendência. Retorna previsões um passo à frente e as futuras (n × horizonte)."""
+    n, W = Y.shape
+    nivel = Y[:, :periodo].mean(axis=1)
+    sazonal = Y[:, :periodo] - nivel[:, None]
+    previsto = np.full((n, W), np.nan)
+    for t in range(periodo, W):
+        j = t % periodo
+        previsto[:, t] = nivel + sazonal[:, j]
+        novo_nivel = nivel + alfa * (Y[:, t] - sazonal[:, j] - nivel)
+        sazonal[:, j] += gama * (Y[:, t] - novo_nivel - sazonal[:, j])
+        nivel = novo_nivel
+    futuro = nivel[:, None] + sazonal[:, [(W + k) % periodo for k in range(horizonte)]]
+    return previsto, futuro
+
+def prever(Y, horizonte):
+    """
+    Ajusta os modelos em todas as linhas de Y (produtos × semanas, da mais antiga
+    para a mais recente). Retorna (previsão semanal n × horizonte, índice do modelo, erro RMSE).
+    """
+    n, W = Y.shape
+    prev_mm, fut_mm = _media_movel(Y, SEMANAS_MEDIA_MOVEL)
+    prev_se, fut_se = _suavizacao(Y, ALFA)
+
+    previsoes = [prev_mm, prev_se]
+    futuros = [np.repeat(fut_mm[:, None], horizonte, axis=1), np.repeat(fut_se[:, None], horizonte, axis=1)]
+    if W >= 2 * SEMANAS_SAZONALIDADE:
+        prev_hw, fut_hw = _holt_winters(Y, SEMANAS_SAZONALIDADE, ALFA, GAMA, horizonte)
+        previsoes.append(prev_hw)
+        futuros.append(fut_hw)
+        inicio = SEMANAS_SAZONALIDADE
+    else:
+        inicio = SEMANAS_MEDIA_MOVEL
+
+    # Erros no mesmo trecho do histórico para todos os modelos
+    erros = np.stack([Y[:, inicio:] - p[:, inicio:] for p in previsoes])
+    mae = np.abs(erros).mean(axis=2)
+    escolha = mae.argmin(axis=0)
+
+    linhas = np.arange(n)
+    previsao = np.clip(np.stack(futuros)[escolha, linhas], 0, None)
+    rmse = np.sqrt((erros[escolha, linhas] ** 2).mean(axis=1))
+    return previsao, escolha, rmse
+
+def _demanda_ate(previsao, semanas):
+    """Demanda acumulada prevista até 'semanas' (fracionário) à frente, por produto."""
+    n, H = previsao.shape
+    acumulado = np.concatenate([np.zeros((n, 1)), np.cumsum(previsao, axis=1)], axis=1)
+    inteiras = np.clip(np.floor(semanas).astype(np.int64), 0, H - 1)
+    fracao = semanas - inteiras
+    linhas = np.arange(n)
+    return acumulado[linhas, inteiras] + fracao * previsao[linhas, inteiras]
+
+def _prazos_fornecedores(cursor):
+    """Prazo médio (dias) entre o pedido de compra e o recebimento, por fornecedor."""
+    cursor.execute(
+        """
+        SELECT pc.fornecedor_id, AVG(DATEDIFF(m.data_movimentacao, pc.data_pedido)) AS prazo
+        FROM pedidos_compra pc
+        JOIN movimentacao_estoque m ON m.documento_referencia = pc.codigo AND m.motivo = %s
+        WHERE pc.status = 'recebido'
+        GROUP BY pc.fornecedor_id
+        """,
+        (MOTIVO_RECEBIMENTO_COMPRA,)
+    )
+    return {row["fornecedor_id"]: float(row["prazo"]) for row in cursor.fetchall() if row["prazo"] is not None}
+
+def _carregar_lote(cursor, ultimo_id, tamanho_lote, semanas, hoje):
+    cursor.execute(
+        """
+        SELECT id, nome, estoque_atual, COALESCE(custo_medio, preco_custo) AS custo
+        FROM produtos
+        WHERE ativo = TRUE AND id > %s
+        ORDER BY id
+        LIMIT %s
+        """,
+        (ultimo_id, tamanho_lote)
+    )
+    produtos = cursor.fetchall()
+    if not produtos:
+        return produtos, None, {}, {}
+
+    ids = [p["id"] for p in produtos]
+    placeholders = _placeholders(ids)
+
+    cursor.execute(
+        f"""
+        SELECT produto_id, FLOOR(DATEDIFF(%s, DATE(data_movimentacao)) / 7) AS semanas_atras,
+               SUM(CASE WHEN tipo = 'saida' THEN quantidade
+                        WHEN motivo IN ({_placeholders(MOTIVOS_DEVOLUCAO_VENDA)}) THEN -quantidade
+                        ELSE 0 END) AS quantidade
+        FROM movimentacao_estoque
+        WHERE produto_id IN ({placeholders})
+        AND data_movimentacao >= DATE_SUB(%s, INTERVAL %s DAY)
+        GROUP BY produto_id, semanas_atras
+        """,
+        [hoje, *MOTIVOS_DEVOLUCAO_VENDA, *ids, hoje, semanas * 7 - 1]
+    )
+    saidas = cursor.fetchall()
+
+    Y = np.zeros((len(ids), semanas))
+    if saidas:
+        linhas = np.searchsorted(np.array(ids), [s["produto_id"] for s in saidas])
+        colunas = semanas - 1 - np.array([int(s["semanas_atras"]) for s in saidas])
+        valido = (colunas >= 0) & (colunas < semanas)
+        np.add.at(Y, (linhas[valido], colunas[valido]), np.array([float(s["quantidade"]) for s in saidas])[valido])
+    Y = np.clip(Y, 0, None)
+
+    cursor.execute(
+        f"""
+        SELECT i.produto_id, SUM(i.quantidade) AS quantidade
+        FROM itens_pedido_compra i
+        JOIN pedidos_compra pc ON pc.id = i.pedido_id
+        WHERE pc.status IN ('pendente', 'aprovado')
+        AND i.produto_id IN ({placeholders})
+        GROUP BY i.produto_id
+        """,
+        ids
+    )
+    em_aberto = {row["produto_id"]: int(row["quantidade"]) for row in cursor.fetchall()}
+
+    # Fornecedor e preço da compra mais recente de cada produto
+    cursor.execute(
+        f"""
+        SELECT i.produto_id, pc.fornecedor_id, i.preco_unitario
+        FROM itens_pedido_compra i
+        JOIN pedidos_compra pc ON pc.id = i.pedido_id
+        WHERE i.id IN (
+            SELECT MAX(id) FROM itens_pedido_compra
+            WHERE produto_id IN ({placeholders})
+            GROUP BY produto_id
+        )
+        """,
+        ids
+    )
+    ultimas_compras = {row["produto_id"]: row for row in cursor.fetchall()}
+
+    return produtos, Y, em_aberto, ultimas_compras
+
+def calcular_sugestoes(
+    semanas=SEMANAS_HISTORICO, cobertura_semanas=COBERTURA_SEMANAS,
+    prazo_padrao=PRAZO_ENTREGA_PADRAO, tamanho_lote=TAMANHO_LOTE,
+    atualizar_minimo=False, hoje=None
+):
+    """
+    Processa todo o catálogo ativo em lotes e retorna (sugestoes, estatisticas).
+    Cada sugestão traz produto, fornecedor, quantidade, preço e os números da previsão.
+    Com atualizar_minimo=True grava o ponto de pedido em produtos.estoque_minimo.
+    """
+    hoje = hoje or date.today()
+    sugestoes = []
+    estatisticas = {"produtos": 0, "modelos": dict.fromkeys(MODELOS, 0), "sem_fornecedor": 0}
+
+    with get_db_cursor(read_only=True) as cursor:
+        prazos = _prazos_fornecedores(cursor)
+
+    ultimo_id = 0
+    while True:
+        with get_db_cursor(read_only=True) as cursor:
+            produtos, Y, em_aberto, ultimas_compras = _carregar_lote(cursor, ultimo_id, tamanho_lote, semanas, hoje)
+        if not produtos:
+            break
+        ultimo_id = produtos[-1]["id"]
+
+        n = len(produtos)
+        fornecedores = [ultimas_compras.get(p["id"], {}).get("fornecedor_id") for p in produtos]
+        prazo_semanas = np.array([prazos.get(f, prazo_padrao) for f in fornecedores]) / 7.0
+        horizonte = int(math.ceil(prazo_semanas.max() + cobertura_semanas)) + 1
+
+        previsao, escolha, rmse = prever(Y, horizonte)
+
+        estoque = np.array([p["estoque_atual"] or 0 for p in produtos], dtype=np.float64)
+        aberto = np.array([em_aberto.get(p["id"], 0) for p in produtos], dtype=np.float64)
+        seguranca = Z_SERVICO * rmse * np.sqrt(prazo_semanas)
+        ponto_pedido = np.ceil(_demanda_ate(previsao, prazo_semanas) + seguranca)
+        alvo = np.ceil(_demanda_ate(previsao, prazo_semanas + cobertura_semanas) + seguranca)
+        posicao = estoque + aberto
+        quantidade = np.where(posicao <= ponto_pedido, np.maximum(alvo - posicao, 0), 0)
+
+        estatisticas["produtos"] += n
+        for indice, modelo in enumerate(MODELOS):
+            estatisticas["modelos"][modelo] += int((escolha == indice).sum())
+
+        for i in np.nonzero(quantidade > 0)[0]:
+            produto = produtos[i]
+            compra = ultimas_compras.get(produto["id"])
+            if not compra:
+                estatisticas["sem_fornecedor"] += 1
+            sugestoes.append({
+                "produto_id": produto["id"],
+                "produto_nome": produto["nome"],
+                "fornecedor_id": fornecedores[i],
+                "quantidade": int(quantidade[i]),
+                "preco_unitario": float(compra["preco_unitario"] if compra else produto["custo"] or 0),
+                "estoque_atual": int(estoque[i]),
+                "em_aberto": int(aberto[i]),
+                "ponto_pedido": int(ponto_pedido[i]),
+                "demanda_semanal": round(float(previsao[i, 0]), 2),
+                "prazo_dias": round(float(prazo_semanas[i] * 7), 1),
+                "modelo": MODELOS[escolha[i]],
+            })
+
+        if atualizar_minimo:
+            with get_db_cursor(commit=True) as cursor:
+                cursor.executemany(
+                    "UPDATE produtos SET estoque_minimo = %s WHERE id = %s",
+                    [(int(ponto_pedido[i]), produtos[i]["id"]) for i in range(n)]
+                )
+                log_alteracoes.registrar(cursor, "produtos", [produto["id"] for produto in produtos], "update")
+
+    return sugestoes, estatisticas
+
+def gerar_pedidos_compra(sugestoes, usuario_id):
+    """
+    Cria um pedido de compra 'pendente' por fornecedor com as sugestões.
+    Sugestões sem fornecedor conhecido são ignoradas. Retorna os pedidos criados.
+    """
+    por_fornecedor = {}
+    for sugestao in sugestoes:
+        if sugestao["fornecedor_id"]:
+            por_fornecedor.setdefault(sugestao["fornecedor_id"], []).append(sugestao)
+
+    pedidos = []
+    for fornecedor_id, itens in por_fornecedor.items():
+        with get_db_cursor(commit=True) as cursor:
+            # Gera o código do pedido (formato: PC + ano + sequencial)
+            cursor.execute("SELECT YEAR(NOW()) as ano")
+            ano = cursor.fetchone()["ano"]
+
+            cursor.execute(
+                "SELECT COUNT(*) + 1 as seq FROM pedidos_compra WHERE YEAR(data_pedido) = %s",
+                (ano,)
+            )
+            seq = cursor.fetchone()["seq"]
+
+            codigo = f"PC{ano}{seq:04d}"
+            valor_total = sum(item["quantidade"] * item["preco_unitario"] for item in itens)
+
+            cursor.execute(
+                """
+                INSERT INTO pedidos_compra (
+                    codigo, fornecedor_id, status, valor_total, observacoes, usuario_id
+                )
+                VALUES (%s, %s, 'pendente', %s, %s, %s)
+                """,
+                (
+                    codigo, fornecedor_id, valor_total,
+                    "Sugestão automática de compra (previsão de demanda)", usuario_id
+                )
+            )
+
+            cursor.execute("SELECT LAST_INSERT_ID()")
+            pedido_id = cursor.fetchone()["LAST_INSERT_ID()"]
+
+            cursor.executemany(
+                """
+                INSERT INTO itens_pedido_compra (
+                    pedido_id, produto_id, quantidade, preco_unitario, subtotal
+                )
+                VALUES (%s, %s, %s, %s, %s)
+                """,
+                [
+                    (
+                        pedido_id, item["produto_id"], item["quantidade"],
+                        item["preco_unitario"], item["quantidade"] * item["preco_unitario"]
+                    )
+                    for item in itens
+                ]
+            )
+
+            cubo_produtos.registrar_compras(cursor, [pedido_id])
+            log_alteracoes.registrar(cursor, "pedidos_compra", pedido_id, "insert", usuario_id)
+
+        pedidos.append({
+            "pedido_id": pedido_id,
+            "codigo": codigo,
+            "fornecedor_id": fornecedor_id,
+            "itens": len(itens),
+            "valor_total": valor_total,
+        })
+
+    return pedidos
@@ -0,0 +1,327 @@
+"""
+Sincronização do rastreamento dos objetos de postagem.
+
+sincronizar() consulta nas transportadoras os objetos ainda não finalizados
+(postado / em_transito) cuja última consulta é mais antiga que o intervalo do
+seu status (INTERVALOS), com chamadas concorrentes limitadas no total
+(MAX_CONCORRENCIA) e por transportadora (concorrência e requisições por
+segundo do cliente). As respostas ficam em cache por CACHE_SEGUNDOS; depois
+disso a consulta manda o ETag recebido e a transportadora pode responder 304.
+Os resultados são gravados em lote: um UPDATE com junção para os objetos que
+mudaram e um UPDATE da data de consulta para os demais.
+
+Cada objeto é ligado a um cliente pelo nome da transportadora
+(objetos_postagem.transportadora, sem diferenciar maiúsculas): clientes
+próprios entram com registrar_cliente(); os da configuração
+rastreamento_transportadoras (nome=URL base) usam o ClienteHTTP genérico,
+que faz GET {URL base}/{codigo} e espera JSON {"status", "descricao"}.
+simular_transportadora.py sobe um servidor local com essa interface.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+from urllib.parse import quote
+from database import get_db_cursor
+import configuracoes_sistema
+import log_alteracoes
+import parcelamento
+
+logger = logging.getLogger("rastreamento")
+
+STATUS = ("postado", "em_transito", "entregue", "devolvido")
+STATUS_ABERTOS = ("postado", "em_transito")
+
+# Intervalo mínimo entre consultas de um objeto, por status
+INTERVALOS = {
+    "postado": timedelta(hours=6),
+    "em_transito": timedelta(hours=2),
+}
+
+MAX_CONCORRENCIA = 20
+
+MAX_OBJETOS = 5000
+
+CACHE_SEGUNDOS = 300
+
+# Espera máxima pedida por uma transportadora sobrecarregada (HTTP 429) antes de repetir
+MAX_ESPERA_429 = 10
+
+TAMANHO_BLOCO = 500
+
+class ErroRastreamento(Exception):
+    """Falha ao consultar a transportadora (rede, HTTP ou resposta inválida)."""
+
+class TransportadoraOcupada(ErroRastreamento):
+    """A transportadora pediu para esperar (HTTP 429) 'espera' segundos."""
+
+    def __init__(self, espera):
+        super().__init__(f"Limite de requisições da transportadora; aguarde {espera}s")
+        self.espera = espera
+
+class SincronizacaoEmAndamento(Exception):
+    """Já há uma sincronização em execução neste processo."""
+
+class ClienteRastreamento:
+    """
+    Interface dos clientes de transportadora. consultar() é síncrono (roda em
+    uma thread) e retorna {"status", "descricao", "etag"}, ou None se o objeto
+    não mudou desde 'etag'. 'status' é um de STATUS ou None se desconhecido.
+    """
+
+    max_concorrencia = 4
+    requisicoes_por_segundo = 5.0
+
+    def consultar(self, codigo, etag=None):
+        raise NotImplementedError
+
+class ClienteHTTP(ClienteRastreamento):
+    """Cliente genérico: GET {url_base}/{codigo} com JSON {"status", "descricao"}."""
+
+    # Status da transportadora -> status do objeto (os de STATUS valem como estão)
+    MAPA_STATUS = {
+        "em transito": "em_transito",
+        "saiu_para_entrega": "em_transito",
+        "saiu para entrega": "em_transito",
+        "entregue ao destinatario": "entregue",
+        "devolvido ao remetente": "devolvido",
+    }
+
+    def __init__(self, url_base, timeout=10, max_concorrencia=None, requisicoes_por_segundo=None, mapa_status=None):
+        self.url_base = url_base.rstrip("/")
+        self.timeout = timeout
+        if max_concorrencia:
+            self.max_concorrencia = max_concorrencia
+        if requisicoes_por_segundo:
+            self.requisicoes_por_segundo = requisicoes_por_segundo
+        self.mapa_status = {**self.MAPA_STATUS, **(mapa_status or {})}
+
+    def consultar(self, codigo, etag=None):
+        cabecalhos = {"Accept": "application/json"}
+        if etag:
+            cabecalhos["If-None-Match"] = etag
+        requisicao = urllib.request.Request(f"{self.url_base}/{quote(codigo, safe='')}", headers=cabecalhos)
+        try:
+            with urllib.request.urlopen(requisicao, timeout=self.timeout) as resposta:
+                dados = json.loads(resposta.read().decode("utf-8"))
+                etag = resposta.headers.get("ETag")
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None
+            if e.code == 429:
+                try:
+                    espera = float(e.headers.get("Retry-After") or 1)
+                except ValueError:
+                    espera = 1.0
+                raise TransportadoraOcupada(min(espera, MAX_ESPERA_429))
+            raise ErroRastreamento(f"HTTP {e.code} ao consultar {codigo}")
+        except (urllib.error.URLError, TimeoutError, ValueError) as e:
+            raise ErroRastreamento(f"Erro ao consultar {codigo}: {e}")
+
+        situacao = str(dados.get("status") or "").strip().lower()
+        return {
+            "status": situacao if situacao in STATUS else self.mapa_status.get(situacao),
+            "descricao": (dados.get("descricao") or None) and str(dados["descricao"])[:255],
+            "etag": etag,
+        }
+
+class LimiteTaxa:
+    """Espaça as chamadas para no máximo 'por_segundo' por segundo."""
+
+    def __init__(self, por_segundo):
+        self.intervalo = 1.0 / por_segundo if por_segundo else 0.0
+        self.proximo = 0.0
+        self.lock = asyncio.Lock()
+
+    async def aguardar(self):
+        async with self.lock:
+            agora = time.monotonic()
+            espera = self.proximo - agora
+            self.proximo = max(agora, self.proximo) + self.intervalo
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+_registrados = {}       # transportadora -> cliente (registrar_cliente)
+_configurados = None    # transportadora -> ClienteHTTP (configuração)
+_cache = {}             # (transportadora, codigo) -> (instante, resposta)
+_execucao = threading.Lock()
+
+def _normalizar(transportadora):
+    return (transportadora or "").strip().lower()
+
+def registrar_cliente(transportadora, cliente):
+    """Liga os objetos da transportadora (pelo nome) a um ClienteRastreamento."""
+    _registrados[_normalizar(transportadora)] = cliente
+    _cache.clear()
+
+def clientes():
+    """Clientes por transportadora: os da configuração e os registrados (estes têm precedência)."""
+    global _configurados
+    if _configurados is None:
+        configurados = {}
+        for item in configuracoes_sistema.obter("rastreamento_transportadoras"):
+            nome, _, url = item.partition("=")
+            if _normalizar(nome) and url.strip():
+                configurados[_normalizar(nome)] = ClienteHTTP(url.strip())
+        _configurados = configurados
+    return {**_configurados, **_registrados}
+
+@configuracoes_sistema.ao_alterar
+def _descartar_clientes(alteradas):
+    global _configurados
+    if "rastreamento_transportadoras" in alteradas:
+        _configurados = None
+        _cache.clear()
+
+def _pendentes(limite, forcar):
+    """Objetos não finalizados com rastreio cuja consulta está vencida (todos, se 'forcar')."""
+    sql = f"""
+        SELECT id, pedido_id, codigo_rastreio, transportadora, status, ultimo_evento
+        FROM objetos_postagem
+        WHERE status IN ({', '.join(['%s'] * len(STATUS_ABERTOS))})
+          AND codigo_rastreio IS NOT NULL AND codigo_rastreio <> ''
+    """
+    parametros = list(STATUS_ABERTOS)
+    if not forcar:
+        agora = datetime.now()
+        sql += """
+          AND (data_ultima_consulta IS NULL
+               OR data_ultima_consulta <= CASE status WHEN 'postado' THEN %s ELSE %s END)
+        """
+        parametros += [agora - INTERVALOS["postado"], agora - INTERVALOS["em_transito"]]
+    sql += " ORDER BY data_ultima_consulta IS NOT NULL, data_ultima_consulta LIMIT %s"
+
+    with get_db_cursor() as cursor:
+        cursor.execute(sql, [*parametros, limite])
+        return cursor.fetchall()
+
+async def _consultar(cliente, controle, semaforo, transportadora, codigo):
+    """Resposta do objeto (do cache ou da transportadora) ou None em caso de falha."""
+    chave = (transportadora, codigo)
+    em_cache = _cache.get(chave)
+    if em_cache and time.monotonic() - em_cache[0] < CACHE_SEGUNDOS:
+        return em_cache[1]
+
+    concorrencia, limite = controle
+    async with semaforo, concorrencia:
+        for tentativa in range(2):
+            await limite.aguardar()
+            try:
+                resposta = await asyncio.to_thread(cliente.consultar, codigo, em_cache and em_cache[1]["etag"])
+                break
+            except TransportadoraOcupada as e:
+                if tentativa:
+                    logger.warning(f"{transportadora}: {e}")
+                    return None
+                await asyncio.sleep(e.espera)
+            except ErroRastreamento as e:
+                logger.warning(f"{transportadora}: {e}")
+                return None
+
+    if resposta is None:
+        # Não modificado desde o ETag: a resposta em cache continua valendo
+        if not em_cache:
+            return None
+        resposta = em_cache[1]
+    _cache[chave] = (time.monotonic(), resposta)
+    return resposta
+
+def _gravar(consultados, alterados):
+    """Grava a data de consulta de todos e o novo status/evento dos alterados [(objeto, status, evento)]."""
+    agora = datetime.now()
+    with get_db_cursor(commit=True) as cursor:
+        for inicio in range(0, len(consultados), TAMANHO_BLOCO):
+            bloco = consultados[inicio:inicio + TAMANHO_BLOCO]
+            cursor.execute(
+                f"UPDATE objetos_postagem SET data_ultima_consulta = %s WHERE id IN ({', '.join(['%s'] * len(bloco))})",
+                [agora, *bloco]
+            )
+
+        for inicio in range(0, len(alterados), TAMANHO_BLOCO):
+            bloco = alterados[inicio:inicio + TAMANHO_BLOCO]
+            novos = " UNION ALL ".join(["SELECT %s AS id, %s AS status, %s AS evento"] * len(bloco))
+            cursor.execute(
+                f"""
+                UPDATE objetos_postagem o
+                JOIN ({novos}) n ON n.id = o.id
+                SET o.status = n.status, o.ultimo_evento = n.evento
+                """,
+                [valor for objeto, status, evento in bloco for valor in (objeto["id"], status, evento)]
+            )
+
+        # Como na alteração manual, a entrega finaliza o pedido de venda
+        pedidos = parcelamento.finalizar_pedidos(
+            cursor, [objeto["pedido_id"] for objeto, status, _ in alterados if status == "entregue"]
+        )
+        log_alteracoes.registrar(cursor, "objetos_postagem", [objeto["id"] for objeto, _, _ in alterados], "update")
+    return len(pedidos)
+
+async def sincronizar(limite=MAX_OBJETOS, forcar=False):
+    """
+    Atualiza o status dos objetos não finalizados pelas transportadoras.
+    Retorna o relatório: objetos lidos, consultados, alterados (por status),
+    sem cliente configurado, com falha e pedidos finalizados.
+    """
+    if not _execucao.acquire(blocking=False):
+        raise SincronizacaoEmAndamento("Já existe uma sincronização de rastreamento em andamento")
+    try:
+        objetos = await asyncio.to_thread(_pendentes, limite, forcar)
+        disponiveis = clientes()
+
+        por_codigo = {}  # (transportadora, codigo) -> objetos
+        sem_cliente = 0
+        for objeto in objetos:
+            transportadora = _normalizar(objeto["transportadora"])
+            if transportadora not in disponiveis:
+                sem_cliente += 1
+                continue
+            por_codigo.setdefault((transportadora, objeto["codigo_rastreio"].strip()), []).append(objeto)
+
+        semaforo = asyncio.Semaphore(MAX_CONCORRENCIA)
+        controles = {
+            transportadora: (asyncio.Semaphore(cliente.max_concorrencia), LimiteTaxa(cliente.requisicoes_por_segundo))
+            for transportadora, cliente in disponiveis.items()
+        }
+        respostas = await asyncio.gather(*(
+            _consultar(disponiveis[transportadora], controles[transportadora], semaforo, transportadora, codigo)
+            for transportadora, codigo in por_codigo
+        ))
+
+        consultados, alterados, falhas = [], [], 0
+        por_status = dict.fromkeys(STATUS, 0)
+        for grupo, resposta in zip(por_codigo.values(), respostas):
+            if resposta is None:
+                falhas += len(grupo)
+                continue
+            for objeto in grupo:
+                consultados.append(objeto["id"])
+                status = resposta["status"] or objeto["status"]
+                evento = resposta["descricao"] or objeto["ultimo_evento"]
+                if status != objeto["status"] or evento != objeto["ultimo_evento"]:
+                    alterados.append((objeto, status, evento))
+                    if status != objeto["status"]:
+                        por_status[status] += 1
+
+        pedidos_finalizados = await asyncio.to_thread(_gravar, consultados, alterados) if consultados else 0
+
+        # Descarta do cache as respostas antigas (objetos finalizados não voltam a ser consultados)
+        limite_cache = time.monotonic() - CACHE_SEGUNDOS * 12
+        for chave in [chave for chave, (instante, _) in _cache.items() if instante < limite_cache]:
+            _cache.pop(chave, None)
+
+        return {
+            "objetos": len(objetos),
+            "consultados": len(consultados),
+            "alterados": len(alterados),
+            "por_status": por_status,
+            "sem_cliente": sem_cliente,
+            "falhas": falhas,
+            "pedidos_finalizados": pedidos_finalizados,
+        }
+    finally:
+        _execucao.release()
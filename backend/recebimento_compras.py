@@ -0,0 +1,64 @@
+"""
+Recebimento de pedidos de compra.
+
+receber() dá entrada de todos os itens do pedido com um número fixo de
+comandos, qualquer que seja a quantidade de itens: um UPDATE de produtos
+(estoque e custo médio, custos.registrar_entradas_compra) e um INSERT de
+várias linhas em movimentacao_estoque. Usado por POST
+/api/estoque/receber-pedido/{id} e pela importação de NF-e.
+"""
+
+import custos
+import log_alteracoes
+
+def receber(cursor, pedido, itens, usuario_id):
+    """
+    Marca o pedido ('id', 'codigo') como recebido e dá entrada dos itens
+    ('produto_id', 'quantidade', 'preco_unitario'). Chame na transação que
+    validou o pedido. Retorna os ids das movimentações de estoque.
+    """
+    cursor.execute(
+        "UPDATE pedidos_compra SET status = 'recebido' WHERE id = %s",
+        (pedido["id"],)
+    )
+
+    custos.registrar_entradas_compra(
+        cursor, [(item["produto_id"], item["quantidade"], item["preco_unitario"]) for item in itens]
+    )
+
+    cursor.execute(
+        f"""
+        INSERT INTO movimentacao_estoque (
+            produto_id, tipo, quantidade, motivo,
+            documento_referencia, usuario_id
+        )
+        VALUES {', '.join(["(%s, 'entrada', %s, %s, %s, %s)"] * len(itens))}
+        """,
+        [
+            valor
+            for item in itens
+            for valor in (
+                item["produto_id"], item["quantidade"], custos.MOTIVO_RECEBIMENTO_COMPRA,
+                pedido["codigo"], usuario_id
+            )
+        ]
+    )
+    # Os ids de um INSERT de várias linhas não são necessariamente consecutivos
+    # (innodb_autoinc_lock_mode=2), mas nenhum é menor que LAST_INSERT_ID(): as
+    # movimentações são relidas pelo documento e pelo motivo
+    cursor.execute("SELECT LAST_INSERT_ID()")
+    primeiro = cursor.fetchone()["LAST_INSERT_ID()"]
+    cursor.execute(
+        """
+        SELECT id FROM movimentacao_estoque
+        WHERE id >= %s AND documento_referencia = %s AND motivo = %s
+        ORDER BY id
+        """,
+        (primeiro, pedido["codigo"], custos.MOTIVO_RECEBIMENTO_COMPRA)
+    )
+    movimentacao_ids = [linha["id"] for linha in cursor.fetchall()]
+
+    log_alteracoes.registrar(cursor, "pedidos_compra", pedido["id"], "update", usuario_id)
+    log_alteracoes.registrar(cursor, "produtos", [item["produto_id"] for item in itens], "update", usuario_id)
+    log_alteracoes.registrar(cursor, "movimentacao_estoque", movimentacao_ids, "insert", usuario_id)
+    return movimentacao_ids
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Reconstrói o cubo de vendas e compras por produto e mês (cubo_produto_mensal)
+a partir do histórico de pedidos.
+
+Use após a migração que cria o cubo, após importações feitas direto no banco
+ou para corrigir divergências. A reconstrução roda em uma única transação.
+As vendas dos meses já arquivados (ver arquivar_historico.py) são mantidas.
+
+Exemplos:
+    python reconstruir_cubo.py
+    python reconstruir_cubo.py --desde 2025-01
+"""
+
+import os
+import sys
+import argparse
+from datetime import datetime
+
+# Adiciona o diretório atual ao path para permitir importações relativas
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import get_db_cursor, sem_timeout_leitura
+import cubo_produtos
+
+def main():
+    parser = argparse.ArgumentParser(description='Reconstrói o cubo de vendas e compras por produto e mês')
+    parser.add_argument('--desde', help='Recalcula apenas a partir deste mês (formato AAAA-MM)')
+
+    args = parser.parse_args()
+
+    desde = None
+    if args.desde:
+        try:
+            desde = datetime.strptime(args.desde, "%Y-%m").date()
+        except ValueError:
+            print("Erro: --desde deve estar no formato AAAA-MM")
+            sys.exit(1)
+
+    # As consultas em lote passam do timeout de leitura das rotas
+    sem_timeout_leitura()
+
+    with get_db_cursor(commit=True) as cursor:
+        vendas, compras = cubo_produtos.reconstruir(cursor, desde)
+
+    print(f"Cubo reconstruído {'a partir de ' + args.desde if desde else 'desde o início'}.")
+    print(f"Linhas de vendas: {vendas}  Linhas de compras afetadas: {compras}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+from database import get_db_cursor
+from auth import get_current_user, UserInDB
+import log_alteracoes
+
+router = APIRouter()
+
+# Modelos Pydantic
+class Alteracao(BaseModel):
+    id: int
+    entidade: str
+    entidade_id: int
+    operacao: str
+    versao: int
+    usuario_id: Optional[int] = None
+    data_alteracao: datetime
+
+class PaginaAlteracoes(BaseModel):
+    alteracoes: List[Alteracao]
+    proximo: int
+
+# Rotas
+@router.get("/", response_model=PaginaAlteracoes)
+async def listar_alteracoes(
+    desde: int = Query(0, ge=0, description="Último offset já processado pelo consumidor"),
+    limite: int = Query(1000, ge=1, le=10000),
+    entidade: Optional[str] = Query(None, description="Entidades separadas por vírgula (ex.: produtos,pedidos_venda)"),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Lê o log de alterações a partir de um offset, em ordem.
+    O consumidor guarda `proximo` e o envia como `desde` na chamada seguinte;
+    uma página vazia significa que não há alterações novas.
+    """
+    entidades = [e.strip() for e in entidade.split(",") if e.strip()] if entidade else None
+
+    with get_db_cursor() as cursor:
+        alteracoes, proximo = log_alteracoes.ler(cursor, desde, limite, entidades)
+
+    return {"alteracoes": alteracoes, "proximo": proximo}
+
+@router.get("/ultimo", response_model=dict)
+async def obter_ultimo_offset(
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Retorna o offset confirmado mais recente, para um consumidor novo começar do
+    estado atual sem pular transações que ainda vão confirmar com offset menor.
+    """
+    with get_db_cursor() as cursor:
+        return {"offset": log_alteracoes.confirmado_ate(cursor)}
@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from database import get_db_cursor
 from auth import get_current_user, UserInDB
+from permissoes import require
+from streaming import quer_streaming, resposta_ndjson
+import log_alteracoes
+import fechamento_caixa
 
 router = APIRouter()
 
@@ -30,17 +34,31 @@ class SaldoCaixa(BaseModel):
     saidas_periodo: float
     saldo_periodo: float
 
+class FechamentoCaixa(BaseModel):
+    data: date
+    saldo_inicial: float
+    entradas: float
+    saidas: float
+    saldo_final: float
+    quantidade_movimentos: int
+
+class FechamentoCaixaCreate(BaseModel):
+    ate: Optional[date] = None  # padrão: ontem
+
 # Rotas
 @router.get("/movimentos", response_model=List[MovimentoCaixa])
 async def listar_movimentos_caixa(
+    request: Request,
     tipo: Optional[str] = None,
     data_inicio: Optional[date] = None,
     data_fim: Optional[date] = None,
+    stream: bool = False,
     current_user: UserInDB = Depends(get_current_user)
 ):
     """
     Lista todos os movimentos de caixa cadastrados no sistema.
     Pode filtrar por tipo e período.
+    Com `?stream=1` ou `Accept: application/x-ndjson`, responde em NDJSON por lotes.
     """
     query = "SELECT * FROM movimentos_caixa WHERE 1=1"
     params = []
@@ -59,6 +77,9 @@ async def listar_movimentos_caixa(
     
     query += " ORDER BY data_movimento DESC, data_registro DESC"
     
+    if quer_streaming(request, stream):
+        return resposta_ndjson(query, params)
+    
     with get_db_cursor() as cursor:
         cursor.execute(query, params)
         movimentos = cursor.fetchall()
@@ -84,32 +105,13 @@ async def obter_saldo_caixa(
         data_fim = date.today()
     
     with get_db_cursor() as cursor:
-        # Calcula o saldo atual (todas as entradas menos todas as saídas)
-        cursor.execute(
-            """
-            SELECT 
-                COALESCE(SUM(CASE WHEN tipo = 'entrada' THEN valor ELSE 0 END), 0) as total_entradas,
-                COALESCE(SUM(CASE WHEN tipo = 'saida' THEN valor ELSE 0 END), 0) as total_saidas
-            FROM movimentos_caixa
-            """
-        )
-        result = cursor.fetchone()
-        saldo_atual = result["total_entradas"] - result["total_saidas"]
+        # Saldo do último fechamento mais os movimentos dos dias abertos
+        saldo_atual = fechamento_caixa.saldo_atual(cursor)
         
-        # Calcula as entradas e saídas no período
-        cursor.execute(
-            """
-            SELECT 
-                COALESCE(SUM(CASE WHEN tipo = 'entrada' THEN valor ELSE 0 END), 0) as entradas_periodo,
-                COALESCE(SUM(CASE WHEN tipo = 'saida' THEN valor ELSE 0 END), 0) as saidas_periodo
-            FROM movimentos_caixa
-            WHERE data_movimento BETWEEN %s AND %s
-            """,
-            (data_inicio, data_fim)
-        )
-        result_periodo = cursor.fetchone()
-        entradas_periodo = result_periodo["entradas_periodo"]
-        saidas_periodo = result_periodo["saidas_periodo"]
+        # Entradas e saídas no período (fechamentos diários mais dias abertos)
+        result_periodo = fechamento_caixa.totais(cursor, data_inicio, data_fim)
+        entradas_periodo = result_periodo["entradas"]
+        saidas_periodo = result_periodo["saidas"]
         saldo_periodo = entradas_periodo - saidas_periodo
     
     return {
@@ -122,7 +124,7 @@ async def obter_saldo_caixa(
 @router.post("/movimentos", response_model=MovimentoCaixa, status_code=status.HTTP_201_CREATED)
 async def criar_movimento_caixa(
     movimento: MovimentoCaixaCreate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("financeiro_editar"))
 ):
     """
     Cria um novo movimento de caixa no sistema.
@@ -146,6 +148,7 @@ async def criar_movimento_caixa(
     
     # Cria o movimento de caixa
     with get_db_cursor(commit=True) as cursor:
+        fechamento_caixa.garantir_aberto(cursor, data_movimento)
         cursor.execute(
             """
             INSERT INTO movimentos_caixa (
@@ -164,6 +167,7 @@ async def criar_movimento_caixa(
         # Obtém o ID do movimento criado
         cursor.execute("SELECT LAST_INSERT_ID()")
         movimento_id = cursor.fetchone()["LAST_INSERT_ID()"]
+        log_alteracoes.registrar(cursor, "movimentos_caixa", movimento_id, "insert", current_user.id)
         
         # Obtém os dados do movimento criado
         cursor.execute(
@@ -200,37 +204,39 @@ async def obter_movimento_caixa(
 @router.delete("/movimentos/{movimento_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def excluir_movimento_caixa(
     movimento_id: int,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("financeiro_editar"))
 ):
     """
     Exclui um movimento de caixa do sistema.
     Apenas administradores podem excluir movimentos.
     """
     # Verifica se o usuário é administrador
-    if not current_user.admin:
+    if current_user.nivel_acesso != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Apenas administradores podem excluir movimentos de caixa"
         )
     
-    # Verifica se o movimento existe
-    with get_db_cursor() as cursor:
+    # Verifica se o movimento existe e se o dia dele ainda está aberto
+    with get_db_cursor(commit=True) as cursor:
         cursor.execute(
-            "SELECT id FROM movimentos_caixa WHERE id = %s",
+            "SELECT id, data_movimento FROM movimentos_caixa WHERE id = %s",
             (movimento_id,)
         )
-        if not cursor.fetchone():
+        movimento = cursor.fetchone()
+        if not movimento:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Movimento de caixa não encontrado"
             )
-    
-    # Exclui o movimento
-    with get_db_cursor(commit=True) as cursor:
+        fechamento_caixa.garantir_aberto(cursor, movimento["data_movimento"])
+        
+        # Exclui o movimento
         cursor.execute(
             "DELETE FROM movimentos_caixa WHERE id = %s",
             (movimento_id,)
         )
+        log_alteracoes.registrar(cursor, "movimentos_caixa", movimento_id, "delete", current_user.id)
     
     return None
 
@@ -263,20 +269,93 @@ async def relatorio_caixa(
         group_sql = "DATE_FORMAT(data_movimento, '%Y-%m')"
     
     with get_db_cursor() as cursor:
+        # Dias fechados vêm de fechamentos_caixa (um registro por dia); só os abertos somam movimentos
+        origem, params_origem = fechamento_caixa.diario(cursor, data_inicio, data_fim)
         cursor.execute(
             f"""
             SELECT 
                 {group_sql} as periodo,
-                COALESCE(SUM(CASE WHEN tipo = 'entrada' THEN valor ELSE 0 END), 0) as total_entradas,
-                COALESCE(SUM(CASE WHEN tipo = 'saida' THEN valor ELSE 0 END), 0) as total_saidas,
-                COALESCE(SUM(CASE WHEN tipo = 'entrada' THEN valor ELSE -valor END), 0) as saldo_periodo
-            FROM movimentos_caixa
-            WHERE data_movimento BETWEEN %s AND %s
+                COALESCE(SUM(entradas), 0) as total_entradas,
+                COALESCE(SUM(saidas), 0) as total_saidas,
+                COALESCE(SUM(entradas - saidas), 0) as saldo_periodo
+            FROM {origem} d
             GROUP BY periodo
             ORDER BY MIN(data_movimento)
             """,
-            (data_inicio, data_fim)
+            params_origem
         )
         relatorio = cursor.fetchall()
     
     return relatorio
+
+@router.get("/fechamentos", response_model=List[FechamentoCaixa])
+async def listar_fechamentos_caixa(
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Lista os fechamentos diários do caixa, do mais recente para o mais antigo.
+    Sem período, retorna os últimos 31 dias fechados.
+    """
+    query = "SELECT * FROM fechamentos_caixa WHERE 1=1"
+    params = []
+    
+    if data_inicio is not None:
+        query += " AND data >= %s"
+        params.append(data_inicio)
+    
+    if data_fim is not None:
+        query += " AND data <= %s"
+        params.append(data_fim)
+    
+    query += " ORDER BY data DESC"
+    if data_inicio is None and data_fim is None:
+        query += " LIMIT 31"
+    
+    with get_db_cursor() as cursor:
+        cursor.execute(query, params)
+        fechamentos = cursor.fetchall()
+    
+    return fechamentos
+
+@router.post("/fechamentos", status_code=status.HTTP_201_CREATED)
+async def fechar_caixa(
+    fechamento: FechamentoCaixaCreate,
+    current_user: UserInDB = Depends(require("financeiro_editar"))
+):
+    """
+    Fecha o caixa de todos os dias abertos até a data informada (padrão: ontem).
+    Dias fechados não aceitam novos movimentos nem exclusões.
+    """
+    ate = fechamento.ate or date.today() - timedelta(days=1)
+    
+    with get_db_cursor(commit=True) as cursor:
+        dias = fechamento_caixa.fechar(cursor, ate, current_user.id)
+        ultimo = fechamento_caixa.ultimo_fechamento(cursor)
+    
+    return {
+        "dias_fechados": dias,
+        "fechado_ate": ultimo["data"] if ultimo else None,
+        "saldo_final": float(ultimo["saldo_final"]) if ultimo else 0
+    }
+
+@router.delete("/fechamentos/{data}")
+async def reabrir_caixa(
+    data: date,
+    current_user: UserInDB = Depends(require("financeiro_editar"))
+):
+    """
+    Reabre o caixa a partir da data informada (inclusive), desfazendo os fechamentos seguintes.
+    Apenas administradores podem reabrir períodos.
+    """
+    if current_user.nivel_acesso != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Apenas administradores podem reabrir o caixa"
+        )
+    
+    with get_db_cursor(commit=True) as cursor:
+        dias = fechamento_caixa.reabrir(cursor, data)
+    
+    return {"dias_reabertos": dias}
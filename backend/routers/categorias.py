@@ -3,6 +3,8 @@ from pydantic import BaseModel
 from typing import List, Optional
 from database import get_db_cursor
 from auth import get_current_user, UserInDB
+from permissoes import require
+import log_alteracoes
 
 router = APIRouter()
 
@@ -80,7 +82,7 @@ async def obter_categoria(
 @router.post("/", response_model=Categoria, status_code=status.HTTP_201_CREATED)
 async def criar_categoria(
     categoria: CategoriaCreate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("produtos_editar"))
 ):
     """
     Cria uma nova categoria de produtos no sistema.
@@ -110,6 +112,7 @@ async def criar_categoria(
         # Obtém o ID da categoria criada
         cursor.execute("SELECT LAST_INSERT_ID()")
         categoria_id = cursor.fetchone()["LAST_INSERT_ID()"]
+        log_alteracoes.registrar(cursor, "categorias_produtos", categoria_id, "insert", current_user.id)
         
         # Obtém os dados da categoria criada
         cursor.execute(
@@ -124,7 +127,7 @@ async def criar_categoria(
 async def atualizar_categoria(
     categoria_id: int,
     categoria: CategoriaUpdate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("produtos_editar"))
 ):
     """
     Atualiza os dados de uma categoria existente.
@@ -178,6 +181,14 @@ async def atualizar_categoria(
             f"UPDATE categorias_produtos SET {set_clause} WHERE id = %s",
             values
         )
+        log_alteracoes.registrar(cursor, "categorias_produtos", categoria_id, "update", current_user.id)
+        
+        # O nome da categoria faz parte dos produtos na sincronização incremental
+        if categoria.nome is not None:
+            cursor.execute("SELECT id FROM produtos WHERE categoria_id = %s", (categoria_id,))
+            log_alteracoes.registrar(
+                cursor, "produtos", [row["id"] for row in cursor.fetchall()], "update", current_user.id
+            )
         
         # Obtém os dados atualizados
         cursor.execute(
@@ -191,7 +202,7 @@ async def atualizar_categoria(
 @router.delete("/{categoria_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def excluir_categoria(
     categoria_id: int,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("produtos_editar"))
 ):
     """
     Exclui uma categoria do sistema.
@@ -227,5 +238,6 @@ async def excluir_categoria(
             "DELETE FROM categorias_produtos WHERE id = %s",
             (categoria_id,)
         )
+        log_alteracoes.registrar(cursor, "categorias_produtos", categoria_id, "delete", current_user.id)
     
     return None
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from pydantic import BaseModel
 from typing import List, Optional
 from database import get_db_cursor
 from auth import get_current_user
+from permissoes import require
 from models import UserInDB
 from datetime import datetime
+import log_alteracoes
+import sincronizacao_cadastros
 
 router = APIRouter()
 
@@ -40,6 +43,12 @@ class Cliente(ClienteBase):
     id: int
     data_cadastro: datetime
 
+class AlteracoesClientes(BaseModel):
+    upserts: List[Cliente]
+    removidos: List[int]
+    proximo: int
+    completo: bool
+
 # Rotas
 @router.get("/", response_model=List[Cliente])
 async def listar_clientes(
@@ -63,6 +72,20 @@ async def listar_clientes(
     
     return clientes
 
+@router.get("/alteracoes", response_model=AlteracoesClientes)
+async def alteracoes_clientes(
+    desde: int = Query(0, ge=0, description="Offset devolvido pela sincronização anterior (0 para a carga completa)"),
+    limite: int = Query(1000, ge=1, le=10000),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Clientes alterados depois do offset `desde` (0 para a carga completa), para
+    manter uma cópia local em dia sem recarregar a lista inteira.
+    Envie `proximo` como `desde` na chamada seguinte e repita enquanto `completo` for falso.
+    """
+    with get_db_cursor() as cursor:
+        return sincronizacao_cadastros.alteracoes(cursor, "clientes", "SELECT * FROM clientes", "id", desde, limite)
+
 @router.get("/{cliente_id}", response_model=Cliente)
 async def obter_cliente(
     cliente_id: int,
@@ -89,7 +112,7 @@ async def obter_cliente(
 @router.post("/", response_model=Cliente, status_code=status.HTTP_201_CREATED)
 async def criar_cliente(
     cliente: ClienteCreate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("clientes_editar"))
 ):
     """
     Cria um novo cliente no sistema e sincroniza com a tabela de parceiros.
@@ -154,6 +177,10 @@ async def criar_cliente(
                 cliente.cidade, cliente.estado, cliente.cep, cliente.ativo
             )
         )
+        cursor.execute("SELECT LAST_INSERT_ID()")
+        parceiro_id = cursor.fetchone()["LAST_INSERT_ID()"]
+        log_alteracoes.registrar(cursor, "clientes", cliente_id, "insert", current_user.id)
+        log_alteracoes.registrar(cursor, "parceiros", parceiro_id, "insert", current_user.id)
         
         # Obtém os dados do cliente criado
         cursor.execute(
@@ -168,7 +195,7 @@ async def criar_cliente(
 async def atualizar_cliente(
     cliente_id: int,
     cliente: ClienteUpdate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("clientes_editar"))
 ):
     """
     Atualiza os dados de um cliente existente e sincroniza com a tabela de parceiros.
@@ -250,6 +277,7 @@ async def atualizar_cliente(
             f"UPDATE clientes SET {set_clause} WHERE id = %s",
             values
         )
+        log_alteracoes.registrar(cursor, "clientes", cliente_id, "update", current_user.id)
         
         # Verifica se existe um parceiro correspondente
         cursor.execute(
@@ -289,6 +317,7 @@ async def atualizar_cliente(
                 f"UPDATE parceiros SET {parceiro_set_clause} WHERE id = %s",
                 parceiro_values
             )
+            log_alteracoes.registrar(cursor, "parceiros", parceiro['id'], "update", current_user.id)
         elif not parceiro and cliente_atual['cpf_cnpj']:
             # Cria um novo parceiro se não existir
             # Obtém os dados atualizados do cliente
@@ -314,6 +343,8 @@ async def atualizar_cliente(
                     cliente_atualizado_dados['ativo']
                 )
             )
+            cursor.execute("SELECT LAST_INSERT_ID()")
+            log_alteracoes.registrar(cursor, "parceiros", cursor.fetchone()["LAST_INSERT_ID()"], "insert", current_user.id)
         
         # Obtém os dados atualizados
         cursor.execute(
@@ -327,7 +358,7 @@ async def atualizar_cliente(
 @router.delete("/{cliente_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def excluir_cliente(
     cliente_id: int,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("clientes_editar"))
 ):
     """
     Exclui um cliente do sistema e remove ou desativa o parceiro correspondente.
@@ -361,6 +392,7 @@ async def excluir_cliente(
             "DELETE FROM clientes WHERE id = %s",
             (cliente_id,)
         )
+        log_alteracoes.registrar(cursor, "clientes", cliente_id, "delete", current_user.id)
         
         # Se encontrou um parceiro correspondente, desativa-o ou exclui
         if parceiro:
@@ -377,6 +409,7 @@ async def excluir_cliente(
                     "UPDATE parceiros SET ativo = FALSE WHERE id = %s",
                     (parceiro['id'],)
                 )
+                log_alteracoes.registrar(cursor, "parceiros", parceiro['id'], "update", current_user.id)
                 print(f"Parceiro ID {parceiro['id']} desativado por ter vendas associadas.")
             else:
                 # Se não tem vendas, exclui o parceiro
@@ -384,6 +417,7 @@ async def excluir_cliente(
                     "DELETE FROM parceiros WHERE id = %s",
                     (parceiro['id'],)
                 )
+                log_alteracoes.registrar(cursor, "parceiros", parceiro['id'], "delete", current_user.id)
                 print(f"Parceiro ID {parceiro['id']} excluído junto com o cliente.")
     
     return None
@@ -0,0 +1,184 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import date, datetime
+from database import get_db_cursor
+from auth import get_current_user, UserInDB
+import comissoes
+
+router = APIRouter()
+
+# Modelos Pydantic
+class FechamentoCreate(BaseModel):
+    data_inicio: date
+    data_fim: date
+
+class Fechamento(BaseModel):
+    id: int
+    data_inicio: date
+    data_fim: date
+    quantidade_pedidos: int
+    total_vendas: float
+    total_comissao: float
+    usuario_id: Optional[int] = None
+    data_fechamento: datetime
+
+class ExtratoVendedor(BaseModel):
+    vendedor_id: int
+    vendedor_nome: str
+    quantidade_pedidos: int
+    quantidade_estornos: int
+    total_vendas: float
+    total_estornos: float
+    total_comissao: float
+
+class ExtratoPeriodo(ExtratoVendedor):
+    fechamento_id: int
+    data_inicio: date
+    data_fim: date
+
+class FechamentoDetalhado(Fechamento):
+    extratos: List[ExtratoVendedor]
+
+class LancamentoComissao(BaseModel):
+    pedido_id: int
+    pedido_codigo: str
+    cliente_nome: Optional[str] = None
+    tipo: str
+    data_pedido: Optional[datetime] = None
+    valor_base: float
+    percentual: float
+    valor_comissao: float
+
+def _obter_fechamento(cursor, fechamento_id):
+    cursor.execute(
+        "SELECT * FROM fechamentos_comissao WHERE id = %s",
+        (fechamento_id,)
+    )
+    fechamento = cursor.fetchone()
+
+    if not fechamento:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Fechamento de comissões não encontrado"
+        )
+
+    return fechamento
+
+# Rotas
+@router.get("/fechamentos", response_model=List[Fechamento])
+async def listar_fechamentos(
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Lista os fechamentos de comissões, do mais recente para o mais antigo.
+    """
+    with get_db_cursor() as cursor:
+        cursor.execute("SELECT * FROM fechamentos_comissao ORDER BY data_fim DESC")
+        return cursor.fetchall()
+
+@router.post("/fechamentos", response_model=FechamentoDetalhado, status_code=status.HTTP_201_CREATED)
+async def fechar_comissoes(
+    periodo: FechamentoCreate,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Fecha as comissões do período: comissiona os pedidos finalizados ainda não
+    comissionados e estorna os comissionados que foram cancelados.
+    O fechamento é definitivo e não pode ser recalculado.
+    Requer autenticação de administrador.
+    """
+    if current_user.nivel_acesso != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Permissão negada. Apenas administradores podem fechar comissões."
+        )
+
+    try:
+        with get_db_cursor(commit=True) as cursor:
+            fechamento_id = comissoes.fechar_periodo(
+                cursor, periodo.data_inicio, periodo.data_fim, current_user.id
+            )
+    except comissoes.PeriodoInvalido as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    return await obter_fechamento(fechamento_id, current_user)
+
+@router.get("/fechamentos/{fechamento_id}", response_model=FechamentoDetalhado)
+async def obter_fechamento(
+    fechamento_id: int,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Obtém um fechamento com o extrato de cada vendedor.
+    """
+    with get_db_cursor() as cursor:
+        fechamento = _obter_fechamento(cursor, fechamento_id)
+
+        cursor.execute(
+            """
+            SELECT e.vendedor_id, v.nome AS vendedor_nome, e.quantidade_pedidos,
+                   e.quantidade_estornos, e.total_vendas, e.total_estornos, e.total_comissao
+            FROM extratos_comissao e
+            JOIN vendedores v ON v.id = e.vendedor_id
+            WHERE e.fechamento_id = %s
+            ORDER BY e.total_comissao DESC
+            """,
+            (fechamento_id,)
+        )
+        fechamento["extratos"] = cursor.fetchall()
+
+    return fechamento
+
+@router.get("/fechamentos/{fechamento_id}/vendedores/{vendedor_id}", response_model=List[LancamentoComissao])
+async def detalhar_extrato(
+    fechamento_id: int,
+    vendedor_id: int,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Detalha o extrato de um vendedor em um fechamento, pedido a pedido.
+    """
+    with get_db_cursor() as cursor:
+        _obter_fechamento(cursor, fechamento_id)
+
+        cursor.execute(
+            """
+            SELECT l.pedido_id, pv.codigo AS pedido_codigo, p.nome AS cliente_nome,
+                   l.tipo, l.data_pedido, l.valor_base, l.percentual, l.valor_comissao
+            FROM lancamentos_comissao l
+            JOIN pedidos_venda pv ON pv.id = l.pedido_id
+            LEFT JOIN parceiros p ON p.id = pv.cliente_id
+            WHERE l.fechamento_id = %s AND l.vendedor_id = %s
+            ORDER BY l.data_pedido, l.pedido_id
+            """,
+            (fechamento_id, vendedor_id)
+        )
+        return cursor.fetchall()
+
+@router.get("/vendedores/{vendedor_id}", response_model=List[ExtratoPeriodo])
+async def historico_vendedor(
+    vendedor_id: int,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Lista os extratos de um vendedor em todos os fechamentos.
+    """
+    with get_db_cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT e.fechamento_id, f.data_inicio, f.data_fim,
+                   e.vendedor_id, v.nome AS vendedor_nome, e.quantidade_pedidos,
+                   e.quantidade_estornos, e.total_vendas, e.total_estornos, e.total_comissao
+            FROM extratos_comissao e
+            JOIN vendedores v ON v.id = e.vendedor_id
+            JOIN fechamentos_comissao f ON f.id = e.fechamento_id
+            WHERE e.vendedor_id = %s
+            ORDER BY f.data_fim DESC
+            """,
+            (vendedor_id,)
+        )
+        return cursor.fetchall()
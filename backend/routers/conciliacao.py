@@ -0,0 +1,80 @@
+from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form, Query
+from fastapi.concurrency import run_in_threadpool
+from typing import Optional
+from database import get_db_cursor
+from auth import get_current_user, UserInDB
+from permissoes import require
+import conciliacao_bancaria
+
+router = APIRouter()
+
+# Rotas
+@router.post("/importar")
+async def importar_extrato(
+    arquivo: UploadFile = File(...),
+    conta_bancaria_id: int = Form(...),
+    formato: Optional[str] = Form(None),
+    current_user: UserInDB = Depends(require("financeiro_editar"))
+):
+    """
+    Importa um extrato OFX ou retorno CNAB 240/400 da conta bancária e concilia
+    os lançamentos com contas a receber/pagar abertas e movimentos de caixa.
+    Sem formato, ele é detectado pelo conteúdo. Retorna o relatório da conciliação.
+    """
+    if formato is not None and formato not in conciliacao_bancaria.FORMATOS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Formato inválido. Use: {', '.join(conciliacao_bancaria.FORMATOS)}"
+        )
+
+    # Leitura e conciliação em lotes; fora do loop de eventos
+    try:
+        return await run_in_threadpool(
+            conciliacao_bancaria.importar, arquivo.file, conta_bancaria_id, current_user.id,
+            arquivo.filename, formato
+        )
+    except conciliacao_bancaria.ExtratoInvalido as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.get("/importacoes")
+async def listar_importacoes(
+    conta_bancaria_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Lista as importações de extratos, da mais recente para a mais antiga.
+    """
+    query = "SELECT * FROM importacoes_extrato WHERE 1=1"
+    params = []
+
+    if conta_bancaria_id is not None:
+        query += " AND conta_bancaria_id = %s"
+        params.append(conta_bancaria_id)
+
+    query += " ORDER BY id DESC LIMIT %s OFFSET %s"
+    params.extend([limit, offset])
+
+    with get_db_cursor() as cursor:
+        cursor.execute(query, params)
+        importacoes = cursor.fetchall()
+
+    return importacoes
+
+@router.get("/pendentes")
+async def listar_pendentes(
+    conta_bancaria_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Lista os lançamentos importados que ainda não foram conciliados
+    (sem correspondência ou de dias com o caixa fechado).
+    """
+    with get_db_cursor() as cursor:
+        return conciliacao_bancaria.pendentes(cursor, conta_bancaria_id, limit, offset)
@@ -1,9 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Body
 from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from typing import Dict, List, Optional, Any
 from pydantic import BaseModel
 from database import get_db_cursor
 from auth import get_current_user
+import configuracoes_sistema
+import permissoes
 import os
 import socket
 import json
@@ -182,8 +185,11 @@ async def update_grupo_usuario(
         # Verificar se o grupo está em uso
         cursor.execute("SELECT COUNT(*) as total FROM usuarios WHERE grupo_id = %s", (grupo_id,))
         em_uso = cursor.fetchone()["total"] > 0
-        
-        return {"id": grupo_id, **grupo.dict(), "em_uso": em_uso}
+    
+    # Após o commit, descarta a máscara de permissões em cache do grupo
+    permissoes.invalidar(grupo_id)
+    
+    return {"id": grupo_id, **grupo.dict(), "em_uso": em_uso}
 
 @router.delete("/grupo_usuario/{grupo_id}")
 async def delete_grupo_usuario(
@@ -224,8 +230,10 @@ async def delete_grupo_usuario(
         
         # Excluir o grupo
         cursor.execute("DELETE FROM grupo_usuario WHERE id = %s", (grupo_id,))
-        
-        return {"message": f"Grupo de usuários '{grupo['nome']}' excluído com sucesso"}
+    
+    permissoes.invalidar(grupo_id)
+    
+    return {"message": f"Grupo de usuários '{grupo['nome']}' excluído com sucesso"}
 
 @router.get("/link_api")
 async def get_api_url():
@@ -234,33 +242,35 @@ async def get_api_url():
     Este endpoint não requer autenticação para permitir que o frontend
     sincronize a URL da API antes do login.
     """
-    with get_db_cursor() as cursor:
-        cursor.execute("SELECT valor FROM configuracoes WHERE chave = 'link_api'")
-        result = cursor.fetchone()
-        
-        if not result:
-            return {"valor": "http://localhost:8000"}
-        
-        return {"valor": result["valor"]}
+    return {"valor": configuracoes_sistema.obter("link_api")}
+
+_endereco = None  # (hostname, ip), resolvido na primeira consulta de status
+
+def _resolver_endereco():
+    hostname = socket.gethostname()
+    return hostname, socket.gethostbyname(hostname)
+
+async def _endereco_servidor():
+    """Nome e IP do servidor. A resolução do IP consulta o DNS, então é feita uma vez só, fora do loop."""
+    global _endereco
+    if _endereco is None:
+        _endereco = await run_in_threadpool(_resolver_endereco)
+    return _endereco
 
 @router.get("/status")
 async def check_api_status():
     """
     Endpoint público para verificar o status da API.
     Retorna informações sobre o servidor e a conexão.
-    Não requer autenticação.
+    Não requer autenticação. Para o balanceador de carga, prefira
+    /api/saude/vivo e /api/saude/pronto.
     """
     try:
-        # Obter o nome do host
-        hostname = socket.gethostname()
-        # Obter o endereço IP
-        ip_address = socket.gethostbyname(hostname)
+        # Nome e IP do servidor
+        hostname, ip_address = await _endereco_servidor()
         
         # Obter a URL da API configurada
-        with get_db_cursor() as cursor:
-            cursor.execute("SELECT valor FROM configuracoes WHERE chave = 'link_api'")
-            result = cursor.fetchone()
-            api_url = result["valor"] if result else "http://localhost:8000"
+        api_url = configuracoes_sistema.obter("link_api")
         
         # Retornar informações de status
         return JSONResponse(
@@ -299,28 +309,20 @@ async def get_all_configs(current_user = Depends(get_current_user)):
             detail="Permissão negada. Apenas administradores podem acessar as configurações."
         )
     
-    with get_db_cursor() as cursor:
-        cursor.execute("SELECT chave, valor, descricao FROM configuracoes")
-        configs = cursor.fetchall()
-        
-        return configs
+    return configuracoes_sistema.listar()
 
-@router.put("/{chave}")
-async def update_config(
-    chave: str, 
-    config_data: ConfigUpdate,
+@router.put("/batch")
+async def update_configs_batch(
+    batch_data: ConfigBatchUpdate,
     current_user = Depends(get_current_user)
 ):
     """
-    Atualiza uma configuração específica.
+    Atualiza múltiplas configurações de uma vez.
     Requer autenticação de administrador.
-    Aceita qualquer chave de configuração.
     
     Parâmetros:
-    - chave: Nome da configuração (path parameter)
-    - config_data: Dados da configuração (request body)
-        - valor: Valor da configuração (obrigatório)
-        - descricao: Descrição da configuração (opcional)
+    - batch_data: Dicionário com as configurações a serem atualizadas
+        - configuracoes: Dict[str, str] - chave: valor
     """
     # Verifica se o usuário tem permissão de administrador
     if current_user.nivel_acesso != "admin":
@@ -328,63 +330,52 @@ async def update_config(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Permissão negada. Apenas administradores podem alterar configurações."
         )
-        
-    # Verifica se o valor foi fornecido
-    if not config_data.valor:
+    
+    if not batch_data.configuracoes:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="O campo 'valor' é obrigatório"
+            detail="Nenhuma configuração fornecida para atualização"
         )
     
-    with get_db_cursor(commit=True) as cursor:
-        # Verifica se a configuração existe
-        cursor.execute("SELECT id FROM configuracoes WHERE chave = %s", (chave,))
-        existing_config = cursor.fetchone()
-        
-        if not existing_config:
-            # Se não existir, cria uma nova configuração
-            cursor.execute(
-                "INSERT INTO configuracoes (chave, valor, descricao) VALUES (%s, %s, %s)",
-                (chave, config_data.valor, config_data.descricao)
-            )
-            return {
-                "message": f"Configuração '{chave}' criada com sucesso",
-                "chave": chave,
-                "valor": config_data.valor,
-                "descricao": config_data.descricao
-            }
-        
-        # Se existir, atualiza o valor e descrição
-        if config_data.descricao is not None:
-            cursor.execute(
-                "UPDATE configuracoes SET valor = %s, descricao = %s WHERE chave = %s",
-                (config_data.valor, config_data.descricao, chave)
-            )
-        else:
-            cursor.execute(
-                "UPDATE configuracoes SET valor = %s WHERE chave = %s",
-                (config_data.valor, chave)
-            )
-        
-        return {
-             "message": f"Configuração '{chave}' atualizada com sucesso",
-             "chave": chave,
-             "valor": config_data.valor,
-             "descricao": config_data.descricao
-         }
+    # Chaves com valor inválido vão para a lista de erros; as demais são gravadas de uma vez
+    errors = []
+    validas = {}
+    for chave, valor in batch_data.configuracoes.items():
+        try:
+            configuracoes_sistema.validar(chave, valor)
+            validas[chave] = valor
+        except configuracoes_sistema.ConfiguracaoInvalida as e:
+            errors.append({"chave": chave, "erro": str(e)})
+    
+    criadas, atualizadas = configuracoes_sistema.salvar(validas, usuario_id=current_user.id)
+    created_configs = [{"chave": chave, "valor": validas[chave]} for chave in criadas]
+    updated_configs = [{"chave": chave, "valor": validas[chave]} for chave in atualizadas]
+    
+    return {
+        "message": "Atualização em lote concluída",
+        "atualizadas": updated_configs,
+        "criadas": created_configs,
+        "erros": errors,
+        "total_processadas": len(updated_configs) + len(created_configs),
+        "total_erros": len(errors)
+    }
 
-@router.put("/batch")
-async def update_configs_batch(
-    batch_data: ConfigBatchUpdate,
+@router.put("/{chave}")
+async def update_config(
+    chave: str, 
+    config_data: ConfigUpdate,
     current_user = Depends(get_current_user)
 ):
     """
-    Atualiza múltiplas configurações de uma vez.
+    Atualiza uma configuração específica.
     Requer autenticação de administrador.
+    Aceita qualquer chave de configuração.
     
     Parâmetros:
-    - batch_data: Dicionário com as configurações a serem atualizadas
-        - configuracoes: Dict[str, str] - chave: valor
+    - chave: Nome da configuração (path parameter)
+    - config_data: Dados da configuração (request body)
+        - valor: Valor da configuração (obrigatório)
+        - descricao: Descrição da configuração (opcional)
     """
     # Verifica se o usuário tem permissão de administrador
     if current_user.nivel_acesso != "admin":
@@ -392,49 +383,32 @@ async def update_configs_batch(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Permissão negada. Apenas administradores podem alterar configurações."
         )
-    
-    if not batch_data.configuracoes:
+        
+    # Verifica se o valor foi fornecido
+    if not config_data.valor:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Nenhuma configuração fornecida para atualização"
+            detail="O campo 'valor' é obrigatório"
         )
     
-    updated_configs = []
-    created_configs = []
-    errors = []
-    
-    with get_db_cursor(commit=True) as cursor:
-        for chave, valor in batch_data.configuracoes.items():
-            try:
-                # Verifica se a configuração existe
-                cursor.execute("SELECT id FROM configuracoes WHERE chave = %s", (chave,))
-                existing_config = cursor.fetchone()
-                
-                if not existing_config:
-                    # Se não existir, cria uma nova configuração
-                    cursor.execute(
-                        "INSERT INTO configuracoes (chave, valor) VALUES (%s, %s)",
-                        (chave, valor)
-                    )
-                    created_configs.append({"chave": chave, "valor": valor})
-                else:
-                    # Se existir, atualiza o valor
-                    cursor.execute(
-                        "UPDATE configuracoes SET valor = %s WHERE chave = %s",
-                        (valor, chave)
-                    )
-                    updated_configs.append({"chave": chave, "valor": valor})
-                    
-            except Exception as e:
-                errors.append({"chave": chave, "erro": str(e)})
+    try:
+        criadas, _ = configuracoes_sistema.salvar(
+            {chave: config_data.valor},
+            {chave: config_data.descricao},
+            current_user.id
+        )
+    except configuracoes_sistema.ConfiguracaoInvalida as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     
+    acao = "criada" if criadas else "atualizada"
     return {
-        "message": "Atualização em lote concluída",
-        "atualizadas": updated_configs,
-        "criadas": created_configs,
-        "erros": errors,
-        "total_processadas": len(updated_configs) + len(created_configs),
-        "total_erros": len(errors)
+        "message": f"Configuração '{chave}' {acao} com sucesso",
+        "chave": chave,
+        "valor": config_data.valor,
+        "descricao": config_data.descricao
     }
 
 @router.post("/")
@@ -458,27 +432,32 @@ async def create_config(
             detail="Permissão negada. Apenas administradores podem criar configurações."
         )
     
-    with get_db_cursor(commit=True) as cursor:
-        # Verifica se a configuração já existe
-        cursor.execute("SELECT id FROM configuracoes WHERE chave = %s", (chave,))
-        if cursor.fetchone():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Configuração '{chave}' já existe. Use PUT para atualizar."
-            )
-        
-        # Cria a nova configuração
-        cursor.execute(
-            "INSERT INTO configuracoes (chave, valor, descricao) VALUES (%s, %s, %s)",
-            (chave, config_data.valor, config_data.descricao)
+    # Verifica se a configuração já existe
+    if configuracoes_sistema.existe(chave):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Configuração '{chave}' já existe. Use PUT para atualizar."
         )
-        
-        return {
-            "message": f"Configuração '{chave}' criada com sucesso",
-            "chave": chave,
-            "valor": config_data.valor,
-            "descricao": config_data.descricao
-        }
+    
+    # Cria a nova configuração
+    try:
+        configuracoes_sistema.salvar(
+            {chave: config_data.valor},
+            {chave: config_data.descricao},
+            current_user.id
+        )
+    except configuracoes_sistema.ConfiguracaoInvalida as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    return {
+        "message": f"Configuração '{chave}' criada com sucesso",
+        "chave": chave,
+        "valor": config_data.valor,
+        "descricao": config_data.descricao
+    }
 
 @router.delete("/{chave}")
 async def delete_config(
@@ -507,23 +486,17 @@ async def delete_config(
             detail=f"Configuração '{chave}' é crítica e não pode ser excluída."
         )
     
-    with get_db_cursor(commit=True) as cursor:
-        # Verifica se a configuração existe
-        cursor.execute("SELECT id, valor, descricao FROM configuracoes WHERE chave = %s", (chave,))
-        config = cursor.fetchone()
-        
-        if not config:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Configuração '{chave}' não encontrada."
-            )
-        
-        # Exclui a configuração
-        cursor.execute("DELETE FROM configuracoes WHERE chave = %s", (chave,))
-        
-        return {
-            "message": f"Configuração '{chave}' excluída com sucesso",
-            "chave": chave,
-            "valor_anterior": config["valor"],
-            "descricao_anterior": config["descricao"]
-        }
+    config = configuracoes_sistema.excluir(chave, current_user.id)
+    
+    if not config:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Configuração '{chave}' não encontrada."
+        )
+    
+    return {
+        "message": f"Configuração '{chave}' excluída com sucesso",
+        "chave": chave,
+        "valor_anterior": config["valor"],
+        "descricao_anterior": config["descricao"]
+    }
@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import date
 from database import get_db_cursor
 from auth import get_current_user, UserInDB
+from models import PlanoParcelamento
+from permissoes import require
+import log_alteracoes
+import fechamento_caixa
+import aging_contas
+import parcelamento
 
 router = APIRouter()
 
@@ -30,6 +36,14 @@ class ContaPagarUpdate(BaseModel):
     forma_pagamento: Optional[str] = None
     observacoes: Optional[str] = None
 
+class ParcelamentoPagarCreate(PlanoParcelamento):
+    fornecedor_id: Optional[int] = None  # padrão: o do pedido
+    pedido_compra_id: Optional[int] = None
+    valor_total: Optional[float] = None  # padrão: o total do pedido
+    descricao: Optional[str] = None
+    forma_pagamento: str = "dinheiro"
+    observacoes: Optional[str] = None
+
 class ContaPagar(ContaPagarBase):
     id: int
     codigo: str
@@ -78,6 +92,19 @@ async def listar_contas_pagar(
     
     return contas
 
+@router.get("/aging")
+async def aging_contas_pagar(
+    limite: int = Query(50, ge=1, le=1000, description="Quantidade de fornecedores retornados"),
+    ordenar_por: str = Query("total_vencido", pattern="^(total_vencido|total)$"),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Aging das contas abertas: valores por faixa de dias vencidos e a vencer
+    (0-30, 31-60, 61-90, 90+), no total e por fornecedor.
+    """
+    with get_db_cursor() as cursor:
+        return aging_contas.por_parceiro(cursor, "contas_pagar", limite, ordenar_por)
+
 @router.get("/{conta_id}", response_model=ContaPagar)
 async def obter_conta_pagar(
     conta_id: int,
@@ -104,7 +131,7 @@ async def obter_conta_pagar(
 @router.post("/", response_model=ContaPagar, status_code=status.HTTP_201_CREATED)
 async def criar_conta_pagar(
     conta: ContaPagarCreate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("financeiro_editar"))
 ):
     """
     Cria uma nova conta a pagar no sistema.
@@ -152,16 +179,7 @@ async def criar_conta_pagar(
     # Cria a conta a pagar
     with get_db_cursor(commit=True) as cursor:
         # Gera o código da conta (formato: CP + ano + sequencial)
-        cursor.execute("SELECT YEAR(NOW()) as ano")
-        ano = cursor.fetchone()["ano"]
-        
-        cursor.execute(
-            "SELECT COUNT(*) + 1 as seq FROM contas_pagar WHERE YEAR(data_emissao) = %s",
-            (ano,)
-        )
-        seq = cursor.fetchone()["seq"]
-        
-        codigo = f"CP{ano}{seq:04d}"
+        codigo = parcelamento.gerar_codigos(cursor, "contas_pagar", 1)[0]
         
         # Insere a conta a pagar
         cursor.execute(
@@ -182,6 +200,7 @@ async def criar_conta_pagar(
         # Obtém o ID da conta criada
         cursor.execute("SELECT LAST_INSERT_ID()")
         conta_id = cursor.fetchone()["LAST_INSERT_ID()"]
+        log_alteracoes.registrar(cursor, "contas_pagar", conta_id, "insert", current_user.id)
         
         # Obtém os dados da conta criada
         cursor.execute(
@@ -192,11 +211,87 @@ async def criar_conta_pagar(
     
     return nova_conta
 
+@router.post("/parcelas", response_model=List[ContaPagar], status_code=status.HTTP_201_CREATED)
+async def criar_parcelas_contas_pagar(
+    plano: ParcelamentoPagarCreate,
+    current_user: UserInDB = Depends(require("financeiro_editar"))
+):
+    """
+    Gera as parcelas de um valor total ou de um pedido de compra em uma única transação.
+    Com pedido_compra_id, fornecedor, valor e descrição vêm do pedido quando não informados.
+    """
+    if plano.forma_pagamento not in parcelamento.FORMAS_PAGAMENTO:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Forma de pagamento inválida. Deve ser uma das seguintes: {', '.join(parcelamento.FORMAS_PAGAMENTO)}"
+        )
+    
+    with get_db_cursor(commit=True) as cursor:
+        fornecedor_id, valor_total, descricao = plano.fornecedor_id, plano.valor_total, plano.descricao
+        
+        if plano.pedido_compra_id:
+            cursor.execute(
+                "SELECT id, codigo, fornecedor_id, valor_total FROM pedidos_compra WHERE id = %s FOR UPDATE",
+                (plano.pedido_compra_id,)
+            )
+            pedido = cursor.fetchone()
+            if not pedido:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Pedido de compra não encontrado"
+                )
+            
+            cursor.execute(
+                "SELECT COUNT(*) as total FROM contas_pagar WHERE pedido_compra_id = %s",
+                (pedido["id"],)
+            )
+            if cursor.fetchone()["total"]:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="O pedido já possui parcelas"
+                )
+            
+            fornecedor_id = fornecedor_id or pedido["fornecedor_id"]
+            valor_total = valor_total or pedido["valor_total"]
+            descricao = descricao or f"Pedido de compra {pedido['codigo']}"
+        
+        if not fornecedor_id or not valor_total or not descricao:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Informe fornecedor_id, valor_total e descricao, ou um pedido"
+            )
+        
+        # Verifica se o fornecedor existe
+        cursor.execute(
+            "SELECT id, tipo FROM parceiros WHERE id = %s",
+            (fornecedor_id,)
+        )
+        parceiro = cursor.fetchone()
+        if not parceiro or parceiro["tipo"] not in ["fornecedor", "ambos"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Fornecedor não encontrado"
+            )
+        
+        try:
+            contas = parcelamento.criar_parcelas(
+                cursor, "contas_pagar", fornecedor_id, valor_total, parcelamento.vencimentos_do_plano(plano),
+                descricao, current_user.id, pedido_id=plano.pedido_compra_id,
+                forma_pagamento=plano.forma_pagamento, observacoes=plano.observacoes, resto=plano.resto
+            )
+        except parcelamento.PlanoInvalido as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+    
+    return contas
+
 @router.put("/{conta_id}", response_model=ContaPagar)
 async def atualizar_conta_pagar(
     conta_id: int,
     conta: ContaPagarUpdate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("financeiro_editar"))
 ):
     """
     Atualiza os dados de uma conta a pagar existente.
@@ -297,6 +392,7 @@ async def atualizar_conta_pagar(
             f"UPDATE contas_pagar SET {set_clause} WHERE id = %s",
             values
         )
+        log_alteracoes.registrar(cursor, "contas_pagar", conta_id, "update", current_user.id)
         
         # Se o status foi alterado para "pago", registra o movimento de caixa
         if update_data.get("status") == "pago" and conta_atual["status"] != "pago":
@@ -306,6 +402,7 @@ async def atualizar_conta_pagar(
                 (conta_id,)
             )
             conta_atualizada = cursor.fetchone()
+            fechamento_caixa.garantir_aberto(cursor, conta_atualizada["data_pagamento"])
             
             # Registra o movimento de caixa
             cursor.execute(
@@ -322,6 +419,10 @@ async def atualizar_conta_pagar(
                     conta_atualizada["codigo"], current_user.id
                 )
             )
+            cursor.execute("SELECT LAST_INSERT_ID()")
+            log_alteracoes.registrar(
+                cursor, "movimentos_caixa", cursor.fetchone()["LAST_INSERT_ID()"], "insert", current_user.id
+            )
         
         # Obtém os dados atualizados
         cursor.execute(
@@ -335,7 +436,7 @@ async def atualizar_conta_pagar(
 @router.delete("/{conta_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def excluir_conta_pagar(
     conta_id: int,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("financeiro_editar"))
 ):
     """
     Exclui uma conta a pagar do sistema.
@@ -367,5 +468,6 @@ async def excluir_conta_pagar(
             "DELETE FROM contas_pagar WHERE id = %s",
             (conta_id,)
         )
+        log_alteracoes.registrar(cursor, "contas_pagar", conta_id, "delete", current_user.id)
     
     return None
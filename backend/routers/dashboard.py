@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from database import get_db_cursor
+from database import get_db_cursor, usar_replica_leitura
 from auth import get_current_user
 from models import UserInDB
 
-router = APIRouter()
+# Consultas analíticas pesadas são servidas pelas réplicas de leitura, quando configuradas
+router = APIRouter(dependencies=[Depends(usar_replica_leitura)])
 
 @router.get("/")
 async def get_dashboard_data(month_year: str = None, current_user: UserInDB = Depends(get_current_user)):
@@ -60,12 +61,7 @@ async def get_dashboard_data(month_year: str = None, current_user: UserInDB = De
         # Total de lucro (calculado da mesma forma que nas atividades recentes, excluindo vendas canceladas)
         query_lucro = f"""
             SELECT COALESCE(SUM(
-                pv.valor_total - COALESCE(pv.custo_produto, 
-                    (SELECT COALESCE(SUM(p.preco_custo * i.quantidade), pv.valor_total * 0.6)
-                    FROM itens_pedido_venda i
-                    JOIN produtos p ON i.produto_id = p.id
-                    WHERE i.pedido_id = pv.id)
-                )
+                pv.valor_total - pv.custo_produto
             ), 0) as total_lucro
             FROM pedidos_venda pv
             WHERE pv.status != 'Cancelada' {' AND ' + date_filter.replace('WHERE', '') if date_filter else ''}
@@ -94,12 +90,7 @@ async def get_dashboard_data(month_year: str = None, current_user: UserInDB = De
         # Lucro pendente (pedidos em aberto ou em andamento)
         query_lucro_pendente = f"""
             SELECT COALESCE(SUM(
-                pv.valor_total - COALESCE(pv.custo_produto, 
-                    (SELECT COALESCE(SUM(p.preco_custo * i.quantidade), pv.valor_total * 0.6)
-                    FROM itens_pedido_venda i
-                    JOIN produtos p ON i.produto_id = p.id
-                    WHERE i.pedido_id = pv.id)
-                )
+                pv.valor_total - pv.custo_produto
             ), 0) as lucro_pendente
             FROM pedidos_venda pv
             WHERE pv.status = 'Pendente' {' AND ' + date_filter.replace('WHERE', '') if date_filter else ''}
@@ -119,12 +110,7 @@ async def get_dashboard_data(month_year: str = None, current_user: UserInDB = De
         # Lucro concluído (pedidos concluídos)
         query_lucro_concluido = f"""
             SELECT COALESCE(SUM(
-                pv.valor_total - COALESCE(pv.custo_produto, 
-                    (SELECT COALESCE(SUM(p.preco_custo * i.quantidade), pv.valor_total * 0.6)
-                    FROM itens_pedido_venda i
-                    JOIN produtos p ON i.produto_id = p.id
-                    WHERE i.pedido_id = pv.id)
-                )
+                pv.valor_total - pv.custo_produto
             ), 0) as lucro_concluido
             FROM pedidos_venda pv
             WHERE pv.status IN ('Concluída', 'Finalizada') {' AND ' + date_filter.replace('WHERE', '') if date_filter else ''}
@@ -141,20 +127,8 @@ async def get_dashboard_data(month_year: str = None, current_user: UserInDB = De
                 pv.valor_total, 
                 pv.status, 
                 pv.data_pedido,
-                COALESCE(pv.custo_produto, 
-                    (SELECT COALESCE(SUM(prod.preco_custo * i.quantidade), pv.valor_total * 0.6)
-                    FROM itens_pedido_venda i
-                    JOIN produtos prod ON i.produto_id = prod.id
-                    WHERE i.pedido_id = pv.id)
-                ) as custo_produto,
-                (
-                    pv.valor_total - COALESCE(pv.custo_produto, 
-                        (SELECT COALESCE(SUM(prod.preco_custo * i.quantidade), pv.valor_total * 0.6)
-                        FROM itens_pedido_venda i
-                        JOIN produtos prod ON i.produto_id = prod.id
-                        WHERE i.pedido_id = pv.id)
-                    )
-                ) as lucro_produto
+                pv.custo_produto,
+                pv.valor_total - pv.custo_produto as lucro_produto
             FROM pedidos_venda pv
             JOIN parceiros p ON pv.cliente_id = p.id
             {date_filter}
@@ -164,20 +138,24 @@ async def get_dashboard_data(month_year: str = None, current_user: UserInDB = De
         cursor.execute(query_vendas_recentes)
         vendas_recentes = cursor.fetchall()
         
-        # Produtos mais vendidos - modificado para garantir resultados
+        # Produtos mais vendidos - lidos do cubo mensal (no mês filtrado ou em todo o histórico)
+        filtro_mes = "WHERE mes = %s" if month_year else ""
         query_produtos = f"""
             SELECT p.id, p.nome, 
-                   COALESCE(SUM(i.quantidade), 1) as quantidade_vendida,
-                   COALESCE(SUM(i.quantidade * i.preco_unitario), p.preco_venda) as valor_total
+                   COALESCE(c.quantidade_vendida, 1) as quantidade_vendida,
+                   COALESCE(c.receita, p.preco_venda) as valor_total
             FROM produtos p
-            LEFT JOIN itens_pedido_venda i ON i.produto_id = p.id
-            LEFT JOIN pedidos_venda pv ON i.pedido_id = pv.id
+            LEFT JOIN (
+                SELECT produto_id, SUM(quantidade_vendida) as quantidade_vendida, SUM(receita) as receita
+                FROM cubo_produto_mensal
+                {filtro_mes}
+                GROUP BY produto_id
+            ) c ON c.produto_id = p.id
             WHERE p.ativo = TRUE
-            GROUP BY p.id, p.nome, p.preco_venda
             ORDER BY quantidade_vendida DESC
             LIMIT 5
         """
-        cursor.execute(query_produtos)
+        cursor.execute(query_produtos, (f"{year}-{int(month):02d}-01",) if month_year else None)
         produtos_mais_vendidos = cursor.fetchall()
         
         # Número de vendedores (ativos no período)
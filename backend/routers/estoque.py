@@ -1,8 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
 from pydantic import BaseModel
 from typing import List, Optional
 from database import get_db_cursor
 from auth import get_current_user, UserInDB
+from permissoes import require
+from streaming import quer_streaming, resposta_ndjson
+from checkout import baixar_estoque, EstoqueInsuficiente
+import recebimento_compras
+import analise_estoque
+import log_alteracoes
 
 router = APIRouter()
 
@@ -25,13 +33,16 @@ class MovimentacaoEstoque(MovimentacaoEstoqueBase):
 # Rotas
 @router.get("/movimentacoes", response_model=List[MovimentacaoEstoque])
 async def listar_movimentacoes(
+    request: Request,
     produto_id: Optional[int] = None,
     tipo: Optional[str] = None,
+    stream: bool = False,
     current_user: UserInDB = Depends(get_current_user)
 ):
     """
     Lista todas as movimentações de estoque cadastradas no sistema.
     Pode filtrar por produto e tipo de movimentação.
+    Com `?stream=1` ou `Accept: application/x-ndjson`, responde em NDJSON por lotes.
     """
     query = "SELECT * FROM movimentacao_estoque WHERE 1=1"
     params = []
@@ -46,6 +57,9 @@ async def listar_movimentacoes(
     
     query += " ORDER BY data_movimentacao DESC"
     
+    if quer_streaming(request, stream):
+        return resposta_ndjson(query, params)
+    
     with get_db_cursor() as cursor:
         cursor.execute(query, params)
         movimentacoes = cursor.fetchall()
@@ -164,10 +178,57 @@ async def listar_produtos_estoque(
     
     return produtos
 
+@router.get("/analise", response_model=dict)
+async def analisar_estoque(
+    dias: int = Query(analise_estoque.DIAS_JANELA, ge=30, le=1095, description="Janela de histórico em dias"),
+    classe: Optional[str] = Query(None, description="Filtra pela classe ABC de receita (A, B ou C)"),
+    somente_parados: bool = False,
+    atualizar: bool = False,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Curva ABC (por receita e por volume), giro, dias de cobertura e sinalização
+    de itens lentos e parados para todo o catálogo ativo.
+    O resultado fica em cache por alguns minutos; use `atualizar=true` para recalcular.
+    """
+    resultado = await run_in_threadpool(analise_estoque.obter_analise, dias, atualizar)
+    
+    produtos = resultado["produtos"]
+    if classe:
+        produtos = [p for p in produtos if p["classe_receita"] == classe.upper()]
+    if somente_parados:
+        produtos = [p for p in produtos if p["parado"]]
+    
+    return {**resultado, "produtos": produtos}
+
+@router.get("/analise/exportar")
+async def exportar_analise_estoque(
+    dias: int = Query(analise_estoque.DIAS_JANELA, ge=30, le=1095),
+    formato: str = "xlsx",
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Exporta a análise de estoque (mesma execução em cache do endpoint /analise) em xlsx ou csv.
+    """
+    if formato not in ["xlsx", "csv"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Formato inválido. Deve ser 'xlsx' ou 'csv'"
+        )
+    
+    resultado = await run_in_threadpool(analise_estoque.obter_analise, dias)
+    conteudo, media_type, nome_arquivo = analise_estoque.exportar(resultado, formato)
+    
+    return Response(
+        content=conteudo,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{nome_arquivo}"'}
+    )
+
 @router.post("/movimentacoes", response_model=MovimentacaoEstoque, status_code=status.HTTP_201_CREATED)
 async def criar_movimentacao_estoque(
     movimentacao: MovimentacaoEstoqueCreate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("estoque_editar"))
 ):
     """
     Cria uma nova movimentação de estoque no sistema.
@@ -208,49 +269,57 @@ async def criar_movimentacao_estoque(
                 detail=f"Estoque insuficiente para o produto {produto['nome']}. Disponível: {produto['estoque_atual']}"
             )
     
-    # Calcula o novo estoque
-    estoque_atual = produto["estoque_atual"]
-    if movimentacao.tipo == "entrada":
-        novo_estoque = estoque_atual + movimentacao.quantidade
-    elif movimentacao.tipo == "saida":
-        novo_estoque = estoque_atual - movimentacao.quantidade
-    else:  # ajuste
-        novo_estoque = movimentacao.quantidade
-    
-    # Cria a movimentação e atualiza o estoque
-    with get_db_cursor(commit=True) as cursor:
-        # Insere a movimentação
-        cursor.execute(
-            """
-            INSERT INTO movimentacao_estoque (
-                produto_id, tipo, quantidade, motivo,
-                documento_referencia, usuario_id
+    # Atualiza o estoque e cria a movimentação na mesma transação.
+    # O novo saldo é calculado pelo banco, para não sobrescrever vendas concorrentes.
+    try:
+        with get_db_cursor(commit=True) as cursor:
+            if movimentacao.tipo == "entrada":
+                cursor.execute(
+                    "UPDATE produtos SET estoque_atual = estoque_atual + %s WHERE id = %s",
+                    (movimentacao.quantidade, movimentacao.produto_id)
+                )
+            elif movimentacao.tipo == "saida":
+                baixar_estoque(cursor, {movimentacao.produto_id: movimentacao.quantidade})
+            else:  # ajuste define o saldo absoluto
+                cursor.execute(
+                    "UPDATE produtos SET estoque_atual = %s WHERE id = %s",
+                    (movimentacao.quantidade, movimentacao.produto_id)
+                )
+            
+            # Insere a movimentação
+            cursor.execute(
+                """
+                INSERT INTO movimentacao_estoque (
+                    produto_id, tipo, quantidade, motivo,
+                    documento_referencia, usuario_id
+                )
+                VALUES (%s, %s, %s, %s, %s, %s)
+                """,
+                (
+                    movimentacao.produto_id, movimentacao.tipo,
+                    movimentacao.quantidade, movimentacao.motivo,
+                    movimentacao.documento_referencia, current_user.id
+                )
             )
-            VALUES (%s, %s, %s, %s, %s, %s)
-            """,
-            (
-                movimentacao.produto_id, movimentacao.tipo,
-                movimentacao.quantidade, movimentacao.motivo,
-                movimentacao.documento_referencia, current_user.id
+            
+            # Obtém o ID da movimentação criada
+            cursor.execute("SELECT LAST_INSERT_ID()")
+            movimentacao_id = cursor.fetchone()["LAST_INSERT_ID()"]
+            
+            log_alteracoes.registrar(cursor, "produtos", movimentacao.produto_id, "update", current_user.id)
+            log_alteracoes.registrar(cursor, "movimentacao_estoque", movimentacao_id, "insert", current_user.id)
+            
+            # Obtém os dados da movimentação criada
+            cursor.execute(
+                "SELECT * FROM movimentacao_estoque WHERE id = %s",
+                (movimentacao_id,)
             )
+            nova_movimentacao = cursor.fetchone()
+    except EstoqueInsuficiente as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
-        
-        # Obtém o ID da movimentação criada
-        cursor.execute("SELECT LAST_INSERT_ID()")
-        movimentacao_id = cursor.fetchone()["LAST_INSERT_ID()"]
-        
-        # Atualiza o estoque do produto
-        cursor.execute(
-            "UPDATE produtos SET estoque_atual = %s WHERE id = %s",
-            (novo_estoque, movimentacao.produto_id)
-        )
-        
-        # Obtém os dados da movimentação criada
-        cursor.execute(
-            "SELECT * FROM movimentacao_estoque WHERE id = %s",
-            (movimentacao_id,)
-        )
-        nova_movimentacao = cursor.fetchone()
     
     return nova_movimentacao
 
@@ -280,7 +349,7 @@ async def obter_movimentacao_estoque(
 @router.post("/receber-pedido/{pedido_id}", status_code=status.HTTP_200_OK)
 async def receber_pedido_compra(
     pedido_id: int,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("estoque_editar"))
 ):
     """
     Recebe um pedido de compra, atualizando o estoque dos produtos.
@@ -324,55 +393,22 @@ async def receber_pedido_compra(
                 detail="O pedido não possui itens"
             )
     
-    # Recebe o pedido e atualiza o estoque
+    # Recebe o pedido e atualiza o estoque de todos os itens em lote
     with get_db_cursor(commit=True) as cursor:
-        # Atualiza o status do pedido
-        cursor.execute(
-            "UPDATE pedidos_compra SET status = 'recebido' WHERE id = %s",
-            (pedido_id,)
-        )
-        
-        # Processa cada item do pedido
-        for item in itens:
-            # Obtém o estoque atual do produto
-            cursor.execute(
-                "SELECT estoque_atual FROM produtos WHERE id = %s",
-                (item["produto_id"],)
-            )
-            produto = cursor.fetchone()
-            novo_estoque = produto["estoque_atual"] + item["quantidade"]
-            
-            # Atualiza o estoque do produto
-            cursor.execute(
-                "UPDATE produtos SET estoque_atual = %s WHERE id = %s",
-                (novo_estoque, item["produto_id"])
-            )
-            
-            # Registra a movimentação de estoque
-            cursor.execute(
-                """
-                INSERT INTO movimentacao_estoque (
-                    produto_id, tipo, quantidade, motivo,
-                    documento_referencia, usuario_id
-                )
-                VALUES (%s, 'entrada', %s, 'Recebimento de pedido de compra',
-                        %s, %s)
-                """,
-                (
-                    item["produto_id"], item["quantidade"],
-                    pedido["codigo"], current_user.id
-                )
-            )
+        recebimento_compras.receber(cursor, pedido, itens, current_user.id)
     
     return {"message": "Pedido recebido com sucesso"}
 
 @router.get("/produto/{produto_id}/historico", response_model=List[MovimentacaoEstoque])
 async def historico_produto(
     produto_id: int,
+    request: Request,
+    stream: bool = False,
     current_user: UserInDB = Depends(get_current_user)
 ):
     """
     Obtém o histórico de movimentações de estoque de um produto específico.
+    Com `?stream=1` ou `Accept: application/x-ndjson`, responde em NDJSON por lotes.
     """
     # Verifica se o produto existe
     with get_db_cursor() as cursor:
@@ -385,16 +421,19 @@ async def historico_produto(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Produto não encontrado"
             )
-        
-        # Obtém as movimentações do produto
-        cursor.execute(
-            """
-            SELECT * FROM movimentacao_estoque
-            WHERE produto_id = %s
-            ORDER BY data_movimentacao DESC
-            """,
-            (produto_id,)
-        )
+    
+    query = """
+        SELECT * FROM movimentacao_estoque
+        WHERE produto_id = %s
+        ORDER BY data_movimentacao DESC
+    """
+    
+    if quer_streaming(request, stream):
+        return resposta_ndjson(query, (produto_id,))
+    
+    # Obtém as movimentações do produto
+    with get_db_cursor() as cursor:
+        cursor.execute(query, (produto_id,))
         movimentacoes = cursor.fetchall()
     
     return movimentacoes
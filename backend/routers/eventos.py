@@ -0,0 +1,66 @@
+from fastapi import APIRouter, HTTPException, status, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import asyncio
+from auth import get_current_user
+import eventos
+
+router = APIRouter()
+
+# Rotas
+@router.get("/")
+async def stream_eventos(
+    request: Request,
+    topicos: str = "vendas,estoque,caixa",
+    token: Optional[str] = None
+):
+    """
+    Canal de eventos (Server-Sent Events) com deltas de vendas, estoque, caixa e financeiro.
+
+    O EventSource do navegador não envia cabeçalhos, então o token pode ir em `?token=`;
+    o cabeçalho Authorization também é aceito.
+    Cada evento traz `topico`, `tipo` (entidade.operação), `id` e `dados` com o estado atual.
+    Um evento `ressincronizar` indica que eventos foram descartados e a tela deve ser recarregada.
+    """
+    if not token:
+        autorizacao = request.headers.get("Authorization", "")
+        if autorizacao.lower().startswith("bearer "):
+            token = autorizacao[7:]
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Credenciais inválidas",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    await get_current_user(token)
+
+    assinados = [t.strip() for t in topicos.split(",") if t.strip()]
+    invalidos = [t for t in assinados if t not in eventos.TOPICOS]
+    if invalidos or not assinados:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Tópicos inválidos. Use: {', '.join(eventos.TOPICOS)}"
+        )
+
+    async def gerar():
+        assinante = eventos.publicador.assinar(assinados)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    evento = await asyncio.wait_for(assinante.fila.get(), eventos.INTERVALO_PING)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Comentário SSE: mantém a conexão viva através de proxies
+                    yield ": ping\n\n"
+                    continue
+                yield eventos.formatar(evento)
+        finally:
+            eventos.publicador.cancelar(assinante)
+
+    return StreamingResponse(
+        gerar(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
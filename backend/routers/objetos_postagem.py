@@ -1,8 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from typing import List, Optional
+from datetime import datetime
 from database import get_db_cursor
 from auth import get_current_user, UserInDB
+from permissoes import require
+import rastreamento
+import log_alteracoes
+import parcelamento
 
 router = APIRouter()
 
@@ -26,6 +31,8 @@ class ObjetoPostagemUpdate(BaseModel):
 class ObjetoPostagem(ObjetoPostagemBase):
     id: int
     data_postagem: str
+    ultimo_evento: Optional[str] = None
+    data_ultima_consulta: Optional[datetime] = None
 
 # Rotas
 @router.get("/", response_model=List[ObjetoPostagem])
@@ -83,7 +90,7 @@ async def obter_objeto_postagem(
 @router.post("/", response_model=ObjetoPostagem, status_code=status.HTTP_201_CREATED)
 async def criar_objeto_postagem(
     objeto: ObjetoPostagemCreate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("vendas_editar"))
 ):
     """
     Cria um novo objeto de postagem no sistema.
@@ -134,12 +141,10 @@ async def criar_objeto_postagem(
         cursor.execute("SELECT LAST_INSERT_ID()")
         objeto_id = cursor.fetchone()["LAST_INSERT_ID()"]
         
-        # Se o status for "entregue", atualiza o status do pedido
+        # Se o status for "entregue", finaliza o pedido (e gera as contas a receber)
         if objeto.status == "entregue":
-            cursor.execute(
-                "UPDATE pedidos_venda SET status = 'Finalizada' WHERE id = %s",
-                (objeto.pedido_id,)
-            )
+            parcelamento.finalizar_pedidos(cursor, [objeto.pedido_id], current_user.id)
+        log_alteracoes.registrar(cursor, "objetos_postagem", objeto_id, "insert", current_user.id)
         
         # Obtém os dados do objeto criado
         cursor.execute(
@@ -150,11 +155,29 @@ async def criar_objeto_postagem(
     
     return novo_objeto
 
+@router.post("/sincronizar")
+async def sincronizar_rastreamento(
+    forcar: bool = False,
+    current_user: UserInDB = Depends(require("vendas_editar"))
+):
+    """
+    Consulta nas transportadoras configuradas os objetos postados ou em trânsito
+    e atualiza seus status em lote. Sem forcar, só os objetos cujo intervalo de
+    consulta (por status) já venceu.
+    """
+    try:
+        return await rastreamento.sincronizar(forcar=forcar)
+    except rastreamento.SincronizacaoEmAndamento as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+
 @router.put("/{objeto_id}", response_model=ObjetoPostagem)
 async def atualizar_objeto_postagem(
     objeto_id: int,
     objeto: ObjetoPostagemUpdate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("vendas_editar"))
 ):
     """
     Atualiza os dados de um objeto de postagem existente.
@@ -208,12 +231,10 @@ async def atualizar_objeto_postagem(
             values
         )
         
-        # Se o status for alterado para "entregue", atualiza o status do pedido
+        # Se o status for alterado para "entregue", finaliza o pedido (e gera as contas a receber)
         if objeto.status == "entregue":
-            cursor.execute(
-                "UPDATE pedidos_venda SET status = 'Finalizada' WHERE id = %s",
-                (objeto_atual["pedido_id"],)
-            )
+            parcelamento.finalizar_pedidos(cursor, [objeto_atual["pedido_id"]], current_user.id)
+        log_alteracoes.registrar(cursor, "objetos_postagem", objeto_id, "update", current_user.id)
         
         # Obtém os dados atualizados
         cursor.execute(
@@ -227,7 +248,7 @@ async def atualizar_objeto_postagem(
 @router.delete("/{objeto_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def excluir_objeto_postagem(
     objeto_id: int,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("vendas_editar"))
 ):
     """
     Exclui um objeto de postagem do sistema.
@@ -250,5 +271,6 @@ async def excluir_objeto_postagem(
             "DELETE FROM objetos_postagem WHERE id = %s",
             (objeto_id,)
         )
+        log_alteracoes.registrar(cursor, "objetos_postagem", objeto_id, "delete", current_user.id)
     
     return None
@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
 import datetime
 from database import get_db_cursor
 from auth import get_current_user, UserInDB
+from permissoes import require
+import segmentacao_clientes
+import log_alteracoes
+import sincronizacao_cadastros
 
 router = APIRouter()
 
@@ -39,11 +44,48 @@ class Parceiro(ParceiroBase):
     id: int
     data_cadastro: str
 
+class AlteracoesParceiros(BaseModel):
+    upserts: List[Parceiro]
+    removidos: List[int]
+    proximo: int
+    completo: bool
+
+class ResumoSegmento(BaseModel):
+    segmento: str
+    clientes: int
+    valor_monetario: float
+    ltv_medio: float
+    ticket_medio: float
+
+class ClienteSegmentado(BaseModel):
+    cliente_id: int
+    nome: str
+    email: Optional[str] = None
+    telefone: Optional[str] = None
+    segmento: Optional[str] = None
+    score_r: Optional[int] = None
+    score_f: Optional[int] = None
+    score_m: Optional[int] = None
+    recencia_dias: Optional[int] = None
+    frequencia: int
+    valor_monetario: float
+    ticket_medio: float
+    ltv: Optional[float] = None
+    ultima_compra: Optional[datetime.datetime] = None
+
+def _validar_segmento(segmento):
+    if segmento not in segmentacao_clientes.SEGMENTOS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Segmento inválido. Use um de: {', '.join(segmentacao_clientes.SEGMENTOS)}"
+        )
+
 # Rotas
 @router.get("/", response_model=List[Parceiro], tags=["Parceiros", "Fornecedores"])
 async def listar_parceiros(
     tipo: Optional[str] = None,
     ativo: Optional[bool] = None,
+    segmento: Optional[str] = None,
     current_user: UserInDB = Depends(get_current_user)
 ):
     """
@@ -55,6 +97,7 @@ async def listar_parceiros(
     ## Parâmetros
     - **tipo**: Filtro por tipo de parceiro ('cliente', 'fornecedor', 'ambos')
     - **ativo**: Filtro por status (true=ativo, false=inativo)
+    - **segmento**: Filtro por segmento RFM de clientes (ver `/segmentos`)
     
     ## Exemplo
     ```
@@ -79,6 +122,11 @@ async def listar_parceiros(
         query += " AND ativo = %s"
         params.append(ativo)
     
+    if segmento is not None:
+        _validar_segmento(segmento)
+        query += " AND id IN (SELECT cliente_id FROM segmento_clientes WHERE segmento = %s)"
+        params.append(segmento)
+    
     with get_db_cursor() as cursor:
         cursor.execute(query, params)
         parceiros = cursor.fetchall()
@@ -90,6 +138,96 @@ async def listar_parceiros(
     
     return parceiros
 
+@router.get("/alteracoes", response_model=AlteracoesParceiros, tags=["Parceiros", "Fornecedores"])
+async def alteracoes_parceiros(
+    desde: int = Query(0, ge=0, description="Offset devolvido pela sincronização anterior (0 para a carga completa)"),
+    limite: int = Query(1000, ge=1, le=10000),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Parceiros alterados depois do offset `desde` (0 para a carga completa), para
+    manter uma cópia local em dia sem recarregar a lista inteira.
+    Envie `proximo` como `desde` na chamada seguinte e repita enquanto `completo` for falso.
+    """
+    with get_db_cursor() as cursor:
+        pagina = sincronizacao_cadastros.alteracoes(cursor, "parceiros", "SELECT * FROM parceiros", "id", desde, limite)
+    
+    # Converter data_cadastro para string em cada parceiro
+    for parceiro in pagina["upserts"]:
+        if isinstance(parceiro['data_cadastro'], datetime.datetime):
+            parceiro['data_cadastro'] = parceiro['data_cadastro'].strftime('%Y-%m-%d %H:%M:%S')
+    
+    return pagina
+
+@router.get("/segmentos", response_model=List[ResumoSegmento], tags=["Parceiros"])
+async def resumo_segmentos(
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Resumo da segmentação RFM: quantidade de clientes, valor total,
+    LTV médio e ticket médio de cada segmento.
+    """
+    with get_db_cursor(read_only=True) as cursor:
+        cursor.execute(
+            """
+            SELECT segmento, COUNT(*) AS clientes,
+                   COALESCE(SUM(valor_monetario), 0) AS valor_monetario,
+                   COALESCE(AVG(ltv), 0) AS ltv_medio,
+                   COALESCE(AVG(ticket_medio), 0) AS ticket_medio
+            FROM segmento_clientes
+            WHERE segmento IS NOT NULL
+            GROUP BY segmento
+            """
+        )
+        resumo = {row["segmento"]: row for row in cursor.fetchall()}
+    
+    return [resumo[s] for s in segmentacao_clientes.SEGMENTOS if s in resumo]
+
+@router.get("/segmentos/clientes", response_model=List[ClienteSegmentado], tags=["Parceiros"])
+async def listar_clientes_segmentados(
+    segmento: Optional[str] = None,
+    ordenar_por: str = Query("ltv", pattern="^(ltv|valor_monetario|frequencia|ultima_compra)$"),
+    limite: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Lista os clientes com suas notas RFM, segmento e LTV,
+    opcionalmente filtrados por segmento, em ordem decrescente de `ordenar_por`.
+    """
+    query = """
+        SELECT s.cliente_id, p.nome, p.email, p.telefone, s.segmento,
+               s.score_r, s.score_f, s.score_m,
+               DATEDIFF(CURDATE(), s.ultima_compra) AS recencia_dias,
+               s.frequencia, s.valor_monetario, s.ticket_medio, s.ltv, s.ultima_compra
+        FROM segmento_clientes s
+        JOIN parceiros p ON p.id = s.cliente_id
+    """
+    params = []
+    
+    if segmento is not None:
+        _validar_segmento(segmento)
+        query += " WHERE s.segmento = %s"
+        params.append(segmento)
+    
+    query += f" ORDER BY s.{ordenar_por} DESC, s.cliente_id LIMIT %s OFFSET %s"
+    params.extend([limite, offset])
+    
+    with get_db_cursor(read_only=True) as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+@router.post("/segmentos/atualizar", tags=["Parceiros"])
+async def atualizar_segmentos(
+    completo: bool = False,
+    current_user: UserInDB = Depends(require("clientes_editar", "fornecedores_editar"))
+):
+    """
+    Atualiza a segmentação RFM. Por padrão só reagrega clientes com pedidos
+    novos ou alterados; use `completo=true` para reagregar todos.
+    """
+    return await run_in_threadpool(segmentacao_clientes.atualizar, completo)
+
 @router.get("/{parceiro_id}", response_model=Parceiro, tags=["Parceiros", "Fornecedores"])
 async def obter_parceiro(
     parceiro_id: int,
@@ -131,7 +269,7 @@ async def obter_parceiro(
 @router.post("/", response_model=Parceiro, status_code=status.HTTP_201_CREATED, tags=["Parceiros", "Fornecedores"])
 async def criar_parceiro(
     parceiro: ParceiroCreate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("clientes_editar", "fornecedores_editar"))
 ):
     """
     Cria um novo parceiro (cliente ou fornecedor) no sistema.
@@ -195,6 +333,7 @@ async def criar_parceiro(
         # Obtém o ID do parceiro criado
         cursor.execute("SELECT LAST_INSERT_ID()")
         parceiro_id = cursor.fetchone()["LAST_INSERT_ID()"]
+        log_alteracoes.registrar(cursor, "parceiros", parceiro_id, "insert", current_user.id)
         
         # Obtém os dados do parceiro criado
         cursor.execute(
@@ -213,7 +352,7 @@ async def criar_parceiro(
 async def atualizar_parceiro(
     parceiro_id: int,
     parceiro_update: ParceiroUpdate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("clientes_editar", "fornecedores_editar"))
 ):
     """
     Atualiza os dados de um parceiro existente.
@@ -306,6 +445,7 @@ async def atualizar_parceiro(
             f"UPDATE parceiros SET {set_clause} WHERE id = %s",
             values
         )
+        log_alteracoes.registrar(cursor, "parceiros", parceiro_id, "update", current_user.id)
         
         # Obtém os dados atualizados
         cursor.execute(
@@ -323,7 +463,7 @@ async def atualizar_parceiro(
 @router.delete("/{parceiro_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["Parceiros", "Fornecedores"])
 async def excluir_parceiro(
     parceiro_id: int,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("clientes_editar", "fornecedores_editar"))
 ):
     """
     Exclui um parceiro do sistema.
@@ -407,5 +547,6 @@ async def excluir_parceiro(
             "DELETE FROM parceiros WHERE id = %s",
             (parceiro_id,)
         )
+        log_alteracoes.registrar(cursor, "parceiros", parceiro_id, "delete", current_user.id)
     
     return None
@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import date
 from database import get_db_cursor
 from auth import get_current_user, UserInDB
+from permissoes import require, mascara_do_usuario, BITS
+import cubo_produtos
+import nfe_importacao
+import log_alteracoes
+import fechamento_caixa
 
 router = APIRouter()
 
@@ -124,7 +130,7 @@ async def obter_pedido_compra(
 @router.post("/", response_model=PedidoCompraDetalhado, status_code=status.HTTP_201_CREATED)
 async def criar_pedido_compra(
     pedido: PedidoCompraCreate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("compras_editar"))
 ):
     """
     Cria um novo pedido de compra no sistema, incluindo seus itens.
@@ -231,6 +237,9 @@ async def criar_pedido_compra(
                 )
             )
         
+        cubo_produtos.registrar_compras(cursor, [pedido_id])
+        log_alteracoes.registrar(cursor, "pedidos_compra", pedido_id, "insert", current_user.id)
+        
         # Obtém os dados do pedido criado
         cursor.execute(
             "SELECT * FROM pedidos_compra WHERE id = %s",
@@ -256,11 +265,38 @@ async def criar_pedido_compra(
     
     return pedido_detalhado
 
+@router.post("/importar-nfe")
+async def importar_nfe(
+    arquivo: UploadFile = File(...),
+    receber: bool = Form(True),
+    current_user: UserInDB = Depends(require("compras_editar"))
+):
+    """
+    Importa NF-e de entrada (um XML ou um .zip com vários) como pedidos de compra.
+    Com receber=true (padrão) os pedidos já são recebidos, dando entrada no estoque.
+    Notas com fornecedor ou produtos não cadastrados são recusadas e listadas no relatório.
+    """
+    if receber and not mascara_do_usuario(current_user) & BITS["estoque_editar"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Permissão negada para receber pedidos no estoque"
+        )
+
+    try:
+        return await run_in_threadpool(
+            nfe_importacao.importar, arquivo.file, current_user.id, arquivo.filename, receber
+        )
+    except nfe_importacao.NotaInvalida as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
 @router.put("/{pedido_id}", response_model=PedidoCompra)
 async def atualizar_pedido_compra(
     pedido_id: int,
     pedido: PedidoCompraUpdate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("compras_editar"))
 ):
     """
     Atualiza os dados de um pedido de compra existente.
@@ -331,8 +367,17 @@ async def atualizar_pedido_compra(
             detail="Nenhum dado para atualizar"
         )
     
+    # Fornecedor e cancelamento entram nos relatórios de compras: em pedidos de
+    # dias com o caixa fechado, só com o período reaberto (ver cache_relatorios)
+    altera_relatorios = "fornecedor_id" in update_data or (
+        pedido.status is not None and (pedido.status == "cancelado") != (pedido_atual["status"] == "cancelado")
+    )
+    
     # Atualiza o pedido
     with get_db_cursor(commit=True) as cursor:
+        if altera_relatorios:
+            fechamento_caixa.garantir_aberto(cursor, pedido_atual["data_pedido"].date())
+        
         set_clause = ", ".join([f"{key} = %s" for key in update_data.keys()])
         values = list(update_data.values())
         values.append(pedido_id)
@@ -342,6 +387,11 @@ async def atualizar_pedido_compra(
             values
         )
         
+        # Pedidos cancelados saem do cubo de compras
+        if pedido.status == "cancelado" and pedido_atual["status"] != "cancelado":
+            cubo_produtos.registrar_compras(cursor, [pedido_id], -1)
+        log_alteracoes.registrar(cursor, "pedidos_compra", pedido_id, "update", current_user.id)
+        
         # Obtém os dados atualizados
         cursor.execute(
             "SELECT * FROM pedidos_compra WHERE id = %s",
@@ -358,7 +408,7 @@ async def atualizar_pedido_compra(
 @router.delete("/{pedido_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def excluir_pedido_compra(
     pedido_id: int,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("compras_editar"))
 ):
     """
     Exclui um pedido de compra do sistema.
@@ -367,7 +417,7 @@ async def excluir_pedido_compra(
     # Verifica se o pedido existe e pode ser excluído
     with get_db_cursor() as cursor:
         cursor.execute(
-            "SELECT id, status FROM pedidos_compra WHERE id = %s",
+            "SELECT id, status, data_pedido FROM pedidos_compra WHERE id = %s",
             (pedido_id,)
         )
         pedido = cursor.fetchone()
@@ -386,6 +436,12 @@ async def excluir_pedido_compra(
     
     # Exclui o pedido e seus itens
     with get_db_cursor(commit=True) as cursor:
+        # Pedidos de dias com o caixa fechado entram nos relatórios de períodos fechados
+        fechamento_caixa.garantir_aberto(cursor, pedido["data_pedido"].date())
+        
+        # Estorna o pedido do cubo de compras antes de apagar os itens
+        cubo_produtos.registrar_compras(cursor, [pedido_id], -1)
+        
         # Exclui os itens do pedido
         cursor.execute(
             "DELETE FROM itens_pedido_compra WHERE pedido_id = %s",
@@ -397,5 +453,6 @@ async def excluir_pedido_compra(
             "DELETE FROM pedidos_compra WHERE id = %s",
             (pedido_id,)
         )
+        log_alteracoes.registrar(cursor, "pedidos_compra", pedido_id, "delete", current_user.id)
     
     return None
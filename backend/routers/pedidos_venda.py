@@ -1,9 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import date, datetime
 from database import get_db_cursor
 from auth import get_current_user, UserInDB
+from models import PlanoParcelamento
+from permissoes import require
+from streaming import quer_streaming, resposta_ndjson
+from checkout import (
+    executar_transacao, registrar_pedido_venda, processar_lote_pedidos,
+    EstoqueInsuficiente, FORMAS_PAGAMENTO
+)
+import cubo_produtos
+import segmentacao_clientes
+import log_alteracoes
+import parcelamento
+import fechamento_caixa
+from comissoes import STATUS_VENDA_FINALIZADA
 
 router = APIRouter()
 
@@ -44,6 +57,7 @@ class PedidoVendaUpdate(BaseModel):
     valor_desconto: Optional[float] = None
     forma_pagamento: Optional[str] = None
     observacoes: Optional[str] = None
+    plano_parcelamento: Optional[PlanoParcelamento] = None  # usado ao finalizar; padrão em prazos_parcelamento
 
 class PedidoVenda(PedidoVendaBase):
     id: int
@@ -59,17 +73,44 @@ class PedidoVenda(PedidoVendaBase):
 class PedidoVendaDetalhado(PedidoVenda):
     itens: List[ItemPedidoVenda]
 
+class PedidoVendaLote(PedidoVendaCreate):
+    chave_idempotencia: str  # identificador do pedido na origem (marketplace, loja virtual)
+
+class LotePedidosVenda(BaseModel):
+    pedidos: List[PedidoVendaLote]
+
+class ResultadoPedidoLote(BaseModel):
+    indice: int
+    chave_idempotencia: str
+    status: str  # 'criado', 'duplicado' ou 'erro'
+    pedido_id: Optional[int] = None
+    codigo: Optional[str] = None
+    erro: Optional[str] = None
+
+class ResultadoLote(BaseModel):
+    total: int
+    criados: int
+    duplicados: int
+    erros: int
+    resultados: List[ResultadoPedidoLote]
+
+# Limite de pedidos por requisição de lote
+MAX_PEDIDOS_LOTE = 5000
+
 # Rotas
 @router.get("/", response_model=List[PedidoVenda])
 async def listar_pedidos_venda(
+    request: Request,
     status: Optional[str] = None,
     cliente_id: Optional[int] = None,
     vendedor_id: Optional[int] = None,
+    stream: bool = False,
     current_user: UserInDB = Depends(get_current_user)
 ):
     """
     Lista todos os pedidos de venda cadastrados no sistema.
     Pode filtrar por status, cliente e vendedor.
+    Com `?stream=1` ou `Accept: application/x-ndjson`, responde em NDJSON por lotes.
     """
     query = (
         "SELECT pv.*, p.nome AS cliente_nome, v.nome AS vendedor_nome "
@@ -94,6 +135,9 @@ async def listar_pedidos_venda(
     
     query += " ORDER BY data_pedido DESC"
     
+    if quer_streaming(request, stream):
+        return resposta_ndjson(query, params)
+    
     with get_db_cursor() as cursor:
         cursor.execute(query, params)
         pedidos = cursor.fetchall()
@@ -138,7 +182,7 @@ async def obter_pedido_venda(
 @router.post("/", response_model=PedidoVendaDetalhado, status_code=status.HTTP_201_CREATED)
 async def criar_pedido_venda(
     pedido: PedidoVendaCreate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("vendas_editar"))
 ):
     """
     Cria um novo pedido de venda no sistema, incluindo seus itens.
@@ -183,6 +227,7 @@ async def criar_pedido_venda(
             )
         
         # Verifica se os produtos existem e têm estoque suficiente
+        # (verificação antecipada; a garantia é a baixa condicional na transação)
         produto_ids = [item.produto_id for item in pedido.itens]
         placeholders = ", ".join(["%s"] * len(produto_ids))
         cursor.execute(
@@ -211,96 +256,26 @@ async def criar_pedido_venda(
                 )
         
         # Verifica se a forma de pagamento é válida
-        formas_pagamento = ["dinheiro", "cartao_credito", "cartao_debito", "boleto", "pix", "transferencia"]
-        if pedido.forma_pagamento not in formas_pagamento:
+        if pedido.forma_pagamento not in FORMAS_PAGAMENTO:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Forma de pagamento inválida. Deve ser uma das seguintes: {', '.join(formas_pagamento)}"
+                detail=f"Forma de pagamento inválida. Deve ser uma das seguintes: {', '.join(FORMAS_PAGAMENTO)}"
             )
     
-    # Cria o pedido e seus itens
-    with get_db_cursor(commit=True) as cursor:
-        # Gera o código do pedido (formato: PV + ano + sequencial)
-        cursor.execute("SELECT YEAR(NOW()) as ano")
-        ano = cursor.fetchone()["ano"]
-        
-        cursor.execute(
-            "SELECT COUNT(*) + 1 as seq FROM pedidos_venda WHERE YEAR(data_pedido) = %s",
-            (ano,)
+    # Cria o pedido, seus itens e a baixa de estoque em uma única transação,
+    # repetida automaticamente em caso de deadlock
+    try:
+        pedido_id = executar_transacao(
+            lambda cursor: registrar_pedido_venda(cursor, pedido, cliente["id"], current_user.id),
+            prepared=True
         )
-        seq = cursor.fetchone()["seq"]
-        
-        codigo = f"PV{ano}{seq:04d}"
-        
-        # Calcula o valor dos produtos
-        valor_produtos = sum((item.preco_unitario - item.desconto) * item.quantidade for item in pedido.itens)
-        
-        # Calcula o valor total do pedido
-        valor_total = valor_produtos + pedido.valor_frete - pedido.valor_desconto
-        
-        # Tratar vendedor_id=0 como None para evitar erro de foreign key
-        if pedido.vendedor_id == 0:
-            pedido.vendedor_id = None
-            
-        # Insere o pedido
-        cursor.execute(
-            """
-            INSERT INTO pedidos_venda (
-                codigo, cliente_id, vendedor_id, data_entrega, status,
-                valor_produtos, valor_frete, valor_desconto, valor_total,
-                forma_pagamento, observacoes, usuario_id
-            )
-            VALUES (%s, %s, %s, %s, 'pendente', %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (
-                codigo, cliente["id"], pedido.vendedor_id, pedido.data_entrega,
-                valor_produtos, pedido.valor_frete, pedido.valor_desconto, valor_total,
-                pedido.forma_pagamento, pedido.observacoes, current_user.id
-            )
+    except EstoqueInsuficiente as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
-        
-        # Obtém o ID do pedido criado
-        cursor.execute("SELECT LAST_INSERT_ID()")
-        pedido_id = cursor.fetchone()["LAST_INSERT_ID()"]
-        
-        # Insere os itens do pedido
-        for item in pedido.itens:
-            subtotal = (item.preco_unitario - item.desconto) * item.quantidade
-            
-            cursor.execute(
-                """
-                INSERT INTO itens_pedido_venda (
-                    pedido_id, produto_id, quantidade, preco_unitario,
-                    desconto, subtotal
-                )
-                VALUES (%s, %s, %s, %s, %s, %s)
-                """,
-                (
-                    pedido_id, item.produto_id, item.quantidade,
-                    item.preco_unitario, item.desconto, subtotal
-                )
-            )
-            
-            # Atualiza o estoque do produto
-            cursor.execute(
-                "UPDATE produtos SET estoque_atual = estoque_atual - %s WHERE id = %s",
-                (item.quantidade, item.produto_id)
-            )
-            
-            # Registra a movimentação de estoque
-            cursor.execute(
-                """
-                INSERT INTO movimentacao_estoque (
-                    produto_id, tipo, quantidade, motivo,
-                    documento_referencia, usuario_id
-                )
-                VALUES (%s, 'saida', %s, 'Pedido de venda', %s, %s)
-                """,
-                (
-                    item.produto_id, item.quantidade, codigo, current_user.id
-                )
-            )
-        
+    
+    with get_db_cursor() as cursor:
         # Obtém os dados do pedido criado
         cursor.execute(
             "SELECT * FROM pedidos_venda WHERE id = %s",
@@ -321,11 +296,44 @@ async def criar_pedido_venda(
     
     return pedido_detalhado
 
+@router.post("/batch", response_model=ResultadoLote)
+async def importar_lote_pedidos_venda(
+    lote: LotePedidosVenda,
+    current_user: UserInDB = Depends(require("vendas_editar"))
+):
+    """
+    Importa um lote de pedidos de venda (integrações com marketplace e loja virtual).
+    Todos os pedidos são validados de uma vez e gravados em blocos transacionais.
+    Cada pedido traz uma chave_idempotencia: reenviar o mesmo lote não duplica pedidos.
+    Retorna o resultado de cada pedido, na ordem recebida.
+    """
+    if not lote.pedidos:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="O lote deve conter pelo menos um pedido"
+        )
+    
+    if len(lote.pedidos) > MAX_PEDIDOS_LOTE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"O lote deve conter no máximo {MAX_PEDIDOS_LOTE} pedidos"
+        )
+    
+    resultados = processar_lote_pedidos(lote.pedidos, current_user.id)
+    
+    return {
+        "total": len(resultados),
+        "criados": sum(1 for r in resultados if r["status"] == "criado"),
+        "duplicados": sum(1 for r in resultados if r["status"] == "duplicado"),
+        "erros": sum(1 for r in resultados if r["status"] == "erro"),
+        "resultados": resultados
+    }
+
 @router.put("/{pedido_id}", response_model=PedidoVenda)
 async def atualizar_pedido_venda(
     pedido_id: int,
     pedido: PedidoVendaUpdate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("vendas_editar"))
 ):
     """
     Atualiza os dados de um pedido de venda existente.
@@ -478,15 +486,44 @@ async def atualizar_pedido_venda(
         valor_total = valor_produtos + valor_frete - valor_desconto
         update_data["valor_total"] = valor_total
     
+    # A finalização grava o status e gera as contas a receber (parcelamento.finalizar_pedidos)
+    finalizando = pedido.status in STATUS_VENDA_FINALIZADA and pedido_atual["status"].lower() not in STATUS_VENDA_FINALIZADA
+    if finalizando:
+        update_data.pop("status")
+    
+    # Cliente, vendedor, valores e cancelamento entram nos relatórios de vendas:
+    # em pedidos de dias com o caixa fechado, só com o período reaberto (ver cache_relatorios)
+    altera_relatorios = any(campo in update_data for campo in ("cliente_id", "vendedor_id", "valor_total")) or (
+        pedido.status is not None
+        and (pedido.status == "cancelado") != (pedido_atual["status"].lower() == "cancelado")
+    )
+    
     # Atualiza o pedido
     with get_db_cursor(commit=True) as cursor:
-        set_clause = ", ".join([f"{key} = %s" for key in update_data.keys()])
-        values = list(update_data.values())
-        values.append(pedido_id)
+        if altera_relatorios:
+            fechamento_caixa.garantir_aberto(cursor, pedido_atual["data_pedido"].date())
         
-        cursor.execute(
-            f"UPDATE pedidos_venda SET {set_clause} WHERE id = %s",
-            values
+        if update_data:
+            set_clause = ", ".join([f"{key} = %s" for key in update_data.keys()])
+            values = list(update_data.values())
+            values.append(pedido_id)
+            
+            cursor.execute(
+                f"UPDATE pedidos_venda SET {set_clause} WHERE id = %s",
+                values
+            )
+            log_alteracoes.registrar(cursor, "pedidos_venda", pedido_id, "update", current_user.id)
+        
+        # Pedidos cancelados saem do cubo de vendas (e voltam se reabertos)
+        if pedido.status is not None:
+            cancelado_antes = cubo_produtos.venda_cancelada(pedido_atual["status"])
+            cancelado_agora = cubo_produtos.venda_cancelada(pedido.status)
+            if cancelado_antes != cancelado_agora:
+                cubo_produtos.registrar_vendas(cursor, [pedido_id], -1 if cancelado_agora else 1)
+        
+        # Status, valores e cliente entram nas métricas RFM: reagrega na próxima atualização
+        segmentacao_clientes.marcar_desatualizados(
+            cursor, [pedido_atual["cliente_id"], update_data.get("cliente_id")]
         )
         
         # Se o status foi alterado para "cancelado", devolve os produtos ao estoque
@@ -519,6 +556,24 @@ async def atualizar_pedido_venda(
                         item["produto_id"], item["quantidade"], pedido_atual["codigo"], current_user.id
                     )
                 )
+                cursor.execute("SELECT LAST_INSERT_ID()")
+                log_alteracoes.registrar(
+                    cursor, "movimentacao_estoque", cursor.fetchone()["LAST_INSERT_ID()"], "insert", current_user.id
+                )
+            
+            log_alteracoes.registrar(cursor, "produtos", [item["produto_id"] for item in itens], "update", current_user.id)
+        
+        # Ao finalizar, grava o status e gera as contas a receber do pedido (se ainda não houver)
+        if finalizando:
+            try:
+                parcelamento.finalizar_pedidos(
+                    cursor, [pedido_id], current_user.id, pedido.plano_parcelamento, pedido.status
+                )
+            except parcelamento.PlanoInvalido as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=str(e)
+                )
         
         # Obtém os dados atualizados
         cursor.execute(
@@ -532,7 +587,7 @@ async def atualizar_pedido_venda(
 @router.delete("/{pedido_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def excluir_pedido_venda(
     pedido_id: int,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("vendas_editar"))
 ):
     """
     Exclui um pedido de venda do sistema.
@@ -541,7 +596,7 @@ async def excluir_pedido_venda(
     # Verifica se o pedido existe e pode ser excluído
     with get_db_cursor() as cursor:
         cursor.execute(
-            "SELECT id, status, codigo FROM pedidos_venda WHERE id = %s",
+            "SELECT id, status, codigo, cliente_id, data_pedido FROM pedidos_venda WHERE id = %s",
             (pedido_id,)
         )
         pedido = cursor.fetchone()
@@ -567,6 +622,13 @@ async def excluir_pedido_venda(
     
     # Exclui o pedido e devolve os produtos ao estoque
     with get_db_cursor(commit=True) as cursor:
+        # Pedidos de dias com o caixa fechado entram nos relatórios de períodos fechados
+        fechamento_caixa.garantir_aberto(cursor, pedido["data_pedido"].date())
+        
+        # Estorna o pedido do cubo de vendas antes de apagar os itens
+        cubo_produtos.registrar_vendas(cursor, [pedido_id], -1)
+        segmentacao_clientes.marcar_desatualizados(cursor, [pedido["cliente_id"]])
+        
         # Devolve os produtos ao estoque
         for item in itens:
             # Atualiza o estoque do produto
@@ -588,6 +650,10 @@ async def excluir_pedido_venda(
                     item["produto_id"], item["quantidade"], pedido["codigo"], current_user.id
                 )
             )
+            cursor.execute("SELECT LAST_INSERT_ID()")
+            log_alteracoes.registrar(
+                cursor, "movimentacao_estoque", cursor.fetchone()["LAST_INSERT_ID()"], "insert", current_user.id
+            )
         
         # Exclui os itens do pedido
         cursor.execute(
@@ -600,5 +666,8 @@ async def excluir_pedido_venda(
             "DELETE FROM pedidos_venda WHERE id = %s",
             (pedido_id,)
         )
+        
+        log_alteracoes.registrar(cursor, "produtos", [item["produto_id"] for item in itens], "update", current_user.id)
+        log_alteracoes.registrar(cursor, "pedidos_venda", pedido_id, "delete", current_user.id)
     
     return None
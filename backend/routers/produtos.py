@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form
+from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form, Query
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from database import get_db_cursor
 from auth import get_current_user
+from permissoes import require
 from models import UserInDB
 from datetime import datetime
+import log_alteracoes
+import sincronizacao_cadastros
 import os
 import uuid
 import shutil
@@ -47,6 +50,14 @@ class Produto(ProdutoBase):
     categoria_nome: Optional[str] = None
     caminho_imagem: Optional[str] = None
 
+class AlteracoesProdutos(BaseModel):
+    upserts: List[Produto]
+    removidos: List[int]
+    proximo: int
+    completo: bool
+
+CONSULTA_PRODUTOS = "SELECT p.*, c.nome AS categoria_nome FROM produtos p LEFT JOIN categorias_produtos c ON p.categoria_id = c.id"
+
 # Rotas
 @router.get("/", response_model=List[Produto])
 async def listar_produtos(
@@ -58,7 +69,7 @@ async def listar_produtos(
     Lista todos os produtos cadastrados no sistema.
     Pode filtrar por status (ativo/inativo) e categoria.
     """
-    query = "SELECT p.*, c.nome AS categoria_nome FROM produtos p LEFT JOIN categorias_produtos c ON p.categoria_id = c.id WHERE 1=1"
+    query = f"{CONSULTA_PRODUTOS} WHERE 1=1"
     params = []
     
     if ativo is not None:
@@ -75,6 +86,20 @@ async def listar_produtos(
     
     return produtos
 
+@router.get("/alteracoes", response_model=AlteracoesProdutos)
+async def alteracoes_produtos(
+    desde: int = Query(0, ge=0, description="Offset devolvido pela sincronização anterior (0 para a carga completa)"),
+    limite: int = Query(1000, ge=1, le=10000),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Produtos alterados depois do offset `desde` (0 para a carga completa), para
+    manter uma cópia local em dia sem recarregar a lista inteira.
+    Envie `proximo` como `desde` na chamada seguinte e repita enquanto `completo` for falso.
+    """
+    with get_db_cursor() as cursor:
+        return sincronizacao_cadastros.alteracoes(cursor, "produtos", CONSULTA_PRODUTOS, "p.id", desde, limite)
+
 @router.get("/{produto_id}", response_model=Produto)
 async def obter_produto(
     produto_id: int,
@@ -83,7 +108,7 @@ async def obter_produto(
     """
     Obtém os detalhes de um produto específico.
     """
-    with get_db_cursor() as cursor:
+    with get_db_cursor(prepared=True) as cursor:
         cursor.execute(
             "SELECT * FROM produtos WHERE id = %s",
             (produto_id,)
@@ -111,7 +136,7 @@ async def criar_produto(
     comissao: float = Form(0.0),
     ativo: bool = Form(True),
     imagens: List[UploadFile] = File(None),
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("produtos_editar"))
 ):
     """
     Cria um novo produto no sistema com upload de imagens.
@@ -204,6 +229,7 @@ async def criar_produto(
         # Obtém o ID do produto criado
         cursor.execute("SELECT LAST_INSERT_ID()")
         produto_id = cursor.fetchone()["LAST_INSERT_ID()"]
+        log_alteracoes.registrar(cursor, "produtos", produto_id, "insert", current_user.id)
         
         # Obtém os dados do produto criado
         cursor.execute(
@@ -218,7 +244,7 @@ async def criar_produto(
 async def atualizar_produto(
     produto_id: int,
     produto: ProdutoUpdate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("produtos_editar"))
 ):
     """
     Atualiza os dados de um produto existente.
@@ -303,6 +329,9 @@ async def atualizar_produto(
             f"UPDATE produtos SET {set_clause} WHERE id = %s",
             values
         )
+        log_alteracoes.registrar(cursor, "produtos", produto_id, "update", current_user.id)
+        # O nome aparece nos relatórios de vendas e compras (ver cache_relatorios)
+        log_alteracoes.contar(cursor, "produtos_cadastro")
         
         # Obtém os dados atualizados
         cursor.execute(
@@ -327,7 +356,7 @@ async def upload_imagens_produto(
     comissao: float = Form(0.0),
     ativo: bool = Form(True),
     imagens: List[UploadFile] = File(None),
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("produtos_editar"))
 ):
     """
     Atualiza um produto existente com upload de novas imagens.
@@ -436,6 +465,8 @@ async def upload_imagens_produto(
                 caminho_imagem, ativo, produto_id
             )
         )
+        log_alteracoes.registrar(cursor, "produtos", produto_id, "update", current_user.id)
+        log_alteracoes.contar(cursor, "produtos_cadastro")
         
         cursor.execute(
             "SELECT * FROM produtos WHERE id = %s",
@@ -453,7 +484,7 @@ async def obter_produto_por_codigo(
     """
     Obtém os detalhes de um produto pelo seu código.
     """
-    with get_db_cursor() as cursor:
+    with get_db_cursor(prepared=True) as cursor:
         cursor.execute(
             "SELECT * FROM produtos WHERE codigo = %s",
             (codigo,)
@@ -471,7 +502,7 @@ async def obter_produto_por_codigo(
 @router.delete("/{produto_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def excluir_produto(
     produto_id: int,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("produtos_editar"))
 ):
     """
     Desativa um produto do sistema (soft delete).
@@ -499,6 +530,7 @@ async def excluir_produto(
             "UPDATE produtos SET ativo = FALSE WHERE id = %s",
             (produto_id,)
         )
+        log_alteracoes.registrar(cursor, "produtos", produto_id, "update", current_user.id)
     
     return None
 
@@ -4,6 +4,11 @@ from typing import List, Optional
 from datetime import date
 from database import get_db_cursor
 from auth import get_current_user, UserInDB
+from permissoes import require
+import cubo_produtos
+import custos
+import log_alteracoes
+import sequencias
 
 router = APIRouter()
 
@@ -126,7 +131,7 @@ async def obter_proposta(
 @router.post("/", response_model=PropostaDetalhada, status_code=status.HTTP_201_CREATED)
 async def criar_proposta(
     proposta: PropostaCreate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("vendas_editar"))
 ):
     """
     Cria uma nova proposta comercial no sistema, incluindo seus itens.
@@ -247,6 +252,8 @@ async def criar_proposta(
                 )
             )
         
+        log_alteracoes.registrar(cursor, "propostas_comerciais", proposta_id, "insert", current_user.id)
+        
         # Obtém os dados da proposta criada
         cursor.execute(
             "SELECT * FROM propostas_comerciais WHERE id = %s",
@@ -271,7 +278,7 @@ async def criar_proposta(
 async def atualizar_proposta(
     proposta_id: int,
     proposta: PropostaUpdate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("vendas_editar"))
 ):
     """
     Atualiza os dados de uma proposta comercial existente.
@@ -370,6 +377,7 @@ async def atualizar_proposta(
             f"UPDATE propostas_comerciais SET {set_clause} WHERE id = %s",
             values
         )
+        log_alteracoes.registrar(cursor, "propostas_comerciais", proposta_id, "update", current_user.id)
         
         # Obtém os dados atualizados
         cursor.execute(
@@ -383,7 +391,7 @@ async def atualizar_proposta(
 @router.delete("/{proposta_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def excluir_proposta(
     proposta_id: int,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("vendas_editar"))
 ):
     """
     Exclui uma proposta comercial do sistema.
@@ -422,13 +430,14 @@ async def excluir_proposta(
             "DELETE FROM propostas_comerciais WHERE id = %s",
             (proposta_id,)
         )
+        log_alteracoes.registrar(cursor, "propostas_comerciais", proposta_id, "delete", current_user.id)
     
     return None
 
 @router.post("/{proposta_id}/converter-pedido", status_code=status.HTTP_201_CREATED)
 async def converter_proposta_em_pedido(
     proposta_id: int,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("vendas_editar"))
 ):
     """
     Converte uma proposta comercial aprovada em um pedido de venda.
@@ -483,16 +492,7 @@ async def converter_proposta_em_pedido(
     # Converte a proposta em pedido
     with get_db_cursor(commit=True) as cursor:
         # Gera o código do pedido (formato: PV + ano + sequencial)
-        cursor.execute("SELECT YEAR(NOW()) as ano")
-        ano = cursor.fetchone()["ano"]
-        
-        cursor.execute(
-            "SELECT COUNT(*) + 1 as seq FROM pedidos_venda WHERE YEAR(data_pedido) = %s",
-            (ano,)
-        )
-        seq = cursor.fetchone()["seq"]
-        
-        codigo = f"PV{ano}{seq:04d}"
+        codigo = sequencias.reservar(cursor, "pedidos_venda", "PV", 1)[0]
         
         # Insere o pedido
         cursor.execute(
@@ -516,6 +516,7 @@ async def converter_proposta_em_pedido(
         pedido_id = cursor.fetchone()["LAST_INSERT_ID()"]
         
         # Insere os itens do pedido
+        movimentacao_ids = []
         for item in itens_proposta:
             cursor.execute(
                 """
@@ -550,6 +551,11 @@ async def converter_proposta_em_pedido(
                     item["produto_id"], item["quantidade"], codigo, current_user.id
                 )
             )
+            cursor.execute("SELECT LAST_INSERT_ID()")
+            movimentacao_ids.append(cursor.fetchone()["LAST_INSERT_ID()"])
+        
+        custos.fixar_custos(cursor, [pedido_id])
+        cubo_produtos.registrar_vendas(cursor, [pedido_id])
         
         # Atualiza o status da proposta
         cursor.execute(
@@ -557,6 +563,11 @@ async def converter_proposta_em_pedido(
             (proposta_id,)
         )
         
+        log_alteracoes.registrar(cursor, "pedidos_venda", pedido_id, "insert", current_user.id)
+        log_alteracoes.registrar(cursor, "produtos", [item["produto_id"] for item in itens_proposta], "update", current_user.id)
+        log_alteracoes.registrar(cursor, "movimentacao_estoque", movimentacao_ids, "insert", current_user.id)
+        log_alteracoes.registrar(cursor, "propostas_comerciais", proposta_id, "update", current_user.id)
+        
         # Obtém os dados do pedido criado
         cursor.execute(
             "SELECT * FROM pedidos_venda WHERE id = %s",
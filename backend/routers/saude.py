@@ -0,0 +1,26 @@
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+import saude
+
+router = APIRouter()
+
+# Rotas (públicas, para o balanceador de carga e o monitoramento)
+@router.get("/vivo")
+async def verificar_vivo():
+    """
+    Liveness: responde enquanto o processo atende requisições.
+    Não acessa o banco nem a rede.
+    """
+    return saude.vivo()
+
+@router.get("/pronto")
+async def verificar_pronto():
+    """
+    Readiness: banco, réplicas, saturação dos pools, heartbeat do gerenciador
+    de timeout e atraso do loop de eventos. As verificações no banco ficam em
+    cache por alguns segundos. Responde 503 quando uma dependência essencial
+    (banco ou gerenciador de timeout) falha.
+    """
+    resultado = await saude.prontidao()
+    codigo = status.HTTP_503_SERVICE_UNAVAILABLE if resultado["status"] == "indisponivel" else status.HTTP_200_OK
+    return JSONResponse(status_code=codigo, content=resultado)
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List
 from database import get_db_cursor
-from auth import get_current_user, get_password_hash, verify_password
+from auth import get_current_user, get_password_hash_async, verify_password_async
+import permissoes
 from models import Usuario, UsuarioBase, UsuarioCreate, UsuarioUpdate, UserInDB, PasswordChange
 
 router = APIRouter()
@@ -42,42 +43,17 @@ async def get_grupo_permissions(
     Retorna as permissões de um grupo específico.
     Requer autenticação.
     """
-    with get_db_cursor() as cursor:
-        cursor.execute(
-            "SELECT * FROM grupo_usuario WHERE id = %s",
-            (grupo_id,)
-        )
-        grupo = cursor.fetchone()
+    mascara = permissoes.mascara_do_grupo(grupo_id)
     
-    if not grupo:
+    if mascara is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Grupo não encontrado"
         )
     
-    # Retorna todas as permissões do grupo
-    return {
-        "dashboard_visualizar": grupo.get('dashboard_visualizar'),
-        "dashboard_editar": grupo.get('dashboard_editar'),
-        "produtos_visualizar": grupo.get('produtos_visualizar'),
-        "produtos_editar": grupo.get('produtos_editar'),
-        "clientes_visualizar": grupo.get('clientes_visualizar'),
-        "clientes_editar": grupo.get('clientes_editar'),
-        "vendas_visualizar": grupo.get('vendas_visualizar'),
-        "vendas_editar": grupo.get('vendas_editar'),
-        "vendedores_visualizar": grupo.get('vendedores_visualizar'),
-        "vendedores_editar": grupo.get('vendedores_editar'),
-        "compras_visualizar": grupo.get('compras_visualizar'),
-        "compras_editar": grupo.get('compras_editar'),
-        "fornecedores_visualizar": grupo.get('fornecedores_visualizar'),
-        "fornecedores_editar": grupo.get('fornecedores_editar'),
-        "estoque_visualizar": grupo.get('estoque_visualizar'),
-        "estoque_editar": grupo.get('estoque_editar'),
-        "configuracoes_visualizar": grupo.get('configuracoes_visualizar'),
-        "configuracoes_editar": grupo.get('configuracoes_editar'),
-        "financeiro_visualizar": grupo.get('financeiro_visualizar'),
-        "financeiro_editar": grupo.get('financeiro_editar')
-    }
+    # Retorna todas as permissões do grupo (a partir da máscara compilada)
+    return permissoes.expandir(mascara)
+
 @router.get("/", response_model=List[Usuario])
 async def listar_usuarios(current_user: UserInDB = Depends(get_current_user)):
     """
@@ -165,7 +141,7 @@ async def criar_usuario(
             )
     
     # Cria o usuário
-    hashed_password = get_password_hash(usuario.senha)
+    hashed_password = await get_password_hash_async(usuario.senha)
     
     with get_db_cursor(commit=True) as cursor:
         cursor.execute(
@@ -230,7 +206,7 @@ async def atualizar_usuario(
     if usuario.nivel_acesso and current_user.nivel_acesso == "admin":
         update_data["nivel_acesso"] = usuario.nivel_acesso
     if usuario.senha:
-        update_data["senha"] = get_password_hash(usuario.senha)
+        update_data["senha"] = await get_password_hash_async(usuario.senha)
     if usuario.grupo_id is not None:
         update_data["grupo_id"] = usuario.grupo_id
     
@@ -324,14 +300,14 @@ async def alterar_senha(
         )
     
     # Verifica se a senha atual está correta
-    if not verify_password(password_data.senha_atual, user_data['senha']):
+    if not await verify_password_async(password_data.senha_atual, user_data['senha']):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Senha atual incorreta"
         )
     
     # Gera o hash da nova senha
-    new_password_hash = get_password_hash(password_data.nova_senha)
+    new_password_hash = await get_password_hash_async(password_data.nova_senha)
     
     # Atualiza a senha no banco
     with get_db_cursor(commit=True) as cursor:
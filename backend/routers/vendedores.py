@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from pydantic import BaseModel
 from typing import List, Optional
 from database import get_db_cursor
 from auth import get_current_user, UserInDB
+from permissoes import require
+import log_alteracoes
+import sincronizacao_cadastros
 
 router = APIRouter()
 
@@ -30,6 +33,12 @@ class Vendedor(VendedorBase):
     id: int
     data_cadastro: str
 
+class AlteracoesVendedores(BaseModel):
+    upserts: List[Vendedor]
+    removidos: List[int]
+    proximo: int
+    completo: bool
+
 # Rotas
 @router.get("/", response_model=List[Vendedor])
 async def listar_vendedores(
@@ -58,6 +67,27 @@ async def listar_vendedores(
     
     return vendedores
 
+@router.get("/alteracoes", response_model=AlteracoesVendedores)
+async def alteracoes_vendedores(
+    desde: int = Query(0, ge=0, description="Offset devolvido pela sincronização anterior (0 para a carga completa)"),
+    limite: int = Query(1000, ge=1, le=10000),
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """
+    Vendedores alterados depois do offset `desde` (0 para a carga completa), para
+    manter uma cópia local em dia sem recarregar a lista inteira.
+    Envie `proximo` como `desde` na chamada seguinte e repita enquanto `completo` for falso.
+    """
+    with get_db_cursor() as cursor:
+        pagina = sincronizacao_cadastros.alteracoes(cursor, "vendedores", "SELECT * FROM vendedores", "id", desde, limite)
+    
+    # Converter o campo data_cadastro para string
+    for vendedor in pagina["upserts"]:
+        if 'data_cadastro' in vendedor and vendedor['data_cadastro']:
+            vendedor['data_cadastro'] = vendedor['data_cadastro'].isoformat()
+    
+    return pagina
+
 @router.get("/{vendedor_id}", response_model=Vendedor)
 async def obter_vendedor(
     vendedor_id: int,
@@ -88,7 +118,7 @@ async def obter_vendedor(
 @router.post("/", response_model=Vendedor, status_code=status.HTTP_201_CREATED)
 async def criar_vendedor(
     vendedor: VendedorCreate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("vendedores_editar"))
 ):
     """
     Cria um novo vendedor no sistema.
@@ -135,6 +165,7 @@ async def criar_vendedor(
         # Obtém o ID do vendedor criado
         cursor.execute("SELECT LAST_INSERT_ID()")
         vendedor_id = cursor.fetchone()["LAST_INSERT_ID()"]
+        log_alteracoes.registrar(cursor, "vendedores", vendedor_id, "insert", current_user.id)
         
         # Obtém os dados do vendedor criado
         cursor.execute(
@@ -153,7 +184,7 @@ async def criar_vendedor(
 async def atualizar_vendedor(
     vendedor_id: int,
     vendedor: VendedorUpdate,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("vendedores_editar"))
 ):
     """
     Atualiza os dados de um vendedor existente.
@@ -224,6 +255,7 @@ async def atualizar_vendedor(
             f"UPDATE vendedores SET {set_clause} WHERE id = %s",
             values
         )
+        log_alteracoes.registrar(cursor, "vendedores", vendedor_id, "update", current_user.id)
         
         # Obtém os dados atualizados
         cursor.execute(
@@ -241,7 +273,7 @@ async def atualizar_vendedor(
 @router.delete("/{vendedor_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def excluir_vendedor(
     vendedor_id: int,
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(require("vendedores_editar"))
 ):
     """
     Exclui um vendedor do sistema.
@@ -289,5 +321,6 @@ async def excluir_vendedor(
             "DELETE FROM vendedores WHERE id = %s",
             (vendedor_id,)
         )
+        log_alteracoes.registrar(cursor, "vendedores", vendedor_id, "delete", current_user.id)
     
     return None
@@ -0,0 +1,234 @@
+"""
+Saúde da API: liveness, readiness e monitor do loop de eventos.
+
+- vivo(): só confirma que o processo atende, sem E/S, para o balanceador
+  consultar com a frequência que quiser;
+- prontidao(): reúne as verificações das dependências. As que vão ao banco
+  (primário e réplicas) rodam em uma thread e ficam em cache por
+  INTERVALO_VERIFICACAO segundos, de modo que polls frequentes não abrem
+  conexões. As demais (saturação dos pools, disjuntores do banco,
+  heartbeat do gerenciador de timeout e atraso do loop) só leem contadores
+  em memória. A API fica
+  indisponível (503) quando uma verificação essencial falha; as outras só
+  marcam o estado como degradado;
+- MonitorLoop: uma tarefa no loop marca um batimento a cada
+  INTERVALO_BATIMENTO segundos e mede o atraso de cada um. Uma thread vigia
+  esse batimento e, se o loop passa de LIMITE_BLOQUEIO sem responder,
+  registra a pilha da thread do loop naquele instante (que aponta a função
+  bloqueante) e as requisições em andamento.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from fastapi.concurrency import run_in_threadpool
+import database
+from timeout_manager import timeout_manager
+
+logger = logging.getLogger("saude")
+
+# Verificações que vão ao banco são refeitas no máximo a cada tantos segundos
+INTERVALO_VERIFICACAO = 10
+
+INTERVALO_BATIMENTO = 0.1
+# Loop parado por mais que isto (segundos) é registrado como bloqueio
+LIMITE_BLOQUEIO = 0.25
+FRAMES_PILHA = 15
+
+# O gerenciador de timeout conclui um ciclo por minuto
+ATRASO_MAXIMO_AGENDADOR = 180
+
+_DIRETORIO_ROTAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "routers")
+
+# Requisições em andamento: id -> (rota, início)
+_requisicoes = {}
+_requisicoes_lock = threading.Lock()
+_sequencia = itertools.count()
+
+def inicio_requisicao(rota):
+    """Registra o início de uma requisição. Retorna o id para fim_requisicao()."""
+    identificador = next(_sequencia)
+    with _requisicoes_lock:
+        _requisicoes[identificador] = (rota, time.monotonic())
+    return identificador
+
+def fim_requisicao(identificador):
+    with _requisicoes_lock:
+        _requisicoes.pop(identificador, None)
+
+def _em_andamento():
+    agora = time.monotonic()
+    with _requisicoes_lock:
+        return [f"{rota} ({(agora - inicio) * 1000:.0f} ms)" for rota, inicio in _requisicoes.values()]
+
+def _funcao_de_rota(frame):
+    """Primeira função de um roteador na pilha (da mais externa), como 'modulo.funcao'."""
+    for resumo in traceback.extract_stack(frame):
+        if os.path.dirname(os.path.abspath(resumo.filename)) == _DIRETORIO_ROTAS:
+            return f"{os.path.splitext(os.path.basename(resumo.filename))[0]}.{resumo.name}"
+    return None
+
+class MonitorLoop:
+    def __init__(self):
+        self.atraso_atual = 0.0
+        self.atraso_maximo = 0.0
+        self.bloqueios = 0
+        self.ultimo_bloqueio = None
+        self._batida = None
+        self._thread_loop = None
+        self._tarefa = None
+        self._suspeito = None  # rota apontada pela vigia no bloqueio em curso
+
+    def iniciar(self):
+        """Inicia o monitor. Chame de dentro do loop (ex.: no startup da aplicação)."""
+        if self._tarefa:
+            return
+        self._thread_loop = threading.get_ident()
+        self._batida = time.monotonic()
+        self._tarefa = asyncio.get_running_loop().create_task(self._batimento())
+        threading.Thread(target=self._vigiar, name="vigia-loop", daemon=True).start()
+
+    async def _batimento(self):
+        while True:
+            antes = time.monotonic()
+            await asyncio.sleep(INTERVALO_BATIMENTO)
+            agora = time.monotonic()
+            atraso = max(agora - antes - INTERVALO_BATIMENTO, 0.0)
+
+            self.atraso_atual = atraso
+            self.atraso_maximo = max(self.atraso_maximo, atraso)
+            if atraso >= LIMITE_BLOQUEIO:
+                self.bloqueios += 1
+                self.ultimo_bloqueio = {
+                    "momento": time.time(),
+                    "duracao_ms": round(atraso * 1000),
+                    "rota": self._suspeito,
+                }
+                logger.warning(
+                    f"Loop de eventos bloqueado por {atraso * 1000:.0f} ms"
+                    + (f" em {self._suspeito}" if self._suspeito else "")
+                )
+            self._suspeito = None
+            self._batida = agora
+
+    def _vigiar(self):
+        alertada = None
+        while True:
+            time.sleep(INTERVALO_BATIMENTO)
+            batida = self._batida
+            parado = time.monotonic() - batida
+            if parado < LIMITE_BLOQUEIO or alertada == batida:
+                continue
+
+            # Um alerta por bloqueio, com a pilha do loop no momento
+            alertada = batida
+            frame = sys._current_frames().get(self._thread_loop)
+            if frame is None:
+                continue
+            self._suspeito = _funcao_de_rota(frame)
+            pilha = "".join(traceback.format_stack(frame, limit=FRAMES_PILHA))
+            del frame
+            logger.warning(
+                f"Loop de eventos parado há {parado * 1000:.0f} ms"
+                + (f" em {self._suspeito}" if self._suspeito else "")
+                + f"; requisições em andamento: {', '.join(_em_andamento()) or 'nenhuma'}\n{pilha}"
+            )
+
+    def estado(self):
+        return {
+            "ok": self._tarefa is None or self.atraso_atual < LIMITE_BLOQUEIO,
+            "ativo": self._tarefa is not None,
+            "atraso_ms": round(self.atraso_atual * 1000, 1),
+            "atraso_maximo_ms": round(self.atraso_maximo * 1000, 1),
+            "bloqueios": self.bloqueios,
+            "ultimo_bloqueio": self.ultimo_bloqueio,
+        }
+
+monitor_loop = MonitorLoop()
+
+def _verificar_banco():
+    inicio = time.monotonic()
+    with database.get_db_cursor() as cursor:
+        cursor.execute("SELECT 1 AS ok")
+        cursor.fetchone()
+    return {"ok": True, "latencia_ms": round((time.monotonic() - inicio) * 1000, 1)}
+
+def _verificar_replicas():
+    # Leituras voltam ao primário quando as réplicas estão atrasadas
+    replicas = database.estado_replicas()
+    return {"ok": all(replica["saudavel"] for replica in replicas), "replicas": replicas}
+
+def _verificar_pools():
+    pools = database.estado_pools()
+    return {"ok": all(pool["em_uso"] < max(pool["tamanho"], 1) for pool in pools), "pools": pools}
+
+def _verificar_disjuntores():
+    disjuntores = [pool["disjuntor"] for pool in database.estado_pools()]
+    return {"ok": all(disjuntor["estado"] == "fechado" for disjuntor in disjuntores), "disjuntores": disjuntores}
+
+def _verificar_agendador():
+    if not timeout_manager.running:
+        # Em outro processo (ex.: com reload) ou desligado: nada a vigiar aqui
+        return {"ok": True, "ativo": False}
+    referencia = timeout_manager.ultimo_ciclo
+    parado = time.monotonic() - referencia if referencia else None
+    return {
+        "ok": parado is None or parado < ATRASO_MAXIMO_AGENDADOR,
+        "ativo": True,
+        "ultimo_ciclo_ha_segundos": round(parado, 1) if parado is not None else None,
+    }
+
+# Nome -> (função, essencial, em cache)
+VERIFICACOES = {
+    "banco": (_verificar_banco, True, True),
+    "replicas": (_verificar_replicas, False, True),
+    "pools": (_verificar_pools, False, False),
+    "disjuntores": (_verificar_disjuntores, False, False),
+    "agendador": (_verificar_agendador, True, False),
+    "loop": (monitor_loop.estado, False, False),
+}
+
+_cache = {}  # nome -> (momento, resultado)
+_travas = {nome: asyncio.Lock() for nome in VERIFICACOES}
+
+def _executar(funcao):
+    try:
+        return funcao()
+    except Exception as e:
+        return {"ok": False, "erro": str(e)}
+
+async def _resultado(nome):
+    funcao, _, em_cache = VERIFICACOES[nome]
+    if not em_cache:
+        return _executar(funcao)
+
+    # Polls simultâneos com o cache vencido esperam uma única verificação
+    async with _travas[nome]:
+        item = _cache.get(nome)
+        if item and time.monotonic() - item[0] < INTERVALO_VERIFICACAO:
+            return item[1]
+        resultado = await run_in_threadpool(_executar, funcao)
+        _cache[nome] = (time.monotonic(), resultado)
+        return resultado
+
+def vivo():
+    return {"status": "ok"}
+
+async def prontidao():
+    """{"status": "pronto"|"degradado"|"indisponivel", "verificacoes": {nome: {...}}}."""
+    verificacoes = {}
+    for nome in VERIFICACOES:
+        verificacoes[nome] = await _resultado(nome)
+
+    if not all(verificacoes[nome]["ok"] for nome, (_, essencial, _) in VERIFICACOES.items() if essencial):
+        situacao = "indisponivel"
+    elif all(resultado["ok"] for resultado in verificacoes.values()):
+        situacao = "pronto"
+    else:
+        situacao = "degradado"
+    return {"status": situacao, "verificacoes": verificacoes}
@@ -0,0 +1,244 @@
+"""
+Segmentação RFM (recência, frequência, valor) e LTV de clientes.
+
+As métricas de cada cliente (pedidos, valor, margem, primeira/última compra)
+vêm de uma única consulta agrupada em pedidos_venda, lida em fluxo, e ficam
+em segmento_clientes. A atualização incremental só reagrega os clientes com
+pedidos novos (id acima do último processado) ou marcados como desatualizados
+por alterações/exclusões de pedidos; as notas e segmentos de todos são então
+recalculados com NumPy a partir da própria tabela, sem tocar nos pedidos.
+
+Notas de 1 a 5 por quintil (empates ficam com a nota menor). O LTV projeta
+a margem média por pedido no ritmo de compra do cliente por HORIZONTE_LTV_MESES.
+"""
+
+from datetime import datetime
+import numpy as np
+from database import get_db_cursor, get_db_cursor_unbuffered
+from cubo_produtos import STATUS_VENDA_CANCELADA
+
+HORIZONTE_LTV_MESES = 24
+DIAS_MES = 30.44
+TAMANHO_LOTE = 1000
+
+# Segmentos na ordem de prioridade (o primeiro critério atendido vence)
+SEGMENTOS = (
+    "campeoes", "fieis", "novos", "promissores",
+    "em_risco", "hibernando", "perdidos", "sem_compras"
+)
+
+def _placeholders(ids):
+    return ", ".join(["%s"] * len(ids))
+
+_AGREGACAO_SQL = f"""
+    SELECT cliente_id,
+           SUM(status NOT IN ({_placeholders(STATUS_VENDA_CANCELADA)})) AS frequencia,
+           SUM(CASE WHEN status NOT IN ({_placeholders(STATUS_VENDA_CANCELADA)}) THEN valor_total ELSE 0 END) AS valor,
+           SUM(CASE WHEN status NOT IN ({_placeholders(STATUS_VENDA_CANCELADA)})
+                    THEN valor_total - custo_produto ELSE 0 END) AS margem,
+           MIN(CASE WHEN status NOT IN ({_placeholders(STATUS_VENDA_CANCELADA)}) THEN data_pedido END) AS primeira_compra,
+           MAX(CASE WHEN status NOT IN ({_placeholders(STATUS_VENDA_CANCELADA)}) THEN data_pedido END) AS ultima_compra,
+           MAX(id) AS ultimo_pedido_id
+    FROM pedidos_venda
+    {{filtro}}
+    GROUP BY cliente_id
+"""
+
+_UPSERT_SQL = """
+    INSERT INTO segmento_clientes (
+        cliente_id, frequencia, valor_monetario, margem, ticket_medio,
+        primeira_compra, ultima_compra, ultimo_pedido_id, desatualizado
+    )
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, FALSE)
+    ON DUPLICATE KEY UPDATE
+        frequencia = VALUES(frequencia),
+        valor_monetario = VALUES(valor_monetario),
+        margem = VALUES(margem),
+        ticket_medio = VALUES(ticket_medio),
+        primeira_compra = VALUES(primeira_compra),
+        ultima_compra = VALUES(ultima_compra),
+        ultimo_pedido_id = VALUES(ultimo_pedido_id),
+        desatualizado = FALSE
+"""
+
+def marcar_desatualizados(cursor, cliente_ids):
+    """Marca clientes cujos pedidos mudaram para serem reagregados na próxima atualização."""
+    cliente_ids = [c for c in set(cliente_ids) if c]
+    if cliente_ids:
+        cursor.execute(
+            f"UPDATE segmento_clientes SET desatualizado = TRUE WHERE cliente_id IN ({_placeholders(cliente_ids)})",
+            cliente_ids
+        )
+
+def _linha_metricas(row):
+    frequencia = int(row["frequencia"] or 0)
+    valor = float(row["valor"] or 0)
+    return (
+        row["cliente_id"], frequencia, valor, float(row["margem"] or 0),
+        valor / frequencia if frequencia else 0,
+        row["primeira_compra"], row["ultima_compra"], row["ultimo_pedido_id"]
+    )
+
+def _parametros_agregacao(extra=()):
+    return [*STATUS_VENDA_CANCELADA * 5, *extra]
+
+def _agregar_todos():
+    """Reagrega todos os clientes em uma passada, lendo o resultado em fluxo."""
+    total = 0
+    with get_db_cursor_unbuffered() as leitura, get_db_cursor(commit=True) as escrita:
+        # A tabela é recriada na mesma transação: quem lê vê a versão anterior até o commit
+        escrita.execute("DELETE FROM segmento_clientes")
+        leitura.execute(_AGREGACAO_SQL.format(filtro=""), _parametros_agregacao())
+        while True:
+            linhas = leitura.fetchmany(TAMANHO_LOTE)
+            if not linhas:
+                break
+            escrita.executemany(_UPSERT_SQL, [_linha_metricas(r) for r in linhas])
+            total += len(linhas)
+    return total
+
+def _agregar_clientes(cliente_ids):
+    total = 0
+    for inicio in range(0, len(cliente_ids), TAMANHO_LOTE):
+        bloco = cliente_ids[inicio:inicio + TAMANHO_LOTE]
+        with get_db_cursor(commit=True) as cursor:
+            cursor.execute(
+                _AGREGACAO_SQL.format(filtro=f"WHERE cliente_id IN ({_placeholders(bloco)})"),
+                _parametros_agregacao(bloco)
+            )
+            linhas = cursor.fetchall()
+            if linhas:
+                cursor.executemany(_UPSERT_SQL, [_linha_metricas(r) for r in linhas])
+            # Clientes que ficaram sem nenhum pedido (excluídos) saem da segmentação
+            sem_pedidos = set(bloco) - {r["cliente_id"] for r in linhas}
+            if sem_pedidos:
+                cursor.execute(
+                    f"DELETE FROM segmento_clientes WHERE cliente_id IN ({_placeholders(sem_pedidos)})",
+                    list(sem_pedidos)
+                )
+            total += len(linhas)
+    return total
+
+def _clientes_alterados():
+    with get_db_cursor() as cursor:
+        cursor.execute("SELECT COALESCE(MAX(ultimo_pedido_id), 0) AS ultimo FROM segmento_clientes")
+        ultimo = cursor.fetchone()["ultimo"]
+        cursor.execute(
+            """
+            SELECT DISTINCT cliente_id FROM pedidos_venda WHERE id > %s
+            UNION
+            SELECT cliente_id FROM segmento_clientes WHERE desatualizado = TRUE
+            """,
+            (ultimo,)
+        )
+        return [row["cliente_id"] for row in cursor.fetchall()]
+
+def _notas(valores):
+    """Nota de 1 a 5 pelo quintil de cada valor (maior valor = maior nota)."""
+    n = len(valores)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    ordenados = np.sort(valores)
+    percentil = (np.searchsorted(ordenados, valores, side="left") + 1) / n
+    return np.clip(np.ceil(percentil * 5), 1, 5).astype(np.int64)
+
+def classificar(recencia, frequencia, valor, margem, dias_ativo):
+    """
+    Calcula notas, segmento e LTV de forma vetorizada.
+    Clientes sem compras válidas (frequencia 0) ficam com notas 0 e segmento 'sem_compras'.
+    """
+    n = len(frequencia)
+    com_compras = frequencia > 0
+    r = np.zeros(n, dtype=np.int64)
+    f = np.zeros(n, dtype=np.int64)
+    m = np.zeros(n, dtype=np.int64)
+    r[com_compras] = _notas(-recencia[com_compras])
+    f[com_compras] = _notas(frequencia[com_compras])
+    m[com_compras] = _notas(valor[com_compras])
+
+    fm = (f + m) / 2
+    segmento = np.select(
+        [
+            ~com_compras,
+            (r >= 4) & (fm >= 4),
+            (r >= 3) & (fm >= 3),
+            (r >= 4) & (f <= 1),
+            r >= 3,
+            fm >= 3,
+            r == 2,
+        ],
+        ["sem_compras", "campeoes", "fieis", "novos", "promissores", "em_risco", "hibernando"],
+        default="perdidos"
+    )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        meses_ativo = np.maximum(dias_ativo / DIAS_MES, 1)
+        pedidos_mes = frequencia / meses_ativo
+        margem_pedido = np.where(com_compras, margem / np.maximum(frequencia, 1), 0)
+    ltv = np.round(np.maximum(margem_pedido * pedidos_mes * HORIZONTE_LTV_MESES, 0), 2)
+
+    return r, f, m, segmento, ltv
+
+def _reclassificar(hoje):
+    """Recalcula notas, segmento e LTV de todos os clientes, gravando só o que mudou."""
+    with get_db_cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT cliente_id, frequencia, valor_monetario, margem, primeira_compra, ultima_compra,
+                   score_r, score_f, score_m, segmento, ltv
+            FROM segmento_clientes
+            ORDER BY cliente_id
+            """
+        )
+        linhas = cursor.fetchall()
+
+    n = len(linhas)
+    if n == 0:
+        return 0
+
+    def dias_desde(coluna):
+        return np.fromiter(
+            ((hoje - l[coluna]).days if l[coluna] else 0 for l in linhas),
+            dtype=np.float64, count=n
+        )
+
+    frequencia = np.fromiter((l["frequencia"] for l in linhas), dtype=np.float64, count=n)
+    valor = np.fromiter((float(l["valor_monetario"]) for l in linhas), dtype=np.float64, count=n)
+    margem = np.fromiter((float(l["margem"]) for l in linhas), dtype=np.float64, count=n)
+    r, f, m, segmento, ltv = classificar(
+        dias_desde("ultima_compra"), frequencia, valor, margem, dias_desde("primeira_compra")
+    )
+
+    alteracoes = []
+    for i, linha in enumerate(linhas):
+        novo = (int(r[i]), int(f[i]), int(m[i]), str(segmento[i]), float(ltv[i]))
+        atual = (linha["score_r"], linha["score_f"], linha["score_m"], linha["segmento"],
+                 float(linha["ltv"]) if linha["ltv"] is not None else None)
+        if novo != atual:
+            alteracoes.append((*novo, linha["cliente_id"]))
+
+    for inicio in range(0, len(alteracoes), TAMANHO_LOTE):
+        with get_db_cursor(commit=True) as cursor:
+            cursor.executemany(
+                """
+                UPDATE segmento_clientes
+                SET score_r = %s, score_f = %s, score_m = %s, segmento = %s, ltv = %s
+                WHERE cliente_id = %s
+                """,
+                alteracoes[inicio:inicio + TAMANHO_LOTE]
+            )
+    return len(alteracoes)
+
+def atualizar(completo=False, hoje=None):
+    """
+    Atualiza a segmentação. Sem 'completo', reagrega apenas os clientes com
+    pedidos novos ou marcados como desatualizados.
+    Retorna um resumo com os clientes reagregados e reclassificados.
+    """
+    hoje = hoje or datetime.now()
+    if completo:
+        reagregados = _agregar_todos()
+    else:
+        reagregados = _agregar_clientes(_clientes_alterados())
+    reclassificados = _reclassificar(hoje)
+    return {"reagregados": reagregados, "reclassificados": reclassificados}
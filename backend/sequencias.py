@@ -0,0 +1,34 @@
+"""
+Sequenciais dos códigos de documentos (PV, CR, CP + ano + sequencial).
+
+Cada (nome, ano) tem uma linha em sequencias com o próximo número livre.
+reservar() soma a quantidade pedida com UPDATE ... LAST_INSERT_ID(...): a
+linha fica travada até o fim da transação, de modo que transações
+concorrentes recebem faixas distintas, sem o COUNT(*) + 1 que repetia
+códigos. A primeira reserva do ano continua depois do maior código já
+gravado na tabela.
+"""
+
+def reservar(cursor, tabela, prefixo, quantidade):
+    """Reserva 'quantidade' códigos sequenciais de 'tabela' (prefixo + ano + sequencial)."""
+    cursor.execute("SELECT YEAR(CURDATE()) AS ano")
+    ano = cursor.fetchone()["ano"]
+
+    reservar_faixa = "UPDATE sequencias SET proximo = LAST_INSERT_ID(proximo + %s) WHERE nome = %s AND ano = %s"
+    cursor.execute(reservar_faixa, (quantidade, tabela, ano))
+    if not cursor.rowcount:
+        # Primeira reserva do ano: continua depois do maior código já gravado
+        cursor.execute(
+            f"""
+            INSERT IGNORE INTO sequencias (nome, ano, proximo)
+            SELECT %s, %s, COALESCE(MAX(CAST(SUBSTRING(codigo, %s) AS UNSIGNED)), 0) + 1
+            FROM {tabela}
+            WHERE codigo LIKE %s
+            """,
+            (tabela, ano, len(prefixo) + 5, f"{prefixo}{ano}%")
+        )
+        cursor.execute(reservar_faixa, (quantidade, tabela, ano))
+
+    cursor.execute("SELECT LAST_INSERT_ID() AS proximo")
+    primeiro = cursor.fetchone()["proximo"] - quantidade
+    return [f"{prefixo}{ano}{primeiro + i:04d}" for i in range(quantidade)]
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Servidor local que simula a API de rastreamento de uma transportadora, para
+testar rastreamento.sincronizar() sem chamar serviços reais.
+
+GET /{codigo} responde JSON {"status", "descricao"} com ETag. Cada objeto
+avança um passo (postado -> em_transito -> entregue) a cada --passos
+consultas; códigos terminados em "DV" terminam como devolvido. Respeita
+If-None-Match (304), simula latência e devolve 429 com Retry-After acima de
+--limite requisições por segundo.
+
+Exemplo:
+    python simular_transportadora.py --porta 9100 --latencia 50 --limite 50
+    (configure rastreamento_transportadoras = "correios=http://127.0.0.1:9100")
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+DESCRICOES = {
+    "postado": "Objeto postado",
+    "em_transito": "Objeto em trânsito - por favor aguarde",
+    "entregue": "Objeto entregue ao destinatário",
+    "devolvido": "Objeto devolvido ao remetente",
+}
+
+class Simulador:
+    def __init__(self, passos, latencia, limite):
+        self.passos = passos
+        self.latencia = latencia / 1000.0
+        self.limite = limite
+        self.consultas = {}
+        self.janela = (0, 0)  # (segundo, requisições nele)
+        self.lock = threading.Lock()
+
+    def permitir(self):
+        with self.lock:
+            segundo = int(time.time())
+            inicio, quantidade = self.janela
+            self.janela = (segundo, quantidade + 1) if segundo == inicio else (segundo, 1)
+            return not self.limite or self.janela[1] <= self.limite
+
+    def situacao(self, codigo):
+        with self.lock:
+            consultas = self.consultas[codigo] = self.consultas.get(codigo, 0) + 1
+        etapa = (consultas - 1) // self.passos
+        if etapa == 0:
+            return "postado"
+        if etapa == 1:
+            return "em_transito"
+        return "devolvido" if codigo.upper().endswith("DV") else "entregue"
+
+def criar_handler(simulador):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if not simulador.permitir():
+                self.send_response(429)
+                self.send_header("Retry-After", "1")
+                self.end_headers()
+                return
+
+            time.sleep(simulador.latencia)
+            codigo = unquote(self.path.strip("/"))
+            if not codigo:
+                self.send_response(404)
+                self.end_headers()
+                return
+
+            status = simulador.situacao(codigo)
+            corpo = json.dumps({"codigo": codigo, "status": status, "descricao": DESCRICOES[status]}).encode("utf-8")
+            etag = '"' + hashlib.md5(corpo).hexdigest() + '"'
+
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, formato, *args):
+            pass
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description='Simula a API de rastreamento de uma transportadora')
+    parser.add_argument('--porta', type=int, default=9100, help='Porta HTTP')
+    parser.add_argument('--passos', type=int, default=1, help='Consultas por etapa do objeto')
+    parser.add_argument('--latencia', type=int, default=50, help='Latência de cada resposta em ms')
+    parser.add_argument('--limite', type=int, default=0, help='Requisições por segundo antes de responder 429 (0: sem limite)')
+
+    args = parser.parse_args()
+
+    simulador = Simulador(args.passos, args.latencia, args.limite)
+    servidor = ThreadingHTTPServer(("127.0.0.1", args.porta), criar_handler(simulador))
+    print(f"Transportadora simulada em http://127.0.0.1:{args.porta} (Ctrl+C para encerrar)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Sincronização incremental dos cadastros (produtos, parceiros, clientes e vendedores).
+
+As rotas de escrita desses cadastros registram cada alteração em
+log_alteracoes, e GET /api/<cadastro>/alteracoes?desde=<offset> devolve só o
+que mudou depois do offset: os registros que ainda existem vêm completos
+(upserts) e os excluídos, só pelo id (removidos). Com desde=0 a resposta é a
+carga completa. Em ambos os casos o cliente guarda `proximo` e o envia na
+chamada seguinte, repetindo enquanto `completo` for falso.
+
+O offset da carga completa é o horizonte confirmado do log
+(log_alteracoes.confirmado_ate), lido antes da carga na mesma transação:
+tudo até ele já está na carga, e o que vier depois (inclusive transações
+ainda em andamento) chega nas chamadas seguintes. As páginas incrementais
+também param no horizonte, então nenhuma alteração confirmada fora de ordem
+é pulada. Uma alteração pode vir de novo, o que é inofensivo (upserts e
+remoções são idempotentes).
+
+Chame no início de uma transação no primário (get_db_cursor() sem réplica).
+"""
+
+import log_alteracoes
+
+def alteracoes(cursor, entidade, consulta, coluna_id="id", desde=0, limite=1000):
+    """
+    Alterações de 'entidade' depois do offset 'desde':
+    {"upserts": [linhas], "removidos": [ids], "proximo": offset, "completo": bool}.
+    'consulta' é o SELECT ... FROM ... (sem WHERE) das linhas do cadastro, como na
+    listagem da rota; 'coluna_id' é a coluna do id nessa consulta.
+    """
+    if not desde:
+        proximo = log_alteracoes.confirmado_ate(cursor)
+        cursor.execute(consulta)
+        return {"upserts": cursor.fetchall(), "removidos": [], "proximo": proximo, "completo": True}
+
+    lidas, proximo = log_alteracoes.ler(cursor, desde, limite, [entidade])
+    ids = list(dict.fromkeys(alteracao["entidade_id"] for alteracao in lidas))
+
+    upserts = []
+    for inicio in range(0, len(ids), log_alteracoes.TAMANHO_BLOCO):
+        bloco = ids[inicio:inicio + log_alteracoes.TAMANHO_BLOCO]
+        cursor.execute(f"{consulta} WHERE {coluna_id} IN ({', '.join(['%s'] * len(bloco))})", bloco)
+        upserts.extend(cursor.fetchall())
+
+    existentes = {linha["id"] for linha in upserts}
+    return {
+        "upserts": upserts,
+        "removidos": [registro_id for registro_id in ids if registro_id not in existentes],
+        "proximo": proximo,
+        "completo": len(lidas) < limite,
+    }
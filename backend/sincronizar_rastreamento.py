@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Script para sincronizar o rastreamento dos objetos de postagem não finalizados.
+Pode ser agendado (ex.: cron a cada 30 minutos); cada objeto só é consultado
+quando vence o intervalo do seu status.
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+
+# Adiciona o diretório atual ao path para permitir importações relativas
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import rastreamento
+
+def main():
+    parser = argparse.ArgumentParser(description='Sincroniza o rastreamento dos objetos de postagem')
+    parser.add_argument('--limite', type=int, default=rastreamento.MAX_OBJETOS, help='Máximo de objetos por execução')
+    parser.add_argument('--forcar', action='store_true', help='Consulta mesmo os objetos consultados recentemente')
+
+    args = parser.parse_args()
+
+    relatorio = asyncio.run(rastreamento.sincronizar(args.limite, args.forcar))
+
+    print(f"{relatorio['objetos']} objeto(s) a consultar, {relatorio['consultados']} consultado(s), "
+          f"{relatorio['alterados']} alterado(s)")
+    for status, quantidade in relatorio['por_status'].items():
+        if quantidade:
+            print(f"  {status}: {quantidade}")
+    if relatorio['sem_cliente']:
+        print(f"Sem transportadora configurada: {relatorio['sem_cliente']}")
+    if relatorio['falhas']:
+        print(f"Falhas na consulta: {relatorio['falhas']}")
+    print(f"Pedidos finalizados: {relatorio['pedidos_finalizados']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Respostas em streaming (NDJSON) para listagens grandes.
+
+O cliente pede o modo streaming com o cabeçalho `Accept: application/x-ndjson`
+ou com `?stream=1`. As linhas são lidas de um cursor não-bufferizado em lotes
+e cada lote é enviado assim que lido, de modo que o primeiro byte chega logo
+e a memória do servidor fica limitada a um lote, qualquer que seja o total.
+"""
+
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from database import get_db_cursor_unbuffered
+
+MEDIA_TYPE_NDJSON = "application/x-ndjson"
+
+# Linhas lidas do banco e enviadas ao cliente por vez
+TAMANHO_LOTE = 1000
+
+def quer_streaming(request: Request, stream: bool = False):
+    """Verifica se o cliente pediu o modo streaming."""
+    return stream or MEDIA_TYPE_NDJSON in request.headers.get("accept", "")
+
+def _json_default(valor):
+    if isinstance(valor, (datetime, date, time)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, timedelta):
+        return valor.total_seconds()
+    if isinstance(valor, (bytes, bytearray)):
+        return valor.decode("utf-8", errors="replace")
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+def _gerar_lotes(query, params, tamanho_lote):
+    with get_db_cursor_unbuffered() as cursor:
+        cursor.execute(query, params)
+        while True:
+            linhas = cursor.fetchmany(tamanho_lote)
+            if not linhas:
+                break
+            yield "".join(
+                json.dumps(linha, default=_json_default, ensure_ascii=False) + "\n"
+                for linha in linhas
+            )
+
+def resposta_ndjson(query, params=None, tamanho_lote=TAMANHO_LOTE):
+    """
+    Executa a consulta em um cursor não-bufferizado e devolve uma StreamingResponse
+    com uma linha JSON por registro.
+    """
+    return StreamingResponse(
+        _gerar_lotes(query, params or (), tamanho_lote),
+        media_type=MEDIA_TYPE_NDJSON
+    )
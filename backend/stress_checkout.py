@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Teste de estresse do checkout de pedidos de venda.
+
+Cria produtos temporários com estoque limitado, dispara muitos checkouts
+simultâneos (mais pedidos do que o estoque comporta) pelo mesmo caminho usado
+por POST /api/vendas e, ao final, confere que nenhuma unidade foi vendida além
+do estoque: saldo final nunca negativo e saldo inicial - saldo final igual à
+soma dos itens vendidos e à soma das movimentações de saída.
+
+Os pedidos, itens, movimentações e produtos criados são removidos ao final
+(a menos que --manter seja informado).
+
+Exemplo:
+    python stress_checkout.py --threads 32 --pedidos 5000 --estoque 300 --produtos 4
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Adiciona o diretório atual ao path para permitir importações relativas
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import get_db_cursor
+from checkout import executar_transacao, registrar_pedido_venda, EstoqueInsuficiente
+from routers.pedidos_venda import PedidoVendaCreate, ItemPedidoVendaCreate
+
+def preparar_dados(qtd_produtos, estoque):
+    """Cria os produtos do teste e obtém um cliente e um usuário existentes."""
+    with get_db_cursor(commit=True) as cursor:
+        cursor.execute("SELECT id FROM parceiros WHERE tipo IN ('cliente', 'ambos') LIMIT 1")
+        cliente = cursor.fetchone()
+        cursor.execute("SELECT id FROM usuarios LIMIT 1")
+        usuario = cursor.fetchone()
+        if not cliente or not usuario:
+            print("Erro: é necessário ao menos um cliente e um usuário cadastrados.")
+            sys.exit(1)
+
+        prefixo = f"STRESS-{int(time.time())}"
+        produto_ids = []
+        for i in range(qtd_produtos):
+            cursor.execute(
+                """
+                INSERT INTO produtos (codigo, nome, preco_custo, preco_venda, estoque_atual)
+                VALUES (%s, %s, 1, 10, %s)
+                """,
+                (f"{prefixo}-{i}", f"Produto de estresse {i}", estoque)
+            )
+            cursor.execute("SELECT LAST_INSERT_ID()")
+            produto_ids.append(cursor.fetchone()["LAST_INSERT_ID()"])
+
+    return cliente["id"], usuario["id"], produto_ids
+
+def gerar_pedido(cliente_id, produto_ids):
+    """Pedido com 1 a 3 itens aleatórios (pode repetir produto, como um carrinho real)."""
+    itens = [
+        ItemPedidoVendaCreate(
+            produto_id=random.choice(produto_ids),
+            quantidade=random.randint(1, 3),
+            preco_unitario=10
+        )
+        for _ in range(random.randint(1, 3))
+    ]
+    return PedidoVendaCreate(cliente_id=cliente_id, itens=itens)
+
+def verificar(produto_ids, estoque, pedido_ids):
+    """Confere o saldo de cada produto contra os itens vendidos e as movimentações."""
+    ok = True
+    placeholders = ", ".join(["%s"] * len(produto_ids))
+    with get_db_cursor() as cursor:
+        cursor.execute(
+            f"SELECT id, estoque_atual FROM produtos WHERE id IN ({placeholders})",
+            produto_ids
+        )
+        saldos = {p["id"]: p["estoque_atual"] for p in cursor.fetchall()}
+
+        vendidos = {produto_id: 0 for produto_id in produto_ids}
+        if pedido_ids:
+            placeholders_pedidos = ", ".join(["%s"] * len(pedido_ids))
+            cursor.execute(
+                f"SELECT produto_id, SUM(quantidade) AS total FROM itens_pedido_venda "
+                f"WHERE pedido_id IN ({placeholders_pedidos}) GROUP BY produto_id",
+                list(pedido_ids)
+            )
+            for linha in cursor.fetchall():
+                vendidos[linha["produto_id"]] = int(linha["total"])
+
+        cursor.execute(
+            f"SELECT produto_id, SUM(quantidade) AS total FROM movimentacao_estoque "
+            f"WHERE tipo = 'saida' AND produto_id IN ({placeholders}) GROUP BY produto_id",
+            produto_ids
+        )
+        movimentado = {linha["produto_id"]: int(linha["total"]) for linha in cursor.fetchall()}
+
+    print(f"\n{'produto':>8} {'inicial':>8} {'vendido':>8} {'movim.':>8} {'final':>8}")
+    for produto_id in produto_ids:
+        saldo = saldos[produto_id]
+        vendido = vendidos[produto_id]
+        mov = movimentado.get(produto_id, 0)
+        print(f"{produto_id:>8} {estoque:>8} {vendido:>8} {mov:>8} {saldo:>8}")
+        if saldo < 0 or estoque - saldo != vendido or vendido != mov:
+            ok = False
+
+    return ok
+
+def limpar(produto_ids, pedido_ids):
+    placeholders = ", ".join(["%s"] * len(produto_ids))
+    with get_db_cursor(commit=True) as cursor:
+        if pedido_ids:
+            placeholders_pedidos = ", ".join(["%s"] * len(pedido_ids))
+            cursor.execute(
+                f"DELETE FROM itens_pedido_venda WHERE pedido_id IN ({placeholders_pedidos})",
+                list(pedido_ids)
+            )
+            cursor.execute(
+                f"DELETE FROM pedidos_venda WHERE id IN ({placeholders_pedidos})",
+                list(pedido_ids)
+            )
+        cursor.execute(f"DELETE FROM movimentacao_estoque WHERE produto_id IN ({placeholders})", produto_ids)
+        cursor.execute(f"DELETE FROM produtos WHERE id IN ({placeholders})", produto_ids)
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de estresse de checkouts concorrentes (sem venda acima do estoque)')
+    parser.add_argument('--threads', type=int, default=32, help='Checkouts simultâneos (padrão: 32)')
+    parser.add_argument('--pedidos', type=int, default=3000, help='Total de pedidos disparados (padrão: 3000)')
+    parser.add_argument('--estoque', type=int, default=300, help='Estoque inicial de cada produto (padrão: 300)')
+    parser.add_argument('--produtos', type=int, default=4, help='Quantidade de produtos disputados (padrão: 4)')
+    parser.add_argument('--manter', action='store_true', help='Não remove os dados criados pelo teste')
+
+    args = parser.parse_args()
+
+    cliente_id, usuario_id, produto_ids = preparar_dados(args.produtos, args.estoque)
+    print(f"Produtos de teste: {produto_ids} (estoque inicial {args.estoque} cada)")
+
+    pedido_ids = []
+    recusados = 0
+    falhas = []
+    lock = threading.Lock()
+
+    def checkout(_):
+        nonlocal recusados
+        pedido = gerar_pedido(cliente_id, produto_ids)
+        try:
+            pedido_id = executar_transacao(
+                lambda cursor: registrar_pedido_venda(cursor, pedido, cliente_id, usuario_id),
+                prepared=True
+            )
+            with lock:
+                pedido_ids.append(pedido_id)
+        except EstoqueInsuficiente:
+            with lock:
+                recusados += 1
+        except Exception as e:
+            with lock:
+                falhas.append(e)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(checkout, range(args.pedidos)))
+    duracao = time.perf_counter() - inicio
+
+    print(f"\nPedidos disparados: {args.pedidos} em {duracao:.2f}s ({args.pedidos / duracao:.0f} pedidos/s)")
+    print(f"Aceitos: {len(pedido_ids)}  Recusados por estoque: {recusados}  Falhas: {len(falhas)}")
+    for erro in falhas[:5]:
+        print(f"  falha: {erro}")
+
+    ok = verificar(produto_ids, args.estoque, pedido_ids) and not falhas
+
+    if not args.manter:
+        limpar(produto_ids, pedido_ids)
+
+    print("\nOK: nenhuma venda acima do estoque" if ok else "\nFALHA: inconsistência de estoque detectada")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""
+Os módulos do backend são importados pelo nome (como em main.py), então o
+diretório do backend entra no path.
+
+Testes marcados com ERP_TESTES_BANCO precisam de um banco descartável criado
+pelo init_db.py (variáveis DB_* do .env) e são pulados sem ele:
+    ERP_TESTES_BANCO=1 python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,36 @@
+"""Cursor falso para testar a lógica das consultas sem banco."""
+
+class CursorFalso:
+    """
+    Registra as consultas executadas e responde com 'respostas', uma lista de
+    (trecho do SQL, função(parâmetros) -> linhas). A primeira resposta cujo
+    trecho aparece na consulta define o resultado de fetchone/fetchall.
+    """
+
+    def __init__(self, respostas=()):
+        self.respostas = list(respostas)
+        self.consultas = []
+        self.rowcount = 0
+        self._linhas = []
+
+    def execute(self, sql, parametros=None):
+        self.consultas.append((" ".join(sql.split()), list(parametros or [])))
+        self._linhas = []
+        for trecho, responder in self.respostas:
+            if trecho in sql:
+                self._linhas = list(responder(list(parametros or [])))
+                break
+        self.rowcount = len(self._linhas)
+
+    def fetchone(self):
+        return self._linhas[0] if self._linhas else None
+
+    def fetchall(self):
+        return self._linhas
+
+    def consulta(self, trecho):
+        """Parâmetros da última consulta que contém 'trecho'."""
+        for sql, parametros in reversed(self.consultas):
+            if trecho in sql:
+                return parametros
+        raise AssertionError(f"Nenhuma consulta com {trecho!r}")
@@ -0,0 +1,118 @@
+"""Reconstrução do cubo e do custo médio depois de arquivar o histórico."""
+
+import os
+import uuid
+from datetime import date, timedelta
+
+import pytest
+
+import arquivo_historico
+import cubo_produtos
+import custos
+from cursor_falso import CursorFalso
+
+requer_banco = pytest.mark.skipif(
+    not os.getenv("ERP_TESTES_BANCO"), reason="precisa de um banco de testes (ERP_TESTES_BANCO=1)"
+)
+
+def test_reconstruir_preserva_vendas_dos_meses_arquivados():
+    cursor = CursorFalso([("FROM arquivamentos", lambda _: [{"arquivado_ate": date(2023, 3, 15)}])])
+
+    cubo_produtos.reconstruir(cursor)
+
+    # Março/2023 tem pedidos arquivados: as vendas só são refeitas a partir de abril
+    assert cursor.consulta("DELETE FROM cubo_produto_mensal") == [date(2023, 4, 1)]
+    assert cursor.consulta("quantidade_vendida, receita, custo) SELECT")[0] == date(2023, 4, 1)
+    # As compras não são arquivadas: são zeradas e refeitas desde o início
+    assert cursor.consulta("UPDATE cubo_produto_mensal") == [date(1970, 1, 1), date(2023, 4, 1)]
+    assert cursor.consulta("quantidade_comprada, valor_comprado) SELECT") == [date(1970, 1, 1)]
+
+def test_reconstruir_sem_arquivo_refaz_tudo_desde_o_mes_pedido():
+    cursor = CursorFalso()
+
+    cubo_produtos.reconstruir(cursor, date(2024, 5, 20))
+
+    assert cursor.consulta("DELETE FROM cubo_produto_mensal") == [date(2024, 5, 1)]
+    assert cursor.consulta("UPDATE cubo_produto_mensal") == [date(2024, 5, 1), date(2024, 5, 1)]
+
+def _inserir(cursor, sql, parametros):
+    cursor.execute(sql, parametros)
+    cursor.execute("SELECT LAST_INSERT_ID() AS id")
+    return cursor.fetchone()["id"]
+
+@requer_banco
+def test_arquivar_e_reconstruir_mantem_os_meses_arquivados():
+    from database import get_db_cursor
+
+    corte = arquivo_historico.limite_arquivamento()
+    dia_venda = corte - timedelta(days=40)
+    mes_venda = date(dia_venda.year, dia_venda.month, 1)
+    sufixo = uuid.uuid4().hex[:8]
+
+    with get_db_cursor(commit=True) as cursor:
+        parceiro_id = _inserir(
+            cursor, "INSERT INTO parceiros (tipo, nome) VALUES ('ambos', %s)", (f"Teste arquivo {sufixo}",)
+        )
+        produto_id = _inserir(
+            cursor,
+            "INSERT INTO produtos (codigo, nome, preco_custo, preco_venda, estoque_atual) VALUES (%s, %s, 8, 20, 2)",
+            (f"TA{sufixo}", f"Teste arquivo {sufixo}")
+        )
+
+        # Compra recebida a 12 (o custo médio passa de 8 para 12) e venda de 3, ambas antes do corte
+        compra_id = _inserir(
+            cursor,
+            "INSERT INTO pedidos_compra (codigo, fornecedor_id, data_pedido, status, valor_total) "
+            "VALUES (%s, %s, %s, 'recebido', 60)",
+            (f"TC{sufixo}", parceiro_id, dia_venda - timedelta(days=1))
+        )
+        cursor.execute(
+            "INSERT INTO itens_pedido_compra (pedido_id, produto_id, quantidade, preco_unitario, subtotal) "
+            "VALUES (%s, %s, 5, 12, 60)",
+            (compra_id, produto_id)
+        )
+        venda_id = _inserir(
+            cursor,
+            "INSERT INTO pedidos_venda (codigo, cliente_id, data_pedido, status, valor_produtos, valor_total) "
+            "VALUES (%s, %s, %s, 'Finalizada', 60, 60)",
+            (f"TV{sufixo}", parceiro_id, dia_venda)
+        )
+        cursor.execute(
+            "INSERT INTO itens_pedido_venda (pedido_id, produto_id, quantidade, preco_unitario, subtotal, custo_unitario) "
+            "VALUES (%s, %s, 3, 20, 60, 12)",
+            (venda_id, produto_id)
+        )
+        cursor.executemany(
+            "INSERT INTO movimentacao_estoque (produto_id, tipo, quantidade, motivo, documento_referencia, data_movimentacao) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            [
+                (produto_id, "entrada", 5, custos.MOTIVO_RECEBIMENTO_COMPRA, f"TC{sufixo}", dia_venda - timedelta(days=1)),
+                (produto_id, "saida", 3, "Venda", f"TV{sufixo}", dia_venda),
+            ]
+        )
+        cubo_produtos.registrar_compras(cursor, [compra_id])
+        cubo_produtos.registrar_vendas(cursor, [venda_id])
+
+    arquivo_historico.arquivar(corte, ["pedidos_venda", "movimentacao_estoque"])
+
+    with get_db_cursor(commit=True) as cursor:
+        cursor.execute("SELECT COUNT(*) AS total FROM pedidos_venda WHERE id = %s", (venda_id,))
+        assert cursor.fetchone()["total"] == 0
+
+        cubo_produtos.reconstruir(cursor)
+        custos.recalcular_historico_produto(cursor, produto_id)
+
+        cursor.execute(
+            "SELECT quantidade_vendida, receita, quantidade_comprada FROM cubo_produto_mensal "
+            "WHERE produto_id = %s AND mes = %s",
+            (produto_id, mes_venda)
+        )
+        cubo = cursor.fetchone()
+        cursor.execute("SELECT custo_medio FROM produtos WHERE id = %s", (produto_id,))
+        custo_medio = cursor.fetchone()["custo_medio"]
+
+    assert cubo is not None
+    assert cubo["quantidade_vendida"] == 3
+    assert float(cubo["receita"]) == 60
+    assert cubo["quantidade_comprada"] == 5
+    assert float(custo_medio) == 12
@@ -0,0 +1,48 @@
+"""Horizonte confirmado do log de alterações com lacunas de transações desfeitas."""
+
+from datetime import datetime, timedelta
+
+import log_alteracoes
+from cursor_falso import CursorFalso
+
+AGORA = datetime(2026, 10, 19, 12, 0, 0)
+
+def _cursor(log, inicio_transacoes=None, com_privilegio=True):
+    """Cursor sobre 'log' ({id: data_alteracao}) que responde às consultas de confirmado_ate."""
+
+    def innodb_trx(_):
+        if not com_privilegio:
+            raise PermissionError("Access denied; you need the PROCESS privilege")
+        return [{"agora": AGORA, "inicio": inicio_transacoes}]
+
+    def anteriores_a(parametros):
+        desde, referencia, margem = parametros
+        ids = [i for i, data in log.items() if i > desde and data < referencia - timedelta(seconds=margem)]
+        return [{"id": max(ids)}] if ids else []
+
+    def seguintes(parametros):
+        base, limite = parametros
+        return [{"id": i} for i in sorted(log) if i > base][:limite]
+
+    return CursorFalso([
+        ("innodb_trx", innodb_trx),
+        ("NOW(6) AS agora", lambda _: [{"agora": AGORA}]),
+        ("data_alteracao <", anteriores_a),
+        ("ORDER BY id LIMIT", seguintes),
+    ])
+
+def test_lacuna_de_transacao_desfeita_e_pulada_com_privilegio():
+    # O offset 3 foi reservado por uma transação desfeita; nenhuma outra está em andamento
+    log = {1: AGORA - timedelta(seconds=30), 2: AGORA - timedelta(seconds=20), 4: AGORA - timedelta(seconds=10)}
+    assert log_alteracoes.confirmado_ate(_cursor(log)) == 4
+
+def test_lacuna_recente_segura_o_horizonte_sem_privilegio():
+    log = {1: AGORA - timedelta(seconds=30), 2: AGORA - timedelta(seconds=20), 4: AGORA - timedelta(seconds=10)}
+    assert log_alteracoes.confirmado_ate(_cursor(log, com_privilegio=False)) == 2
+
+def test_lacuna_antiga_de_transacao_desfeita_nao_para_o_log_sem_privilegio():
+    antigo = AGORA - timedelta(seconds=log_alteracoes.LACUNA_MAXIMA + 60)
+    log = {1: antigo, 2: antigo, 4: antigo, 5: AGORA - timedelta(seconds=5), 7: AGORA}
+    # A lacuna 3 é antiga e fica para trás; a 6 ainda pode ser uma transação em andamento
+    assert log_alteracoes.confirmado_ate(_cursor(log, com_privilegio=False)) == 5
+    assert log_alteracoes.confirmado_ate(_cursor(log, com_privilegio=False), desde=5) == 5
@@ -2,6 +2,7 @@ import threading
 import time
 from datetime import datetime, timedelta
 from database import get_db_cursor
+import configuracoes_sistema
 import logging
 
 # Configurar logging
@@ -13,20 +14,14 @@ class TimeoutManager:
         self.running = False
         self.thread = None
         self.timeout_minutes = 15  # Valor padrão
+        self.ultimo_ciclo = None  # time.monotonic() do último ciclo concluído (heartbeat)
         
     def get_timeout_setting(self):
-        """Obtém a configuração de timeout do banco de dados"""
-        try:
-            with get_db_cursor() as cursor:
-                cursor.execute("SELECT valor FROM configuracoes WHERE chave = 'timeout_time'")
-                result = cursor.fetchone()
-                if result and result['valor']:
-                    self.timeout_minutes = int(result['valor'])
-                    logger.info(f"Timeout configurado para {self.timeout_minutes} minutos")
-                else:
-                    logger.warning("Configuração de timeout não encontrada, usando valor padrão de 15 minutos")
-        except Exception as e:
-            logger.error(f"Erro ao obter configuração de timeout: {e}")
+        """Obtém a configuração de timeout do snapshot de configurações"""
+        timeout_minutes = configuracoes_sistema.obter("timeout_time")
+        if timeout_minutes != self.timeout_minutes:
+            self.timeout_minutes = timeout_minutes
+            logger.info(f"Timeout configurado para {self.timeout_minutes} minutos")
             
     def check_user_timeouts(self):
         """Verifica e desconecta usuários que excederam o tempo limite"""
@@ -76,6 +71,7 @@ class TimeoutManager:
         while self.running:
             try:
                 self.check_user_timeouts()
+                self.ultimo_ciclo = time.monotonic()
                 # Aguarda 60 segundos antes da próxima verificação
                 time.sleep(60)
             except Exception as e:
@@ -217,3 +217,192 @@ async function apiDelete(endpoint) {
     
     return true;
 }
+
+/**
+ * Assina o canal de eventos em tempo real (Server-Sent Events) da API
+ * @param {string[]} topicos - Tópicos desejados ('vendas', 'estoque', 'caixa', 'financeiro')
+ * @param {Function} aoReceber - Chamada com cada evento ({topico, tipo, id, dados})
+ * @param {Function} aoRessincronizar - Chamada quando eventos foram perdidos e a tela deve ser recarregada
+ * @returns {Promise<EventSource|null>} - A conexão aberta (use .close() para encerrar)
+ */
+async function assinarEventos(topicos, aoReceber, aoRessincronizar = null) {
+    if (typeof EventSource === 'undefined') {
+        return null;
+    }
+    
+    const token = localStorage.getItem('erp_token');
+    if (!token) {
+        return null;
+    }
+    
+    const baseUrl = await getApiBaseUrl();
+    const params = new URLSearchParams({ topicos: topicos.join(','), token });
+    const fonte = new EventSource(`${baseUrl}/api/eventos/?${params.toString()}`);
+    
+    topicos.forEach(topico => {
+        fonte.addEventListener(topico, (mensagem) => {
+            try {
+                aoReceber(JSON.parse(mensagem.data));
+            } catch (error) {
+                console.error('Erro ao processar evento:', error);
+            }
+        });
+    });
+    
+    fonte.addEventListener('sistema', (mensagem) => {
+        const evento = JSON.parse(mensagem.data);
+        if (evento.tipo === 'ressincronizar' && aoRessincronizar) {
+            aoRessincronizar();
+        }
+    });
+    
+    // Ao reconectar depois de uma queda, eventos podem ter sido perdidos
+    let conectado = false;
+    fonte.addEventListener('open', () => {
+        if (conectado && aoRessincronizar) {
+            aoRessincronizar();
+        }
+        conectado = true;
+    });
+    
+    window.addEventListener('beforeunload', () => fonte.close());
+    
+    return fonte;
+}
+
+// Cópia local (IndexedDB) dos cadastros, mantida em dia pelas rotas /api/<cadastro>/alteracoes:
+// a primeira visita baixa o cadastro inteiro e as seguintes só o que mudou desde então
+const CADASTROS_SINCRONIZADOS = ['produtos', 'parceiros', 'clientes', 'vendedores'];
+const CADASTROS_DB_NOME = 'erp_cadastros';
+const CADASTROS_DB_VERSAO = 1;
+
+let cadastrosDb = null;
+const sincronizacoesEmAndamento = {};
+
+function requisicaoIndexedDB(requisicao) {
+    return new Promise((resolve, reject) => {
+        requisicao.onsuccess = () => resolve(requisicao.result);
+        requisicao.onerror = () => reject(requisicao.error);
+    });
+}
+
+function abrirCadastrosDb() {
+    if (!cadastrosDb) {
+        const requisicao = indexedDB.open(CADASTROS_DB_NOME, CADASTROS_DB_VERSAO);
+        requisicao.onupgradeneeded = () => {
+            const db = requisicao.result;
+            CADASTROS_SINCRONIZADOS.forEach(cadastro => {
+                if (!db.objectStoreNames.contains(cadastro)) {
+                    db.createObjectStore(cadastro, { keyPath: 'id' });
+                }
+            });
+            if (!db.objectStoreNames.contains('offsets')) {
+                db.createObjectStore('offsets', { keyPath: 'cadastro' });
+            }
+        };
+        cadastrosDb = requisicaoIndexedDB(requisicao).catch(error => {
+            cadastrosDb = null;
+            throw error;
+        });
+    }
+    return cadastrosDb;
+}
+
+/**
+ * Aplica uma página de alterações ao cadastro local, em uma única transação
+ * @param {IDBDatabase} db - Banco local
+ * @param {string} cadastro - Nome do cadastro
+ * @param {Object} pagina - Resposta da rota /alteracoes ({upserts, removidos, proximo})
+ * @param {boolean} cargaCompleta - Se a página substitui todo o conteúdo local
+ * @param {string} baseUrl - URL da API à qual o offset pertence
+ */
+function aplicarAlteracoes(db, cadastro, pagina, cargaCompleta, baseUrl) {
+    return new Promise((resolve, reject) => {
+        const transacao = db.transaction([cadastro, 'offsets'], 'readwrite');
+        const registros = transacao.objectStore(cadastro);
+        
+        if (cargaCompleta) {
+            registros.clear();
+        }
+        pagina.upserts.forEach(registro => registros.put(registro));
+        pagina.removidos.forEach(id => registros.delete(id));
+        transacao.objectStore('offsets').put({ cadastro, offset: pagina.proximo, baseUrl });
+        
+        transacao.oncomplete = () => resolve();
+        transacao.onerror = () => reject(transacao.error);
+        transacao.onabort = () => reject(transacao.error);
+    });
+}
+
+/**
+ * Traz o cadastro local até a versão atual do servidor
+ * @param {string} cadastro - 'produtos', 'parceiros', 'clientes' ou 'vendedores'
+ * @returns {Promise<void>}
+ */
+async function sincronizarCadastro(cadastro) {
+    // Chamadas simultâneas na mesma página compartilham a mesma sincronização
+    if (!sincronizacoesEmAndamento[cadastro]) {
+        sincronizacoesEmAndamento[cadastro] = (async () => {
+            const db = await abrirCadastrosDb();
+            const baseUrl = await getApiBaseUrl();
+            const salvo = await requisicaoIndexedDB(
+                db.transaction('offsets').objectStore('offsets').get(cadastro)
+            );
+            // Offsets de outra API não valem aqui: recomeça pela carga completa
+            let desde = salvo && salvo.baseUrl === baseUrl ? salvo.offset : 0;
+            
+            let pagina;
+            do {
+                pagina = await apiGet(`/api/${cadastro}/alteracoes`, { desde });
+                await aplicarAlteracoes(db, cadastro, pagina, desde === 0, baseUrl);
+                desde = pagina.proximo;
+            } while (!pagina.completo);
+        })().finally(() => {
+            delete sincronizacoesEmAndamento[cadastro];
+        });
+    }
+    return sincronizacoesEmAndamento[cadastro];
+}
+
+/**
+ * Lista um cadastro a partir da cópia local, sincronizada antes com o servidor.
+ * Sem IndexedDB (ou se ele falhar), busca a lista completa na API.
+ * @param {string} cadastro - 'produtos', 'parceiros', 'clientes' ou 'vendedores'
+ * @param {Function} filtro - Função aplicada a cada registro (opcional)
+ * @returns {Promise<Object[]>} - Registros do cadastro, ordenados por id
+ */
+async function obterCadastro(cadastro, filtro = null) {
+    let registros;
+    
+    try {
+        if (typeof indexedDB === 'undefined') {
+            throw new Error('IndexedDB indisponível');
+        }
+        await sincronizarCadastro(cadastro);
+        const db = await abrirCadastrosDb();
+        registros = await requisicaoIndexedDB(db.transaction(cadastro).objectStore(cadastro).getAll());
+    } catch (error) {
+        console.warn(`Cópia local de ${cadastro} indisponível, buscando a lista completa:`, error);
+        registros = await apiGet(`/api/${cadastro}`);
+    }
+    
+    return filtro ? registros.filter(filtro) : registros;
+}
+
+/**
+ * Descarta as cópias locais dos cadastros (por exemplo, ao sair do sistema)
+ * @returns {Promise<void>}
+ */
+async function limparCadastrosLocais() {
+    if (typeof indexedDB === 'undefined') {
+        return;
+    }
+    const db = await abrirCadastrosDb();
+    const nomes = [...CADASTROS_SINCRONIZADOS, 'offsets'];
+    const transacao = db.transaction(nomes, 'readwrite');
+    nomes.forEach(nome => transacao.objectStore(nome).clear());
+    await new Promise((resolve, reject) => {
+        transacao.oncomplete = () => resolve();
+        transacao.onerror = () => reject(transacao.error);
+    });
+}
@@ -47,7 +47,12 @@ function logout() {
     localStorage.removeItem('erp_token');
     localStorage.removeItem('erp_token_type');
     localStorage.removeItem('erp_user_data');
-    window.location.href = 'index.html';
+    
+    // Descarta as cópias locais dos cadastros antes de sair
+    const limpeza = typeof limparCadastrosLocais === 'function' ? limparCadastrosLocais() : Promise.resolve();
+    limpeza.catch(() => {}).finally(() => {
+        window.location.href = 'index.html';
+    });
 }
 
 // Exibe modal informando que o usuário foi desconectado
@@ -64,17 +64,13 @@ async function loadClientes() {
     const status = statusElement ? statusElement.value : '';
     const tipo = tipoElement ? tipoElement.value : '';
     
-    // Constrói os parâmetros de consulta
-    const params = new URLSearchParams();
-    if (status !== '') params.append('ativo', status);
-    if (tipo !== '') params.append('tipo', tipo);
-    
     try {
-        // Usa a API centralizada
-        const url = `/api/clientes${params.toString() ? '?' + params.toString() : ''}`;
-        console.log(`Enviando requisição GET para API centralizada: ${url}`);
-        
-        const data = await apiGet(url);
+        // Clientes da cópia local (sincronizada com a API), filtrados pelo status
+        // e pelo tipo ('fisica'/'juridica' no filtro, 'pessoa_fisica'/'pessoa_juridica' no cadastro)
+        const data = await obterCadastro('clientes', cliente =>
+            (status === '' || cliente.ativo === (status === 'ativo')) &&
+            (tipo === '' || cliente.tipo === `pessoa_${tipo}`)
+        );
         console.log('Clientes carregados com sucesso:', data.length);
         
         // Configuração da paginação
@@ -170,8 +166,7 @@ function setupActionButtons() {
     const filterTipo = document.getElementById('tipoCliente');
     if (filterTipo) {
         filterTipo.addEventListener('change', function() {
-            // Implementar filtro por tipo
-            loadClientes(); // Por enquanto apenas recarrega
+            loadClientes();
         });
     }
     
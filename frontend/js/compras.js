@@ -414,8 +414,8 @@ async function loadFornecedoresWithSelection(selectedFornecedorId) {
     fornecedorSelect.innerHTML = '<option value="">Carregando fornecedores...</option>';
     
     try {
-        // Usa a função apiGet para buscar fornecedores
-        const data = await apiGet('/api/parceiros', { tipo: 'fornecedor,ambos' });
+        // Fornecedores da cópia local dos parceiros (sincronizada com a API)
+        const data = await obterCadastro('parceiros', p => p.tipo === 'fornecedor' || p.tipo === 'ambos');
         
         // Limpa o select
         fornecedorSelect.innerHTML = '<option value="">Selecione...</option>';
@@ -452,8 +452,8 @@ async function loadFornecedores() {
     fornecedorSelect.innerHTML = '<option value="">Carregando fornecedores...</option>';
     
     try {
-        // Usa a nova API centralizada
-        const data = await apiGet('/api/parceiros', { tipo: 'fornecedor,ambos' });
+        // Fornecedores da cópia local dos parceiros (sincronizada com a API)
+        const data = await obterCadastro('parceiros', p => p.tipo === 'fornecedor' || p.tipo === 'ambos');
         
         // Limpa o select
         fornecedorSelect.innerHTML = '<option value="">Selecione...</option>';
@@ -672,8 +672,8 @@ async function loadProdutos() {
     produtoSelect.innerHTML = '<option value="">Carregando produtos...</option>';
     
     try {
-        // Usa a nova API centralizada
-        const data = await apiGet('/api/produtos', { ativo: true });
+        // Produtos ativos da cópia local (sincronizada com a API)
+        const data = await obterCadastro('produtos', p => p.ativo);
         
         // Limpa o select
         produtoSelect.innerHTML = '<option value="">Selecione...</option>';
@@ -12,8 +12,14 @@ document.addEventListener('DOMContentLoaded', function() {
     setupDateFilter();
 });
 
+// Mês/ano exibido no dashboard e estado das atualizações em tempo real
+let dashboardMesAno = null;
+let eventosDashboard = null;
+const recargasDashboard = {};
+
 // Inicializa o dashboard com dados
 async function initDashboard(monthYear = null) {
+    dashboardMesAno = monthYear;
     try {
         // Carrega dados reais da API
         console.log('Iniciando inicialização do dashboard...');
@@ -56,6 +62,11 @@ async function initDashboard(monthYear = null) {
         // Gráficos removidos conforme solicitado
         
         console.log('Dashboard inicializado com sucesso!');
+        
+        // Passa a receber as alterações em tempo real (uma única conexão)
+        if (!eventosDashboard) {
+            eventosDashboard = iniciarEventosDashboard();
+        }
     } catch (error) {
         console.error('Erro ao inicializar dashboard:', error);
     }
@@ -397,35 +408,41 @@ function updateRecentActivities(vendasRecentes) {
     
     // Adiciona as vendas recentes à tabela
     vendasRecentes.forEach(venda => {
-        const row = document.createElement('tr');
-        
-        // Formata a data
-        const data = new Date(venda.data_pedido);
-        const dataFormatada = data.toLocaleDateString('pt-BR');
-        
-        // Cria o status com a classe apropriada
-        const statusClass = getStatusClass(venda.status);
-        
-        // Usa o custo do produto da tabela pedidos_venda
-        const custo = venda.custo_produto !== null ? venda.custo_produto : venda.valor_total * 0.6;
-        // Calcula o lucro com base no custo obtido
-        const lucro = venda.valor_total - custo;
-        
-        row.innerHTML = `
-            <td>#${venda.codigo}</td>
-            <td>${venda.cliente_nome}</td>
-            <td>Pedido #${venda.codigo}</td>
-            <td>R$ ${custo.toFixed(2).replace('.', ',')}</td>
-            <td>R$ ${venda.valor_total.toFixed(2).replace('.', ',')}</td>
-            <td>R$ ${lucro.toFixed(2).replace('.', ',')}</td>
-            <td><span class="status ${statusClass}">${formatarStatus(venda.status)}</span></td>
-            <td>${dataFormatada}</td>
-        `;
-        
-        tableBody.appendChild(row);
+        tableBody.appendChild(criarLinhaVenda(venda));
     });
 }
 
+// Cria a linha de uma venda na tabela de atividades recentes
+function criarLinhaVenda(venda) {
+    const row = document.createElement('tr');
+    row.dataset.pedidoId = venda.id;
+    
+    // Formata a data
+    const data = new Date(venda.data_pedido);
+    const dataFormatada = data.toLocaleDateString('pt-BR');
+    
+    // Cria o status com a classe apropriada
+    const statusClass = getStatusClass(venda.status);
+    
+    // Usa o custo do produto da tabela pedidos_venda
+    const custo = venda.custo_produto !== null ? venda.custo_produto : venda.valor_total * 0.6;
+    // Calcula o lucro com base no custo obtido
+    const lucro = venda.valor_total - custo;
+    
+    row.innerHTML = `
+        <td>#${venda.codigo}</td>
+        <td>${venda.cliente_nome}</td>
+        <td>Pedido #${venda.codigo}</td>
+        <td>R$ ${custo.toFixed(2).replace('.', ',')}</td>
+        <td>R$ ${venda.valor_total.toFixed(2).replace('.', ',')}</td>
+        <td>R$ ${lucro.toFixed(2).replace('.', ',')}</td>
+        <td><span class="status ${statusClass}">${formatarStatus(venda.status)}</span></td>
+        <td>${dataFormatada}</td>
+    `;
+    
+    return row;
+}
+
 // Função para formatar o status
 function formatarStatus(status) {
     const statusMap = {
@@ -484,4 +501,75 @@ function setupDateFilter() {
     }
 }
 
+// Assina os eventos de vendas e estoque: as linhas da tabela são atualizadas com o
+// delta recebido e os totais são recarregados no máximo uma vez a cada 30 segundos
+function iniciarEventosDashboard() {
+    return assinarEventos(['vendas', 'estoque'], (evento) => {
+        if (evento.topico === 'vendas') {
+            aplicarEventoVenda(evento);
+            agendarRecarga('totais', 30000, async () => {
+                const dashboardData = await fetchDashboardData(dashboardMesAno);
+                if (dashboardData) {
+                    updateDashboardCards(dashboardData);
+                }
+            });
+        } else if (evento.topico === 'estoque') {
+            agendarRecarga('estoque', 30000, async () => {
+                await updateValorizacaoEstoque();
+                await updateCustoTotalEstoque();
+            });
+        }
+    }, () => initDashboard(dashboardMesAno));
+}
+
+// Executa a recarga uma vez ao fim do intervalo, agrupando os eventos recebidos nesse meio tempo
+function agendarRecarga(chave, intervalo, recarregar) {
+    if (recargasDashboard[chave]) return;
+    recargasDashboard[chave] = setTimeout(async () => {
+        delete recargasDashboard[chave];
+        try {
+            await recarregar();
+        } catch (error) {
+            console.error('Erro ao atualizar o dashboard:', error);
+        }
+    }, intervalo);
+}
+
+// Aplica o delta de um pedido de venda na tabela de atividades recentes
+function aplicarEventoVenda(evento) {
+    const tableBody = document.querySelector('.recent-activities .data-table tbody');
+    if (!tableBody) return;
+    
+    const linhaAtual = tableBody.querySelector(`tr[data-pedido-id="${evento.id}"]`);
+    const venda = evento.dados;
+    
+    if (!venda) {
+        // Pedido excluído
+        if (linhaAtual) linhaAtual.remove();
+        return;
+    }
+    
+    if (linhaAtual) {
+        linhaAtual.replaceWith(criarLinhaVenda(venda));
+        return;
+    }
+    
+    // Pedido novo: só entra na tabela se for do mês exibido
+    if (evento.tipo !== 'pedidos_venda.insert') return;
+    if (dashboardMesAno && !String(venda.data_pedido).startsWith(dashboardMesAno)) return;
+    
+    // Remove a linha de "nenhuma atividade", se houver
+    if (!tableBody.querySelector('tr[data-pedido-id]')) {
+        tableBody.innerHTML = '';
+    }
+    
+    tableBody.prepend(criarLinhaVenda(venda));
+    
+    // Mantém apenas as 5 vendas mais recentes
+    const linhas = tableBody.querySelectorAll('tr[data-pedido-id]');
+    for (let i = 5; i < linhas.length; i++) {
+        linhas[i].remove();
+    }
+}
+
 // Funções de gráficos removidas conforme solicitado
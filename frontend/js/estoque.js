@@ -28,6 +28,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Carrega a lista de produtos em estoque
     loadEstoque();
 
+    // Atualiza os saldos em tempo real pelo canal de eventos (recarrega a lista se eventos forem perdidos)
+    assinarEventos(['estoque'], aplicarEventoEstoque, loadEstoque);
+
     // Configura os filtros
     setupFilters();
 });
@@ -172,6 +175,7 @@ async function displayEstoque(produtos) {
     
     produtos.forEach(produto => {
         const row = document.createElement('tr');
+        row.dataset.produtoId = produto.id;
         
         // Adiciona classe para destacar produtos abaixo do estoque mínimo
         if (produto.estoque_atual < produto.estoque_minimo) {
@@ -232,6 +236,26 @@ async function displayEstoque(produtos) {
     });
 }
 
+// Aplica o saldo recebido pelo canal de eventos ao produto listado
+function aplicarEventoEstoque(evento) {
+    if (!evento.dados) return;
+    
+    const produto = allItems.find(item => item.id === evento.id);
+    if (!produto) return;
+    
+    produto.estoque_atual = evento.dados.estoque_atual;
+    produto.estoque_minimo = evento.dados.estoque_minimo;
+    
+    // Atualiza a linha se o produto estiver na página exibida
+    const row = document.querySelector(`#estoqueTableBody tr[data-produto-id="${evento.id}"]`);
+    if (!row) return;
+    
+    const colunas = row.querySelectorAll('td');
+    colunas[4].textContent = produto.estoque_atual;
+    colunas[5].textContent = produto.estoque_minimo;
+    row.classList.toggle('estoque-baixo', produto.estoque_atual < produto.estoque_minimo);
+}
+
 // Configura os filtros de estoque
 function setupFilters() {
     const filtroAbaixoMinimo = document.getElementById('filtroAbaixoMinimo');
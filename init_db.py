@@ -1,5 +1,6 @@
 import os
 import mysql.connector
+from datetime import datetime
 from dotenv import load_dotenv
 from passlib.context import CryptContext
 
@@ -120,6 +121,7 @@ tables = {
             preco_venda DECIMAL(10, 2) NOT NULL,
             estoque_atual INT DEFAULT 0,
             estoque_minimo INT DEFAULT 5,
+            custo_medio DECIMAL(12, 4),
             categoria_id INT,
             tipo_produto ENUM('comprado', 'fabricado') DEFAULT 'comprado',
             comissao DECIMAL(4, 0) DEFAULT 0,
@@ -193,6 +195,25 @@ tables = {
             FOREIGN KEY (produto_id) REFERENCES produtos(id)
         )
     """,
+
+    # NF-e de entrada importadas (ver backend/nfe_importacao.py)
+    "notas_fiscais_entrada": """
+        CREATE TABLE IF NOT EXISTS notas_fiscais_entrada (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            chave CHAR(44) NOT NULL UNIQUE,
+            numero VARCHAR(9),
+            serie VARCHAR(3),
+            fornecedor_id INT NOT NULL,
+            pedido_compra_id INT NOT NULL,
+            data_emissao DATE,
+            valor_nota DECIMAL(12, 2),
+            usuario_id INT,
+            data_importacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (fornecedor_id) REFERENCES parceiros(id),
+            FOREIGN KEY (pedido_compra_id) REFERENCES pedidos_compra(id),
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+        )
+    """,
     
     # Tabela de movimentação de estoque
     "movimentacao_estoque": """
@@ -228,6 +249,9 @@ tables = {
             forma_pagamento ENUM('dinheiro', 'cartao_credito', 'cartao_debito', 'boleto', 'pix', 'transferencia') DEFAULT 'dinheiro',
             observacoes TEXT,
             usuario_id INT,
+            chave_idempotencia VARCHAR(100) NULL,
+            UNIQUE KEY uk_pedidos_venda_codigo (codigo),
+            UNIQUE KEY uk_pedidos_venda_chave_idempotencia (chave_idempotencia),
             FOREIGN KEY (cliente_id) REFERENCES parceiros(id),
             FOREIGN KEY (vendedor_id) REFERENCES vendedores(id),
             FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
@@ -244,11 +268,177 @@ tables = {
             preco_unitario DECIMAL(10, 2) NOT NULL,
             desconto DECIMAL(10, 2) DEFAULT 0,
             subtotal DECIMAL(10, 2) NOT NULL,
+            custo_unitario DECIMAL(10, 2),
             FOREIGN KEY (pedido_id) REFERENCES pedidos_venda(id),
             FOREIGN KEY (produto_id) REFERENCES produtos(id)
         )
     """,
     
+    # Cubo de vendas e compras por produto e mês (mantido pelos pedidos, ver cubo_produtos.py)
+    "cubo_produto_mensal": """
+        CREATE TABLE IF NOT EXISTS cubo_produto_mensal (
+            produto_id INT NOT NULL,
+            mes DATE NOT NULL,
+            quantidade_vendida INT NOT NULL DEFAULT 0,
+            receita DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            custo DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            margem DECIMAL(14, 2) AS (receita - custo) STORED,
+            quantidade_comprada INT NOT NULL DEFAULT 0,
+            valor_comprado DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (produto_id, mes),
+            INDEX idx_cubo_produto_mensal_mes (mes),
+            FOREIGN KEY (produto_id) REFERENCES produtos(id)
+        )
+    """,
+
+    # Segmentação RFM e LTV por cliente (mantida em lote, ver segmentacao_clientes.py)
+    "segmento_clientes": """
+        CREATE TABLE IF NOT EXISTS segmento_clientes (
+            cliente_id INT PRIMARY KEY,
+            frequencia INT NOT NULL DEFAULT 0,
+            valor_monetario DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            margem DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            ticket_medio DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            primeira_compra DATETIME NULL,
+            ultima_compra DATETIME NULL,
+            ultimo_pedido_id INT NOT NULL DEFAULT 0,
+            score_r TINYINT NULL,
+            score_f TINYINT NULL,
+            score_m TINYINT NULL,
+            segmento VARCHAR(20) NULL,
+            ltv DECIMAL(14, 2) NULL,
+            desatualizado BOOLEAN NOT NULL DEFAULT FALSE,
+            data_calculo TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            INDEX idx_segmento_clientes_segmento (segmento),
+            INDEX idx_segmento_clientes_desatualizado (desatualizado),
+            FOREIGN KEY (cliente_id) REFERENCES parceiros(id) ON DELETE CASCADE
+        )
+    """,
+
+    # Fechamentos de comissão: períodos fechados são imutáveis (ver comissoes.py)
+    "fechamentos_comissao": """
+        CREATE TABLE IF NOT EXISTS fechamentos_comissao (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            data_inicio DATE NOT NULL,
+            data_fim DATE NOT NULL,
+            quantidade_pedidos INT NOT NULL DEFAULT 0,
+            total_vendas DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            total_comissao DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            usuario_id INT,
+            data_fechamento TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY uk_fechamentos_comissao_periodo (data_inicio, data_fim),
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+        )
+    """,
+
+    # Extrato de comissão de cada vendedor em um fechamento
+    "extratos_comissao": """
+        CREATE TABLE IF NOT EXISTS extratos_comissao (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            fechamento_id INT NOT NULL,
+            vendedor_id INT NOT NULL,
+            quantidade_pedidos INT NOT NULL DEFAULT 0,
+            quantidade_estornos INT NOT NULL DEFAULT 0,
+            total_vendas DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            total_estornos DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            total_comissao DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            UNIQUE KEY uk_extratos_comissao_vendedor (fechamento_id, vendedor_id),
+            FOREIGN KEY (fechamento_id) REFERENCES fechamentos_comissao(id),
+            FOREIGN KEY (vendedor_id) REFERENCES vendedores(id)
+        )
+    """,
+
+    # Lançamentos por pedido de cada fechamento (comissão ou estorno de pedido cancelado)
+    "lancamentos_comissao": """
+        CREATE TABLE IF NOT EXISTS lancamentos_comissao (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            fechamento_id INT NOT NULL,
+            vendedor_id INT NOT NULL,
+            pedido_id INT NOT NULL,
+            tipo ENUM('comissao', 'estorno') NOT NULL DEFAULT 'comissao',
+            data_pedido TIMESTAMP NULL,
+            valor_base DECIMAL(12, 2) NOT NULL,
+            percentual DECIMAL(5, 2) NOT NULL,
+            valor_comissao DECIMAL(12, 2) NOT NULL,
+            UNIQUE KEY uk_lancamentos_comissao_pedido (pedido_id, tipo),
+            INDEX idx_lancamentos_comissao_extrato (fechamento_id, vendedor_id),
+            FOREIGN KEY (fechamento_id) REFERENCES fechamentos_comissao(id),
+            FOREIGN KEY (vendedor_id) REFERENCES vendedores(id),
+            FOREIGN KEY (pedido_id) REFERENCES pedidos_venda(id)
+        )
+    """,
+
+    # Log de alterações das rotas de escrita (outbox transacional, ver log_alteracoes.py)
+    "log_alteracoes": """
+        CREATE TABLE IF NOT EXISTS log_alteracoes (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            entidade VARCHAR(50) NOT NULL,
+            entidade_id INT NOT NULL,
+            operacao ENUM('insert', 'update', 'delete') NOT NULL,
+            versao INT NOT NULL,
+            usuario_id INT NULL,
+            data_alteracao TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6),
+            UNIQUE KEY uk_log_alteracoes_versao (entidade, entidade_id, versao),
+            INDEX idx_log_alteracoes_entidade (entidade, id)
+        )
+    """,
+
+    # Última versão registrada de cada registro no log (ver log_alteracoes.registrar)
+    "versoes_registros": """
+        CREATE TABLE IF NOT EXISTS versoes_registros (
+            entidade VARCHAR(50) NOT NULL,
+            entidade_id INT NOT NULL,
+            versao INT NOT NULL,
+            PRIMARY KEY (entidade, entidade_id)
+        )
+    """,
+
+    # Total de alterações registradas por entidade, em fatias por conexão
+    # (ver log_alteracoes.contar e log_alteracoes.marca)
+    "contadores_log": """
+        CREATE TABLE IF NOT EXISTS contadores_log (
+            entidade VARCHAR(50) NOT NULL,
+            fatia SMALLINT NOT NULL,
+            total BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (entidade, fatia)
+        )
+    """,
+
+    # Próximo sequencial dos códigos por tabela e ano (ver backend/parcelamento.py)
+    "sequencias": """
+        CREATE TABLE IF NOT EXISTS sequencias (
+            nome VARCHAR(50) NOT NULL,
+            ano INT NOT NULL,
+            proximo INT NOT NULL,
+            PRIMARY KEY (nome, ano)
+        )
+    """,
+
+    # Fechamento diário do caixa (ver backend/fechamento_caixa.py)
+    "fechamentos_caixa": """
+        CREATE TABLE IF NOT EXISTS fechamentos_caixa (
+            data DATE PRIMARY KEY,
+            saldo_inicial DECIMAL(14, 2) NOT NULL,
+            entradas DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            saidas DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            saldo_final DECIMAL(14, 2) NOT NULL,
+            quantidade_movimentos INT NOT NULL DEFAULT 0,
+            usuario_id INT,
+            data_fechamento TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+        )
+    """,
+
+    # Data de corte do último arquivamento de cada tabela (ver backend/arquivo_historico.py)
+    "arquivamentos": """
+        CREATE TABLE IF NOT EXISTS arquivamentos (
+            tabela VARCHAR(64) PRIMARY KEY,
+            arquivado_ate DATE NOT NULL,
+            linhas BIGINT NOT NULL DEFAULT 0,
+            data_arquivamento TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """,
+
     # Tabela de objetos de postagem
     "objetos_postagem": """
         CREATE TABLE IF NOT EXISTS objetos_postagem (
@@ -356,7 +546,49 @@ tables = {
             FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
         )
     """,
-    
+
+    # Importações de extratos bancários (ver backend/conciliacao_bancaria.py)
+    "importacoes_extrato": """
+        CREATE TABLE IF NOT EXISTS importacoes_extrato (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            conta_bancaria_id INT NOT NULL,
+            arquivo VARCHAR(255),
+            formato VARCHAR(10) NOT NULL,
+            lancamentos INT NOT NULL DEFAULT 0,
+            conciliados INT NOT NULL DEFAULT 0,
+            ja_conciliados INT NOT NULL DEFAULT 0,
+            pendentes INT NOT NULL DEFAULT 0,
+            usuario_id INT,
+            data_importacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conta_bancaria_id) REFERENCES contas_bancarias(id),
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+        )
+    """,
+
+    # Lançamentos dos extratos e o que os conciliou. Sem chave estrangeira para
+    # contas e movimentos, que podem ir para as tabelas de arquivo.
+    "extrato_bancario": """
+        CREATE TABLE IF NOT EXISTS extrato_bancario (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            importacao_id INT NOT NULL,
+            conta_bancaria_id INT NOT NULL,
+            id_externo VARCHAR(100) NOT NULL,
+            data DATE NOT NULL,
+            valor DECIMAL(14, 2) NOT NULL,
+            documento VARCHAR(50),
+            descricao VARCHAR(255),
+            situacao ENUM('conciliado', 'pendente', 'periodo_fechado') NOT NULL,
+            conta_tabela VARCHAR(20),
+            conta_id INT,
+            movimento_caixa_id INT,
+            UNIQUE KEY uk_extrato_bancario_lancamento (conta_bancaria_id, id_externo),
+            INDEX idx_extrato_bancario_movimento (movimento_caixa_id),
+            INDEX idx_extrato_bancario_situacao (situacao, data),
+            FOREIGN KEY (importacao_id) REFERENCES importacoes_extrato(id),
+            FOREIGN KEY (conta_bancaria_id) REFERENCES contas_bancarias(id)
+        )
+    """,
+
     # Tabela de movimentação de caixa
     "movimentacao_caixa": """
         CREATE TABLE IF NOT EXISTS movimentacao_caixa (
@@ -401,6 +633,175 @@ try:
 except mysql.connector.Error as err:
     print(f"Ignorado erro ao alterar tipo de clientes: {err}")
 
+# Adiciona chave de idempotência aos pedidos de venda (importação em lote)
+try:
+    cursor.execute("""
+        ALTER TABLE pedidos_venda
+        ADD COLUMN chave_idempotencia VARCHAR(100) NULL,
+        ADD UNIQUE KEY uk_pedidos_venda_chave_idempotencia (chave_idempotencia)
+    """)
+    conn.commit()
+    print("Coluna chave_idempotencia adicionada em pedidos_venda")
+except mysql.connector.Error as err:
+    print(f"Ignorado erro ao adicionar chave_idempotencia: {err}")
+
+# Adiciona o custo unitário do produto no momento da venda aos itens de pedido
+try:
+    cursor.execute("ALTER TABLE itens_pedido_venda ADD COLUMN custo_unitario DECIMAL(10, 2)")
+    cursor.execute("""
+        UPDATE itens_pedido_venda i
+        JOIN produtos p ON p.id = i.produto_id
+        SET i.custo_unitario = p.preco_custo
+    """)
+    conn.commit()
+    print("Coluna custo_unitario adicionada em itens_pedido_venda")
+except mysql.connector.Error as err:
+    print(f"Ignorado erro ao adicionar custo_unitario: {err}")
+
+# Adiciona o custo médio ponderado aos produtos (recalcule o histórico com backend/backfill_custos.py)
+try:
+    cursor.execute("ALTER TABLE produtos ADD COLUMN custo_medio DECIMAL(12, 4) AFTER estoque_minimo")
+    conn.commit()
+    print("Coluna custo_medio adicionada em produtos")
+except mysql.connector.Error as err:
+    print(f"Ignorado erro ao adicionar custo_medio: {err}")
+
+# Índice por data nos pedidos de venda (fechamento de comissões e relatórios por período)
+try:
+    cursor.execute("CREATE INDEX idx_pedidos_venda_data_pedido ON pedidos_venda (data_pedido)")
+    conn.commit()
+    print("Índice idx_pedidos_venda_data_pedido criado")
+except mysql.connector.Error as err:
+    print(f"Ignorado erro ao criar idx_pedidos_venda_data_pedido: {err}")
+
+# Índice por documento nas movimentações de estoque (log de alterações, custos e prazos de compra)
+try:
+    cursor.execute("CREATE INDEX idx_movimentacao_estoque_documento ON movimentacao_estoque (documento_referencia)")
+    conn.commit()
+    print("Índice idx_movimentacao_estoque_documento criado")
+except mysql.connector.Error as err:
+    print(f"Ignorado erro ao criar idx_movimentacao_estoque_documento: {err}")
+
+# Versões dos registros já presentes no log de alterações (instalações anteriores)
+try:
+    cursor.execute("""
+        INSERT IGNORE INTO versoes_registros (entidade, entidade_id, versao)
+        SELECT entidade, entidade_id, MAX(versao) FROM log_alteracoes GROUP BY entidade, entidade_id
+    """)
+    conn.commit()
+    print("Versões dos registros carregadas do log de alterações")
+except mysql.connector.Error as err:
+    print(f"Ignorado erro ao carregar versoes_registros: {err}")
+
+# Código único dos pedidos de venda (reservado em sequencias; ver backend/sequencias.py).
+# Instalações com códigos repetidos pelo antigo COUNT(*) + 1 precisam corrigi-los antes
+try:
+    cursor.execute("CREATE UNIQUE INDEX uk_pedidos_venda_codigo ON pedidos_venda (codigo)")
+    conn.commit()
+    print("Índice único uk_pedidos_venda_codigo criado")
+except mysql.connector.Error as err:
+    print(f"Ignorado erro ao criar uk_pedidos_venda_codigo: {err}")
+
+# Índices cobrindo o aging de contas (status, vencimento, parceiro e valor; ver backend/aging_contas.py)
+for tabela, coluna in (("contas_pagar", "fornecedor_id"), ("contas_receber", "cliente_id")):
+    try:
+        cursor.execute(f"CREATE INDEX idx_{tabela}_aging ON {tabela} (status, data_vencimento, {coluna}, valor)")
+        conn.commit()
+        print(f"Índice idx_{tabela}_aging criado")
+    except mysql.connector.Error as err:
+        print(f"Ignorado erro ao criar idx_{tabela}_aging: {err}")
+
+# Índices por código das contas (conciliação pelo seu número / nosso número; ver backend/conciliacao_bancaria.py)
+for tabela in ("contas_pagar", "contas_receber"):
+    try:
+        cursor.execute(f"CREATE INDEX idx_{tabela}_codigo ON {tabela} (codigo)")
+        conn.commit()
+        print(f"Índice idx_{tabela}_codigo criado")
+    except mysql.connector.Error as err:
+        print(f"Ignorado erro ao criar idx_{tabela}_codigo: {err}")
+
+# Controle da sincronização de rastreamento (ver backend/rastreamento.py)
+for coluna, definicao in (("data_ultima_consulta", "DATETIME NULL"), ("ultimo_evento", "VARCHAR(255)")):
+    try:
+        cursor.execute(f"ALTER TABLE objetos_postagem ADD COLUMN {coluna} {definicao}")
+        conn.commit()
+        print(f"Coluna objetos_postagem.{coluna} criada")
+    except mysql.connector.Error as err:
+        print(f"Ignorado erro ao criar objetos_postagem.{coluna}: {err}")
+
+try:
+    cursor.execute("CREATE INDEX idx_objetos_postagem_consulta ON objetos_postagem (status, data_ultima_consulta)")
+    conn.commit()
+    print("Índice idx_objetos_postagem_consulta criado")
+except mysql.connector.Error as err:
+    print(f"Ignorado erro ao criar idx_objetos_postagem_consulta: {err}")
+
+# Tabelas de arquivo dos lançamentos (preenchidas por backend/arquivar_historico.py).
+# As tabelas vivas têm chaves estrangeiras e por isso não podem ser particionadas;
+# as de arquivo são cópias sem chaves estrangeiras, comprimidas e particionadas por ano.
+tabelas_arquivo = {
+    "movimentacao_estoque": "data_movimentacao",
+    "movimentos_caixa": "data_movimento",
+    "contas_pagar": "data_vencimento",
+    "contas_receber": "data_vencimento",
+    "pedidos_venda": "data_pedido",
+    "itens_pedido_venda": None,
+}
+ano_atual = datetime.now().year
+for tabela, coluna_data in tabelas_arquivo.items():
+    try:
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            (f"arquivo_{tabela}",)
+        )
+        if cursor.fetchone()[0]:
+            continue
+
+        cursor.execute(f"CREATE TABLE arquivo_{tabela} LIKE {tabela}")
+        cursor.execute(f"ALTER TABLE arquivo_{tabela} MODIFY id INT NOT NULL, ROW_FORMAT=COMPRESSED")
+
+        # Chaves únicas precisam incluir a coluna de partição; no arquivo só a primária é mantida
+        cursor.execute("""
+            SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND NON_UNIQUE = 0 AND INDEX_NAME <> 'PRIMARY'
+        """, (f"arquivo_{tabela}",))
+        for (indice,) in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE arquivo_{tabela} DROP INDEX {indice}")
+
+        if coluna_data:
+            # Anos anteriores separados em partições; p_futuro é dividida pelo arquivamento
+            particoes = ", ".join(
+                f"PARTITION p{ano} VALUES LESS THAN ({ano + 1})" for ano in range(ano_atual - 10, ano_atual)
+            )
+            # YEAR() não é aceito em TIMESTAMP na função de partição
+            cursor.execute("""
+                SELECT DATA_TYPE FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+            """, (tabela, coluna_data))
+            tipo = cursor.fetchone()[0].upper()
+            tipo = "DATETIME" if tipo == "TIMESTAMP" else tipo
+            cursor.execute(f"""
+                ALTER TABLE arquivo_{tabela}
+                MODIFY {coluna_data} {tipo} NOT NULL,
+                DROP PRIMARY KEY,
+                ADD PRIMARY KEY (id, {coluna_data})
+            """)
+            cursor.execute(f"""
+                ALTER TABLE arquivo_{tabela}
+                PARTITION BY RANGE (YEAR({coluna_data})) (
+                    PARTITION p_antigo VALUES LESS THAN ({ano_atual - 10}),
+                    {particoes},
+                    PARTITION p_futuro VALUES LESS THAN MAXVALUE
+                )
+            """)
+        else:
+            cursor.execute(f"CREATE INDEX idx_arquivo_{tabela}_pedido ON arquivo_{tabela} (pedido_id)")
+
+        conn.commit()
+        print(f"Tabela arquivo_{tabela} criada")
+    except mysql.connector.Error as err:
+        print(f"Ignorado erro ao criar arquivo_{tabela}: {err}")
+
 # Insere um usuário administrador padrão (senha: admin123)
 try:
     # Criptografa a senha antes de inserir